@@ -23,8 +23,19 @@ from .wrapper import plotData
 # -------------------------------------------------------------------------------------------------------------------
 # Import utils methods
 # -------------------------------------------------------------------------------------------------------------------
-from .utils import exception, _showFigure, _saveFigData, getCellsInclude, getCellsIncludeTags, _roundFigures, \
-     _smooth1d, syncMeasure, invertDictMapping
+from .utils import exception, _showFigure, _saveFigData, getCellsInclude, _getAllCellsTagTable, _getSpikeStore, _getConnMatrix, _getConnArrays, getCellsIncludeTags, \
+     _roundFigures, _smooth1d, syncMeasure, invertDictMapping
+
+# -------------------------------------------------------------------------------------------------------------------
+# Import SpikeStore class
+# -------------------------------------------------------------------------------------------------------------------
+from .spikeStore import SpikeStore
+
+
+# -------------------------------------------------------------------------------------------------------------------
+# Import ConnMatrix class
+# -------------------------------------------------------------------------------------------------------------------
+from .connMatrix import ConnMatrix
 
 
 # -------------------------------------------------------------------------------------------------------------------
@@ -36,7 +47,7 @@ from .network import plotConn, _plotConnCalculateFromSim, _plotConnCalculateFrom
 # -------------------------------------------------------------------------------------------------------------------
 # Import spike-related functions
 # -------------------------------------------------------------------------------------------------------------------
-from .spikes import calculateRate, plotRates, plotSyncs, plotRaster, plotSpikeHist, plotSpikeStats, plotRatePSD, popAvgRates
+from .spikes import calculateRate, calculateSpikeStats, plotRates, plotSyncs, plotRaster, plotSpikeHist, plotSpikeStats, plotRatePSD, popAvgRates
 
 
 # -------------------------------------------------------------------------------------------------------------------
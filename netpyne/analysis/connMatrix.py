@@ -0,0 +1,202 @@
+"""
+analysis/connMatrix.py
+
+Contains ConnMatrix class with sparse adjacency matrices of conns used by connectivity analysis functions
+
+Contributors: salvadordura@gmail.com
+"""
+from __future__ import print_function
+from __future__ import division
+from __future__ import unicode_literals
+from __future__ import absolute_import
+
+from builtins import range
+from future import standard_library
+standard_library.install_aliases()
+import numpy as np
+import scipy.sparse
+
+
+###############################################################################
+#
+# CONN MATRIX CLASS
+#
+###############################################################################
+
+class ConnMatrix (object):
+    ''' Conns of a network as arrays (one element per synapse) indexed by the position of the pre and postsyn gids in
+    the sorted list of cell gids, from which scipy.sparse CSR adjacency matrices (pre x post gid) with layers 'count',
+    'weight' or 'delay' (summed over the synapses of each pair of cells) are built and cached for each selection of
+    synMechs. Matrices grouped by pop or other cell property, convergence/divergence of each cell and disynaptic conns
+    are then obtained from sparse products instead of Python loops over cells and conns. Conns from NetStims
+    (preGid = -1) are kept with their preLabel to be grouped by NetStim pop '''
+
+    layers = ['count', 'weight', 'delay']
+
+    def __init__(self, preGids, postGids, weight=None, delay=None, synMech=None, preLabel=None, gids=None):
+        preGids, postGids = np.asarray(preGids, dtype=int), np.asarray(postGids, dtype=int)
+        if gids is None:
+            gids = np.concatenate((preGids[preGids >= 0], postGids))
+        self.gids = np.unique(np.asarray(gids, dtype=int))
+        self.numConns = len(postGids)
+
+        self.pre, self.post = self.gidIndex(preGids), self.gidIndex(postGids)
+        self.netStim = preGids < 0
+        self.weight = np.asarray(weight, dtype=float) if weight is not None else np.full(self.numConns, np.nan)
+        self.delay = np.asarray(delay, dtype=float) if delay is not None else np.full(self.numConns, np.nan)
+
+        # synMechs stored as codes of list of labels
+        synMechLabels = [str(mech) if mech is not None else '' for mech in synMech] if synMech is not None else [''] * self.numConns
+        synMechs, self.synMechCodes = np.unique(np.array(synMechLabels, dtype=str), return_inverse=True)
+        self.synMechs = synMechs.tolist()
+        self.synMechCodes = self.synMechCodes.astype(int).ravel()
+
+        self.preLabel = np.asarray(preLabel, dtype=object) if preLabel is not None else None
+        self._matrices = {}
+
+
+    # -----------------------------------------------------------------------------
+    # Create from dict of conns of each postsyn gid (eg. conns file) in compact format
+    # -----------------------------------------------------------------------------
+    @classmethod
+    def fromConnsDict(cls, conns, connsFormat, gids=None):
+        ''' Returns ConnMatrix with conns in dict {postGid: [conn, ...]} with each conn a list with the params in connsFormat '''
+        keys = [key for key in ['preGid', 'weight', 'delay', 'synMech', 'preLabel'] if key in connsFormat]
+        indices = [connsFormat.index(key) for key in keys]
+        postGids = []
+        values = [[] for key in keys]
+        for postGid, cellConns in conns.items():
+            if postGid == 'format': continue
+            postGids.extend([int(postGid)] * len(cellConns))
+            for i, index in enumerate(indices):
+                values[i].extend([conn[index] for conn in cellConns])
+        arrays = dict(zip(keys, values))
+        preGids = [-1 if gid == 'NetStim' else gid for gid in arrays.get('preGid', [])]
+        return cls(preGids, postGids, weight=arrays.get('weight'), delay=arrays.get('delay'), synMech=arrays.get('synMech'),
+            preLabel=arrays.get('preLabel'), gids=gids)
+
+
+    def __len__(self):
+        return self.numConns
+
+
+    def gidIndex(self, gids):
+        ''' Returns array with position of each gid in self.gids (-1 if not a cell of the network) '''
+        gids = np.asarray(gids, dtype=int)
+        idx = np.searchsorted(self.gids, gids)
+        found = idx < len(self.gids)
+        found[found] = self.gids[idx[found]] == gids[found]
+        return np.where(found, idx, -1)
+
+
+    def gidMask(self, gids):
+        ''' Returns bool array with True at the positions of gids in self.gids '''
+        mask = np.zeros(len(self.gids), dtype=bool)
+        idx = self.gidIndex(list(gids))
+        mask[idx[idx >= 0]] = True
+        return mask
+
+
+    def connMask(self, synMechs=None, synOrConn='syn'):
+        ''' Returns bool array selecting conns with synMechs (all if None); if synOrConn='conn' only includes the first
+        synapse of each pair of pre and postsyn cells '''
+        mask = np.ones(self.numConns, dtype=bool)
+        if synMechs:
+            codes = [self.synMechs.index(mech) for mech in synMechs if mech in self.synMechs]
+            mask &= np.isin(self.synMechCodes, codes)
+        if synOrConn == 'conn' and self.numConns:
+            pairs = (self.pre.astype(np.int64) + 1) * (len(self.gids) + 1) + self.post
+            first = np.zeros(self.numConns, dtype=bool)
+            first[np.unique(pairs, return_index=True)[1]] = True
+            mask &= first
+        return mask
+
+
+    def matrix(self, layer='count', synMechs=None, synOrConn='syn'):
+        ''' Returns CSR matrix (pre x post gid) with sum over synapses between cells of layer ('count'|'weight'|'delay') '''
+        key = (layer, tuple(synMechs) if synMechs else None, synOrConn)
+        if key not in self._matrices:
+            mask = self.connMask(synMechs, synOrConn) & (self.pre >= 0) & (self.post >= 0)
+            data = np.ones(mask.sum()) if layer == 'count' else getattr(self, layer)[mask]
+            shape = (len(self.gids), len(self.gids))
+            self._matrices[key] = scipy.sparse.csr_matrix((data, (self.pre[mask], self.post[mask])), shape=shape)  # duplicates summed
+        return self._matrices[key]
+
+
+    def groupMatrix(self, layer, preGroups, postGroups, numPreGroups, numPostGroups, synMechs=None, synOrConn='syn', netStimGroups=None):
+        ''' Returns dense matrix (pre x post group) with sum of layer over conns between groups of cells, obtained as
+        the sparse product Gpre * M * Gpost' of the conn matrix and the indicator matrices of groups; preGroups and
+        postGroups are arrays with the group of each gid in self.gids (-1 if excluded), and netStimGroups a dict with
+        the pre group of NetStim conns of each preLabel ('NetStim' if no preLabel) '''
+        groupMatrix = np.zeros((numPreGroups, numPostGroups))
+        if len(self.gids):
+            indicators = []
+            for groups, numGroups in [(preGroups, numPreGroups), (postGroups, numPostGroups)]:
+                groups = np.asarray(groups, dtype=int)
+                cells = np.flatnonzero(groups >= 0)
+                indicators.append(scipy.sparse.csr_matrix((np.ones(len(cells)), (groups[cells], cells)), shape=(numGroups, len(self.gids))))
+            groupMatrix += (indicators[0].dot(self.matrix(layer, synMechs, synOrConn)).dot(indicators[1].T)).toarray()
+
+        # conns from NetStims (not in conn matrix)
+        if netStimGroups and self.netStim.any():
+            mask = self.connMask(synMechs, synOrConn) & self.netStim & (self.post >= 0)
+            labels = self.preLabel[mask] if self.preLabel is not None else np.full(mask.sum(), 'NetStim', dtype=object)
+            preGroup = np.array([netStimGroups.get(label, -1) for label in labels.tolist()], dtype=int)
+            postGroup = np.asarray(postGroups, dtype=int)[self.post[mask]]
+            valid = (preGroup >= 0) & (postGroup >= 0)
+            data = np.ones(mask.sum()) if layer == 'count' else getattr(self, layer)[mask]
+            groupMatrix += np.bincount(preGroup[valid] * numPostGroups + postGroup[valid], weights=data[valid],
+                minlength=numPreGroups*numPostGroups).reshape(numPreGroups, numPostGroups)
+        return groupMatrix
+
+
+    def cellMatrix(self, layer, preGids, postGids, synMechs=None, synOrConn='syn'):
+        ''' Returns dense matrix (preGids x postGids, in the order given) with sum of layer over conns between cells '''
+        preIdx, postIdx = self.gidIndex(preGids), self.gidIndex(postGids)
+        cellMatrix = np.zeros((len(preIdx), len(postIdx)))
+        validPre, validPost = np.flatnonzero(preIdx >= 0), np.flatnonzero(postIdx >= 0)
+        if len(validPre) and len(validPost):
+            subMatrix = self.matrix(layer, synMechs, synOrConn)[preIdx[validPre]][:, postIdx[validPost]]
+            cellMatrix[np.ix_(validPre, validPost)] = subMatrix.toarray()
+        return cellMatrix
+
+
+    def degrees(self, direction='in', preGids=None, postGids=None, synMechs=None, synOrConn='syn'):
+        ''' Returns arrays with gids and number of conns received from preGids (direction='in', ie. convergence) by each
+        postGid, or sent to postGids by each preGid (direction='out', ie. divergence); all cells if gids are None '''
+        preMask = self.gidMask(preGids) if preGids is not None else np.ones(len(self.gids), dtype=bool)
+        postMask = self.gidMask(postGids) if postGids is not None else np.ones(len(self.gids), dtype=bool)
+        matrix = self.matrix('count', synMechs, synOrConn)
+        if direction == 'in':
+            counts = np.asarray(scipy.sparse.diags(preMask.astype(float)).dot(matrix).sum(axis=0)).ravel()
+            return self.gids[postMask], counts[postMask].astype(int)
+        else:
+            counts = np.asarray(matrix.dot(scipy.sparse.diags(postMask.astype(float))).sum(axis=1)).ravel()
+            return self.gids[preMask], counts[preMask].astype(int)
+
+
+    def degreeHist(self, direction='in', preGids=None, postGids=None, synMechs=None, synOrConn='syn', bins=10):
+        ''' Returns histogram (counts and bin edges) of convergence (direction='in') or divergence (direction='out') '''
+        return np.histogram(self.degrees(direction, preGids, postGids, synMechs, synOrConn)[1], bins=bins)
+
+
+    def disynaptic(self, preGids, prePreGids, postGids, maxPaths=int(1e7)):
+        ''' Returns number of conns (synapses) from preGids to postGids, and number of them that are disynaptic, ie.
+        where the post cell and the pre cell share an input from prePreGids. Shared inputs of each pair are counted
+        with the product Q'Q of the (binary) conn matrix Q from prePreGids, in blocks of postsyn cells so that at most
+        maxPaths pairs are held in memory '''
+        preMask, prePreMask, postMask = self.gidMask(preGids), self.gidMask(prePreGids), self.gidMask(postGids)
+        count = self.matrix('count')
+        preConns = scipy.sparse.diags(preMask.astype(float)).dot(count).dot(scipy.sparse.diags(postMask.astype(float))).tocsc()
+        prePreConns = (scipy.sparse.diags(prePreMask.astype(float)).dot(count) > 0).astype(float).tocsc()
+        prePreConnsT = prePreConns.T.tocsr()
+
+        totCon = int(round(preConns.sum()))
+        numDis = 0
+        posts = np.flatnonzero(postMask)
+        blockSize = max(1, int(maxPaths // max(len(self.gids), 1)))
+        for start in range(0, len(posts), blockSize):
+            block = posts[start:start+blockSize]
+            shared = prePreConnsT.dot(prePreConns[:, block])  # shared prePre inputs of each (pre, post) pair
+            numDis += int(round(preConns[:, block].multiply(shared > 0).sum()))
+        return numDis, totCon
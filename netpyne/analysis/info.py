@@ -23,7 +23,7 @@ from netpyne import __gui__
 if __gui__:
     import matplotlib.pyplot as plt
 import numpy as np
-from .utils import exception, _saveFigData, _showFigure, getCellsInclude
+from .utils import exception, _saveFigData, _showFigure, getCellsInclude, _getSpikeStore
 
 
 # -------------------------------------------------------------------------------------------------------------------
@@ -70,10 +70,7 @@ def nTE(cells1 = [], cells2 = [], spks1 = None, spks2 = None, timeRange = None,
 
         # Select cells to include
         if len(cellGids) > 0:
-            try:
-                spkts = [spkt for spkgid,spkt in zip(sim.allSimData['spkid'],sim.allSimData['spkt']) if spkgid in cellGids]
-            except:
-                spkts = []
+            spkts = _getSpikeStore().getSpikes(cellGids)[0].tolist()
         else: 
             spkts = []
 
@@ -96,10 +93,7 @@ def nTE(cells1 = [], cells2 = [], spks1 = None, spks2 = None, timeRange = None,
 
         # Select cells to include
         if len(cellGids) > 0:
-            try:
-                spkts = [spkt for spkgid,spkt in zip(sim.allSimData['spkid'],sim.allSimData['spkt']) if spkgid in cellGids]
-            except:
-                spkts = []
+            spkts = _getSpikeStore().getSpikes(cellGids)[0].tolist()
         else: 
             spkts = []
 
@@ -177,10 +171,7 @@ def granger(cells1 = [], cells2 = [], spks1 = None, spks2 = None, label1 = 'spkT
 
         # Select cells to include
         if len(cellGids) > 0:
-            try:
-                spkts = [spkt for spkgid,spkt in zip(sim.allSimData['spkid'],sim.allSimData['spkt']) if spkgid in cellGids]
-            except:
-                spkts = []
+            spkts = _getSpikeStore().getSpikes(cellGids)[0].tolist()
         else: 
             spkts = []
 
@@ -203,10 +194,7 @@ def granger(cells1 = [], cells2 = [], spks1 = None, spks2 = None, label1 = 'spkT
 
         # Select cells to include
         if len(cellGids) > 0:
-            try:
-                spkts = [spkt for spkgid,spkt in zip(sim.allSimData['spkid'],sim.allSimData['spkt']) if spkgid in cellGids]
-            except:
-                spkts = []
+            spkts = _getSpikeStore().getSpikes(cellGids)[0].tolist()
         else: 
             spkts = []
 
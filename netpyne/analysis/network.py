@@ -29,8 +29,50 @@ if __gui__:
     import matplotlib.pyplot as plt
 import numpy as np
 from numbers import Number
-from .utils import colorList, exception, _roundFigures, getCellsInclude, getCellsIncludeTags
+from .utils import colorList, exception, _roundFigures, getCellsInclude, getCellsIncludeTags, _getConnMatrix
 from .utils import _saveFigData, _showFigure
+from .connMatrix import ConnMatrix
+
+# -------------------------------------------------------------------------------------------------------------------
+## Support function for plotConn() - calculate matrix of conn feature between groups of cells
+# -------------------------------------------------------------------------------------------------------------------
+
+def _plotConnGroupMatrix(conns, feature, preGroups, postGroups, numCellsPre, numCellsPost, synOrConn, synMech, netStimGroups=None):
+    ''' Returns matrix with conn feature between groups of cells, calculated from sums of the ConnMatrix conns between 
+    groups (preGroups and postGroups = group of each gid in conns.gids, -1 if not included) '''
+
+    numCellsPre, numCellsPost = np.array(numCellsPre, dtype=float), np.array(numCellsPost, dtype=float)
+    groupArgs = (preGroups, postGroups, len(numCellsPre), len(numCellsPost), synMech, synOrConn, netStimGroups)
+    countMatrix = conns.groupMatrix('count', *groupArgs)
+
+    with np.errstate(divide='ignore', invalid='ignore'):
+        if feature == 'weight': 
+            connMatrix = conns.groupMatrix('weight', *groupArgs) / countMatrix  # avg weight per conn
+        elif feature == 'delay': 
+            connMatrix = conns.groupMatrix('delay', *groupArgs) / countMatrix
+        elif feature == 'numConns':
+            connMatrix = countMatrix
+        elif feature in ['probability', 'strength']:
+            connMatrix = countMatrix / np.outer(numCellsPre, numCellsPost)  # probability
+            if feature == 'strength':
+                connMatrix = connMatrix * conns.groupMatrix('weight', *groupArgs)  # strength
+        elif feature == 'convergence':
+            connMatrix = countMatrix / numCellsPost[np.newaxis, :]
+        elif feature == 'divergence':
+            connMatrix = countMatrix / numCellsPre[:, np.newaxis]
+    return connMatrix
+
+
+# -------------------------------------------------------------------------------------------------------------------
+## Support function for plotConn() - group index of each gid of ConnMatrix (-1 if gid not included)
+# -------------------------------------------------------------------------------------------------------------------
+
+def _plotConnGidGroups(conns, gids, groups):
+    gidGroups = np.full(len(conns.gids), -1, dtype=int)
+    idx = conns.gidIndex(gids)
+    gidGroups[idx[idx >= 0]] = np.asarray(groups, dtype=int)[idx >= 0]
+    return gidGroups
+
 
 # -------------------------------------------------------------------------------------------------------------------
 ## Support function for plotConn() - calculate conn using data from sim object
@@ -40,34 +82,13 @@ def _plotConnCalculateFromSim(includePre, includePost, feature, orderBy, groupBy
 
     from .. import sim
 
-    def list_of_dict_unique_by_key(seq, key):
-        seen = set()
-        seen_add = seen.add
-        return [x for x in seq if x[key] not in seen and not seen_add(x[key])]
-
-    # adapt indices/keys based on compact vs long conn format
+    # check compact conn format includes required fields
     if sim.cfg.compactConnFormat: 
-        connsFormat = sim.cfg.compactConnFormat
-
-        # set indices of fields to read compact format (no keys)
-        missing = []
-        preGidIndex = connsFormat.index('preGid') if 'preGid' in connsFormat else missing.append('preGid')
-        synMechIndex = connsFormat.index('synMech') if 'synMech' in connsFormat else missing.append('synMech')
-        weightIndex = connsFormat.index('weight') if 'weight' in connsFormat else missing.append('weight')
-        delayIndex = connsFormat.index('delay') if 'delay' in connsFormat else missing.append('delay')
-        preLabelIndex = connsFormat.index('preLabel') if 'preLabel' in connsFormat else -1
-        
+        missing = [key for key in ['preGid', 'synMech', 'weight', 'delay'] if key not in sim.cfg.compactConnFormat]
         if len(missing) > 0:
             print("  Error: cfg.compactConnFormat missing:")
             print(missing)
             return None, None, None 
-    else:  
-        # using long conn format (dict)
-        preGidIndex = 'preGid' 
-        synMechIndex = 'synMech'
-        weightIndex = 'weight'
-        delayIndex = 'delay'
-        preLabelIndex = 'preLabel'
 
     # Calculate pre and post cells involved
     cellsPre, cellGidsPre, netStimPopsPre = getCellsInclude(includePre)
@@ -77,15 +98,14 @@ def _plotConnCalculateFromSim(includePre, includePost, feature, orderBy, groupBy
         cellsPost, cellGidsPost, netStimPopsPost = getCellsInclude(includePost) 
 
     if isinstance(synMech, basestring): synMech = [synMech]  # make sure synMech is a list
+
+    conns = _getConnMatrix()  # sparse conn matrix of all cells
     
     # Calculate matrix if grouped by cell
     if groupBy == 'cell': 
-        if feature in ['weight', 'delay', 'numConns']: 
-            connMatrix = np.zeros((len(cellGidsPre), len(cellGidsPost)))
-            countMatrix = np.zeros((len(cellGidsPre), len(cellGidsPost)))
-        else: 
+        if feature not in ['weight', 'delay', 'numConns']: 
             print('Conn matrix with groupBy="cell" only supports features= "weight", "delay" or "numConns"')
-            return fig
+            return None, None, None
         cellIndsPre = {cell['gid']: ind for ind,cell in enumerate(cellsPre)}
         cellIndsPost = {cell['gid']: ind for ind,cell in enumerate(cellsPost)}
 
@@ -112,28 +132,15 @@ def _plotConnCalculateFromSim(includePre, includePost, feature, orderBy, groupBy
                 sortedGidsPost = {gid:i for i,(y,gid) in enumerate(sorted(zip(yorderPost,cellGidsPost)))}
                 cellIndsPost = sortedGidsPost
 
-
-        # Calculate conn matrix
-        for cell in cellsPost:  # for each postsyn cell
-
-            if synOrConn=='syn':
-                cellConns = cell['conns'] # include all synapses 
-            else:
-                cellConns = list_of_dict_unique_by_key(cell['conns'], preGidIndex)
-
-            if synMech:
-                cellConns = [conn for conn in cellConns if conn[synMechIndex] in synMech]
-
-            for conn in cellConns:
-                if conn[preGidIndex] != 'NetStim' and conn[preGidIndex] in cellIndsPre:
-                    if feature in ['weight', 'delay']:
-                        featureIndex = weightIndex if feature == 'weight' else delayIndex
-                        if conn[preGidIndex] in cellIndsPre:
-                            connMatrix[cellIndsPre[conn[preGidIndex]], cellIndsPost[cell['gid']]] += conn[featureIndex]
-                    countMatrix[cellIndsPre[conn[preGidIndex]], cellIndsPost[cell['gid']]] += 1
-
-        if feature in ['weight', 'delay']: connMatrix = connMatrix / countMatrix 
-        elif feature in ['numConns']: connMatrix = countMatrix 
+        # Calculate conn matrix from submatrix of sparse conn matrix with rows and columns of pre and post cells (in order)
+        orderedGidsPre = sorted(cellIndsPre, key=cellIndsPre.get)
+        orderedGidsPost = sorted(cellIndsPost, key=cellIndsPost.get)
+        countMatrix = conns.cellMatrix('count', orderedGidsPre, orderedGidsPost, synMech, synOrConn)  # excludes NetStims
+        with np.errstate(divide='ignore', invalid='ignore'):
+            if feature in ['weight', 'delay']: 
+                connMatrix = conns.cellMatrix(feature, orderedGidsPre, orderedGidsPost, synMech, synOrConn) / countMatrix 
+            elif feature in ['numConns']: 
+                connMatrix = countMatrix 
 
         pre, post = cellsPre, cellsPost 
 
@@ -153,65 +160,21 @@ def _plotConnCalculateFromSim(includePre, includePost, feature, orderBy, groupBy
             popsPost = [pop for pop in sim.net.allPops if pop in popsTempPost]+netStimPopsPost
             popIndsPost = {pop: ind for ind,pop in enumerate(popsPost)}
         
-        # initialize matrices
-        if feature in ['weight', 'strength']: 
-            weightMatrix = np.zeros((len(popsPre), len(popsPost)))
-        elif feature == 'delay': 
-            delayMatrix = np.zeros((len(popsPre), len(popsPost)))
-        countMatrix = np.zeros((len(popsPre), len(popsPost)))
-        
-        # calculate max num conns per pre and post pair of pops
-        numCellsPopPre = {}
-        for pop in popsPre:
-            if pop in netStimPopsPre:
-                numCellsPopPre[pop] = -1
-            else:
-                numCellsPopPre[pop] = len([cell for cell in cellsPre if cell['tags']['pop']==pop])
-
-        if includePre == includePost:
-            numCellsPopPost = numCellsPopPre
-        else:
-            numCellsPopPost = {}
-            for pop in popsPost:
-                if pop in netStimPopsPost:
-                    numCellsPopPost[pop] = -1
-                else:
-                    numCellsPopPost[pop] = len([cell for cell in cellsPost if cell['tags']['pop']==pop])
-
-        maxConnMatrix = np.zeros((len(popsPre), len(popsPost)))
-        if feature == 'convergence': maxPostConnMatrix = np.zeros((len(popsPre), len(popsPost)))
-        if feature == 'divergence': maxPreConnMatrix = np.zeros((len(popsPre), len(popsPost)))
-        for prePop in popsPre:
-            for postPop in popsPost: 
-                if numCellsPopPre[prePop] == -1: numCellsPopPre[prePop] = numCellsPopPost[postPop]
-                maxConnMatrix[popIndsPre[prePop], popIndsPost[postPop]] = numCellsPopPre[prePop]*numCellsPopPost[postPop]
-                if feature == 'convergence': maxPostConnMatrix[popIndsPre[prePop], popIndsPost[postPop]] = numCellsPopPost[postPop]
-                if feature == 'divergence': maxPreConnMatrix[popIndsPre[prePop], popIndsPost[postPop]] = numCellsPopPre[prePop]
+        # pop of each pre and post cell
+        preGroups = _plotConnGidGroups(conns, [cell['gid'] for cell in cellsPre], [popIndsPre[cell['tags']['pop']] for cell in cellsPre])
+        postGroups = _plotConnGidGroups(conns, [cell['gid'] for cell in cellsPost], [popIndsPost[cell['tags']['pop']] for cell in cellsPost])
+
+        # num of cells of each pop (-1 for postsyn NetStims; presyn NetStims use num of cells of first post pop)
+        numCellsPopPre = np.bincount(preGroups[preGroups >= 0], minlength=len(popsPre))
+        numCellsPopPost = np.bincount(postGroups[postGroups >= 0], minlength=len(popsPost))
+        for pop in netStimPopsPost:
+            numCellsPopPost[popIndsPost[pop]] = -1
+        for pop in netStimPopsPre:
+            numCellsPopPre[popIndsPre[pop]] = numCellsPopPost[0] if len(popsPost) else 0
         
-        # Calculate conn matrix
-        for cell in cellsPost:  # for each postsyn cell
-
-            if synOrConn=='syn':
-                cellConns = cell['conns'] # include all synapses 
-            else:
-                cellConns = list_of_dict_unique_by_key(cell['conns'], preGidIndex)
-
-            if synMech:
-                cellConns = [conn for conn in cellConns if conn[synMechIndex] in synMech]
-
-            for conn in cellConns:
-                if conn[preGidIndex] == 'NetStim':
-                    prePopLabel = conn[preLabelIndex] if preLabelIndex in conn else 'NetStim'
-                else:
-                    preCell = next((cell for cell in cellsPre if cell['gid']==conn[preGidIndex]), None)
-                    prePopLabel = preCell['tags']['pop'] if preCell else None
-                
-                if prePopLabel in popIndsPre:
-                    if feature in ['weight', 'strength']: 
-                        weightMatrix[popIndsPre[prePopLabel], popIndsPost[cell['tags']['pop']]] += conn[weightIndex]
-                    elif feature == 'delay': 
-                        delayMatrix[popIndsPre[prePopLabel], popIndsPost[cell['tags']['pop']]] += conn[delayIndex] 
-                    countMatrix[popIndsPre[prePopLabel], popIndsPost[cell['tags']['pop']]] += 1    
+        # Calculate conn matrix (conns from NetStims grouped by their preLabel)
+        netStimGroups = {pop: popIndsPre[pop] for pop in netStimPopsPre}
+        connMatrix = _plotConnGroupMatrix(conns, feature, preGroups, postGroups, numCellsPopPre, numCellsPopPost, synOrConn, synMech, netStimGroups)
 
         pre, post = popsPre, popsPost 
     
@@ -246,65 +209,19 @@ def _plotConnCalculateFromSim(includePre, includePost, feature, orderBy, groupBy
         # set indices for pre and post groups
         groupIndsPre = {group: ind for ind,group in enumerate(groupsPre)}
         groupIndsPost = {group: ind for ind,group in enumerate(groupsPost)}
-        
-        # initialize matrices
-        if feature in ['weight', 'strength']: 
-            weightMatrix = np.zeros((len(groupsPre), len(groupsPost)))
-        elif feature == 'delay': 
-            delayMatrix = np.zeros((len(groupsPre), len(groupsPost)))
-        countMatrix = np.zeros((len(groupsPre), len(groupsPost)))
 
-        # calculate max num conns per pre and post pair of pops
-        numCellsGroupPre = {}
-        for groupPre in groupsPre:
-            numCellsGroupPre[groupPre] = len([cell for cell in cellsPre if groupPre <= cell['tags'][groupBy] < (groupPre+groupByIntervalPre)])
-        
-        if includePre == includePost:
-            numCellsGroupPost = numCellsGroupPre  
-        else:
-            numCellsGroupPost = {}
-            for groupPost in groupsPost:
-                numCellsGroupPost[groupPost] = len([cell for cell in cellsPost if groupPost <= cell['tags'][groupBy] < (groupPost+groupByIntervalPost)])
-
-
-        maxConnMatrix = np.zeros((len(groupsPre), len(groupsPost)))
-        if feature == 'convergence': maxPostConnMatrix = np.zeros((len(groupsPre), len(groupsPost)))
-        if feature == 'divergence': maxPreConnMatrix = np.zeros((len(groupsPre), len(groupsPost)))
-        for preGroup in groupsPre:
-            for postGroup in groupsPost: 
-                if numCellsGroupPre[preGroup] == -1: numCellsGroupPre[preGroup] = numCellsGroupPost[postGroup]
-                maxConnMatrix[groupIndsPre[preGroup], groupIndsPost[postGroup]] = numCellsGroupPre[preGroup]*numCellsGroupPost[postGroup]
-                if feature == 'convergence': maxPostConnMatrix[groupIndsPre[preGroup], groupIndsPost[postGroup]] = numCellsGroupPost[postGroup]
-                if feature == 'divergence': maxPreConnMatrix[groupIndsPre[preGroup], groupIndsPost[postGroup]] = numCellsGroupPre[preGroup]
+        # group of each pre and post cell
+        preGroups = _plotConnGidGroups(conns, [cell['gid'] for cell in cellsPre], 
+            [groupIndsPre.get(_roundFigures(groupByIntervalPre * np.floor(cell['tags'][groupBy] / groupByIntervalPre), 3), -1) for cell in cellsPre])
+        postGroups = _plotConnGidGroups(conns, [cell['gid'] for cell in cellsPost], 
+            [groupIndsPost.get(_roundFigures(groupByIntervalPost * np.floor(cell['tags'][groupBy] / groupByIntervalPost), 3), -1) for cell in cellsPost])
+
+        # num of cells of each group
+        numCellsGroupPre = np.bincount(preGroups[preGroups >= 0], minlength=len(groupsPre))
+        numCellsGroupPost = np.bincount(postGroups[postGroups >= 0], minlength=len(groupsPost))
         
         # Calculate conn matrix
-        for cell in cellsPost:  # for each postsyn cell
-            if synOrConn=='syn':
-                cellConns = cell['conns'] # include all synapses 
-            else:
-                cellConns = list_of_dict_unique_by_key(cell['conns'], preGidIndex)
-
-            if synMech:
-                cellConns = [conn for conn in cellConns if conn[synMechIndex] in synMech]
-
-            for conn in cellConns:
-                if conn[preGidIndex] == 'NetStim':
-                    prePopLabel = -1  # maybe add in future
-                else:
-                    preCell = next((c for c in cellsPre if c['gid']==conn[preGidIndex]), None)
-                    if preCell:
-                        preGroup = _roundFigures(groupByIntervalPre * np.floor(preCell['tags'][groupBy] / groupByIntervalPre), 3)
-                    else:
-                        preGroup = None
-
-                postGroup = _roundFigures(groupByIntervalPost * np.floor(cell['tags'][groupBy] / groupByIntervalPost), 3)
-                if preGroup in groupIndsPre:
-                    if feature in ['weight', 'strength']: 
-                        weightMatrix[groupIndsPre[preGroup], groupIndsPost[postGroup]] += conn[weightIndex]
-                    elif feature == 'delay': 
-                        delayMatrix[groupIndsPre[preGroup], groupIndsPost[postGroup]] += conn[delayIndex] 
-                    countMatrix[groupIndsPre[preGroup], groupIndsPost[postGroup]] += 1  
-
+        connMatrix = _plotConnGroupMatrix(conns, feature, preGroups, postGroups, numCellsGroupPre, numCellsGroupPost, synOrConn, synMech)
   
         pre, post = groupsPre, groupsPost 
 
@@ -313,25 +230,6 @@ def _plotConnCalculateFromSim(includePre, includePost, feature, orderBy, groupBy
         print('groupBy (%s) is not valid'%(str(groupBy)))
         return
 
-    # normalize by number of postsyn cells
-    if groupBy != 'cell':
-        if feature == 'weight': 
-            connMatrix = weightMatrix / countMatrix  # avg weight per conn (fix to remove divide by zero warning) 
-        elif feature == 'delay': 
-            connMatrix = delayMatrix / countMatrix
-        elif feature == 'numConns':
-            connMatrix = countMatrix
-        elif feature in ['probability', 'strength']:
-            connMatrix = countMatrix / maxConnMatrix  # probability
-            if feature == 'strength':
-                connMatrix = connMatrix * weightMatrix  # strength
-        elif feature == 'convergence':
-            connMatrix = countMatrix / maxPostConnMatrix
-        elif feature == 'divergence':
-            connMatrix = countMatrix / maxPreConnMatrix
-
-
-
     return connMatrix, pre, post
 
 
@@ -345,11 +243,6 @@ def _plotConnCalculateFromFile(includePre, includePost, feature, orderBy, groupB
     import json
     from time import time    
 
-    def list_of_dict_unique_by_key(seq, index):
-        seen = set()
-        seen_add = seen.add
-        return [x for x in seq if x[index] not in seen and not seen_add(x[index])]
-
     # load files with tags and conns
     start = time()
     tags, conns = None, None
@@ -381,18 +274,14 @@ def _plotConnCalculateFromFile(includePre, includePost, feature, orderBy, groupB
 
 
     # set indices of fields to read compact format (no keys)
-    missing = []
-    popIndex = tagsFormat.index('pop') if 'pop' in tagsFormat else missing.append('pop')
-    preGidIndex = connsFormat.index('preGid') if 'preGid' in connsFormat else missing.append('preGid')
-    synMechIndex = connsFormat.index('synMech') if 'synMech' in connsFormat else missing.append('synMech')
-    weightIndex = connsFormat.index('weight') if 'weight' in connsFormat else missing.append('weight')
-    delayIndex = connsFormat.index('delay') if 'delay' in connsFormat else missing.append('delay')
-    preLabelIndex = connsFormat.index('preLabel') if 'preLabel' in connsFormat else -1
+    missing = [key for key in ['pop'] if key not in tagsFormat]
+    missing += [key for key in ['preGid', 'synMech', 'weight', 'delay'] if key not in connsFormat]
     
     if len(missing) > 0:
         print("Missing:")
         print(missing)
         return None, None, None 
+    popIndex = tagsFormat.index('pop')
 
     if isinstance(synMech, basestring): synMech = [synMech]  # make sure synMech is a list
     
@@ -408,8 +297,6 @@ def _plotConnCalculateFromFile(includePre, includePost, feature, orderBy, groupB
         print('    Obtaining list of populations ...')
         popsPre = list(set([tags[gid][popIndex] for gid in cellGidsPre]))
         popIndsPre = {pop: ind for ind,pop in enumerate(popsPre)}
-        netStimPopsPre = []  # netstims not yet supported
-        netStimPopsPost = []
 
         if includePre == includePost:
             popsPost = popsPre
@@ -418,67 +305,17 @@ def _plotConnCalculateFromFile(includePre, includePost, feature, orderBy, groupB
             popsPost = list(set([tags[gid][popIndex] for gid in cellGidsPost]))
             popIndsPost = {pop: ind for ind,pop in enumerate(popsPost)}
         
-        # initialize matrices
-        if feature in ['weight', 'strength']: 
-            weightMatrix = np.zeros((len(popsPre), len(popsPost)))
-        elif feature == 'delay': 
-            delayMatrix = np.zeros((len(popsPre), len(popsPost)))
-        countMatrix = np.zeros((len(popsPre), len(popsPost)))
-        
-        # calculate max num conns per pre and post pair of pops
-        print('    Calculating max num conns for each pair of population ...')
-        numCellsPopPre = {}
-        for pop in popsPre:
-            if pop in netStimPopsPre:
-                numCellsPopPre[pop] = -1
-            else:
-                numCellsPopPre[pop] = len([gid for gid in cellGidsPre if tags[gid][popIndex]==pop])
-
-        if includePre == includePost:
-            numCellsPopPost = numCellsPopPre
-        else:
-            numCellsPopPost = {}
-            for pop in popsPost:
-                if pop in netStimPopsPost:
-                    numCellsPopPost[pop] = -1
-                else:
-                    numCellsPopPost[pop] = len([gid for gid in cellGidsPost if tags[gid][popIndex]==pop])
-
-        maxConnMatrix = np.zeros((len(popsPre), len(popsPost)))
-        if feature == 'convergence': maxPostConnMatrix = np.zeros((len(popsPre), len(popsPost)))
-        if feature == 'divergence': maxPreConnMatrix = np.zeros((len(popsPre), len(popsPost)))
-        for prePop in popsPre:
-            for postPop in popsPost: 
-                if numCellsPopPre[prePop] == -1: numCellsPopPre[prePop] = numCellsPopPost[postPop]
-                maxConnMatrix[popIndsPre[prePop], popIndsPost[postPop]] = numCellsPopPre[prePop]*numCellsPopPost[postPop]
-                if feature == 'convergence': maxPostConnMatrix[popIndsPre[prePop], popIndsPost[postPop]] = numCellsPopPost[postPop]
-                if feature == 'divergence': maxPreConnMatrix[popIndsPre[prePop], popIndsPost[postPop]] = numCellsPopPre[prePop]
-        
-        # Calculate conn matrix
+        # sparse conn matrix with conns of all cells in file, and pop of each pre and post cell
+        print('    Building sparse conn matrix ...')
+        connMatrix = ConnMatrix.fromConnsDict(conns, connsFormat, gids=list(tags.keys()))
+        preGroups = _plotConnGidGroups(connMatrix, cellGidsPre, [popIndsPre[tags[gid][popIndex]] for gid in cellGidsPre])
+        postGroups = _plotConnGidGroups(connMatrix, cellGidsPost, [popIndsPost[tags[gid][popIndex]] for gid in cellGidsPost])
+        numCellsPopPre = np.bincount(preGroups[preGroups >= 0], minlength=len(popsPre))
+        numCellsPopPost = np.bincount(postGroups[postGroups >= 0], minlength=len(popsPost))
+
+        # Calculate conn matrix (netstims not yet supported)
         print('    Calculating weights, strength, prob, delay etc matrices ...')
-        for postGid in cellGidsPost:  # for each postsyn cell
-            print('     cell %d'%(int(postGid)))
-            if synOrConn=='syn':
-                cellConns = conns[postGid] # include all synapses 
-            else:
-                cellConns = list_of_dict_unique_by_index(conns[postGid], preGidIndex)
-
-            if synMech:
-                cellConns = [conn for conn in cellConns if conn[synMechIndex] in synMech]
-
-            for conn in cellConns:
-                if conn[preGidIndex] == 'NetStim':
-                    prePopLabel = conn[preLabelIndex] if preLabelIndex >=0 else 'NetStims'
-                else:
-                    preCellGid = next((gid for gid in cellGidsPre if gid==conn[preGidIndex]), None)
-                    prePopLabel = tags[preCellGid][popIndex] if preCellGid else None
-                
-                if prePopLabel in popIndsPre:
-                    if feature in ['weight', 'strength']: 
-                        weightMatrix[popIndsPre[prePopLabel], popIndsPost[tags[postGid][popIndex]]] += conn[weightIndex]
-                    elif feature == 'delay': 
-                        delayMatrix[popIndsPre[prePopLabel], popIndsPost[tags[postGid][popIndex]]] += conn[delayIndex] 
-                    countMatrix[popIndsPre[prePopLabel], popIndsPost[tags[postGid][popIndex]]] += 1    
+        connMatrix = _plotConnGroupMatrix(connMatrix, feature, preGroups, postGroups, numCellsPopPre, numCellsPopPost, synOrConn, synMech)
 
         pre, post = popsPre, popsPost 
     
@@ -492,22 +329,6 @@ def _plotConnCalculateFromFile(includePre, includePost, feature, orderBy, groupB
         print('groupBy (%s) is not valid'%(str(groupBy)))
         return
 
-    if groupBy != 'cell':
-        if feature == 'weight': 
-            connMatrix = weightMatrix / countMatrix  # avg weight per conn (fix to remove divide by zero warning) 
-        elif feature == 'delay': 
-            connMatrix = delayMatrix / countMatrix
-        elif feature == 'numConns':
-            connMatrix = countMatrix
-        elif feature in ['probability', 'strength']:
-            connMatrix = countMatrix / maxConnMatrix  # probability
-            if feature == 'strength':
-                connMatrix = connMatrix * weightMatrix  # strength
-        elif feature == 'convergence':
-            connMatrix = countMatrix / maxPostConnMatrix
-        elif feature == 'divergence':
-            connMatrix = countMatrix / maxPreConnMatrix
-
     print('    plotting ...')
     return connMatrix, pre, post
 
@@ -1004,9 +825,6 @@ def calculateDisynaptic(includePost = ['allCells'], includePre = ['allCells'], i
     from time import time
     from .. import sim
 
-    numDis = 0
-    totCon = 0
-
     start = time()
     if tagsFile:
         print('Loading tags file...')
@@ -1026,40 +844,21 @@ def calculateDisynaptic(includePost = ['allCells'], includePre = ['allCells'], i
         cellsPrePreGids = getCellsIncludeTags(includePrePre, tags)
         cellsPostGids = getCellsIncludeTags(includePost, tags)
 
-        preGidIndex = conns['format'].index('preGid') if 'format' in conns else 0
-        for postGid in cellsPostGids:
-            preGidsAll = [conn[preGidIndex] for conn in conns[postGid] if isinstance(conn[preGidIndex], Number) and conn[preGidIndex] in cellsPreGids+cellsPrePreGids]
-            preGids = [gid for gid in preGidsAll if gid in cellsPreGids]
-            for preGid in preGids:
-                prePreGids = [conn[preGidIndex] for conn in conns[preGid] if conn[preGidIndex] in cellsPrePreGids]
-                totCon += 1
-                if not set(prePreGids).isdisjoint(preGidsAll):
-                    numDis += 1
+        connsFormat = conns['format'] if 'format' in conns else ['preGid']
+        connMatrix = ConnMatrix.fromConnsDict(conns, connsFormat, gids=[gid for gid in tags if gid != 'format'])
 
     else:
-        if sim.cfg.compactConnFormat: 
-            if 'preGid' in sim.cfg.compactConnFormat:
-                preGidIndex = sim.cfg.compactConnFormat.index('preGid')  # using compact conn format (list)
-            else:
-                print('   Error: cfg.compactConnFormat does not include "preGid"')
-                return -1
-        else:  
-            preGidIndex = 'preGid' # using long conn format (dict)
+        if sim.cfg.compactConnFormat and 'preGid' not in sim.cfg.compactConnFormat:
+            print('   Error: cfg.compactConnFormat does not include "preGid"')
+            return -1
 
         _, cellsPreGids, _ =  getCellsInclude(includePre)
         _, cellsPrePreGids, _ = getCellsInclude(includePrePre)
-        cellsPost, _, _ = getCellsInclude(includePost)
-
-        for postCell in cellsPost:
-            print(postCell['gid'])
-            preGidsAll = [conn[preGidIndex] for conn in postCell['conns'] if isinstance(conn[preGidIndex], Number) and conn[preGidIndex] in cellsPreGids+cellsPrePreGids]
-            preGids = [gid for gid in preGidsAll if gid in cellsPreGids]
-            for preGid in preGids:
-                preCell = sim.net.allCells[preGid]
-                prePreGids = [conn[preGidIndex] for conn in preCell['conns'] if conn[preGidIndex] in cellsPrePreGids]
-                totCon += 1
-                if not set(prePreGids).isdisjoint(preGidsAll):
-                    numDis += 1
+        _, cellsPostGids, _ = getCellsInclude(includePost)
+        connMatrix = _getConnMatrix()
+
+    # conns from pre to post cells where both cells receive conns from a common prePre cell (from sparse matrix products)
+    numDis, totCon = connMatrix.disynaptic(cellsPreGids, cellsPrePreGids, cellsPostGids)
 
     print('    Total disynaptic connections: %d / %d (%.2f%%)' % (numDis, totCon, float(numDis)/float(totCon)*100 if totCon>0 else 0.0))
     try:
@@ -0,0 +1,180 @@
+"""
+analysis/spikeStore.py
+
+Contains SpikeStore class with indexed spike times and gids used by spike analysis functions
+
+Contributors: salvadordura@gmail.com
+"""
+from __future__ import print_function
+from __future__ import division
+from __future__ import unicode_literals
+from __future__ import absolute_import
+
+from future import standard_library
+standard_library.install_aliases()
+import numpy as np
+
+
+###############################################################################
+#
+# SPIKE STORE CLASS
+#
+###############################################################################
+
+class SpikeStore (object):
+    ''' Spike times and gids as time-sorted NumPy arrays, with an index of the spikes of each gid (CSR: spike rows
+    sorted by gid plus pointer to first row of each gid) and the gids of each population. Time windows are obtained
+    by binary search (O(log n)) and the spikes of a subset of cells by concatenating their rows (O(k) for k spikes) '''
+
+    def __init__(self, spkt, spkid, popGids=None):
+        spkt, spkid = np.asarray(spkt, dtype=float), np.asarray(spkid, dtype=float).astype(int)
+        if len(spkt) > 1 and np.any(np.diff(spkt) < 0):
+            order = np.argsort(spkt, kind='stable')
+            spkt, spkid = spkt[order], spkid[order]
+        self.spkt, self.spkid = spkt, spkid
+
+        # index of spikes by gid (rows of each gid in time order)
+        self.gidRows = np.argsort(spkid, kind='stable')
+        self.gids, counts = np.unique(spkid, return_counts=True)
+        self.gidPtr = np.concatenate(([0], np.cumsum(counts))).astype(int)
+
+        self.popGids = {pop: np.unique(np.asarray(gids, dtype=int)) for pop, gids in (popGids or {}).items()}
+
+
+    def __len__(self):
+        return len(self.spkt)
+
+
+    def timeRows(self, timeRange=None):
+        ''' Returns (start, end) rows of spikes within [timeRange[0], timeRange[1]) '''
+        if not timeRange:
+            return 0, len(self.spkt)
+        return int(np.searchsorted(self.spkt, timeRange[0], side='left')), int(np.searchsorted(self.spkt, timeRange[1], side='left'))
+
+
+    def gidRowRanges(self, gids):
+        ''' Returns arrays with start and end (in self.gidRows) of the spike rows of each gid with spikes '''
+        gids = np.asarray(gids, dtype=int)
+        idx = np.searchsorted(self.gids, gids)
+        valid = idx < len(self.gids)
+        idx, gids = idx[valid], gids[valid]
+        idx = np.unique(idx[self.gids[idx] == gids])
+        return self.gidPtr[idx], self.gidPtr[idx+1]
+
+
+    def gidSortedRows(self, gids):
+        ''' Returns array of rows of spikes of gids, sorted by gid and time '''
+        starts, ends = self.gidRowRanges(gids)
+        lengths = ends - starts
+        if lengths.sum() == 0:
+            return np.array([], dtype=int)
+        # concatenate ranges of rows of each gid without a Python loop
+        offsets = np.repeat(starts - np.concatenate(([0], np.cumsum(lengths)[:-1])), lengths)
+        return self.gidRows[np.arange(lengths.sum()) + offsets]
+
+
+    def rows(self, gids=None, timeRange=None):
+        ''' Returns sorted array of rows (ie. in time order) of spikes of gids (all if None) within timeRange '''
+        start, end = self.timeRows(timeRange)
+        if gids is None:
+            return np.arange(start, end)
+        rows = np.sort(self.gidSortedRows(gids))
+        if timeRange:
+            rows = rows[(rows >= start) & (rows < end)]
+        return rows
+
+
+    def getSpikes(self, gids=None, timeRange=None):
+        ''' Returns arrays with times and gids (sorted by time) of spikes of gids (all if None) within timeRange '''
+        if gids is None:
+            start, end = self.timeRows(timeRange)
+            return self.spkt[start:end], self.spkid[start:end]
+        rows = self.rows(gids, timeRange)
+        return self.spkt[rows], self.spkid[rows]
+
+
+    def getPopSpikes(self, pop, timeRange=None):
+        ''' Returns arrays with times and gids of spikes of population within timeRange '''
+        return self.getSpikes(self.popGids.get(pop, []), timeRange)
+
+
+    def cellSpikes(self, gid):
+        ''' Returns array with spike times of cell gid '''
+        starts, ends = self.gidRowRanges([gid])
+        return self.spkt[self.gidRows[starts[0]:ends[0]]] if len(starts) else np.array([])
+
+
+    def numSpikes(self, gids=None, timeRange=None):
+        ''' Returns number of spikes of gids (all if None) within timeRange '''
+        if gids is None:
+            start, end = self.timeRows(timeRange)
+            return end - start
+        return len(self.rows(gids, timeRange))
+
+
+    def cellStats(self, gids=None, timeRange=None, fanoBinSize=100.0, burstISI=10.0, minBurstSpikes=3):
+        ''' Returns table (dict of arrays, one row per gid) with spike statistics of each cell (all with spikes if gids is 
+        None), computed in one pass over the spikes sorted by gid: num of spikes, rate (Hz), mean ISI, ISI CV, local 
+        variation (LV) of ISIs, Fano factor of spike counts in bins of fanoBinSize (ms), number of bursts (at least 
+        minBurstSpikes spikes with ISIs <= burstISI) and fraction of spikes in bursts. Stats not defined (eg. ISI CV of 
+        cells with less than 2 ISIs) are NaN. Spikes within timeRange [start, stop) are used, and rates are calculated over
+        its duration; if None, uses the simulated time [sim.tstart, sim.cfg.duration] (required if no simulation is loaded, eg. when used on saved 
+        data in batch fitness functions: SpikeStore(simData['spkt'], simData['spkid']).cellStats(timeRange=[0, 
+        simConfig['duration']])) '''
+        from .. import sim
+
+        gids = self.gids if gids is None else np.unique(np.asarray(gids, dtype=int))
+        if not timeRange:
+            simDuration = getattr(getattr(sim, 'cfg', None), 'duration', None)
+            if simDuration is None:
+                raise Exception('SpikeStore.cellStats: timeRange required to calculate rates (simulation duration not available)')
+            timeRange = [getattr(sim, 'tstart', 0), simDuration]
+        duration = float(timeRange[1] - timeRange[0])
+        numCells = len(gids)
+
+        # spikes of cells sorted by gid and time, with index of cell (row of table) of each spike
+        rows = self.gidSortedRows(gids)
+        spkt = self.spkt[rows]
+        cellIdx = np.searchsorted(gids, self.spkid[rows])
+        inRange = (spkt >= timeRange[0]) & (spkt < timeRange[1])
+        spkt, cellIdx = spkt[inRange], cellIdx[inRange]
+
+        # counts and rates
+        numSpikes = np.bincount(cellIdx, minlength=numCells)
+        rate = numSpikes * 1e3 / duration if duration > 0 else np.full(numCells, np.nan)
+
+        # ISIs (consecutive spikes of same cell)
+        sameCell = cellIdx[1:] == cellIdx[:-1]
+        isi = np.diff(spkt)[sameCell]
+        isiCell = cellIdx[1:][sameCell]
+        numIsi = np.bincount(isiCell, minlength=numCells)
+        with np.errstate(divide='ignore', invalid='ignore'):
+            isiMean = np.bincount(isiCell, weights=isi, minlength=numCells) / numIsi
+            isiVar = np.bincount(isiCell, weights=isi**2, minlength=numCells) / numIsi - isiMean**2
+            isicv = np.sqrt(np.clip(isiVar, 0, None)) / isiMean
+            isicv[numIsi < 2] = np.nan
+
+            # local variation: 3/(n-1) * sum(((I_i - I_i+1) / (I_i + I_i+1))^2) over consecutive ISIs of same cell
+            samePair = isiCell[1:] == isiCell[:-1]
+            lvTerms = (3 * ((isi[:-1] - isi[1:]) / (isi[:-1] + isi[1:]))**2)[samePair]
+            lv = np.bincount(isiCell[1:][samePair], weights=lvTerms, minlength=numCells) / (numIsi - 1)
+            lv[numIsi < 2] = np.nan
+
+            # Fano factor of spike counts in time bins
+            numBins = max(int(np.ceil(duration / fanoBinSize)), 1)
+            binIdx = np.minimum(((spkt - timeRange[0]) / fanoBinSize).astype(int), numBins-1)
+            binCounts = np.bincount(cellIdx * numBins + binIdx, minlength=numCells*numBins).reshape(numCells, numBins)
+            fano = binCounts.var(axis=1) / binCounts.mean(axis=1) if numBins > 1 else np.full(numCells, np.nan)
+
+        # bursts: runs of consecutive ISIs <= burstISI of the same cell (runs broken between cells)
+        short = np.concatenate(([False], sameCell & (np.diff(spkt) <= burstISI), [False])).astype(int)
+        runStarts, runEnds = np.flatnonzero(np.diff(short) == 1), np.flatnonzero(np.diff(short) == -1)
+        runSpikes = runEnds - runStarts + 1
+        isBurst = runSpikes >= minBurstSpikes
+        burstCount = np.bincount(cellIdx[runStarts[isBurst]], minlength=numCells)
+        burstSpikes = np.bincount(cellIdx[runStarts[isBurst]], weights=runSpikes[isBurst], minlength=numCells)
+        with np.errstate(divide='ignore', invalid='ignore'):
+            burstFraction = np.where(numSpikes > 0, burstSpikes / numSpikes, np.nan)
+
+        return {'gid': gids, 'numSpikes': numSpikes, 'rate': rate, 'isiMean': isiMean, 'isicv': isicv, 'lv': lv, 
+            'fano': fano, 'burstCount': burstCount, 'burstFraction': burstFraction}
@@ -33,7 +33,7 @@ from numbers import Number
 import pandas as pd
 import scipy
 from ..specs import Dict
-from .utils import colorList, exception, getCellsInclude, getSpktSpkid, _showFigure, _saveFigData, syncMeasure, _smooth1d
+from .utils import colorList, exception, getCellsInclude, getSpktSpkid, _getSpikeStore, _showFigure, _saveFigData, syncMeasure, _smooth1d
 
 
 # -------------------------------------------------------------------------------------------------------------------
@@ -72,10 +72,8 @@ def calculateRate (include = ['allCells', 'eachPop'], peakBin = 5, timeRange = N
 
         # Select cells to include
         if len(cellGids) > 0:
-            try:
-                spkinds,spkts = list(zip(*[(spkgid,spkt) for spkgid,spkt in zip(sim.allSimData['spkid'],sim.allSimData['spkt']) if spkgid in cellGids]))
-            except:
-                spkinds,spkts = [],[]
+            spkts, spkinds = _getSpikeStore().getSpikes(cellGids)
+            spkts, spkinds = spkts.tolist(), spkinds.tolist()
         else: 
             spkinds,spkts = [],[]
 
@@ -110,6 +108,40 @@ def calculateRate (include = ['allCells', 'eachPop'], peakBin = 5, timeRange = N
     return include, avg, peak
 
 
+# -------------------------------------------------------------------------------------------------------------------
+## Calculate spike stats of each cell
+# -------------------------------------------------------------------------------------------------------------------
+@exception
+def calculateSpikeStats (include = ['allCells'], timeRange = None, fanoBinSize = 100, burstISI = 10, minBurstSpikes = 3, includeRate0 = True):
+    ''' 
+    Calculate spike stats of each cell, in a single pass over the spikes of all cells sorted by gid
+        - include (['all',|'allCells',|120,|,'E1'|,('L2', 56)|,('L5',[4,5,6])]): Cells to include (default: ['allCells'])
+        - timeRange ([start:stop]): Time range of spikes; if None uses whole simulation (default: None)
+        - fanoBinSize (float): Size of bins (ms) of spike counts used to calculate the Fano factor (default: 100)
+        - burstISI (float): Maximum ISI (ms) between consecutive spikes of a burst (default: 10)
+        - minBurstSpikes (int): Minimum number of spikes of a burst (default: 3)
+        - includeRate0 (True|False): Include cells without spikes (default: True)
+        - Returns pandas DataFrame with one row per cell and columns gid, pop, numSpikes, rate (Hz), isiMean (ms), isicv,
+          lv (local variation of ISIs), fano, burstCount and burstFraction (fraction of spikes in bursts); NaN if not defined
+    '''
+
+    from .. import sim
+
+    if timeRange is None:
+        timeRange = [sim.tstart, sim.cfg.duration]  # simulated time (from end of transient if warm started)
+
+    cells, cellGids, netStimLabels = getCellsInclude(include)
+    cellStats = _getSpikeStore().cellStats(cellGids, timeRange, fanoBinSize=fanoBinSize, burstISI=burstISI, minBurstSpikes=minBurstSpikes)
+    cellPops = {cell['gid']: cell['tags'].get('pop') for cell in cells}
+    cellStats['pop'] = [cellPops.get(gid) for gid in cellStats['gid'].tolist()]
+
+    columns = ['gid', 'pop', 'numSpikes', 'rate', 'isiMean', 'isicv', 'lv', 'fano', 'burstCount', 'burstFraction']
+    df = pd.DataFrame(cellStats, columns=columns)
+    if not includeRate0:
+        df = df[df['numSpikes'] > 0].reset_index(drop=True)
+    return df
+
+
 # -------------------------------------------------------------------------------------------------------------------
 ## Plot avg and peak rates at different time periods 
 # -------------------------------------------------------------------------------------------------------------------
@@ -606,11 +638,9 @@ def plotSpikeHist (include = ['allCells', 'eachPop'], timeRange = None, binSize
 
         # Select cells to include
         if len(cellGids) > 0:
-            try:
-                spkinds,spkts = list(zip(*[(spkgid,spkt) for spkgid,spkt in zip(sim.allSimData['spkid'],sim.allSimData['spkt']) if spkgid in cellGids]))
-            except:
-                spkinds,spkts = [],[]
-        else:
+            spkts, spkinds = _getSpikeStore().getSpikes(cellGids)
+            spkts, spkinds = spkts.tolist(), spkinds.tolist()
+        else: 
             spkinds,spkts = [],[]
 
         # Add NetStim spikes
@@ -732,7 +762,8 @@ def plotSpikeStats (include = ['allCells', 'eachPop'], statDataIn = {}, timeRang
             Note: one line per item, not grouped (default: ['allCells', 'eachPop'])
         - timeRange ([start:stop]): Time range of spikes shown; if None shows all (default: None)
         - graphType ('boxplot', 'histogram'): Type of graph to use (default: 'boxplot')
-        - stats (['rate', |'isicv'| 'sync'| 'pairsync']): Measure to plot stats on (default: ['rate', 'isicv'])
+        - stats (['rate', |'isicv'| 'lv'| 'fano'| 'burst'| 'sync'| 'pairsync']): Measure to plot stats on; 'lv', 'fano' and 'burst'
+            (fraction of spikes in bursts) can be configured via fanoBinSize, burstISI and minBurstSpikes (see calculateSpikeStats) (default: ['rate', 'isicv'])
         - bins (int or list of edges): Number of bins (if integer) of edges (if list) for histogram (default: 50)
         - popColors (dict): Dictionary with color (value) used for each population (key) (default: None)
         - figSize ((width, height)): Size of figure (default: (10,8))
@@ -761,7 +792,10 @@ def plotSpikeStats (include = ['allCells', 'eachPop'], statDataIn = {}, timeRang
         }
     plt.rcParams.update(params)
 
-    xlabels = {'rate': 'Rate (Hz)', 'isicv': 'Irregularity (ISI CV)', 'sync':  'Synchrony', ' pairsync': 'Pairwise synchrony'}
+    xlabels = {'rate': 'Rate (Hz)', 'isicv': 'Irregularity (ISI CV)', 'lv': 'Irregularity (ISI LV)', 'fano': 'Fano factor', 
+        'burst': 'Fraction of spikes in bursts', 'sync':  'Synchrony', ' pairsync': 'Pairwise synchrony'}
+    statsArgs = {key: kwargs[key] for key in ['fanoBinSize', 'burstISI', 'minBurstSpikes'] if key in kwargs}
+    cellStatsData = {}
 
     # Replace 'eachPop' with list of pops
     if 'eachPop' in include: 
@@ -770,7 +804,7 @@ def plotSpikeStats (include = ['allCells', 'eachPop'], statDataIn = {}, timeRang
 
     # time range
     if timeRange is None:
-        timeRange = [0,sim.cfg.duration]
+        timeRange = [sim.tstart, sim.cfg.duration]  # simulated time (from end of transient if warm started)
 
     for stat in stats:
         # create fig
@@ -791,47 +825,30 @@ def plotSpikeStats (include = ['allCells', 'eachPop'], statDataIn = {}, timeRang
                 ynormsData = statDataIn[stat].get('ynormsData', [])
 
             else:
-                cells, cellGids, netStimLabels = getCellsInclude([subset])
-                numNetStims = 0
-
-                # Select cells to include
-                if len(cellGids) > 0:
-                    try:
-                        spkinds,spkts = list(zip(*[(spkgid,spkt) for spkgid,spkt in 
-                            zip(sim.allSimData['spkid'],sim.allSimData['spkt']) if spkgid in cellGids]))
-                    except:
-                        spkinds,spkts = [],[]
-                else: 
-                    spkinds,spkts = [],[]
-
-                # Add NetStim spikes
-                spkts, spkinds = list(spkts), list(spkinds)
-                numNetStims = 0
-                if 'stims' in sim.allSimData:
-                    for netStimLabel in netStimLabels:
-                        netStimSpks = [spk for cell,stims in sim.allSimData['stims'].items() \
-                        for stimLabel,stimSpks in stims.items() 
-                            for spk in stimSpks if stimLabel == netStimLabel]
-                        if len(netStimSpks) > 0:
-                            lastInd = max(spkinds) if len(spkinds)>0 else 0
-                            spktsNew = netStimSpks 
-                            spkindsNew = [lastInd+1+i for i in range(len(netStimSpks))]
-                            spkts.extend(spktsNew)
-                            spkinds.extend(spkindsNew)
-                            numNetStims += 1
-                try:
-                    spkts,spkinds = list(zip(*[(spkt, spkind) for spkt, spkind in zip(spkts, spkinds) 
-                        if timeRange[0] <= spkt <= timeRange[1]]))
-                except:
-                    pass
+                # stats of all cells of subset calculated once for all stats (see calculateSpikeStats)
+                if iplot not in cellStatsData:
+                    cells, cellGids, netStimLabels = getCellsInclude([subset])
+                    cellYnorms = {cell['gid']: cell['tags'].get('ynorm') for cell in cells}
+                    cellStats = _getSpikeStore().cellStats(cellGids, timeRange, **statsArgs)
+
+                    # NetStim spikes (each spike counted as a separate source)
+                    netStimSpkts = []
+                    if 'stims' in sim.allSimData:
+                        for netStimLabel in netStimLabels:
+                            netStimSpkts.extend([spk for cell,stims in sim.allSimData['stims'].items() \
+                                for stimLabel,stimSpks in stims.items() for spk in stimSpks 
+                                    if stimLabel == netStimLabel and timeRange[0] <= spk <= timeRange[1]])
+                    cellStatsData[iplot] = (cellStats, cellYnorms, netStimSpkts)
+                cellStats, cellYnorms, netStimSpkts = cellStatsData[iplot]
+                withSpikes = cellStats['numSpikes'] > 0
 
                 # if scatter get gids and ynorm
                 if graphType == 'scatter':    
                     if includeRate0:
-                        gids = cellGids
+                        gids = cellStats['gid'].tolist()
                     else:
-                        gids = set(spkinds)
-                    ynorms = [sim.net.allCells[int(gid)]['tags']['ynorm'] for gid in gids]
+                        gids = cellStats['gid'][withSpikes].tolist()
+                    ynorms = [cellYnorms[gid] for gid in gids]
 
                     gidsData.insert(0, gids)
                     ynormsData.insert(0, ynorms)
@@ -840,25 +857,24 @@ def plotSpikeStats (include = ['allCells', 'eachPop'], statDataIn = {}, timeRang
                 if stat == 'rate':
                     toRate = 1e3/(timeRange[1]-timeRange[0])
                     if includeRate0:
-                        rates = [spkinds.count(gid)*toRate for gid in cellGids] \
-                            if len(spkinds)>0 else [0]*len(cellGids) #cellGids] #set(spkinds)] 
+                        rates = cellStats['rate'].tolist()
                     else:
-                        rates = [spkinds.count(gid)*toRate for gid in set(spkinds)] \
-                            if len(spkinds)>0 else [0] #cellGids] #set(spkinds)] 
-
-                    statData.insert(0, rates)
+                        rates = cellStats['rate'][withSpikes].tolist() + [toRate]*len(netStimSpkts)
+                    statData.insert(0, rates if len(rates) > 0 else [0])
 
 
                 # Inter-spike interval (ISI) coefficient of variation (CV) stats
                 elif stat == 'isicv':
-                    import numpy as np
-                    spkmat = [[spkt for spkind,spkt in zip(spkinds,spkts) if spkind==gid] 
-                        for gid in set(spkinds)]
-                    isimat = [[t - s for s, t in zip(spks, spks[1:])] for spks in spkmat if len(spks)>10]
-                    isicv = [np.std(x) / np.mean(x) if len(x)>0 else 0 for x in isimat] # if len(x)>0] 
+                    isicv = cellStats['isicv'][cellStats['numSpikes'] > 10].tolist()
                     statData.insert(0, isicv) 
 
 
+                # local variation of ISIs, Fano factor and fraction of spikes in bursts
+                elif stat in ['lv', 'fano', 'burst']:
+                    values = cellStats['burstFraction' if stat == 'burst' else stat]
+                    statData.insert(0, values[~np.isnan(values)].tolist())
+
+
                 # synchrony
                 elif stat in ['sync', 'pairsync']:
                     try: 
@@ -868,8 +884,10 @@ def plotSpikeStats (include = ['allCells', 'eachPop'], statDataIn = {}, timeRang
                             to calculate synchrony (try: pip install pyspike)")
                         return 0
                     
-                    spkmat = [pyspike.SpikeTrain([spkt for spkind,spkt in zip(spkinds,spkts) 
-                        if spkind==gid], timeRange) for gid in set(spkinds)]
+                    spikeStore = _getSpikeStore()
+                    spkmat = [pyspike.SpikeTrain(spikeStore.getSpikes([gid], timeRange)[0].tolist(), timeRange) 
+                        for gid in cellStats['gid'][withSpikes].tolist()]
+                    spkmat += [pyspike.SpikeTrain([spkt], timeRange) for spkt in netStimSpkts]
                     if stat == 'sync':
                         # (SPIKE-Sync measure)' # see http://www.scholarpedia.org/article/Measures_of_spike_train_synchrony
                         syncMat = [pyspike.spike_sync(spkmat)]
@@ -1131,10 +1149,8 @@ def plotRatePSD (include = ['allCells', 'eachPop'], timeRange = None, binSize =
 
         # Select cells to include
         if len(cellGids) > 0:
-            try:
-                spkinds,spkts = list(zip(*[(spkgid,spkt) for spkgid,spkt in zip(sim.allSimData['spkid'],sim.allSimData['spkt']) if spkgid in cellGids]))
-            except:
-                spkinds,spkts = [],[]
+            spkts, spkinds = _getSpikeStore().getSpikes(cellGids)
+            spkts, spkinds = spkts.tolist(), spkinds.tolist()
         else: 
             spkinds,spkts = [],[]
 
@@ -1237,20 +1253,17 @@ def popAvgRates (trange = None, show = True):
         print('Error: sim.allSimData not available; please call sim.gatherData()')
         return None
 
-    spkts = sim.allSimData['spkt']
-    spkids = sim.allSimData['spkid']
+    spikeStore = _getSpikeStore()
 
     if not trange:
-        trange = [0, sim.cfg.duration]
-    else:
-        spkids,spkts = list(zip(*[(spkid,spkt) for spkid,spkt in zip(spkids,spkts) if trange[0] <= spkt <= trange[1]]))
+        trange = [sim.tstart, sim.cfg.duration]  # simulated time (from end of transient if warm started)
 
     avgRates = Dict()
     for pop in sim.net.allPops:
         numCells = float(len(sim.net.allPops[pop]['cellGids']))
         if numCells > 0:
             tsecs = float((trange[1]-trange[0]))/1000.0
-            avgRates[pop] = len([spkid for spkid in spkids if sim.net.allCells[int(spkid)]['tags']['pop']==pop])/numCells/tsecs
+            avgRates[pop] = spikeStore.numSpikes(spikeStore.popGids[pop], trange)/numCells/tsecs
             print('   %s : %.3f Hz'%(pop, avgRates[pop]))
 
     return avgRates
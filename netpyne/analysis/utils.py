@@ -175,6 +175,7 @@ def getCellsInclude(include):
 
     allCells = sim.net.allCells
     allNetStimLabels = list(sim.net.params.stimSourceParams.keys())
+    cellTagTable = _getAllCellsTagTable()
     cellGids = []
     cells = []
     netStimLabels = []
@@ -199,7 +200,7 @@ def getCellsInclude(include):
             if condition in allNetStimLabels:
                 netStimLabels.append(condition)
             else:
-                cellGids.extend([c['gid'] for c in allCells if c['tags']['pop']==condition])
+                cellGids.extend(cellTagTable.popGids(condition))
         
         # subset of a pop with relative indices
         # when load from json gets converted to list (added as exception)
@@ -207,11 +208,7 @@ def getCellsInclude(include):
         and len(condition)==2 
         and isinstance(condition[0], basestring) 
         and isinstance(condition[1], (list,int))):  
-            cellsPop = [c['gid'] for c in allCells if c['tags']['pop']==condition[0]]
-            if isinstance(condition[1], list):
-                cellGids.extend([gid for i,gid in enumerate(cellsPop) if i in condition[1]])
-            elif isinstance(condition[1], int):
-                cellGids.extend([gid for i,gid in enumerate(cellsPop) if i==condition[1]])
+            cellGids.extend(cellTagTable.popGids(condition[0], condition[1]))
 
         elif isinstance(condition, (list,tuple)):  # subset
             for subcond in condition:
@@ -222,15 +219,115 @@ def getCellsInclude(include):
                     if subcond in allNetStimLabels:
                         netStimLabels.append(subcond)
                     else:
-                        cellGids.extend([c['gid'] for c in allCells if c['tags']['pop']==subcond])
+                        cellGids.extend(cellTagTable.popGids(subcond))
 
     cellGids = sim.unique(cellGids)  # unique values
-    cells = [cell for cell in allCells if cell['gid'] in cellGids]
+    cellGidsSet = set(cellGids)
+    cells = [cell for cell in allCells if cell['gid'] in cellGidsSet]
     cells = sorted(cells, key=lambda k: k['gid'])
 
     return cells, cellGids, netStimLabels
 
 
+# -------------------------------------------------------------------------------------------------------------------
+## Get table with tags of all (gathered) cells; reused by all analysis functions until allCells changes
+# -------------------------------------------------------------------------------------------------------------------
+def _getAllCellsTagTable():
+    from .. import sim
+
+    allCells = sim.net.allCells
+    cellTagTable = getattr(sim.net, 'allCellTagTable', None)
+    if cellTagTable is None or cellTagTable.cells is not allCells or len(cellTagTable) != len(allCells):
+        cellTagTable = sim.CellTagTable({c['gid']: c['tags'] for c in allCells})
+        cellTagTable.cells = allCells  # to check table corresponds to current allCells
+        sim.net.allCellTagTable = cellTagTable
+    return cellTagTable
+
+
+# -------------------------------------------------------------------------------------------------------------------
+## Get indexed spikes of all (gathered) cells; reused by all analysis functions until allSimData spikes change
+# -------------------------------------------------------------------------------------------------------------------
+def _getSpikeStore():
+    from .. import sim
+    from .spikeStore import SpikeStore
+
+    spkt, spkid = sim.allSimData['spkt'], sim.allSimData['spkid']
+    spikeStore = getattr(sim, 'spikeStore', None)
+    if spikeStore is None or spikeStore.source is not spkt or len(spikeStore) != len(spkt):
+        popGids = {pop: popData['cellGids'] for pop, popData in sim.net.allPops.items()} if getattr(sim.net, 'allPops', None) else None
+        spikeStore = SpikeStore(spkt, spkid, popGids)
+        spikeStore.source = spkt  # to check store corresponds to current allSimData spikes
+        sim.spikeStore = spikeStore
+    return spikeStore
+
+
+# -------------------------------------------------------------------------------------------------------------------
+## Get sparse conn matrix of all (gathered) cells; reused by all connectivity analysis functions until allCells or conns change
+# -------------------------------------------------------------------------------------------------------------------
+def _getConnMatrix():
+    from .. import sim
+    from .connMatrix import ConnMatrix
+
+    allCells = sim.net.allCells
+    connMatrix = getattr(sim, 'connMatrix', None)
+    connVersion = getattr(sim.net, 'connVersion', 0)
+    if (connMatrix is None or connMatrix.source is not allCells or len(connMatrix.gids) != len(allCells) 
+            or connMatrix.connVersion != connVersion):
+        connFormat = sim.cfg.compactConnFormat
+        keys = [key for key in ['preGid', 'weight', 'delay', 'synMech', 'preLabel'] if not connFormat or key in connFormat]
+        connArrays = _getConnArrays(allCells, keys)
+        connMatrix = ConnMatrix(connArrays['preGid'], connArrays['postGid'], weight=connArrays.get('weight'), 
+            delay=connArrays.get('delay'), synMech=connArrays.get('synMech'), preLabel=connArrays.get('preLabel'), 
+            gids=[cell['gid'] for cell in allCells])
+        connMatrix.source = allCells  # to check matrix corresponds to current allCells
+        connMatrix.connVersion = connVersion  # and current conns (see connectCells, modifyConns)
+        sim.connMatrix = connMatrix
+    return connMatrix
+
+
+# -------------------------------------------------------------------------------------------------------------------
+## Get arrays with params of conns of a list of cells (preGid of NetStims = -1; label params as object arrays)
+# -------------------------------------------------------------------------------------------------------------------
+def _getConnArrays(cells, keys):
+    from .. import sim
+
+    allConns = getattr(sim.net, 'allConns', None)
+    if allConns is not None and all(isinstance(cell['conns'], sim.CellConns) and cell['conns'].table is allConns for cell in cells):
+        # read columns of ConnTable (see cfg.connTable)
+        rows = allConns.getRows([cell['gid'] for cell in cells])
+        connArrays = {'postGid': allConns.getColumn('postGid', rows)}
+        for key in keys:
+            if key in allConns.labelColumns:
+                connArrays[key] = np.array([None]+allConns.labels[key][1:], dtype=object)[allConns.getColumn(key, rows)]
+            else:
+                connArrays[key] = allConns.getColumn(key, rows)
+            for i, row in enumerate(rows.tolist()):  # params stored outside columns
+                if row in allConns.extra and key in allConns.extra[row]:
+                    connArrays[key][i] = allConns.extra[row][key]
+    else:
+        # conns in long (dict) or compact (list) format
+        connFormat = sim.cfg.compactConnFormat
+        indices = [connFormat.index(key) if connFormat else key for key in keys]
+        postGids = []
+        values = [[] for key in keys]
+        for cell in cells:
+            for conn in cell['conns']:
+                postGids.append(cell['gid'])
+                for i, index in enumerate(indices):
+                    values[i].append(conn.get(index) if isinstance(conn, dict) else conn[index])  # eg. preLabel only in NetStim conns
+        connArrays = {'postGid': np.array(postGids, dtype=int)}
+        for key, keyValues in zip(keys, values):
+            if key == 'preGid':
+                keyValues = [-1 if value == 'NetStim' else value for value in keyValues]
+                connArrays[key] = np.array(keyValues, dtype=int)
+            elif key in ['weight', 'delay', 'loc']:
+                connArrays[key] = np.array(keyValues, dtype=float)
+            else:
+                connArrays[key] = np.empty(len(keyValues), dtype=object)
+                connArrays[key][:] = keyValues
+    return connArrays
+
+
 # -------------------------------------------------------------------------------------------------------------------
 ## Get subset of cells and netstims indicated by include list
 # -------------------------------------------------------------------------------------------------------------------
@@ -296,7 +393,7 @@ def syncMeasure ():
     t0=-1 
     width=1 
     cnt=0
-    for spkt in sim.allSimData['spkt']:
+    for spkt in _getSpikeStore().spkt.tolist():
         if (spkt>=t0+width): 
             t0=spkt 
             cnt+=1
@@ -316,21 +413,16 @@ def invertDictMapping(d):
 
 
 # -------------------------------------------------------------------------------------------------------------------
-## Get subset of spkt, spkid based on a timeRange and cellGids list; ~10x speedup over list iterate
+## Get subset of spkt, spkid based on a timeRange and cellGids list (using indexed SpikeStore)
 # -------------------------------------------------------------------------------------------------------------------
 def getSpktSpkid(cellGids=[], timeRange=None, allCells=False):
     '''return spike ids and times; with allCells=True just need to identify slice of time so can omit cellGids'''
     import pandas as pd
-    from .. import sim
-    df = pd.DataFrame(pd.lib.to_object_array([sim.allSimData['spkt'], sim.allSimData['spkid']]).transpose(), columns=['spkt', 'spkid'])
-    if timeRange:
-        min, max = [int(df['spkt'].searchsorted(timeRange[i])) for i in range(2)] # binary search faster than query
-    else: # timeRange None or empty list means all times
-        min, max = 0, len(df)
     if len(cellGids)==0 or allCells: # get all by either using flag or giving empty list -- can get rid of the flag
-        sel = df[min:max]
+        spkts, spkids = _getSpikeStore().getSpikes(timeRange=timeRange)
     else:
-        sel = df[min:max].query('spkid in @cellGids')
-    return sel, sel['spkt'].tolist(), sel['spkid'].tolist() # will want to return sel as well for further sorting
+        spkts, spkids = _getSpikeStore().getSpikes(cellGids, timeRange=timeRange)
+    sel = pd.DataFrame({'spkt': spkts, 'spkid': spkids}, columns=['spkt', 'spkid'])
+    return sel, spkts.tolist(), spkids.tolist() # will want to return sel as well for further sorting
 
 
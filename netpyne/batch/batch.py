@@ -32,6 +32,7 @@ from neuron import h
 from copy import copy
 from netpyne import specs
 from .utils import bashTemplate
+from .pool import JobPool
 from random import Random
 from time import sleep, time
 from itertools import product
@@ -100,7 +101,7 @@ def tupleToStr (obj):
 # -------------------------------------------------------------------------------
 class Batch(object):
 
-    def __init__(self, cfgFile='cfg.py', netParamsFile='netParams.py', params=None, groupedParams=None, initCfg={}, seed=None):
+    def __init__(self, cfgFile='cfg.py', netParamsFile='netParams.py', params=None, groupedParams=None, initCfg={}, seed=None, warmStartParams=None):
         self.batchLabel = 'batch_'+str(datetime.date.today())
         self.cfgFile = cfgFile
         self.initCfg = initCfg
@@ -109,6 +110,7 @@ class Batch(object):
         self.method = 'grid'
         self.runCfg = {}
         self.evolCfg = {}
+        self.warmStartCfg = {}
         self.params = []
         self.seed = seed
         if params:
@@ -117,6 +119,9 @@ class Batch(object):
         if groupedParams:
             for p in self.params:
                 if p['label'] in groupedParams: p['group'] = True
+        if warmStartParams:
+            for p in self.params:
+                if p['label'] in warmStartParams: p['warmStart'] = True
     
 
     def save(self, filename):
@@ -129,7 +134,7 @@ class Batch(object):
         # make dir
         createFolder(folder)
 
-        odict = deepcopy(self.__dict__)
+        odict = deepcopy({k: v for k, v in self.__dict__.items() if k != 'jobPool'})
         if 'evolCfg' in odict:
             odict['evolCfg']['fitnessFunc'] = 'removed'
         dataSave = {'batch': tupleToStr(odict)} 
@@ -153,6 +158,96 @@ class Batch(object):
             setattr(self.cfg, paramLabel, paramVal) # set simConfig params
 
 
+    def getCfgNestedParam(self, paramLabel):
+        if isinstance(paramLabel, tuple):
+            container = self.cfg
+            for ip in range(len(paramLabel)):
+                if isinstance(container, specs.SimConfig):
+                    container = getattr(container, paramLabel[ip])
+                else:
+                    container = container[paramLabel[ip]]
+            return container
+        else:
+            return getattr(self.cfg, paramLabel)
+
+
+    def isWarmStartParam(self, paramLabel):
+        ''' Returns True if param is compatible with warm start, ie. it only changes values that modifyConns and
+        modifySynMechs can set (eg. conn weights or synMech time constants) and not the network or initial state '''
+        return any([p['label'] == paramLabel and p.get('warmStart', False) for p in self.params])
+
+
+    def setupWarmStart(self):
+        ''' Keeps the values of the cfg params compatible with warm start in the cfg file (and initCfg), used in the
+        base simulations that run the transient of the jobs '''
+        self.warmStartBaseValues = {}
+        self.warmStartDirs = {}
+        for p in self.params:
+            if p.get('warmStart', False):
+                try:
+                    self.warmStartBaseValues[p['label']] = copy(self.getCfgNestedParam(p['label']))
+                except (AttributeError, KeyError):
+                    print('  Warning: %s not in cfg, so base simulations for warm start will use the value of the first job' % (str(p['label'])))
+
+
+    def prepareWarmStart(self, netParamsSavePath):
+        ''' Returns folder with state at the end of the transient (warmStartCfg['transient'], ms) for the job with the
+        current cfg, to set as its cfg.warmStartDir. The state is saved by a base simulation of the transient, run
+        locally (with the same number of cores as the jobs) the first time each combination of values of params not
+        compatible with warm start is found, with the params compatible with warm start set to their values in the cfg
+        file. Returns None (ie. job simulates the transient) if the base simulation fails '''
+        import os
+
+        transient = self.warmStartCfg['transient']
+        if self.cfg.duration <= transient:
+            print('  Warning: duration (%s ms) not longer than warm start transient (%s ms), so job is not warm started' % (self.cfg.duration, transient))
+            return None
+
+        baseKey = str([(p['label'], self.getCfgNestedParam(p['label'])) for p in self.params if not p.get('warmStart', False)] + [('duration', transient)])
+        if baseKey in self.warmStartDirs:
+            return self.warmStartDirs[baseKey]
+
+        baseLabel = self.batchLabel+'_warmStart_%d' % (len(self.warmStartDirs))
+        stateDir = self.saveFolder+'/'+baseLabel+'_state'
+        if not (self.warmStartCfg.get('skip', True) and os.path.isfile(stateDir+'/checkpoint.json')):
+            # base cfg: simulate transient and save state, without saving output or analysis
+            baseValues = {'simLabel': baseLabel, 'saveFolder': self.saveFolder, 'filename': self.saveFolder+'/'+baseLabel,
+                'duration': transient, 'saveStateDir': stateDir, 'warmStartDir': None, 'checkpointInterval': None,
+                'streamOutput': None, 'analysis': {}}
+            for saveOption in ['savePickle', 'saveJson', 'saveMat', 'saveCSV', 'saveDpk', 'saveHDF5', 'saveDat', 'saveNpy']:
+                if getattr(self.cfg, saveOption, False): baseValues[saveOption] = False
+            baseValues.update(self.warmStartBaseValues)
+            jobValues = {paramLabel: self.getCfgNestedParam(paramLabel) for paramLabel in baseValues}
+            for paramLabel, paramVal in baseValues.items():
+                self.setCfgNestedParam(paramLabel, paramVal)
+            baseCfgSavePath = self.saveFolder+'/'+baseLabel+'_cfg.json'
+            self.cfg.save(baseCfgSavePath)
+            for paramLabel, paramVal in jobValues.items():
+                self.setCfgNestedParam(paramLabel, paramVal)
+
+            # run base simulation with same number of nodes as jobs (NEURON state is saved per node)
+            script = self.warmStartCfg.get('script', self.runCfg.get('script', 'init.py'))
+            mpiCommand = self.warmStartCfg.get('mpiCommand', self.runCfg.get('mpiCommand', 'mpiexec'))
+            if self.runCfg.get('type', None) == 'mpi_bulletin':  # jobs run in 1 core (see runJob)
+                command = 'nrniv %s simConfig=%s netParams=%s' % (script, baseCfgSavePath, netParamsSavePath)
+            else:
+                if self.runCfg.get('type', None) == 'local_pool':
+                    cores = self.runCfg.get('coresPerJob', 1)
+                else:
+                    cores = self.runCfg.get('cores', self.runCfg.get('nodes', 1) * self.runCfg.get('coresPerNode', self.runCfg.get('ppn', 1)))
+                command = '%s -np %d nrniv -python -mpi %s simConfig=%s netParams=%s' % (mpiCommand, cores, script, baseCfgSavePath, netParamsSavePath)
+            print('Running base simulation %s of %s ms for warm start' % (baseLabel, transient))
+            print(command+'\n')
+            with open(self.saveFolder+'/'+baseLabel+'.run', 'w') as outf, open(self.saveFolder+'/'+baseLabel+'.err', 'w') as errf:
+                exitCode = Popen(command.split(' '), stdout=outf, stderr=errf).wait()
+            if exitCode != 0 or not os.path.isfile(stateDir+'/checkpoint.json'):
+                print('  Warning: base simulation %s failed (exit code %d; see %s.err), so jobs are not warm started' % (baseLabel, exitCode, self.saveFolder+'/'+baseLabel))
+                stateDir = None
+
+        self.warmStartDirs[baseKey] = stateDir
+        return stateDir
+
+
     def saveScripts(self):
         import os
 
@@ -192,6 +287,29 @@ class Batch(object):
         self.cfg.checkErrors = False  # avoid error checking during batch
 
 
+    def createJobPool(self):
+        ''' Creates pool to run jobs as local processes (runCfg type 'local_pool'), with at most runCfg['cores']
+        (default: all cores) used by runCfg['coresPerJob'] x running jobs '''
+        self.jobPool = JobPool(cores=self.runCfg.get('cores', None),
+                               coresPerJob=self.runCfg.get('coresPerJob', 1),
+                               maxRetries=self.runCfg.get('maxRetries', 0),
+                               statusFile=self.saveFolder+'/'+self.batchLabel+'_jobs.json',
+                               pollInterval=self.runCfg.get('pollInterval', 1),
+                               progressInterval=self.runCfg.get('progressInterval', 60))
+
+
+    def submitPoolJob(self, jobName, cfgSavePath, netParamsSavePath):
+        ''' Submits job to the local job pool (with MPI if runCfg['coresPerJob'] > 1) '''
+        script = self.runCfg.get('script', 'init.py')
+        coresPerJob = self.runCfg.get('coresPerJob', 1)
+        if coresPerJob > 1:
+            mpiCommand = self.runCfg.get('mpiCommand', 'mpiexec')
+            command = '%s -np %d nrniv -python -mpi %s simConfig=%s netParams=%s' % (mpiCommand, coresPerJob, script, cfgSavePath, netParamsSavePath)
+        else:
+            command = 'nrniv -python %s simConfig=%s netParams=%s' % (script, cfgSavePath, netParamsSavePath)
+        self.jobPool.submit(jobName, command, outFile=jobName+'.run', errFile=jobName+'.err')
+
+
     def openFiles2SaveStats(self):
         stat_file_name = '%s/%s_stats.cvs' %(self.saveFolder, self.batchLabel)
         ind_file_name = '%s/%s_stats_indiv.cvs' %(self.saveFolder, self.batchLabel)
@@ -238,6 +356,9 @@ class Batch(object):
                 for paramLabel, paramVal in self.initCfg.items():
                     self.setCfgNestedParam(paramLabel, paramVal)
 
+            if self.warmStartCfg:
+                self.setupWarmStart()
+
             # iterate over all param combinations
             if self.method == 'grid':
                 groupedParams = False
@@ -273,6 +394,10 @@ class Batch(object):
                 for iworker in range(int(pc.nhost())):
                     pc.runworker()
 
+            # if using local job pool, create pool
+            if self.runCfg.get('type', None) == 'local_pool':
+                self.createJobPool()
+
             for iCombG, pCombG in zip(indexCombGroups, valueCombGroups):
                 for iCombNG, pCombNG in zip(indexCombinations, valueCombinations):
                     if groupedParams and ungroupedParams: # temporary hack - improve
@@ -311,6 +436,8 @@ class Batch(object):
                         # save simConfig json to saveFolder                        
                         self.cfg.simLabel = simLabel
                         self.cfg.saveFolder = self.saveFolder
+                        if self.warmStartCfg:
+                            self.cfg.warmStartDir = self.prepareWarmStart(netParamsSavePath)
                         cfgSavePath = self.saveFolder+'/'+simLabel+'_cfg.json'
                         self.cfg.save(cfgSavePath)
                         
@@ -440,17 +567,30 @@ wait
                             print('Submitting job ',jobName)
                             # master/slave bulletin board schedulling of jobs
                             pc.submit(runJob, self.runCfg.get('script', 'init.py'), cfgSavePath, netParamsSavePath)
+
+                        # local job pool (bounded by number of cores)
+                        # eg. usage: python batch.py
+                        elif self.runCfg.get('type',None) == 'local_pool':
+                            self.submitPoolJob(jobName, cfgSavePath, netParamsSavePath)
                         
                         else:
-                            print("Error: invalid runCfg 'type' selected; valid types are 'mpi_bulletin', 'mpi_direct', 'hpc_slurm', 'hpc_torque'")
+                            print("Error: invalid runCfg 'type' selected; valid types are 'mpi_bulletin', 'mpi_direct', 'hpc_slurm', 'hpc_torque', 'local_pool'")
                             import sys
                             sys.exit(0)
                 
-                    sleep(1) # avoid saturating scheduler
+                    if self.runCfg.get('type',None) != 'local_pool':
+                        sleep(1) # avoid saturating scheduler
             print("-"*80)
             print("   Finished submitting jobs for grid parameter exploration   ")
             print("-"*80)
 
+            # wait for jobs of local job pool
+            if self.runCfg.get('type', None) == 'local_pool':
+                self.jobPool.wait()
+                print("-"*80)
+                print("   Completed grid parameter exploration   ")
+                print("-"*80)
+
 
         # -------------------------------------------------------------------------------
         # Evolutionary optimization
@@ -469,7 +609,7 @@ wait
                 ngen += 1
                 total_jobs = 0
 
-                # options slurm, mpi
+                # options slurm, mpi, local_pool
                 type = args.get('type', 'mpi_direct')
                 
                 # paths to required scripts
@@ -524,6 +664,8 @@ wait
                     #self.setCfgNestedParam("filename", jobPath)
                     self.cfg.simLabel = jobName
                     self.cfg.saveFolder = genFolderPath
+                    if self.warmStartCfg:
+                        self.cfg.warmStartDir = self.prepareWarmStart(netParamsSavePath)
 
                     # save cfg instance to file
                     cfgSavePath = jobPath + '_cfg.json' 
@@ -537,6 +679,13 @@ wait
                         pc.submit(runEvolJob, script, cfgSavePath, netParamsSavePath, jobPath)
                         print('-'*80)
 
+                    elif type=='local_pool':
+                        # ----------------------------------------------------------------------
+                        # local job pool (bounded by number of cores)
+                        # ----------------------------------------------------------------------
+                        self.submitPoolJob(jobPath, cfgSavePath, netParamsSavePath)
+                        print('-'*80)
+
                     else:
                         # ----------------------------------------------------------------------
                         # MPI job commnand
@@ -610,6 +759,16 @@ wait
                 num_iters = 0
                 jobs_completed = 0
                 fitness = [None for cand in candidates]
+
+                if type == 'local_pool':
+                    # wait for jobs of local job pool; failed jobs set to default fitness
+                    self.jobPool.wait()
+                    for candidate_index in range(len(candidates)):
+                        jobPath = genFolderPath + "/gen_" + str(ngen) + "_cand_" + str(candidate_index)
+                        if self.jobPool.jobs[jobPath]['status'] == 'failed':
+                            fitness[candidate_index] = defaultFitness
+                            jobs_completed += 1
+                            print('  Candidate %d failed, fitness set to default = %.1f' % (candidate_index, defaultFitness))
                 # print outfilestem
                 print("Waiting for jobs from generation %d/%d ..." %(ngen, args.get('max_generations')))
                 # print "PID's: %r" %(pids)
@@ -724,6 +883,9 @@ wait
             file_handler.setFormatter(formatter)
             logger.addHandler(file_handler)    
 
+            if self.warmStartCfg:
+                self.setupWarmStart()
+
             # create randomizer instance
             rand = Random()
             rand.seed(self.seed) 
@@ -753,6 +915,10 @@ wait
                 for iworker in range(int(pc.nhost())):
                     pc.runworker()
 
+            # if using local job pool, create pool (used by all generations)
+            if self.runCfg.get('type', None) == 'local_pool':
+                self.createJobPool()
+
             ####################################################################
             #                       Evolution strategy
             ####################################################################
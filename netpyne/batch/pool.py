@@ -0,0 +1,162 @@
+"""
+batch/pool.py
+
+Class to run batch jobs as local processes with a core budget (runCfg type 'local_pool')
+
+Contributors: salvadordura@gmail.com
+"""
+from __future__ import print_function
+from __future__ import unicode_literals
+from __future__ import division
+from __future__ import absolute_import
+
+from builtins import open
+from builtins import str
+from future import standard_library
+standard_library.install_aliases()
+
+import json
+from time import sleep, time
+from collections import OrderedDict
+from subprocess import Popen
+
+
+###############################################################################
+#
+# JOB POOL CLASS
+#
+###############################################################################
+
+class JobPool (object):
+    ''' Runs job commands as local processes, queued and started when there are free cores, so that coresPerJob x
+    running jobs <= cores. Keeps the status ('queued', 'running', 'done' or 'failed'), exit codes, start time and
+    duration of each job, retries failed jobs up to maxRetries times, and saves the status of all jobs to statusFile
+    (JSON) each time it changes '''
+
+    def __init__ (self, cores=None, coresPerJob=1, maxRetries=0, statusFile=None, pollInterval=1, progressInterval=60):
+        if not cores:
+            import multiprocessing
+            cores = multiprocessing.cpu_count()
+        if coresPerJob > cores:
+            raise Exception('Job pool: coresPerJob (%d) larger than number of cores available (%d)' % (coresPerJob, cores))
+        self.cores = cores
+        self.coresPerJob = coresPerJob
+        self.maxJobs = cores // coresPerJob  # max number of concurrent jobs
+        self.maxRetries = maxRetries
+        self.statusFile = statusFile
+        self.pollInterval = pollInterval
+        self.progressInterval = progressInterval
+        self.jobs = OrderedDict()
+        self.queue = []
+        self.running = {}  # label: Popen of running jobs
+        self.startTime = None
+        print('Job pool: %d cores, %d cores per job, up to %d concurrent jobs' % (self.cores, self.coresPerJob, self.maxJobs))
+
+
+    def submit (self, label, command, outFile=None, errFile=None):
+        ''' Adds job to queue (stdout and stderr saved to outFile and errFile) and starts it if there are free cores '''
+        if label in self.jobs and self.jobs[label]['status'] in ['queued', 'running']:
+            print('Job pool: job %s already queued or running' % (label))
+            return
+        self.jobs[label] = {'command': command, 'outFile': outFile, 'errFile': errFile, 'status': 'queued', 'attempts': 0,
+            'exitCodes': [], 'start': None, 'time': None}
+        self.queue.append(label)
+        if self.startTime is None: self.startTime = time()
+        self.poll()
+
+
+    def _start (self, label):
+        job = self.jobs[label]
+        job['status'], job['start'], job['attempts'] = 'running', time(), job['attempts'] + 1
+        print('Job pool: starting job %s (attempt %d)' % (label, job['attempts']))
+        print(job['command']+'\n')
+        with open(job['outFile'] or '/dev/null', 'w') as outf, open(job['errFile'] or '/dev/null', 'w') as errf:
+            self.running[label] = Popen(job['command'].split(' '), stdout=outf, stderr=errf)
+        job['pid'] = self.running[label].pid
+
+
+    def poll (self):
+        ''' Updates status of running jobs (retrying failed ones) and starts queued jobs while there are free cores;
+        returns number of jobs queued or running '''
+        changed = False
+        for label, proc in list(self.running.items()):
+            exitCode = proc.poll()
+            if exitCode is None: continue
+            job = self.jobs[label]
+            del self.running[label]
+            job['exitCodes'].append(exitCode)
+            job['time'] = time() - job['start']
+            if exitCode == 0:
+                job['status'] = 'done'
+            elif job['attempts'] <= self.maxRetries:
+                print('Job pool: job %s failed (exit code %d), retrying' % (label, exitCode))
+                job['status'] = 'queued'
+                self.queue.append(label)
+            else:
+                print('Job pool: job %s failed (exit code %d) after %d attempts; see %s' % (label, exitCode, job['attempts'], job['errFile']))
+                job['status'] = 'failed'
+            changed = True
+
+        while self.queue and len(self.running) < self.maxJobs:
+            self._start(self.queue.pop(0))
+            changed = True
+
+        if changed: self.saveStatus()
+        return len(self.queue) + len(self.running)
+
+
+    def wait (self):
+        ''' Waits until all jobs finish, printing the progress every progressInterval seconds; running jobs are
+        terminated if interrupted (eg. Ctrl+C) '''
+        lastProgress = time()
+        try:
+            while self.poll() > 0:
+                if time() - lastProgress >= self.progressInterval:
+                    self.printProgress()
+                    lastProgress = time()
+                sleep(self.pollInterval)
+        except KeyboardInterrupt:
+            self.terminate()
+            raise
+        self.printProgress()
+
+
+    def terminate (self):
+        for label, proc in self.running.items():
+            proc.terminate()
+            self.jobs[label]['status'] = 'failed'
+        self.running = {}
+        self.saveStatus()
+
+
+    def summary (self):
+        ''' Returns dict with number of jobs of each status, mean duration of finished jobs and elapsed and estimated
+        remaining time (s) '''
+        summary = {status: 0 for status in ['queued', 'running', 'done', 'failed']}
+        for job in self.jobs.values():
+            summary[job['status']] += 1
+        summary['total'] = len(self.jobs)
+        times = [job['time'] for job in self.jobs.values() if job['status'] == 'done']
+        summary['meanJobTime'] = sum(times) / len(times) if times else None
+        summary['elapsed'] = time() - self.startTime if self.startTime else 0
+        remaining = summary['queued'] + summary['running']
+        summary['remaining'] = (summary['meanJobTime'] * remaining / min(self.maxJobs, remaining)) if (times and remaining) else None
+        return summary
+
+
+    def printProgress (self):
+        summary = self.summary()
+        progress = 'Job pool: %d/%d done, %d failed, %d running, %d queued; elapsed %.0f s' % (summary['done'],
+            summary['total'], summary['failed'], summary['running'], summary['queued'], summary['elapsed'])
+        if summary['meanJobTime'] is not None:
+            progress += '; mean job time %.0f s' % (summary['meanJobTime'])
+        if summary['remaining'] is not None:
+            progress += '; ~%.0f s remaining' % (summary['remaining'])
+        print(progress)
+
+
+    def saveStatus (self):
+        if self.statusFile:
+            status = {'summary': self.summary(), 'jobs': self.jobs}
+            with open(self.statusFile, 'w') as fileObj:
+                fileObj.write(str(json.dumps(status, indent=4)))
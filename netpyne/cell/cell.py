@@ -40,7 +40,7 @@ class Cell (object):
 
         self.gid = gid  # global cell id 
         self.tags = tags  # dictionary of cell tags/attributes 
-        self.conns = []  # list of connections
+        self.conns = sim.net._getConnTable().cellConns(gid) if sim.cfg.connTable else []  # list of connections
         self.stims = []  # list of stimuli
 
         # calculate border distance correction to avoid conn border effect
@@ -127,6 +127,13 @@ class Cell (object):
         return stimvecs  
 
 
+    def addConns (self, paramsList, netStimParams=None):
+        ''' Add list of conns to cell in one call (batched version of addConn, eg. all conns of a conn rule that target 
+        this cell); conns are added in the order of the list, and synMechs already in the cell are reused '''
+        for params in paramsList:
+            self.addConn(params, netStimParams)
+
+
     def addNetStim (self, params, stimContainer=None):
         from .. import sim
 
@@ -135,6 +142,9 @@ class Cell (object):
             stimContainer = self.stims[-1]
 
             if sim.cfg.verbose: print(('  Created %s NetStim for cell gid=%d'% (params['source'], self.gid)))
+
+        if params.get('pool'):
+            return self._addPoolNetStim(params, stimContainer)
         
         if sim.cfg.createNEURONObj:
             rand = h.Random()
@@ -162,36 +172,34 @@ class Cell (object):
             return stimContainer['hObj']
 
 
+    def _addPoolNetStim (self, params, stimContainer):
+        ''' Connects stim to one of the params['pool'] NetStims shared by all targets of the stim source (instead of
+        creating a NetStim and Random for each synapse); the stream is picked deterministically from the cell gid and 
+        stim seed (Random123), and kept in stimContainer['poolStream'] so the same stream is used when loading '''
+        from .. import sim
+
+        if stimContainer.get('poolStream') is None:
+            numPicks = sum(1 for stim in self.stims if stim.get('source') == params['source'] and stim.get('poolStream') is not None)
+            rand = sim.net.rand
+            rand.Random123(sim.hashStr('poolStream_'+params['source']), self.gid, params['seed'])
+            stream = rand.discunif(0, int(params['pool'])-1)
+            for i in range(numPicks):  # previous picks used by other synapses of the cell
+                stream = rand.repick()
+            stimContainer['poolStream'] = int(stream)
+
+        if sim.cfg.createNEURONObj:
+            pool = sim.net._getStimPool(params, self)
+            stimContainer['hObj'] = pool[stimContainer['poolStream']]['hObj']  # shared NetStim (randomizer kept in pool)
+
+            return stimContainer['hObj']
+
+
     def recordTraces (self):
         from .. import sim
 
         # set up voltagse recording; recdict will be taken from global context
         for key, params in sim.cfg.recordTraces.items():
-            
-            conditionsMet = 1
-            
-            if 'conds' in params:
-                for (condKey,condVal) in params['conds'].items():  # check if all conditions are met
-                    # choose what to comapare to 
-                    if condKey in ['gid']:  # CHANGE TO GID
-                        compareTo = self.gid
-                    else:
-                        compareTo = self.tags[condKey]
-
-                    # check if conditions met
-                    if isinstance(condVal, list) and isinstance(condVal[0], Number):
-                        if compareTo < condVal[0] or compareTo > condVal[1]:
-                            conditionsMet = 0
-                            break
-                    elif isinstance(condVal, list) and isinstance(condVal[0], basestring):
-                        if compareTo not in condVal:
-                            conditionsMet = 0
-                            break 
-                    elif compareTo != condVal: 
-                        conditionsMet = 0
-                        break
-                        
-            if conditionsMet:
+            if self._recordTraceConds(params):
                 try:
                     ptr = None
                     if 'loc' in params and params['sec'] in self.secs:
@@ -199,8 +207,7 @@ class Cell (object):
                             ptr = getattr(getattr(self.secs[params['sec']]['hObj'](params['loc']), params['mech']), '_ref_'+params['var'])
                             #print params['var'], ptr
                         elif 'synMech' in params:  # eg. soma(0.5).AMPA._ref_g
-                            sec = self.secs[params['sec']]
-                            synMech = next((synMech for synMech in sec['synMechs'] if synMech['label']==params['synMech'] and synMech['loc']==params['loc']), None)
+                            synMech = self.getSynMech(params['sec'], params['synMech'], params['loc'])
                             ptr = getattr(synMech['hObj'], '_ref_'+params['var'])
                         else:  # eg. soma(0.5)._ref_v
                             ptr = getattr(self.secs[params['sec']]['hObj'](params['loc']), '_ref_'+params['var'])
@@ -244,11 +251,41 @@ class Cell (object):
 
 
 
+    def _recordTraceConds (self, params):
+        ''' Returns 1 if cell meets the conds of trace params (see cfg.recordTraces), 0 otherwise '''
+        conditionsMet = 1
+        
+        if 'conds' in params:
+            for (condKey,condVal) in params['conds'].items():  # check if all conditions are met
+                # choose what to comapare to 
+                if condKey in ['gid']:  # CHANGE TO GID
+                    compareTo = self.gid
+                else:
+                    compareTo = self.tags[condKey]
+
+                # check if conditions met
+                if isinstance(condVal, list) and isinstance(condVal[0], Number):
+                    if compareTo < condVal[0] or compareTo > condVal[1]:
+                        conditionsMet = 0
+                        break
+                elif isinstance(condVal, list) and isinstance(condVal[0], basestring):
+                    if compareTo not in condVal:
+                        conditionsMet = 0
+                        break 
+                elif compareTo != condVal: 
+                    conditionsMet = 0
+                    break
+
+        return conditionsMet
+
+
     def __getstate__ (self): 
         ''' Removes non-picklable h objects so can be pickled and sent via py_alltoall'''
         from .. import sim
 
         odict = self.__dict__.copy() # copy the dict since we change it
+        if isinstance(self.conns, sim.CellConns):
+            odict['conns'] = []  # conns stored in ConnTable are gathered as columns (see sim.gatherData)
         odict = sim.copyRemoveItemObj(odict, keystart='h') #, newval=None)  # replace h objects with None so can be pickled
         odict = sim.copyReplaceItemObj(odict, keystart='NeuroML', newval='---Removed_NeuroML_obj---')  # replace NeuroML objects with str so can be pickled
         return odict
@@ -30,7 +30,7 @@ from neuron import h # Import NEURON
 import numpy as np
 from math import sin, cos
 from .cell import Cell
-from ..specs import Dict
+from ..specs import Dict, FrozenDict
 
 
 ###############################################################################
@@ -45,11 +45,14 @@ h("dp_total_L2 = 0."); h("dp_total_L5 = 0.") # put here since these variables us
 
 class CompartCell (Cell):
     ''' Class for section-based neuron models '''
+
+    __slots__ = ['_synMechIndex']  # not in __dict__, so not included when gathering or saving cells (nor pickled; see _getSynMechIndex)
     
     def __init__ (self, gid, tags, create=True, associateGid=True):
         super(CompartCell, self).__init__(gid, tags)
         self.secs = Dict()  # dict of sections
         self.secLists = Dict()  # dict of sectionLists
+        self._synMechIndex = {}  # index of synMechs of each section (see getSynMech)
 
         if create: self.create()  # create cell 
         if associateGid: self.associateGid() # register cell for this node
@@ -67,28 +70,20 @@ class CompartCell (Cell):
             rand.Random123(self.gid)
             self.randRotationAngle = rand.uniform(0, 6.2832)  # 0 to 2pi
 
+        propLabels = _matchCellRules(self.tags)  # labels of cellParams rules with conds met by cell tags
+        if sim.cfg.includeParamsLabel:
+            for propLabel in propLabels:
+                if 'label' not in self.tags:
+                    self.tags['label'] = [propLabel] # create list of property sets
+                else:
+                    self.tags['label'].append(propLabel)  # add label of cell property set to list of property sets for this cell
 
-        for propLabel, prop in sim.net.params.cellParams.items():  # for each set of cell properties
-            conditionsMet = 1
-            for (condKey,condVal) in prop['conds'].items():  # check if all conditions are met
-                if isinstance(condVal, list): 
-                    if isinstance(condVal[0], Number):
-                        if self.tags.get(condKey) < condVal[0] or self.tags.get(condKey) > condVal[1]:
-                            conditionsMet = 0
-                            break
-                    elif isinstance(condVal[0], basestring):
-                        if self.tags.get(condKey) not in condVal:
-                            conditionsMet = 0
-                            break 
-                elif self.tags.get(condKey) != condVal: 
-                    conditionsMet = 0
-                    break
-            if conditionsMet:  # if all conditions are met, set values for this cell
-                if sim.cfg.includeParamsLabel:
-                    if 'label' not in self.tags:
-                        self.tags['label'] = [propLabel] # create list of property sets
-                    else:
-                        self.tags['label'].append(propLabel)  # add label of cell property set to list of property sets for this cell
+        prototype = _getCellPrototype(propLabels) if sim.cfg.cellPrototypes and sim.cfg.createPyStruct else None
+        if prototype:  # share python struct of cell type and create NEURON objects from its recipe
+            self.createFromPrototype(prototype)
+        else:
+            for propLabel in propLabels:  # for each set of cell properties with conditions met, set values for this cell
+                prop = sim.net.params.cellParams[propLabel]
                 if sim.cfg.createPyStruct:
                     self.createPyStruct(prop)
                 if sim.cfg.createNEURONObj:
@@ -127,101 +122,52 @@ class CompartCell (Cell):
     def createPyStruct (self, prop):
         from .. import sim
 
-        # set params for all sections
-        for sectName,sectParams in prop['secs'].items(): 
-            # create section
-            if sectName not in self.secs:
-                self.secs[sectName] = Dict()  # create section dict
-            sec = self.secs[sectName]  # pointer to section
-            
-            # add distributed mechanisms 
-            if 'mechs' in sectParams:
-                for mechName,mechParams in sectParams['mechs'].items(): 
-                    if 'mechs' not in sec:
-                        sec['mechs'] = Dict()
-                    if mechName not in sec['mechs']: 
-                        sec['mechs'][mechName] = Dict()  
-                    for mechParamName,mechParamValue in mechParams.items():  # add params of the mechanism
-                        sec['mechs'][mechName][mechParamName] = mechParamValue
-            
-            # add ion info 
-            if 'ions' in sectParams:
-                for ionName,ionParams in sectParams['ions'].items(): 
-                    if 'ions' not in sec:
-                        sec['ions'] = Dict()
-                    if ionName not in sec['ions']: 
-                        sec['ions'][ionName] = Dict()  
-                    for ionParamName,ionParamValue in ionParams.items():  # add params of the ion
-                        sec['ions'][ionName][ionParamName] = ionParamValue
-
+        self.unshareSecs()
+        rotationAngle = self.randRotationAngle if sim.net.params.rotateCellsRandomly == True else None
+        _addSecParams(self.secs, self.secLists, prop, gid=self.gid, rotationAngle=rotationAngle)
 
-            # add synMechs
+        # add synMechs
+        for sectName,sectParams in prop['secs'].items(): 
             if 'synMechs' in sectParams:
                 for synMech in sectParams['synMechs']:
                     if 'label' in synMech and 'loc' in synMech:
                         self.addSynMech(synLabel=synMech['label'], secLabel=sectName, loc=synMech['loc'])
 
-            # add point processes
-            if 'pointps' in sectParams:
-                for pointpName,pointpParams in sectParams['pointps'].items(): 
-                    #if self.tags['cellModel'] == pointpName: # only required if want to allow setting various cell models in same rule
-                    if 'pointps' not in sec:
-                        sec['pointps'] = Dict()
-                    if pointpName not in sec['pointps']: 
-                        sec['pointps'][pointpName] = Dict()  
-                    for pointpParamName,pointpParamValue in pointpParams.items():  # add params of the mechanism
-                        if pointpParamValue == 'gid': 
-                            pointpParamValue = self.gid
-                        sec['pointps'][pointpName][pointpParamName] = pointpParamValue
-
 
-            # add geometry params 
-            if 'geom' in sectParams:
-                for geomParamName,geomParamValue in sectParams['geom'].items():  
-                    if 'geom' not in sec:
-                        sec['geom'] = Dict()
-                    if not type(geomParamValue) in [list, dict]:  # skip any list or dic params
-                        sec['geom'][geomParamName] = geomParamValue
-
-                # add 3d geometry
-                if 'pt3d' in sectParams['geom']:
-                    if 'pt3d' not in sec['geom']:  
-                        sec['geom']['pt3d'] = []
-                    for ipt, pt3d in enumerate(sectParams['geom']['pt3d']):
-                        if sim.net.params.rotateCellsRandomly == True:
-                            """Rotate the cell about the Z axis."""
-                            x = pt3d[0]
-                            z = pt3d[2]
-                            c = cos(self.randRotationAngle)
-                            s = sin(self.randRotationAngle)
-                            pt3d = (x * c - z * s, pt3d[1], x * s + z * c, pt3d[3])
-                            sectParams['geom']['pt3d'][ipt] = pt3d
-
-                        sec['geom']['pt3d'].append(pt3d)
-
-            # add topolopgy params
-            if 'topol' in sectParams:
-                if 'topol' not in sec:
-                    sec['topol'] = Dict()
-                for topolParamName,topolParamValue in sectParams['topol'].items(): 
-                    sec['topol'][topolParamName] = topolParamValue
-
-            # add other params
-            if 'spikeGenLoc' in sectParams:
-                sec['spikeGenLoc'] = sectParams['spikeGenLoc']
-
-            if 'vinit' in sectParams:
-                sec['vinit'] = sectParams['vinit']
-
-            if 'weightNorm' in sectParams:
-                sec['weightNorm'] = sectParams['weightNorm']
-
-            if 'threshold' in sectParams:
-                sec['threshold'] = sectParams['threshold']
+    def createFromPrototype (self, prototype):
+        ''' Create cell python struct from the struct of the prototype of its cell type (see _getCellPrototype): each 
+        section dict references the shared (read-only) params of the prototype (geom, mechs, ions, topol), and only 
+        has own copies of the params that differ between cells (pointps with gid and hObj, geom if rotated, hObj and 
+        synMechs); NEURON objects are created using the precompiled recipe of the prototype '''
+        from .. import sim
 
-        # add sectionLists
-        if 'secLists' in prop:
-            self.secLists.update(prop['secLists'])  # diction of section lists
+        for sectName, sectParams in prototype['secs'].items():
+            sec = self.secs[sectName] = Dict()
+            dict.update(sec, sectParams)  # reference shared params (not copied)
+            if 'pointps' in sectParams:
+                sec['pointps'] = _copySecParams(sectParams['pointps'])
+                for pointpParams in sec['pointps'].values():
+                    for pointpParamName, pointpParamValue in pointpParams.items():
+                        if pointpParamValue == 'gid':
+                            pointpParams[pointpParamName] = self.gid
+            if sim.net.params.rotateCellsRandomly == True and 'pt3d' in sectParams.get('geom', {}):
+                # rotate the cell about the Z axis
+                c, s = cos(self.randRotationAngle), sin(self.randRotationAngle)
+                sec['geom'] = _copySecParams(sectParams['geom'])
+                sec['geom']['pt3d'] = [(pt3d[0] * c - pt3d[2] * s, pt3d[1], pt3d[0] * s + pt3d[2] * c, pt3d[3]) for pt3d in sec['geom']['pt3d']]
+        self.secLists.update(_copySecParams(prototype['secLists']))
+
+        if sim.cfg.createNEURONObj:
+            self.createNEURONObjFromRecipe(prototype['recipe'])
+
+
+    def unshareSecs (self):
+        ''' Replace the section params shared with other cells of the same type (FrozenDicts, see createFromPrototype)
+        by own copies, so they can be modified for this cell only (copy-on-write) '''
+        for sec in self.secs.values():
+            for key, value in list(sec.items()):
+                if isinstance(value, FrozenDict):
+                    sec[key] = _copySecParams(value)
 
 
     def initV (self): 
@@ -308,6 +254,7 @@ class CompartCell (Cell):
     def createNEURONObj (self, prop):
         from .. import sim
 
+        self.unshareSecs()
         excludeMechs = ['dipole']  # dipole is special case 
         mechInsertError = False  # flag to print error inserting mechanisms
 
@@ -425,6 +372,65 @@ class CompartCell (Cell):
         if mechInsertError:
             print("ERROR: Some mechanisms and/or ions were not inserted (for details run with cfg.verbose=True). Make sure the required mod files are compiled.")
 
+    def createNEURONObjFromRecipe (self, recipe):
+        ''' Create NEURON sections, mechanisms, ions, point processes and topology from recipe (see _neuronRecipe); 
+        params with same value in all segments are set once per section '''
+        from .. import sim
+
+        mechInsertError = False  # flag to print error inserting mechanisms
+
+        for sectName, geomParams, hasPt3d, mechs, ions, pointps in recipe['secs']:
+            sec = self.secs[sectName]
+            if 'hObj' not in sec or sec['hObj'] in [None, {}, []]: 
+                sec['hObj'] = h.Section(name=sectName, cell=self)  # create h Section object
+            hSec = sec['hObj']
+
+            # set geometry params 
+            for geomParamName, geomParamValue in geomParams:
+                setattr(hSec, geomParamName, geomParamValue)
+            if hasPt3d:
+                h.pt3dclear(sec=hSec)
+                x, y, z = self.tags['x'], -self.tags['y'], self.tags['z']  # Neuron y-axis positive = upwards
+                for pt3d in sec['geom']['pt3d']:
+                    h.pt3dadd(x+pt3d[0], y+pt3d[1], z+pt3d[2], pt3d[3], sec=hSec)
+
+            # add distributed mechanisms and ions
+            for mechName, secParams, segParams, hocStmts in mechs + ions:
+                try:
+                    hSec.insert(mechName)
+                except:
+                    mechInsertError = True
+                    if sim.cfg.verbose: 
+                        print('# Error inserting %s mechanims in %s section! (check mod files are compiled)'%(mechName, sectName)) 
+                    continue
+                for attrName, value in secParams:
+                    setattr(hSec, attrName, value)  # all segments of section
+                for mechAttr, attrName, values in segParams:
+                    for seg, value in zip(hSec, values):
+                        if value is not None:
+                            setattr(getattr(seg, mechAttr) if mechAttr else seg, attrName, value)
+                for hocStmt in hocStmts:
+                    h(hocStmt)
+
+            # add point processes
+            for pointpName, mod, loc, pointpParams in pointps:
+                pointp = getattr(h, mod)(loc, sec=hSec)  # create h Pointp object (eg. h.Izhi2007b)
+                sec['pointps'][pointpName]['hObj'] = pointp
+                for pointpParamName, pointpParamValue in pointpParams:
+                    setattr(pointp, pointpParamName, self.gid if pointpParamValue == 'gid' else pointpParamValue)
+
+        # set topology 
+        for sectName, parentSec, parentX, childX in recipe['topol']:
+            self.secs[sectName]['hObj'].connect(self.secs[parentSec]['hObj'], parentX, childX)
+
+        # add dipoles
+        for sectName in recipe['dipoles']:
+            self.__dipoleInsert(sectName, self.secs[sectName])
+
+        if mechInsertError:
+            print("ERROR: Some mechanisms and/or ions were not inserted (for details run with cfg.verbose=True). Make sure the required mod files are compiled.")
+
+
     def addSynMechsNEURONObj(self):
         # set params for all sections
         for sectName,sectParams in self.secs.items(): 
@@ -460,48 +466,79 @@ class CompartCell (Cell):
            
 
     # Create NEURON objs for conns and syns if included in prop (used when loading)
-    def addConnsNEURONObj(self):
-        # Note: loading connections to point process (eg. Izhi2007a) not yet supported
-        # Note: assumes weight is in index 0 (netcon.weight[0])
-        
+    def addConnsNEURONObj(self, conns=None):
+        ''' Create NetCons (and synMechs if not created yet) of conns in the python struct of the cell (all conns if None), 
+        eg. when loading, after distributing synapses with subConnParams or with cfg.bulkNetCons. Conns are processed 
+        in bulk: params of all conns read at once (from the columns of the ConnTable if cfg.connTable), postsyn target 
+        of each (sec, synMech, loc) resolved once, and NetCons created in a single loop with weight and delay from the 
+        conn params (already scaled and normalized). Returns number of NetCons created '''
         from .. import sim
 
-        # assumes python structure exists
-        for conn in self.conns:
+        if conns is None:
+            conns = self.conns
+        keys = ['preGid', 'sec', 'synMech', 'loc', 'weight', 'delay', 'preLabel', 'plast']
+        if isinstance(conns, sim.CellConns):
+            connValues = conns.tolists(keys)  # read from ConnTable columns
+        else:
+            connValues = [[conn.get(key) for key in keys] for conn in conns]
+
+        netStims = {}  # NetStims of each source, in the order they were connected
+        for stim in self.stims:
+            if 'source' in stim and stim.get('hObj'):
+                netStims.setdefault(stim['source'], []).append(stim['hObj'])
+        netStimCount = {source: 0 for source in netStims}
+
+        gidConnect, NetCon = sim.pc.gid_connect, h.NetCon
+        targets = {}  # (sec, synMech, loc) -> (postsyn target, weight index)
+        numNetCons = 0
+        for iconn, (preGid, secLabel, synLabel, loc, weight, delay, preLabel, plast) in enumerate(connValues):
             # set postsyn target
-            synMech = next((synMech for synMech in self.secs[conn['sec']]['synMechs'] if synMech['label']==conn['synMech'] and synMech['loc']==conn['loc']), None)
-
-            if not synMech: 
-                synMech = self.addSynMech(conn['synMech'], conn['sec'], conn['loc'])
-                #continue  # go to next conn
-
-            try:
-                postTarget = synMech['hObj']
-            except:
-                print('\nError: no synMech available for conn: ', conn)
-                print(' cell tags: ',self.tags)
-                print(' cell synMechs: ',self.secs[conn['sec']]['synMechs'])
-                import sys
-                sys.exit()
+            key = (secLabel, synLabel, loc)
+            target = targets.get(key)
+            if target is None:
+                target = targets[key] = self._connTarget(secLabel, synLabel, loc)
+            postTarget, weightIndex = target
 
             # create NetCon
-            if conn['preGid'] == 'NetStim':
-                netstim = next((stim['hObj'] for stim in self.stims if stim['source']==conn['preLabel']), None)
-                if netstim:
-                    netcon = h.NetCon(netstim, postTarget)
-                else: continue
+            if preGid == 'NetStim':
+                if preLabel not in netStims: continue
+                sourceNetStims = netStims[preLabel]
+                netstim = sourceNetStims[min(netStimCount[preLabel], len(sourceNetStims)-1)]
+                netStimCount[preLabel] += 1
+                netcon = NetCon(netstim, postTarget)
             else:
-                #cell = next((c for c in sim.net.cells if c.gid == conn['preGid']), None)
-                netcon = sim.pc.gid_connect(conn['preGid'], postTarget)
-
-            netcon.weight[0] = conn['weight']
-            netcon.delay = conn['delay']
-            #netcon.threshold = conn.get('threshold', sim.net.params.defaultThreshold)
+                netcon = gidConnect(preGid, postTarget)
+            netcon.weight[weightIndex] = weight
+            netcon.delay = delay
+            conn = conns[iconn]
             conn['hObj'] = netcon
-            
+            numNetCons += 1
+
             # Add plasticity 
-            if conn.get('plast'):
-                self._addConnPlasticity(conn['plast'], self.secs[conn['sec']], netcon, 0)
+            if plast:
+                self._addConnPlasticity(conn, self.secs[secLabel], netcon, weightIndex)
+
+        return numNetCons
+
+
+    def _connTarget (self, secLabel, synLabel, loc):
+        ''' Returns postsyn target (synMech or point process with V not in section) of conn and index of NetCon weight '''
+        sec = self.secs[secLabel]
+        for pointpName, pointpParams in sec.get('pointps', {}).items():  # artificial cell (eg. Izhi2007a)
+            if 'vref' in pointpParams:
+                synList = pointpParams.get('synList', [])
+                return pointpParams['hObj'], synList.index(synLabel) if synLabel in synList else 0
+
+        synMech = self.getSynMech(secLabel, synLabel, loc)
+        if not synMech or not synMech.get('hObj'):
+            synMech = self.addSynMech(synLabel, secLabel, loc)
+        if not synMech or not synMech.get('hObj'):
+            print('\nError: no synMech available for conn: ', {'sec': secLabel, 'synMech': synLabel, 'loc': loc})
+            print(' cell tags: ',self.tags)
+            print(' cell synMechs: ',sec.get('synMechs'))
+            import sys
+            sys.exit()
+        return synMech['hObj'], 0
 
 
     def associateGid (self, threshold = None):
@@ -543,22 +580,22 @@ class CompartCell (Cell):
 
         if synMechParams and sec:  # if both the synMech and the section exist
             if sim.cfg.createPyStruct and sim.cfg.addSynMechs:
-                synMech = next((synMech for synMech in sec['synMechs'] if synMech['label']==synLabel and synMech['loc']==loc), None)
+                synMech = self.getSynMech(secLabel, synLabel, loc)
                 if not synMech:  # if synMech not in section, then create
                     synMech = Dict({'label': synLabel, 'loc': loc})
                     for paramName, paramValue in synMechParams.items():
                         synMech[paramName] = paramValue
-                    sec['synMechs'].append(synMech)
+                    self._appendSynMech(secLabel, synMech)
             else:
                 synMech = None
 
             if sim.cfg.createNEURONObj and sim.cfg.addSynMechs: 
                 # add synaptic mechanism NEURON objectes 
                 if not synMech:  # if pointer not created in createPyStruct, then check 
-                    synMech = next((synMech for synMech in sec['synMechs'] if synMech['label']==synLabel and synMech['loc']==loc), None)
+                    synMech = self.getSynMech(secLabel, synLabel, loc)
                 if not synMech:  # if still doesnt exist, then create
                     synMech = Dict()
-                    sec['synMechs'].append(synMech)
+                    self._appendSynMech(secLabel, synMech)
                 if not synMech.get('hObj'):  # if synMech doesn't have NEURON obj, then create
                     synObj = getattr(h, synMechParams['mod'])
                     synMech['hObj'] = synObj(loc, sec=sec['hObj'])  # create h Syn object (eg. h.Exp2Syn)
@@ -580,6 +617,63 @@ class CompartCell (Cell):
             return synMech
 
 
+    def getSynMech (self, secLabel, synLabel, loc):
+        ''' Returns synMech with label synLabel at loc of section secLabel (None if not found), using an index of the 
+        synMechs of the section by (label, loc) instead of scanning the list. The index is built when first needed and 
+        updated by addSynMech; it is rebuilt if the synMechs list of the section was replaced or its length changed 
+        (eg. cell loaded from file, or synMechs added/removed elsewhere). Since modifySynMechs doesn't change the label or 
+        loc of synMechs, and subcellular conn redistribution only moves conns, the index remains valid '''
+        sec = self.secs.get(secLabel)
+        synMechs = sec.get('synMechs') if sec else None
+        if not isinstance(synMechs, list):
+            return None
+        index = self._getSynMechIndex().get(secLabel)
+        if index is None or index[0] is not synMechs or index[1] != len(synMechs):
+            index = self._indexSynMechs(secLabel, synMechs)
+        try:
+            return index[2].get((synLabel, loc))
+        except TypeError:  # unhashable loc
+            return next((synMech for synMech in synMechs if synMech.get('label')==synLabel and synMech.get('loc')==loc), None)
+
+
+    def _getSynMechIndex (self):
+        ''' Returns index of synMechs of each section; slot is not set in copies of the cell (pickled, eg. gathered or 
+        loaded, or copied), so it is created again when needed '''
+        index = getattr(self, '_synMechIndex', None)
+        if index is None:
+            index = self._synMechIndex = {}
+        return index
+
+
+    def _indexSynMechs (self, secLabel, synMechs):
+        ''' Returns (and stores) index of list of synMechs of section: (list, length, {(label, loc): first synMech}) '''
+        synMechsDict = {}
+        for synMech in synMechs:
+            try:
+                key = (synMech.get('label'), synMech.get('loc'))
+                if key not in synMechsDict:
+                    synMechsDict[key] = synMech
+            except TypeError:  # unhashable loc
+                pass
+        index = self._getSynMechIndex()[secLabel] = [synMechs, len(synMechs), synMechsDict]
+        return index
+
+
+    def _appendSynMech (self, secLabel, synMech):
+        ''' Appends synMech to list of synMechs of section and updates the index '''
+        synMechs = self.secs[secLabel]['synMechs']
+        index = self._getSynMechIndex().get(secLabel)
+        if index is None or index[0] is not synMechs or index[1] != len(synMechs):
+            index = self._indexSynMechs(secLabel, synMechs)
+        synMechs.append(synMech)
+        index[1] += 1
+        if 'label' in synMech and 'loc' in synMech:
+            try:
+                index[2].setdefault((synMech['label'], synMech['loc']), synMech)
+            except TypeError:  # unhashable loc
+                pass
+
+
     def modifySynMechs (self, params):
         from .. import sim
 
@@ -620,7 +714,7 @@ class CompartCell (Cell):
                                 break
 
                     if conditionsMet:  # if all conditions are met, set values for this cell
-                        exclude = ['conds', 'cellConds', 'label', 'mod', 'selfNetCon', 'loc']
+                        exclude = ['conds', 'cellConds', 'label', 'mod', 'selfNetCon', 'loc']  # label and loc not modified (index of synMechs remains valid)
                         for synParamName,synParamValue in {k: v for k,v in params.items() if k not in exclude}.items():
                             if sim.cfg.createPyStruct: 
                                 synMech[synParamName] = synParamValue
@@ -964,6 +1058,7 @@ class CompartCell (Cell):
                 'number': params['number'],
                 'start': params['start'],
                 'seed': params['seed'] if 'seed' in params else sim.cfg.seeds['stim']}
+            if params.get('pool'): netStimParams['pool'] = params['pool']  # pool of NetStims shared by targets
         
             self.addConn(connParams, netStimParams)
        
@@ -1261,6 +1356,7 @@ class CompartCell (Cell):
         y = -self.tags['y'] # Neuron y-axis positive = upwards, so assume pia=0 and cortical depth = neg
         z = self.tags['z']
                 
+        self.unshareSecs()
         for sec in list(self.secs.values()):
             if 'geom' in sec and 'pt3d' not in sec['geom']:  # only cells that didn't have pt3d before
                 sec['geom']['pt3d'] = []
@@ -1273,4 +1369,251 @@ class CompartCell (Cell):
                     h.pt3dchange(i, x+pt3d[0], y+pt3d[1], z+pt3d[2], pt3d[3], sec=sec['hObj'])
                 h.pop_section() 
 
-        
\ No newline at end of file
+        
+
+
+# -----------------------------------------------------------------------------
+# Add section params of cellParams rule to python struct of sections
+# -----------------------------------------------------------------------------
+def _addSecParams (secs, secLists, prop, gid=None, rotationAngle=None):
+    ''' Add the params of the sections of prop (geom, mechs, ions, pointps, topol, etc; excluding synMechs) to secs 
+    and secLists; point process params with value 'gid' are replaced by gid (if not None), and pt3d rotated about 
+    the Z axis by rotationAngle (if not None) '''
+
+    # set params for all sections
+    for sectName,sectParams in prop['secs'].items(): 
+        # create section
+        if sectName not in secs:
+            secs[sectName] = Dict()  # create section dict
+        sec = secs[sectName]  # pointer to section
+
+        # add distributed mechanisms 
+        if 'mechs' in sectParams:
+            for mechName,mechParams in sectParams['mechs'].items(): 
+                if 'mechs' not in sec:
+                    sec['mechs'] = Dict()
+                if mechName not in sec['mechs']: 
+                    sec['mechs'][mechName] = Dict()  
+                for mechParamName,mechParamValue in mechParams.items():  # add params of the mechanism
+                    sec['mechs'][mechName][mechParamName] = mechParamValue
+
+        # add ion info 
+        if 'ions' in sectParams:
+            for ionName,ionParams in sectParams['ions'].items(): 
+                if 'ions' not in sec:
+                    sec['ions'] = Dict()
+                if ionName not in sec['ions']: 
+                    sec['ions'][ionName] = Dict()  
+                for ionParamName,ionParamValue in ionParams.items():  # add params of the ion
+                    sec['ions'][ionName][ionParamName] = ionParamValue
+
+
+        # add point processes
+        if 'pointps' in sectParams:
+            for pointpName,pointpParams in sectParams['pointps'].items(): 
+                #if self.tags['cellModel'] == pointpName: # only required if want to allow setting various cell models in same rule
+                if 'pointps' not in sec:
+                    sec['pointps'] = Dict()
+                if pointpName not in sec['pointps']: 
+                    sec['pointps'][pointpName] = Dict()  
+                for pointpParamName,pointpParamValue in pointpParams.items():  # add params of the mechanism
+                    if pointpParamValue == 'gid' and gid is not None: 
+                        pointpParamValue = gid
+                    sec['pointps'][pointpName][pointpParamName] = pointpParamValue
+
+
+        # add geometry params 
+        if 'geom' in sectParams:
+            for geomParamName,geomParamValue in sectParams['geom'].items():  
+                if 'geom' not in sec:
+                    sec['geom'] = Dict()
+                if not type(geomParamValue) in [list, dict]:  # skip any list or dic params
+                    sec['geom'][geomParamName] = geomParamValue
+
+            # add 3d geometry
+            if 'pt3d' in sectParams['geom']:
+                if 'pt3d' not in sec['geom']:  
+                    sec['geom']['pt3d'] = []
+                for ipt, pt3d in enumerate(sectParams['geom']['pt3d']):
+                    if rotationAngle is not None:
+                        """Rotate the cell about the Z axis."""
+                        x = pt3d[0]
+                        z = pt3d[2]
+                        c = cos(rotationAngle)
+                        s = sin(rotationAngle)
+                        pt3d = (x * c - z * s, pt3d[1], x * s + z * c, pt3d[3])
+                        sectParams['geom']['pt3d'][ipt] = pt3d
+
+                    sec['geom']['pt3d'].append(pt3d)
+
+        # add topolopgy params
+        if 'topol' in sectParams:
+            if 'topol' not in sec:
+                sec['topol'] = Dict()
+            for topolParamName,topolParamValue in sectParams['topol'].items(): 
+                sec['topol'][topolParamName] = topolParamValue
+
+        # add other params
+        if 'spikeGenLoc' in sectParams:
+            sec['spikeGenLoc'] = sectParams['spikeGenLoc']
+
+        if 'vinit' in sectParams:
+            sec['vinit'] = sectParams['vinit']
+
+        if 'weightNorm' in sectParams:
+            sec['weightNorm'] = sectParams['weightNorm']
+
+        if 'threshold' in sectParams:
+            sec['threshold'] = sectParams['threshold']
+
+    # add sectionLists
+    if 'secLists' in prop:
+        secLists.update(prop['secLists'])  # diction of section lists
+
+
+# -----------------------------------------------------------------------------
+# Copy python struct of sections
+# -----------------------------------------------------------------------------
+def _copySecParams (params):
+    ''' Returns copy of nested dicts (as Dicts, also if FrozenDicts) and lists of section params (tuples and other 
+    values are not copied) '''
+    if isinstance(params, dict):
+        copy = Dict()
+        for key, value in params.items():
+            copy[key] = _copySecParams(value)
+        return copy
+    elif isinstance(params, list):
+        if any(isinstance(value, (dict, list)) for value in params):
+            return [_copySecParams(value) for value in params]
+        return list(params)
+    return params
+
+
+# -----------------------------------------------------------------------------
+# Check if cell tags meet conds of cellParams rule
+# -----------------------------------------------------------------------------
+def _cellRuleMatch (tags, conds):
+    for (condKey,condVal) in conds.items():  # check if all conditions are met
+        if isinstance(condVal, list): 
+            if isinstance(condVal[0], Number):
+                if tags.get(condKey) < condVal[0] or tags.get(condKey) > condVal[1]:
+                    return False
+            elif isinstance(condVal[0], basestring):
+                if tags.get(condKey) not in condVal:
+                    return False
+        elif tags.get(condKey) != condVal: 
+            return False
+    return True
+
+
+# -----------------------------------------------------------------------------
+# Labels of cellParams rules matching cell tags (memoized)
+# -----------------------------------------------------------------------------
+def _matchCellRules (tags):
+    ''' Returns labels of the cellParams rules whose conds are met by cell tags. Results are memoized in 
+    sim.net.cellRuleMatches by the values of the tags used in the conds of all rules (for tags compared to numeric 
+    ranges, by whether the value is within each range), so conds are only checked once per distinct combination 
+    (eg. once per population instead of once per cell) '''
+    from .. import sim
+
+    cellParams = sim.net.params.cellParams
+    matches = sim.net.cellRuleMatches
+    if matches is None or matches['cellParams'] is not cellParams:
+        # tags used in conds, with the numeric ranges they are compared to (None if also compared to values)
+        condRanges = {}
+        for prop in cellParams.values():
+            for condKey, condVal in prop['conds'].items():
+                isRange = isinstance(condVal, list) and isinstance(condVal[0], Number)
+                if isRange and condRanges.get(condKey, []) is not None:
+                    condRanges[condKey] = condRanges.get(condKey, []) + [(condVal[0], condVal[1])]
+                else:
+                    condRanges[condKey] = None
+        matches = sim.net.cellRuleMatches = {'cellParams': cellParams, 'condRanges': sorted(condRanges.items()), 'labels': {}}
+
+    key = tuple(tuple(not (tags.get(condKey) < low or tags.get(condKey) > high) for low, high in ranges)
+        if ranges is not None else tags.get(condKey) for condKey, ranges in matches['condRanges'])
+    try:
+        return matches['labels'][key]
+    except KeyError:
+        labels = [propLabel for propLabel, prop in cellParams.items() if _cellRuleMatch(tags, prop['conds'])]
+        matches['labels'][key] = labels
+        return labels
+    except TypeError:  # unhashable tag values
+        return [propLabel for propLabel, prop in cellParams.items() if _cellRuleMatch(tags, prop['conds'])]
+
+
+# -----------------------------------------------------------------------------
+# Prototype of cell type (combination of cellParams rules)
+# -----------------------------------------------------------------------------
+def _getCellPrototype (propLabels):
+    ''' Returns prototype of cells with cellParams rules propLabels (cached in sim.net.cellPrototypes): python struct of 
+    sections (with the params of each section frozen so they can be shared by all cells of the type) and section lists
+    with the params of all rules (built once per cell type) and recipe to create its NEURON objects; None if rules 
+    include synMechs (added per cell) '''
+    from .. import sim
+
+    key = tuple(propLabels)
+    if key not in sim.net.cellPrototypes:
+        props = [sim.net.params.cellParams[propLabel] for propLabel in propLabels]
+        if not props or any('synMechs' in sectParams for prop in props for sectParams in prop['secs'].values()):
+            prototype = None
+        else:
+            secs, secLists = Dict(), Dict()
+            for prop in props:
+                _addSecParams(secs, secLists, prop)
+            for sectName in secs:
+                secs[sectName] = FrozenDict(secs[sectName])
+            prototype = {'secs': secs, 'secLists': secLists, 'recipe': _neuronRecipe(secs)}
+        sim.net.cellPrototypes[key] = prototype
+    return sim.net.cellPrototypes[key]
+
+
+# -----------------------------------------------------------------------------
+# Recipe to create NEURON objects of python struct of sections
+# -----------------------------------------------------------------------------
+def _neuronRecipe (secs):
+    ''' Returns recipe (lists of attributes and values in the order they are set) to create the NEURON objects of secs 
+    with CompartCell.createNEURONObjFromRecipe. Mech and ion params with the same value in all segments are set as 
+    section attributes (eg. sec.gnabar_hh); params with lists of values are set for each segment '''
+    recipe = {'secs': [], 'topol': [], 'dipoles': []}
+    for sectName, sec in secs.items():
+        geom = sec.get('geom', {})
+        geomParams = [(name, value) for name, value in geom.items() if not type(value) in [list, dict]]
+
+        mechs = []
+        for mechName, mechParams in sec.get('mechs', {}).items():
+            secParams, segParams = [], []
+            for mechParamName, mechParamValue in mechParams.items():
+                if type(mechParamValue) in [list] and len(mechParamValue) == 1:
+                    mechParamValue = mechParamValue[0]
+                if type(mechParamValue) in [list]:
+                    segParams.append((mechName, mechParamName, mechParamValue))
+                elif mechParamValue is not None:  # avoid setting None values
+                    secParams.append(('%s_%s' % (mechParamName, mechName), mechParamValue))
+            mechs.append((mechName, secParams, segParams, []))
+
+        ions = []
+        for ionName, ionParams in sec.get('ions', {}).items():
+            secParams, segParams, hocStmts = [], [], []
+            for ionParamName, ionParamValue in ionParams.items():
+                if ionParamName not in ['e', 'o', 'i']: continue
+                attrName = 'e'+ionName if ionParamName == 'e' else ionName+ionParamName
+                if type(ionParamValue) in [list]:
+                    segParams.append((None, attrName, ionParamValue))
+                else:
+                    secParams.append((attrName, ionParamValue))
+                if ionParamName in ['o', 'i']:  # default initial value, eg. cao0_ca_ion
+                    lastValue = ionParamValue[-1] if type(ionParamValue) in [list] else ionParamValue
+                    hocStmts.append('%s%s0_%s_ion = %s' % (ionName, ionParamName, ionName, lastValue))
+            ions.append((ionName+'_ion', secParams, segParams, hocStmts))
+
+        pointps = [(pointpName, pointpParams['mod'], pointpParams.get('loc', 0.5), 
+            [(name, value) for name, value in pointpParams.items() if name not in ['mod', 'loc', 'vref', 'synList'] and not name.startswith('_')])
+            for pointpName, pointpParams in sec.get('pointps', {}).items()]
+
+        recipe['secs'].append((sectName, geomParams, 'pt3d' in geom, mechs, ions, pointps))
+        if sec.get('topol'):
+            recipe['topol'].append((sectName, sec['topol']['parentSec'], sec['topol']['parentX'], sec['topol']['childX']))
+        if 'dipole' in sec.get('mechs', {}):
+            recipe['dipoles'].append(sectName)
+    return recipe
@@ -16,11 +16,14 @@ from builtins import range
 
 from future import standard_library
 standard_library.install_aliases()
+import os
+import hashlib
 from copy import deepcopy
 from neuron import h # Import NEURON
 import numpy as np
 from .cell import Cell
 from ..specs import Dict
+from ..support import random123
 
 
 ###############################################################################
@@ -58,14 +61,8 @@ class PointCell (Cell):
             return 
 
         # if rate is list with 2 items generate random value from uniform 
-        
-        #from IPython import embed; embed()
+        self._setRandomRate()
 
-        if 'rate' in self.params and isinstance(self.params['rate'], list) and len(self.params['rate']) == 2:
-            rand = h.Random()
-            rand.Random123(sim.hashStr('point_rate'), self.gid, sim.cfg.seeds['stim']) # initialize randomizer 
-            self.params['rate'] = rand.uniform(self.params['rate'][0], self.params['rate'][1])
- 
         # set pointp params - for PointCells these are stored in self.params
         params = {k: v for k,v in self.params.items()}
         for paramName, paramValue in params.items():
@@ -89,147 +86,175 @@ class PointCell (Cell):
                 self.params['seed'] = sim.cfg.seeds['stim'] # note: random number generator initialized from sim.preRun()
         
 
-        # VecStim - generate spike vector based on params
+        # VecStim - generate spike vector based on params (or later in batch with the rest of the pop; see cfg.vecStimBatch)
         if self.tags['cellModel'] == 'VecStim':
-            # seed
-            if 'seed' not in self.params: 
-                self.params['seed'] = sim.cfg.seeds['stim']
-
-            # convert rate to interval
-            if 'rate' in self.params:
-                self.params['interval'] = 1000.0/self.params['rate'] 
-
-            # if interval
-            if 'interval' in self.params:
-                # set interval, start and noise params
-                interval = self.params['interval'] 
-                start = self.params['start'] if 'start' in self.params else 0.0
-                noise = self.params['noise'] if 'noise' in self.params else 0.0
-
-                maxReproducibleSpks = 1e4  # num of rand spikes generated; only a subset is used; ensures reproducibility 
-
-                # fixed interval of duration (1 - noise)*interval 
-                fixedInterval = np.full(int(((1+1.5*noise)*sim.cfg.duration/interval)), [(1.0-noise)*interval])  # generate 1+1.5*noise spikes to account for noise
-                numSpks = len(fixedInterval)
-
-                # randomize the first spike so on average it occurs at start + noise*interval
-                # invl = (1. - noise)*mean + noise*mean*erand() - interval*(1. - noise)    
-                if noise == 0.0:
-                    vec = h.Vector(len(fixedInterval))
-                    spkTimes =  np.cumsum(fixedInterval) + (start - interval) 
-                else:
-                    # plus negexp interval of mean duration noise*interval. Note that the most likely negexp interval has duration 0.
-                    rand = h.Random()
-                    rand.Random123(sim.hashStr('vecstim_spkt'), self.gid, self.params['seed'])
-
-                    # Method 1: vec length depends on duration -- not reproducible
-                    # vec = h.Vector(numSpks)
-                    # rand.negexp(noise*interval)
-                    # vec.setrand(rand)
-                    # negexpInterval= np.array(vec)                     
-                    # #print negexpInterval
-                    # spkTimes = np.cumsum(fixedInterval + negexpInterval) + (start - interval*(1-noise))
-
-                    if numSpks < 100:
-                        # Method 2: vec length=1, slower but reproducible
-                        vec = h.Vector(1) 
-                        rand.negexp(noise*interval)
-                        negexpInterval = []
-                        for i in range(numSpks):
-                            vec.setrand(rand)
-                            negexpInterval.append(vec.x[0])  # = np.array(vec)[0:len(fixedInterval)]                     
-                        spkTimes = np.cumsum(fixedInterval + np.array(negexpInterval)) + (start - interval*(1-noise))
+            if sim.net.vecStimBatch is not None:
+                sim.net.vecStimBatch.append(self)
+            else:
+                self.playSpkTimes(self.vecStimSpkTimes())
 
-                    elif numSpks < maxReproducibleSpks:
-                        # Method 3: vec length=maxReproducibleSpks, then select subset; slower but reproducible
-                        vec = h.Vector(maxReproducibleSpks)
-                        rand.negexp(noise*interval)
+
+    def playSpkTimes (self, spkTimes):
+        ''' Plays array of spike times into the VecStim '''
+        if spkTimes is None:
+            return
+        self.hSpkTimes = h.Vector()  # store the vector containins spikes to avoid seg fault
+        self.hPointp.play(self.hSpkTimes.from_python(spkTimes))
+
+
+    def _setRandomRate (self, seed=None):
+        ''' If rate is list with 2 items replace with random value from uniform distribution; the range is kept in
+        params['_rateRange'] so the rate can be drawn again with another stim seed (eg. in sim.runTrials) '''
+        from .. import sim
+
+        if 'rate' in self.params and isinstance(self.params['rate'], list) and len(self.params['rate']) == 2:
+            self.params['_rateRange'] = self.params['rate']
+        elif seed is None or '_rateRange' not in self.params:
+            return
+        rand = h.Random()
+        rand.Random123(sim.hashStr('point_rate'), self.gid, sim.cfg.seeds['stim'] if seed is None else seed) # initialize randomizer 
+        self.params['rate'] = rand.uniform(self.params['_rateRange'][0], self.params['_rateRange'][1])
+
+
+    def vecStimSpkTimes (self):
+        ''' Returns array with VecStim spike times generated from params (interval or rate, start, noise and pulses; or spkTimes) '''
+        from .. import sim
+
+        # seed
+        if 'seed' not in self.params: 
+            self.params['seed'] = sim.cfg.seeds['stim']
+
+        # convert rate to interval
+        if 'rate' in self.params:
+            self.params['interval'] = 1000.0/self.params['rate'] 
+
+        # if interval
+        if 'interval' in self.params:
+            # set interval, start and noise params
+            interval = self.params['interval'] 
+            start = self.params['start'] if 'start' in self.params else 0.0
+            noise = self.params['noise'] if 'noise' in self.params else 0.0
+
+            maxReproducibleSpks = 1e4  # num of rand spikes generated; only a subset is used; ensures reproducibility 
+
+            # fixed interval of duration (1 - noise)*interval 
+            fixedInterval = np.full(int(((1+1.5*noise)*sim.cfg.duration/interval)), [(1.0-noise)*interval])  # generate 1+1.5*noise spikes to account for noise
+            numSpks = len(fixedInterval)
+
+            # randomize the first spike so on average it occurs at start + noise*interval
+            # invl = (1. - noise)*mean + noise*mean*erand() - interval*(1. - noise)    
+            if noise == 0.0:
+                spkTimes =  np.cumsum(fixedInterval) + (start - interval) 
+            else:
+                # plus negexp interval of mean duration noise*interval. Note that the most likely negexp interval has duration 0.
+                rand = h.Random()
+                rand.Random123(sim.hashStr('vecstim_spkt'), self.gid, self.params['seed'])
+
+                # Method 1: vec length depends on duration -- not reproducible
+                # vec = h.Vector(numSpks)
+                # rand.negexp(noise*interval)
+                # vec.setrand(rand)
+                # negexpInterval= np.array(vec)                     
+                # #print negexpInterval
+                # spkTimes = np.cumsum(fixedInterval + negexpInterval) + (start - interval*(1-noise))
+
+                if numSpks < 100:
+                    # Method 2: vec length=1, slower but reproducible
+                    vec = h.Vector(1) 
+                    rand.negexp(noise*interval)
+                    negexpInterval = []
+                    for i in range(numSpks):
                         vec.setrand(rand)
-                        negexpInterval = np.array(vec.c(0,len(fixedInterval)-1))                  
-                        spkTimes = np.cumsum(fixedInterval + negexpInterval) + (start - interval*(1-noise))
+                        negexpInterval.append(vec.x[0])  # = np.array(vec)[0:len(fixedInterval)]                     
+                    spkTimes = np.cumsum(fixedInterval + np.array(negexpInterval)) + (start - interval*(1-noise))
 
+                elif numSpks < maxReproducibleSpks:
+                    # Method 3: vec length=maxReproducibleSpks, then select subset; slower but reproducible
+                    vec = h.Vector(maxReproducibleSpks)
+                    rand.negexp(noise*interval)
+                    vec.setrand(rand)
+                    negexpInterval = np.array(vec.c(0,len(fixedInterval)-1))                  
+                    spkTimes = np.cumsum(fixedInterval + negexpInterval) + (start - interval*(1-noise))
 
 
-                    else:
-                        print('\nError: exceeded the maximum number of VecStim spikes per cell (%d > %d)' % (numSpks, maxReproducibleSpks))
-                        return
-
-            # if spkTimess
-            elif 'spkTimes' in self.params:
-                spkTimes = self.params['spkTimes']
-                if type(spkTimes) not in (list,tuple,np.array):
-                    print('\nError: VecStim "spkTimes" needs to be a list, tuple or numpy array')
+
+                else:
+                    print('\nError: exceeded the maximum number of VecStim spikes per cell (%d > %d)' % (numSpks, maxReproducibleSpks))
                     return
-                spkTimes = np.array(spkTimes)
-                vec = h.Vector(len(spkTimes))
-            
-            # missing params
-            else:
-                print('\nError: VecStim requires interval, rate or spkTimes')
+
+        # if spkTimess
+        elif 'spkTimes' in self.params:
+            spkTimes = self.params['spkTimes']
+            if type(spkTimes) not in (list,tuple,np.array):
+                print('\nError: VecStim "spkTimes" needs to be a list, tuple or numpy array')
                 return
+            spkTimes = np.array(spkTimes)
+        
+        # missing params
+        else:
+            print('\nError: VecStim requires interval, rate or spkTimes')
+            return
 
-            # pulse list: start, end, rate, noise
-            if 'pulses' in self.params:
-                for ipulse, pulse in enumerate(self.params['pulses']):
-                    
-                    # check interval or rate params
-                    if 'interval' in pulse:
-                        interval = pulse['interval'] 
-                    elif 'rate' in pulse:
-                        interval = 1000.0/pulse['rate']
-                    else:
-                        print('Error: Vecstim pulse missing "rate" or "interval" parameter')
-                        return
+        # pulse list: start, end, rate, noise
+        if 'pulses' in self.params:
+            for ipulse, pulse in enumerate(self.params['pulses']):
+                
+                # check interval or rate params
+                if 'interval' in pulse:
+                    interval = pulse['interval'] 
+                elif 'rate' in pulse:
+                    interval = 1000.0/pulse['rate']
+                else:
+                    print('Error: Vecstim pulse missing "rate" or "interval" parameter')
+                    return
 
-                    # check start,end and noise params
-                    if any([x not in pulse for x in ['start', 'end']]):  
-                        print('Error: Vecstim pulse missing "start" and/or "end" parameter')
-                        return
+                # check start,end and noise params
+                if any([x not in pulse for x in ['start', 'end']]):  
+                    print('Error: Vecstim pulse missing "start" and/or "end" parameter')
+                    return
+                else:
+                    noise = pulse['noise'] if 'noise' in pulse else 0.0
+                    start = pulse['start']
+                    end = pulse['end']
+
+                    # fixed interval of duration (1 - noise)*interval 
+                    fixedInterval = np.full(int(((1+1.5*noise)*(end-start)/interval)), [(1.0-noise)*interval])  # generate 1+0.5*noise spikes to account for noise
+                    numSpks = len(fixedInterval)
+
+                    # randomize the first spike so on average it occurs at start + noise*interval
+                    # invl = (1. - noise)*mean + noise*mean*erand() - interval*(1. - noise)
+                    if noise == 0.0:
+                        pulseSpikes = np.cumsum(fixedInterval) + (start - interval)
+                        pulseSpikes[pulseSpikes < start] = start
+                        spkTimes = np.append(spkTimes, pulseSpikes[pulseSpikes <= end])
                     else:
-                        noise = pulse['noise'] if 'noise' in pulse else 0.0
-                        start = pulse['start']
-                        end = pulse['end']
-
-                        # fixed interval of duration (1 - noise)*interval 
-                        fixedInterval = np.full(int(((1+1.5*noise)*(end-start)/interval)), [(1.0-noise)*interval])  # generate 1+0.5*noise spikes to account for noise
-                        numSpks = len(fixedInterval)
-
-                        # randomize the first spike so on average it occurs at start + noise*interval
-                        # invl = (1. - noise)*mean + noise*mean*erand() - interval*(1. - noise)
-                        if noise == 0.0:
-                            vec = h.Vector(len(fixedInterval))
-                            pulseSpikes = np.cumsum(fixedInterval) + (start - interval)
-                            pulseSpikes[pulseSpikes < start] = start
-                            spkTimes = np.append(spkTimes, pulseSpikes[pulseSpikes <= end])
-                        else:
-                            # plus negexp interval of mean duration noise*interval. Note that the most likely negexp interval has duration 0.
-                            rand = h.Random()
-                            rand.Random123(ipulse, self.gid, self.params['seed'])
-                            
-                            # Method 1: vec length depends on duration -- not reproducible
-                            # vec = h.Vector(len(fixedInterval))
-                            # rand.negexp(noise*interval)
-                            # vec.setrand(rand)
-                            # negexpInterval = np.array(vec) 
-                            # pulseSpikes = np.cumsum(fixedInterval + negexpInterval) + (start - interval*(1-noise))
-
-                            # Method 2: vec length=1, slower but reproducible
-                            vec = h.Vector(1) 
-                            rand.negexp(noise*interval)
-                            negexpInterval = []
-                            for i in range(numSpks):
-                                vec.setrand(rand)
-                                negexpInterval.append(vec.x[0])  # = np.array(vec)[0:len(fixedInterval)]                    
-                            pulseSpikes = np.cumsum(fixedInterval + np.array(negexpInterval)) + (start - interval*(1-noise))
-     
-                            pulseSpikes[pulseSpikes < start] = start
-                            spkTimes = np.append(spkTimes, pulseSpikes[pulseSpikes <= end])
-
-            spkTimes[spkTimes < 0] = 0
-            spkTimes = np.sort(spkTimes)
-            spkTimes = spkTimes[spkTimes <= sim.cfg.duration]
-            self.hSpkTimes = vec  # store the vector containins spikes to avoid seg fault
-            self.hPointp.play(self.hSpkTimes.from_python(spkTimes))
+                        # plus negexp interval of mean duration noise*interval. Note that the most likely negexp interval has duration 0.
+                        rand = h.Random()
+                        rand.Random123(ipulse, self.gid, self.params['seed'])
+                        
+                        # Method 1: vec length depends on duration -- not reproducible
+                        # vec = h.Vector(len(fixedInterval))
+                        # rand.negexp(noise*interval)
+                        # vec.setrand(rand)
+                        # negexpInterval = np.array(vec) 
+                        # pulseSpikes = np.cumsum(fixedInterval + negexpInterval) + (start - interval*(1-noise))
+
+                        # Method 2: vec length=1, slower but reproducible
+                        vec = h.Vector(1) 
+                        rand.negexp(noise*interval)
+                        negexpInterval = []
+                        for i in range(numSpks):
+                            vec.setrand(rand)
+                            negexpInterval.append(vec.x[0])  # = np.array(vec)[0:len(fixedInterval)]                    
+                        pulseSpikes = np.cumsum(fixedInterval + np.array(negexpInterval)) + (start - interval*(1-noise))
+ 
+                        pulseSpikes[pulseSpikes < start] = start
+                        spkTimes = np.append(spkTimes, pulseSpikes[pulseSpikes <= end])
+
+        spkTimes[spkTimes < 0] = 0
+        spkTimes = np.sort(spkTimes)
+        spkTimes = spkTimes[spkTimes <= sim.cfg.duration]
+        return spkTimes
 
 
     def associateGid (self, threshold = None):
@@ -385,4 +410,141 @@ class PointCell (Cell):
     # def addSynMechsNEURONObj (self):
     #     print 'Error: Function not yet implemented for Point Neurons'
 
-        
\ No newline at end of file
+        
+
+
+
+###############################################################################
+#
+# VECSTIM SPIKE TIMES GENERATED IN BATCH
+#
+###############################################################################
+
+def vecStimSpkTimesBatch (cells):
+    ''' Returns dict with the spike times of each VecStim cell (gid: array), generated at once for all cells with the
+    same params (except rate/interval, eg. drawn from a range) from vectorized Random123 streams with the same ids as
+    PointCell.vecStimSpkTimes (Random123(hashStr('vecstim_spkt'), gid, seed), and (ipulse, gid, seed) for pulses).
+    Trains are read from/saved to cfg.vecStimCache folder if set. Cells with spkTimes param are generated one by one '''
+    from .. import sim
+
+    spkTimes = {}
+    groups = {}
+    for cell in cells:
+        cell._setRandomRate()
+        if 'seed' not in cell.params:
+            cell.params['seed'] = sim.cfg.seeds['stim']
+        if 'rate' in cell.params:
+            cell.params['interval'] = 1000.0/cell.params['rate']
+        pulses = cell.params.get('pulses', [])
+        if 'interval' not in cell.params or any(('interval' not in p and 'rate' not in p) or 'start' not in p or 'end' not in p for p in pulses):
+            spkTimes[cell.gid] = cell.vecStimSpkTimes()  # prints errors of missing params
+            continue
+        key = repr(sorted((k, v) for k, v in cell.params.items() if k not in ['rate', 'interval', '_rateRange']))
+        groups.setdefault(key, []).append(cell)
+
+    globalIndex = int(h.Random().Random123_globalindex())  # used by Random123 streams of NEURON
+    for key, groupCells in groups.items():
+        gids = np.array([cell.gid for cell in groupCells], dtype=int)
+        intervals = np.array([cell.params['interval'] for cell in groupCells], dtype=float)
+        cacheFile, cached = None, {}
+        if sim.cfg.vecStimCache:
+            cacheFile, cached = _loadVecStimCache(key, globalIndex)
+        missing = np.array([gid not in cached or cached[gid][0] != interval for gid, interval in zip(gids.tolist(), intervals.tolist())], dtype=bool)
+        if missing.any():
+            params = groupCells[0].params
+            for chunk in _chunks(intervals[missing], params):
+                cached.update(_vecStimTrains(gids[missing][chunk], intervals[missing][chunk], params, sim.cfg.duration, globalIndex))
+            if cacheFile:
+                _saveVecStimCache(cacheFile, cached)
+        spkTimes.update({gid: cached[gid][1] for gid in gids.tolist()})
+
+    return spkTimes
+
+
+def _chunks (intervals, params, maxValues=1e7):
+    ''' Yields slices of cells so that at most maxValues random values are drawn at once '''
+    from .. import sim
+
+    noise = params.get('noise', 0.0)
+    numSpks = int((1+1.5*noise)*sim.cfg.duration/intervals.min()) + 1 if len(intervals) else 1
+    size = max(1, int(maxValues // numSpks))
+    for start in range(0, len(intervals), size):
+        yield slice(start, start+size)
+
+
+def _vecStimTrains (gids, intervals, params, duration, globalIndex):
+    ''' Returns dict with (interval, spike times) of VecStims gids with the same params, following
+    PointCell.vecStimSpkTimes (negexp picks start at 1 since pick 0 is returned by rand.negexp() in that method) '''
+    from .. import sim
+
+    start = params['start'] if 'start' in params else 0.0
+    noise = params['noise'] if 'noise' in params else 0.0
+    seed = params['seed']
+    maxReproducibleSpks = 1e4
+
+    # fixed interval of duration (1 - noise)*interval plus negexp interval of mean duration noise*interval
+    numSpks = ((1+1.5*noise)*duration/intervals).astype(int)
+    fixedInterval = np.repeat(((1.0-noise)*intervals)[:, None], numSpks.max() if len(numSpks) else 0, axis=1)
+    if noise == 0.0:
+        trains = np.cumsum(fixedInterval, axis=1) + (start - intervals)[:, None]
+    else:
+        negexpInterval = random123.negexp(noise*intervals, sim.hashStr('vecstim_spkt'), gids, seed, fixedInterval.shape[1], 1, globalIndex)
+        trains = np.cumsum(fixedInterval + negexpInterval, axis=1) + (start - intervals*(1-noise))[:, None]
+    trains = [trains[i, :numSpks[i]] for i in range(len(gids))]
+    if noise != 0.0:
+        for i in np.flatnonzero(numSpks >= maxReproducibleSpks):
+            print('\nError: exceeded the maximum number of VecStim spikes per cell (%d > %d)' % (numSpks[i], maxReproducibleSpks))
+            trains[i] = None
+
+    # pulse list: start, end, rate, noise
+    for ipulse, pulse in enumerate(params.get('pulses', [])):
+        interval = pulse['interval'] if 'interval' in pulse else 1000.0/pulse['rate']
+        noise = pulse['noise'] if 'noise' in pulse else 0.0
+        fixedInterval = np.full(int(((1+1.5*noise)*(pulse['end']-pulse['start'])/interval)), [(1.0-noise)*interval])
+        if noise == 0.0:
+            pulseSpikes = np.tile(np.cumsum(fixedInterval) + (pulse['start'] - interval), (len(gids), 1))
+        else:
+            negexpInterval = random123.negexp(noise*interval, ipulse, gids, seed, len(fixedInterval), 1, globalIndex)
+            pulseSpikes = np.cumsum(fixedInterval + negexpInterval, axis=1) + (pulse['start'] - interval*(1-noise))
+        pulseSpikes[pulseSpikes < pulse['start']] = pulse['start']
+        for i in range(len(gids)):
+            if trains[i] is not None:
+                trains[i] = np.append(trains[i], pulseSpikes[i][pulseSpikes[i] <= pulse['end']])
+
+    spkTimes = {}
+    for gid, interval, train in zip(gids.tolist(), intervals.tolist(), trains):
+        if train is not None:
+            train[train < 0] = 0
+            if params.get('pulses'):
+                train = np.sort(train)
+            train = train[train <= duration]
+        spkTimes[gid] = (interval, train)
+    return spkTimes
+
+
+def _loadVecStimCache (key, globalIndex):
+    ''' Returns file name and dict (gid: (interval, spike times)) of VecStim trains cached for params key '''
+    from .. import sim
+
+    cacheKey = hashlib.md5(repr((key, sim.cfg.duration, globalIndex)).encode('utf-8')).hexdigest()
+    node = '_node%d' % (sim.rank) if sim.nhosts > 1 else ''
+    cacheFile = os.path.join(sim.cfg.vecStimCache, 'vecStimSpkTimes_%s%s.npz' % (cacheKey, node))
+    cached = {}
+    if os.path.exists(cacheFile):
+        data = np.load(cacheFile)
+        trains = np.split(data['spkTimes'], data['offsets'][1:-1])
+        for gid, interval, valid, train in zip(data['gids'].tolist(), data['intervals'].tolist(), data['valid'].tolist(), trains):
+            cached[gid] = (interval, train if valid else None)
+    return cacheFile, cached
+
+
+def _saveVecStimCache (cacheFile, cached):
+    ''' Saves dict (gid: (interval, spike times)) of VecStim trains to cache file '''
+    if not os.path.exists(os.path.dirname(cacheFile) or '.'):
+        os.makedirs(os.path.dirname(cacheFile))
+    gids = sorted(cached)
+    trains = [cached[gid][1] if cached[gid][1] is not None else np.array([]) for gid in gids]
+    np.savez(cacheFile, gids=np.array(gids, dtype=int), intervals=np.array([cached[gid][0] for gid in gids], dtype=float),
+        valid=np.array([cached[gid][1] is not None for gid in gids], dtype=bool),
+        offsets=np.concatenate(([0], np.cumsum([len(train) for train in trains]))).astype(int),
+        spkTimes=np.concatenate(trains) if trains else np.array([]))
@@ -899,6 +899,13 @@ metadata = {
                         "hintText": "",
                         "type": "float"
                     },
+                    "pool": {
+                        "label": "Number of shared NetStims",
+                        "help": "Number of independent NetStims shared by all the cells targeted by this source (NetStim only); each synapse is connected to one of them, picked from the cell gid and seed, instead of creating a NetStim per synapse (default: None).",
+                        "suggestions": "",
+                        "hintText": "",
+                        "type": "int"
+                    },
                     "tau1": {
                         "label": "Voltage clamp tau1",
                         "help": "Voltage clamp tau1.",
@@ -1335,6 +1342,18 @@ metadata = {
                 "suggestions": "",
                 "type": "bool"
             },
+            "saveLFPPops": {
+                "label": "Store LFP of populations",
+                "help": "Store LFP generated by each population in sim.allSimData['LFPPops'].",
+                "suggestions": "",
+                "type": "bool"
+            },
+            "bufferLFPSteps": {
+                "label": "LFP buffer record steps",
+                "help": "Number of record steps for which the membrane currents of all segments are buffered before calculating the LFP with a single matrix product (default: 1).",
+                "suggestions": "",
+                "type": "int"
+            },
             "recordStep": {
                 "label": "Time step for data recording (ms)",
                 "help": "Step size in ms for data recording (default: 0.1).",
@@ -1360,6 +1379,114 @@ metadata = {
                 "suggestions": "",
                 "type": "bool"
             },
+            "vectorizeConns": {
+                "label": "Vectorize connectivity rules",
+                "help": "Evaluate string-based connectivity functions (probability, convergence, divergence, weight, delay, etc) over NumPy arrays of all pre and post cells at once; produces the same connections as the default per-pair evaluation (default: False).",
+                "suggestions": "",
+                "type": "bool"
+            },
+            "connTable": {
+                "label": "Store conns in table",
+                "help": "Store the conns of all cells in a node in a table with one typed column per conn param (struct-of-arrays) instead of a list of dicts per cell; reduces memory and speeds up gathering, saving, modifying and analyzing conns (default: False).",
+                "suggestions": "",
+                "type": "bool"
+            },
+            "distributeCells": {
+                "label": "Cell distribution method",
+                "help": "Method to distribute cells across hosts: 'roundRobin' (default); 'cost', which assigns each cell to the host with lowest predicted load based on the estimated cost of each cell (segments, mechanisms and expected synapses, or cfg.cellCostProfile); or 'partition', which co-locates strongly interconnected populations while balancing the estimated cost of each host.",
+                "suggestions": "",
+                "type": "str"
+            },
+            "cellCostProfile": {
+                "label": "Cell cost profile file",
+                "help": "JSON file with cost per cell of each population measured in a previous run (saved via sim.loadBalance(saveProfile=filename)); used to distribute cells when distributeCells='cost' (default: None).",
+                "suggestions": "",
+                "type": "str"
+            },
+            "partitionGraphFile": {
+                "label": "Partition graph file",
+                "help": "Saved network file (json or pkl) used to count the conns between populations when distributeCells='partition'; if None, the expected conns are estimated from connParams (default: None).",
+                "suggestions": "",
+                "type": "str"
+            },
+            "arrayGather": {
+                "label": "Gather data as arrays",
+                "help": "Gather spikes and traces from all nodes as contiguous arrays instead of pickled dicts (traces stored as 2D arrays; 'float32' to reduce memory) (default: False).",
+                "suggestions": "",
+                "type": "bool"
+            },
+            "distributedSave": {
+                "label": "Distributed save",
+                "help": "Each node saves its cells, conns, spikes and traces to its own file (filename.rankN.npz) plus a manifest (filename_manifest.json), instead of gathering all data in the master node (default: False).",
+                "suggestions": "",
+                "type": "bool"
+            },
+            "saveNpy": {
+                "label": "Save as NPY",
+                "help": "Save data to directory of .npy files (columnar format that can be loaded partially using sim.load(include=...)) (default: False).",
+                "suggestions": "",
+                "type": "bool"
+            },
+            "cellPrototypes": {
+                "label": "Create cells from prototype of cell type",
+                "help": "Build python struct and NEURON recipe once per cell type (combination of cellParams rules) and create cells from it, sharing its (read-only) section params; params modified for a cell are copied on write (default: False).",
+                "suggestions": "",
+                "type": "bool"
+            },
+            "bulkNetCons": {
+                "label": "Create NetCons in bulk",
+                "help": "Create NetCons of each cell in bulk after applying all conn rules, instead of one at a time when each conn is added; not used with gap junctions, conns with shape or postsyn point cells (default: False).",
+                "suggestions": "",
+                "type": "bool"
+            },
+            "numpyBackend": {
+                "label": "NumPy backend for point cells",
+                "help": "Simulate networks of point cells (IntFire1, IntFire2, IntFire4, NetStim, VecStim) with NumPy instead of NEURON; requires createNEURONObj=False (default: False).",
+                "suggestions": "",
+                "type": "bool"
+            },
+            "vecStimBatch": {
+                "label": "Generate VecStim spikes in batch",
+                "help": "Generate the spike times of all VecStims of each pop at once from vectorized Random123 streams, with the same trains as when generated one by one (default: False).",
+                "suggestions": "",
+                "type": "bool"
+            },
+            "vecStimCache": {
+                "label": "VecStim spike times cache",
+                "help": "Folder to cache VecStim spike times generated in batch, reused in runs with the same params, gids and duration; None to disable (default: None).",
+                "suggestions": "",
+                "type": "str"
+            },
+            "streamOutput": {
+                "label": "Stream output to disk",
+                "help": "Write spikes and traces to disk at intervals during the run, eg. {'interval': 1000, 'format': 'h5'}; merged at the end into <filename>_stream, with the layout of saveNpy (default: None).",
+                "suggestions": "",
+                "type": "dict"
+            },
+            "checkpointInterval": {
+                "label": "Checkpoint interval (ms)",
+                "help": "Save a checkpoint of the simulation (NEURON state, stim random streams and recorded data of each node) every interval, to continue the run with sim.resume(checkpointDir) (default: None).",
+                "suggestions": "",
+                "type": "float"
+            },
+            "checkpointDir": {
+                "label": "Checkpoint folder",
+                "help": "Folder where checkpoints are saved (default: None, ie. <filename>_checkpoint).",
+                "suggestions": "",
+                "type": "str"
+            },
+            "saveStateDir": {
+                "label": "Save state folder",
+                "help": "Folder where the state at the end of the run is saved, to warm start other runs with warmStartDir (default: None).",
+                "suggestions": "",
+                "type": "str"
+            },
+            "warmStartDir": {
+                "label": "Warm start folder",
+                "help": "Folder with state saved with saveStateDir from which to start the simulation; only the time from the saved state to duration is simulated (default: None).",
+                "suggestions": "",
+                "type": "str"
+            },
             "connRandomSecFromList": {
                 "label": "Select random sections from list for connection",
                 "help": "Select random section (and location) from list even when synsPerConn=1 (default: True).",
@@ -5,4 +5,6 @@ from __future__ import absolute_import
 from future import standard_library
 standard_library.install_aliases()
 from .network import Network
-from .pop import Pop
\ No newline at end of file
+from .pop import Pop
+from .cellTagTable import CellTagTable
+from .connTable import ConnTable, CellConns
\ No newline at end of file
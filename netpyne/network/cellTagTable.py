@@ -0,0 +1,130 @@
+"""
+cellTagTable.py
+
+Contains CellTagTable class to select cells based on their tags
+
+Contributors: salvadordura@gmail.com
+"""
+from __future__ import print_function
+from __future__ import division
+from __future__ import unicode_literals
+from __future__ import absolute_import
+
+from builtins import range
+try:
+    basestring
+except NameError:
+    basestring = str
+from future import standard_library
+standard_library.install_aliases()
+import numpy as np
+
+
+###############################################################################
+#
+# CELL TAG TABLE CLASS
+#
+###############################################################################
+
+class CellTagTable (object):
+    ''' Columnar table of cell tags (one NumPy column per tag) with hash indexes on categorical tags (eg. pop, cellType)
+    and sorted indexes on numeric tags (eg. x, ynorm), used to select the cells matching a set of conditions
+    (preConds, postConds, stim conds, analysis include) without scanning the tags of every cell '''
+
+    numericKeys = ['x', 'y', 'z', 'xnorm', 'ynorm', 'znorm']
+
+    def __init__(self, cellsTags):
+        self.tags = cellsTags  # dict {gid: tags}; rows follow the dict order
+        self.gids = np.array(list(cellsTags), dtype=int)
+        self.columns = {}  # tag columns (built on first use)
+        self.hashIndexes = {}  # categorical tag -> {value: array of rows}
+        self.sortedIndexes = {}  # numeric tag -> (sorted values, rows)
+
+
+    def __len__(self):
+        return len(self.gids)
+
+
+    def column(self, key):
+        ''' Returns array with the value of tag `key` for each cell (NaN or None if missing) '''
+        if key not in self.columns:
+            if key in self.numericKeys:
+                self.columns[key] = np.array([tags.get(key, np.nan) for tags in self.tags.values()], dtype=float)
+            else:
+                column = np.empty(len(self.gids), dtype=object)
+                column[:] = [tags.get(key, None) for tags in self.tags.values()]
+                self.columns[key] = column
+        return self.columns[key]
+
+
+    def _hashIndex(self, key):
+        ''' Returns dict with rows of cells for each value of tag `key` (None if values are not hashable) '''
+        if key not in self.hashIndexes:
+            index = {}
+            try:
+                for row, value in enumerate(self.column(key)):
+                    index.setdefault(value, []).append(row)
+                self.hashIndexes[key] = {value: np.array(rows, dtype=int) for value, rows in index.items()}
+            except TypeError:  # unhashable tag values (eg. lists)
+                self.hashIndexes[key] = None
+        return self.hashIndexes[key]
+
+
+    def _sortedIndex(self, key):
+        if key not in self.sortedIndexes:
+            rows = np.argsort(self.column(key), kind='mergesort')
+            self.sortedIndexes[key] = (self.column(key)[rows], rows)
+        return self.sortedIndexes[key]
+
+
+    def selectRows(self, conds):
+        ''' Returns sorted array of rows of cells matching all conditions, where each condition is either
+        a range [min, max) for numeric tags, a list of allowed values or a single value '''
+        rows = None
+        for condKey, condValue in conds.items():
+            if condKey in self.numericKeys:
+                values, sortedRows = self._sortedIndex(condKey)
+                start, end = np.searchsorted(values, condValue[0], side='left'), np.searchsorted(values, condValue[1], side='left')
+                condRows = np.sort(sortedRows[start:end])
+            else:
+                index = self._hashIndex(condKey)
+                condValues = condValue if isinstance(condValue, list) else [condValue]
+                if index is None:
+                    condRows = np.array([row for row, value in enumerate(self.column(condKey)) if value in condValues], dtype=int)
+                else:
+                    condRows = [index[value] for value in condValues if _hashable(value) and value in index]
+                    condRows = np.unique(np.concatenate(condRows)) if condRows else np.array([], dtype=int)
+            rows = condRows if rows is None else np.intersect1d(rows, condRows, assume_unique=True)
+            if len(rows) == 0: break
+
+        return np.arange(len(self.gids)) if rows is None else rows
+
+
+    def selectGids(self, conds):
+        ''' Returns list of gids of cells matching conditions (in table order) '''
+        return self.gids[self.selectRows(conds)].tolist()
+
+
+    def selectTags(self, conds):
+        ''' Returns dict {gid: tags} of cells matching conditions (in table order) '''
+        if not conds:
+            return dict(self.tags)
+        return {gid: self.tags[gid] for gid in self.selectGids(conds)}
+
+
+    def popGids(self, pop, relativeIndices=None):
+        ''' Returns list of gids of population `pop`, optionally only those at the given relative indices (int or list) '''
+        gids = self.selectGids({'pop': pop})
+        if relativeIndices is None:
+            return gids
+        if not isinstance(relativeIndices, list):
+            relativeIndices = [relativeIndices]
+        return [gids[i] for i in sorted(set(relativeIndices)) if 0 <= i < len(gids)]
+
+
+def _hashable(value):
+    try:
+        hash(value)
+        return True
+    except TypeError:
+        return False
@@ -22,8 +22,11 @@ except NameError:
 from future import standard_library
 standard_library.install_aliases()
 import numpy as np 
+import ast
+from time import time
 from array import array as arrayFast
 from numbers import Number
+from .cellTagTable import CellTagTable
 from numpy import array, sin, cos, tan, exp, sqrt, mean, inf, dstack, unravel_index, argsort, zeros, ceil, copy 
 
 
@@ -38,13 +41,16 @@ def connectCells (self):
     if sim.rank==0: 
         print('Making connections...')
 
-    if sim.nhosts > 1: # Gather tags from all cells 
-        allCellTags = sim._gatherAllCellTags()  
-    else:
-        allCellTags = {cell.gid: cell.tags for cell in self.cells}
+    allCellTags = self._getCellTagTable().tags  # gather tags from all cells 
     allPopTags = {-i: pop.tags for i,pop in enumerate(self.pops.values())}  # gather tags from pops so can connect NetStim pops
 
-    if self.params.subConnParams:  # do not create NEURON objs until synapses are distributed based on subConnParams
+    # create NetCons of each cell in bulk once all conn rules are applied (not supported for gap junctions, conns with 
+    # time-dependent weight shape, or postsyn point cells)
+    bulkNetCons = sim.cfg.bulkNetCons and sim.cfg.createNEURONObj and sim.cfg.createPyStruct \
+        and not any('gapJunction' in connParam or 'shape' in connParam for connParam in self.params.connParams.values()) \
+        and all(isinstance(cell, sim.CompartCell) for cell in self.cells if cell.tags.get('cellModel') not in ['NetStim', 'VecStim'])
+
+    if self.params.subConnParams or bulkNetCons:  # do not create NEURON objs until synapses are distributed based on subConnParams
         origCreateNEURONObj = bool(sim.cfg.createNEURONObj)
         origAddSynMechs = bool(sim.cfg.addSynMechs)
         sim.cfg.createNEURONObj = False
@@ -106,15 +112,22 @@ def connectCells (self):
     # apply subcellular connectivity params (distribution of synaspes)
     if self.params.subConnParams:
         self.subcellularConn(allCellTags, allPopTags)
+
+    if self.params.subConnParams or bulkNetCons:
         sim.cfg.createNEURONObj = origCreateNEURONObj # set to original value
         sim.cfg.addSynMechs = origAddSynMechs # set to original value
-        cellsUpdate = [c for c in sim.net.cells if c.tags['cellModel'] not in ['NetStim', 'VecStim']]
+        cellsUpdate = [c for c in sim.net.cells if c.tags.get('cellModel') not in ['NetStim', 'VecStim']]
         if sim.cfg.createNEURONObj:
+            startTime = time()
+            numNetCons = 0
             for cell in cellsUpdate:
                 # Add synMechs, stim and conn NEURON objects
                 cell.addStimsNEURONObj()
                 #cell.addSynMechsNEURONObj()
-                cell.addConnsNEURONObj()
+                numNetCons += cell.addConnsNEURONObj() or 0
+            netConsTime = time() - startTime
+            if sim.cfg.timing: 
+                print(('  Created %i NetCons on node %i in %0.2f s (%0.0f conns/s)' % (numNetCons, sim.rank, netConsTime, numNetCons / max(netConsTime, 1e-9))))
 
     nodeSynapses = sum([len(cell.conns) for cell in sim.net.cells]) 
     if sim.cfg.createPyStruct:
@@ -125,9 +138,11 @@ def connectCells (self):
     print(('  Number of connections on node %i: %i ' % (sim.rank, nodeConnections)))
     if nodeSynapses != nodeConnections:
         print(('  Number of synaptic contacts on node %i: %i ' % (sim.rank, nodeSynapses)))
+    self.connVersion += 1
     sim.pc.barrier()
     sim.timing('stop', 'connectTime')
-    if sim.rank == 0 and sim.cfg.timing: print(('  Done; cell connection time = %0.2f s.' % sim.timingData['connectTime']))
+    if sim.rank == 0 and sim.cfg.timing: 
+        print(('  Done; cell connection time = %0.2f s (%0.0f conns/s on node 0).' % (sim.timingData['connectTime'], nodeSynapses / max(sim.timingData['connectTime'], 1e-9))))
 
     return [cell.conns for cell in self.cells]
 
@@ -139,30 +154,14 @@ def connectCells (self):
 # -----------------------------------------------------------------------------
 def _findPrePostCellsCondition(self, allCellTags, preConds, postConds):
 
-    #try:
-    preCellsTags = dict(allCellTags)  # initialize with all presyn cells (make copy)
-    postCellsTags = None
+    # use indexed table of cell tags (shared by all conn rules) to find cells matching conditions
+    cellTagTable = self.cellTagTable if self.cellTagTable is not None and self.cellTagTable.tags is allCellTags else CellTagTable(allCellTags)
 
-    for condKey,condValue in preConds.items():  # Find subset of cells that match presyn criteria
-        if condKey in ['x','y','z','xnorm','ynorm','znorm']:
-            preCellsTags = {gid: tags for (gid,tags) in preCellsTags.items() if condValue[0] <= tags.get(condKey, None) < condValue[1]}  # dict with pre cell tags
-        else:
-            if isinstance(condValue, list): 
-                preCellsTags = {gid: tags for (gid,tags) in preCellsTags.items() if tags.get(condKey, None) in condValue}  # dict with pre cell tags
-            else:
-                preCellsTags = {gid: tags for (gid,tags) in preCellsTags.items() if tags.get(condKey, None) == condValue}  # dict with pre cell tags
+    preCellsTags = cellTagTable.selectTags(preConds)  # dict with pre cell tags
+    postCellsTags = None
 
     if preCellsTags:  # only check post if there are pre
-        postCellsTags = allCellTags
-        for condKey,condValue in postConds.items():  # Find subset of cells that match postsyn criteria
-            if condKey in ['x','y','z','xnorm','ynorm','znorm']:
-                postCellsTags = {gid: tags for (gid,tags) in postCellsTags.items() if condValue[0] <= tags.get(condKey, None) < condValue[1]}  # dict with post Cell objects}  # dict with pre cell tags
-            elif isinstance(condValue, list): 
-                postCellsTags = {gid: tags for (gid,tags) in postCellsTags.items() if tags.get(condKey, None) in condValue}  # dict with post Cell objects
-            else:
-                postCellsTags = {gid: tags for (gid,tags) in postCellsTags.items() if tags.get(condKey, None) == condValue}  # dict with post Cell objects
-    #except:
-    #   return None, None
+        postCellsTags = cellTagTable.selectTags(postConds)  # dict with post cell tags
 
     return preCellsTags, postCellsTags
 
@@ -171,6 +170,8 @@ def _findPrePostCellsCondition(self, allCellTags, preConds, postConds):
 # Convert connection param string to function
 # -----------------------------------------------------------------------------
 def _connStrToFunc (self, preCellsTags, postCellsTags, connParam):
+    from .. import sim
+
     # list of params that have a function passed in as a string
     paramsStrFunc = [param for param in self.connStringFuncParams+['probability', 'convergence', 'divergence'] if param in connParam and isinstance(connParam[param], basestring)]  
 
@@ -214,6 +215,12 @@ def _connStrToFunc (self, preCellsTags, postCellsTags, connParam):
         if isinstance(v, Number):
             dictVars[k] = v
 
+    # evaluate string-based functions over NumPy arrays of all pre/post cells (see cfg.vectorizeConns)
+    vectorize = getattr(sim.cfg, 'vectorizeConns', False)
+    if vectorize:
+        preArrays = self._cellTagsToArrays(preCellsTags)
+        postArrays = self._cellTagsToArrays(postCellsTags)
+
     # for each parameter containing a function, calculate lambda function and arguments
     for paramStrFunc in paramsStrFunc:
         strFunc = connParam[paramStrFunc]  # string containing function
@@ -221,7 +228,33 @@ def _connStrToFunc (self, preCellsTags, postCellsTags, connParam):
         strVars = [var for var in list(dictVars.keys()) if var in strFunc and var+'norm' not in strFunc]  # get list of variables used (eg. post_ynorm or dist_xyz)
         lambdaStr = 'lambda ' + ','.join(strVars) +': ' + strFunc # convert to lambda function 
         lambdaFunc = eval(lambdaStr)
-   
+
+        if paramStrFunc == 'probability' and self._connMaxDist(connParam)[0] is not None:
+            # only evaluated for pairs within maxDist (see probConn)
+            connParam[paramStrFunc+'Func'] = lambdaFunc
+            connParam[paramStrFunc+'FuncVars'] = {strVar: dictVars[strVar] for strVar in strVars} 
+            continue
+
+        if vectorize and paramStrFunc in ['probability', 'convergence', 'divergence']:
+            if paramStrFunc == 'probability' and not isinstance(connParam.get('disynapticBias', None), Number):
+                # matrix of values (one per pre+post cell; rows follow preCellsTags order, columns postCellsTags order)
+                values = self._connStrFuncEvalArrays(lambdaFunc, strVars, dictVars, 
+                    self._cellArraysReshape(preArrays, (-1, 1)), self._cellArraysReshape(postArrays, (1, -1)), 
+                    (len(preCellsTags), len(postCellsTags)))
+                if values is not None:
+                    connParam[paramStrFunc+'Func'] = values
+                    continue
+            elif paramStrFunc == 'convergence':
+                values = self._connStrFuncEvalArrays(lambdaFunc, strVars, dictVars, None, postArrays, (len(postCellsTags),))
+                if values is not None:
+                    connParam[paramStrFunc+'Func'] = dict(zip(postCellsTags, values.tolist()))
+                    continue
+            elif paramStrFunc == 'divergence':
+                values = self._connStrFuncEvalArrays(lambdaFunc, strVars, dictVars, preArrays, None, (len(preCellsTags),))
+                if values is not None:
+                    connParam[paramStrFunc+'Func'] = dict(zip(preCellsTags, values.tolist()))
+                    continue
+
         if paramStrFunc in ['probability']:
             # replace function with dict of values derived from function (one per pre+post cell)
             connParam[paramStrFunc+'Func'] = {(preGid,postGid): lambdaFunc(
@@ -245,6 +278,151 @@ def _connStrToFunc (self, preCellsTags, postCellsTags, connParam):
             connParam[paramStrFunc+'Func'] = lambdaFunc
             connParam[paramStrFunc+'FuncVars'] = {strVar: dictVars[strVar] for strVar in strVars} 
 
+    if vectorize:
+        # cache tag arrays so conn functions can evaluate weight, delay, etc over all selected conns at once
+        connParam['preCellsArrays'] = preArrays
+        connParam['postCellsArrays'] = postArrays
+
+
+# -----------------------------------------------------------------------------
+# Convert dict of cell tags to dict of NumPy arrays (vectorized conns)
+# -----------------------------------------------------------------------------
+def _cellTagsToArrays (self, cellsTags):
+    ''' Returns dict with one array per tag (x, y, z, xnorm, ynorm, znorm, borderCorrect), with values in cellsTags order '''
+    arrays = {}
+    for key in ['x', 'y', 'z', 'xnorm', 'ynorm', 'znorm', 'borderCorrect']:
+        try:
+            arrays[key] = np.array([tags[key] for tags in cellsTags.values()], dtype=float)
+        except (KeyError, TypeError, ValueError):
+            pass  # tag missing in some cells; string funcs using it will raise KeyError as in the per-pair evaluation
+    if 'borderCorrect' in arrays: 
+        arrays['borderCorrect'] = arrays['borderCorrect'].reshape((-1, 3)).T  # so borderCorrect[0] is the x correction of all cells
+    return arrays
+
+
+def _cellArraysReshape (self, arrays, shape, index=None):
+    ''' Select (optional) and reshape cell tag arrays so pre and post arrays broadcast against each other '''
+    out = {}
+    for key, values in arrays.items():
+        if key == 'borderCorrect':
+            values = values if index is None else values[:, index]
+            out[key] = values.reshape((3,)+shape)
+        else:
+            values = values if index is None else values[index]
+            out[key] = values.reshape(shape)
+    return out
+
+
+# -----------------------------------------------------------------------------
+# Evaluate string-based function over arrays of cell tags (vectorized conns)
+# -----------------------------------------------------------------------------
+def _connStrFuncEvalArrays (self, lambdaFunc, strVars, dictVars, preArrays, postArrays, shape, allowRand=True):
+    ''' Returns array of values with given shape, or None if the function can't be evaluated over arrays 
+    (eg. uses python built-ins like max() or draws more than one random number per value); the randomizer
+    sequence is then restored so the per-pair evaluation produces the same values '''
+    if 'rand' in strVars:
+        if not allowRand: return None
+        randSeq = self.rand.seq()
+    try:
+        args = {}
+        for strVar in strVars:
+            if strVar == 'rand':
+                args[strVar] = _RandArray(self.rand, shape)
+            elif isinstance(dictVars[strVar], Number):
+                args[strVar] = dictVars[strVar]
+            else:
+                args[strVar] = dictVars[strVar](preArrays, postArrays)
+        values = np.array(np.broadcast_to(lambdaFunc(**args), shape))
+        if 'rand' in strVars and args['rand'].numCalls != 1:  
+            raise ValueError('random values must be drawn in per-pair order') 
+        return values
+    except (TypeError, ValueError, AttributeError):
+        if 'rand' in strVars: self.rand.seq(randSeq)
+        return None
+
+
+# -----------------------------------------------------------------------------
+# Evaluate string-based weight, delay, etc for a set of conns (vectorized conns)
+# -----------------------------------------------------------------------------
+def _connStrFuncsToLists (self, preCellsTags, postCellsTags, connParam, preIndex, postIndex, allowRand=False):
+    ''' Sets connParam[param+'List'] with the values for each (preGid,postGid) pair given by preIndex and 
+    postIndex (positions in preCellsTags and postCellsTags); returns list of params that still need to be 
+    evaluated per conn (eg. those using rand, since the randomizer is reseeded for each conn) '''
+    preGids = np.array(list(preCellsTags), dtype=int)[preIndex].tolist()
+    postGids = np.array(list(postCellsTags), dtype=int)[postIndex].tolist()
+    preArrays = self._cellArraysReshape(connParam['preCellsArrays'], (-1,), preIndex)
+    postArrays = self._cellArraysReshape(connParam['postCellsArrays'], (-1,), postIndex)
+
+    paramsPerConn = []
+    for paramStrFunc in [p+'Func' for p in self.connStringFuncParams if p+'Func' in connParam]:
+        funcVars = connParam[paramStrFunc+'Vars']
+        values = self._connStrFuncEvalArrays(connParam[paramStrFunc], list(funcVars.keys()), funcVars, 
+            preArrays, postArrays, (len(preGids),), allowRand=allowRand)
+        if values is None: 
+            paramsPerConn.append(paramStrFunc)
+            if 'rand' in funcVars: allowRand = False  # keep order of random values drawn by later params
+        else:
+            connParam[paramStrFunc[:-4]+'List'] = dict(zip(zip(preGids, postGids), values.tolist()))
+    return paramsPerConn
+
+
+# -----------------------------------------------------------------------------
+# Create list of conns (vectorized conns)
+# -----------------------------------------------------------------------------
+def _addCellConnsVectorized (self, preCellsTags, postCellsTags, connParam, connPairs, funcKeys):
+    ''' Evaluates string-based functions over all (preGid,postGid) conn pairs at once and then creates the conns of each
+    postsyn cell in one batch (in order); gap junctions are created one at a time to keep the order of their ids '''
+    preIndexOf = {gid: i for i,gid in enumerate(preCellsTags)}
+    postIndexOf = {gid: i for i,gid in enumerate(postCellsTags)}
+    preIndex = np.array([preIndexOf[preGid] for preGid,_ in connPairs], dtype=int)
+    postIndex = np.array([postIndexOf[postGid] for _,postGid in connPairs], dtype=int)
+    paramsPerConn = self._connStrFuncsToLists(preCellsTags, postCellsTags, connParam, preIndex, postIndex)
+
+    connsPerCell = {} if not connParam.get('gapJunction') else None
+    for preCellGid, postCellGid in connPairs:
+        for paramStrFunc in paramsPerConn: # call lambda functions to get weight func args
+            for funcKey in funcKeys[paramStrFunc]:
+                connParam[paramStrFunc + 'Args'][funcKey] = connParam[paramStrFunc + 'Vars'][funcKey](preCellsTags[preCellGid], postCellsTags[postCellGid])
+        self._addCellConn(connParam, preCellGid, postCellGid, connsPerCell) # add connection
+
+    if connsPerCell:
+        for postCellGid, paramsList in connsPerCell.items():
+            self.cells[self.gid2lid[postCellGid]].addConns(paramsList)
+
+
+class _RandArray (object):
+    ''' Wraps h.Random() so that a string-based function (eg. 'rand.uniform(0,1)') returns an array with one value 
+    per pre/post pair, drawn in the same order as calling the method once per pair '''
+    # distributions without internal state (eg. normal caches values) can be filled in a single Vector.setrand() call
+    setrandMethods = ['uniform', 'discunif', 'negexp']
+
+    def __init__ (self, rand, shape):
+        self.rand = rand
+        self.shape = shape
+        self.numCalls = 0
+
+    def __getattr__ (self, method):
+        from .. import sim
+        randMethod = getattr(self.rand, method)
+
+        def draw (*args):
+            self.numCalls += 1
+            size = int(np.prod(self.shape))
+            values = np.zeros(size)
+            if all(np.ndim(arg) == 0 for arg in args) and method in self.setrandMethods:
+                if size > 0: values[0] = randMethod(*args)  # set distribution
+                if size > 1:
+                    vec = sim.h.Vector(size-1)
+                    vec.setrand(self.rand)
+                    values[1:] = vec.as_numpy()
+            else:
+                args = [np.broadcast_to(arg, self.shape).ravel() for arg in args]
+                for i in range(size):
+                    values[i] = randMethod(*[arg[i] for arg in args])
+            return values.reshape(self.shape)
+
+        return draw
+
 
 # -----------------------------------------------------------------------------
 # Disynaptic bias for probability
@@ -316,6 +494,11 @@ def fullConn (self, preCellsTags, postCellsTags, connParam):
     # get list of params that have a lambda function
     paramsStrFunc = [param for param in [p+'Func' for p in self.connStringFuncParams] if param in connParam] 
 
+    if 'preCellsArrays' in connParam:  # vectorized conns: evaluate over all pre+post cells at once 
+        numPre, numPost = len(preCellsTags), len(postCellsTags)
+        paramsStrFunc = self._connStrFuncsToLists(preCellsTags, postCellsTags, connParam, 
+            np.repeat(np.arange(numPre), numPost), np.tile(np.arange(numPost), numPre), allowRand=True)
+
     for paramStrFunc in paramsStrFunc:
         # replace lambda function (with args as dict of lambda funcs) with list of values
         connParam[paramStrFunc[:-4]+'List'] = {(preGid,postGid): connParam[paramStrFunc](**{k:v if isinstance(v, Number) else v(preCellTags,postCellTags) for k,v in connParam[paramStrFunc+'Vars'].items()})  
@@ -330,7 +513,7 @@ def fullConn (self, preCellsTags, postCellsTags, connParam):
 # -----------------------------------------------------------------------------
 # Generate random values for all pre and post cells (to use in prob conn)
 # -----------------------------------------------------------------------------
-def generateRandsPrePost(self, pre, post):
+def generateRandsPrePost(self, pre, post, asArray=False):
     from .. import sim
 
     sortedPre = sorted(pre)
@@ -343,7 +526,10 @@ def generateRandsPrePost(self, pre, post):
     lenPost = len(post)
     vec = sim.h.Vector(lenPre*lenPost)  # create Vector
     self.rand.uniform(0,1)  # set unfiform distribution
-    vecList = list(vec.setrand(self.rand))  # fill in vector 
+    vec.setrand(self.rand)  # fill in vector 
+    if asArray:  # matrix of rand values (rows = sorted pre gids, columns = sorted post gids)
+        return np.array(vec.as_numpy()).reshape((lenPre, lenPost))
+    vecList = list(vec)
     allRands = {(preGid,postGid): vecList[(ipre*lenPost)+ipost] 
         for ipre,preGid in enumerate(sortedPre) for ipost,postGid in enumerate(sortedPost)}  # convert to dict
 
@@ -359,8 +545,6 @@ def probConn (self, preCellsTags, postCellsTags, connParam):
     ''' Generates connections between all pre and post-syn cells based on probability values'''
     if sim.cfg.verbose: print('Generating set of probabilistic connections (rule: %s) ...' % (connParam['label']))
 
-    allRands = self.generateRandsPrePost(preCellsTags, postCellsTags)
-
     # get list of params that have a lambda function
     paramsStrFunc = [param for param in [p+'Func' for p in self.connStringFuncParams] if param in connParam]
 
@@ -370,6 +554,35 @@ def probConn (self, preCellsTags, postCellsTags, connParam):
         connParam[paramStrFunc + 'Args'] = connParam[paramStrFunc + 'Vars'].copy()
         funcKeys[paramStrFunc] = [key for key in connParam[paramStrFunc + 'Vars'] if callable(connParam[paramStrFunc + 'Vars'][key])]
 
+    # probabilistic connections only between cells within maxDist
+    maxDist, coords = self._connMaxDist(connParam)
+    if maxDist is not None:
+        self._probConnMaxDist(preCellsTags, postCellsTags, connParam, maxDist, coords, funcKeys)
+        return
+
+    # vectorized probabilistic connections (see cfg.vectorizeConns)
+    if 'preCellsArrays' in connParam and not isinstance(connParam.get('disynapticBias', None), Number):
+        preGids, postGids = list(preCellsTags), list(postCellsTags)
+        
+        # reorder rand values from sorted gids to preCellsTags/postCellsTags order
+        allRands = self.generateRandsPrePost(preCellsTags, postCellsTags, asArray=True)
+        allRands = allRands[np.ix_(argsort(argsort(preGids)), argsort(argsort(postGids)))]
+
+        if isinstance(connParam.get('probabilityFunc'), dict):  # string func could not be vectorized
+            probability = array(list(connParam['probabilityFunc'].values())).reshape(allRands.shape)
+        else:
+            probability = connParam['probabilityFunc'] if 'probabilityFunc' in connParam else connParam['probability']
+
+        # select conns of postsyn cells in this node; ordered by post and then pre cell (same as non-vectorized)
+        localPostIndex = np.flatnonzero([postCellGid in self.gid2lid for postCellGid in postGids])
+        connCreate = np.broadcast_to(probability >= allRands, allRands.shape)[:, localPostIndex]
+        postIndex, preIndex = np.nonzero(connCreate.T)
+        connPairs = [(preGids[ipre], postGids[ipost]) for ipre,ipost in zip(preIndex.tolist(), localPostIndex[postIndex].tolist())]
+        self._addCellConnsVectorized(preCellsTags, postCellsTags, connParam, connPairs, funcKeys)
+        return
+
+    allRands = self.generateRandsPrePost(preCellsTags, postCellsTags)
+
     # probabilistic connections with disynapticBias (deprecated)
     if isinstance(connParam.get('disynapticBias', None), Number):  
         allPreGids = sim._gatherAllCellConnPreGids()
@@ -404,6 +617,116 @@ def probConn (self, preCellsTags, postCellsTags, connParam):
                         self._addCellConn(connParam, preCellGid, postCellGid) # add connection
 
 
+# -----------------------------------------------------------------------------
+# Max distance between connected pre and post cells
+# -----------------------------------------------------------------------------
+def _connMaxDist (self, connParam):
+    ''' Returns (maxDist, coords) with the distance beyond which cells are not connected and the coordinates it applies to;
+    taken from connParam['maxDist'] (3D distance) or inferred from probability string functions of the form 
+    'A * (dist_3D < maxDist)' or 'A * (dist_2D < maxDist)'; returns (None, None) if there is no cutoff '''
+    if connParam.get('connFunc') != 'probConn' or isinstance(connParam.get('disynapticBias', None), Number): 
+        return None, None
+    if connParam.get('maxDist') is not None:
+        return connParam['maxDist'], ['x', 'y', 'z']
+
+    probability = connParam.get('probability')
+    if not isinstance(probability, basestring):
+        return None, None
+    try:
+        node = ast.parse(probability.strip(), mode='eval').body
+    except SyntaxError:
+        return None, None
+
+    # split product into factors; the cutoff applies if any of them is a distance comparison
+    factors, nodes = [], [node]
+    while nodes:
+        node = nodes.pop()
+        if isinstance(node, ast.BinOp) and isinstance(node.op, ast.Mult):
+            nodes.extend([node.left, node.right])
+        else:
+            factors.append(node)
+    for factor in factors:
+        if isinstance(factor, ast.Compare) and len(factor.ops) == 1 and isinstance(factor.ops[0], (ast.Lt, ast.LtE)) \
+                and isinstance(factor.left, ast.Name) and factor.left.id in ['dist_3D', 'dist_2D']:
+            comparator = factor.comparators[0]
+            value = getattr(comparator, 'value', getattr(comparator, 'n', None))
+            if isinstance(value, Number):
+                return value, ['x', 'y', 'z'] if factor.left.id == 'dist_3D' else ['x', 'z']
+    return None, None
+
+
+# -----------------------------------------------------------------------------
+# Generate random values for a subset of pre and post cell pairs (to use in prob conn)
+# -----------------------------------------------------------------------------
+def generateRandsPairs(self, pre, post, pairs):
+    ''' Returns the same values as generateRandsPrePost() for the given (preGid,postGid) pairs, without 
+    generating the values of all other pairs (uses the Random123 sequence index to jump to each value) '''
+    from .. import sim
+
+    sortedPre = sorted(pre)
+    sortedPost = sorted(post)
+    self.rand.Random123(sim.hashList(sortedPre), sim.hashList(sortedPost), sim.cfg.seeds['conn'])
+    self.rand.uniform(0,1)  # set unfiform distribution
+    seqStart = self.rand.seq()
+
+    lenPost = len(post)
+    preIndex = {gid: i for i,gid in enumerate(sortedPre)}
+    postIndex = {gid: i for i,gid in enumerate(sortedPost)}
+    rands = []
+    for preGid, postGid in pairs:
+        self.rand.seq(seqStart + preIndex[preGid]*lenPost + postIndex[postGid])
+        rands.append(self.rand.repick())
+
+    return rands
+
+
+# -----------------------------------------------------------------------------
+# Probabilistic connectivity between cells within max distance
+# -----------------------------------------------------------------------------
+def _probConnMaxDist (self, preCellsTags, postCellsTags, connParam, maxDist, coords, funcKeys):
+    ''' Uses a KD-tree of the presyn cell positions to evaluate only the pairs within maxDist (O(N*k) instead of O(N^2)) '''
+    from scipy.spatial import cKDTree
+
+    preGids = list(preCellsTags)
+    localPostGids = [gid for gid in postCellsTags if gid in self.gid2lid]
+    if not localPostGids: return
+
+    prePos = np.array([[tags[coord] for coord in coords] for tags in preCellsTags.values()], dtype=float)
+    postPos = np.array([[postCellsTags[gid][coord] for coord in coords] for gid in localPostGids], dtype=float)
+    neighbors = cKDTree(prePos).query_ball_point(postPos, r=maxDist)  # presyn cells within maxDist of each postsyn cell
+
+    # candidate pairs ordered by post and then pre cell (same as probConn)
+    candidatePairs = [(preGids[ipre], postGid) for postGid, ipres in zip(localPostGids, neighbors) for ipre in sorted(ipres)]
+    allRands = self.generateRandsPairs(preCellsTags, postCellsTags, candidatePairs)
+
+    if 'probabilityFunc' in connParam:
+        funcVars = connParam['probabilityFuncVars']
+        probabilities = None
+        if 'preCellsArrays' in connParam:  # vectorized conns
+            postIndexOf = {gid: i for i,gid in enumerate(postCellsTags)}
+            preIndex = np.array([ipre for ipres in neighbors for ipre in sorted(ipres)], dtype=int)
+            postIndex = np.array([postIndexOf[postGid] for _,postGid in candidatePairs], dtype=int)
+            probabilities = self._connStrFuncEvalArrays(connParam['probabilityFunc'], list(funcVars), funcVars,
+                self._cellArraysReshape(connParam['preCellsArrays'], (-1,), preIndex),
+                self._cellArraysReshape(connParam['postCellsArrays'], (-1,), postIndex), (len(candidatePairs),))
+        if probabilities is None:
+            probabilities = [connParam['probabilityFunc'](**{k: v if isinstance(v, Number) else v(preCellsTags[preGid], postCellsTags[postGid]) 
+                for k,v in funcVars.items()}) for preGid,postGid in candidatePairs]
+    else:
+        probabilities = [connParam['probability']] * len(candidatePairs)
+
+    connPairs = [pair for pair, probability, rand in zip(candidatePairs, probabilities, allRands) if probability >= rand]
+
+    if 'preCellsArrays' in connParam:  # vectorized conns
+        self._addCellConnsVectorized(preCellsTags, postCellsTags, connParam, connPairs, funcKeys)
+    else:
+        for preCellGid, postCellGid in connPairs:
+            for paramStrFunc in funcKeys: # call lambda functions to get weight func args
+                for funcKey in funcKeys[paramStrFunc]:
+                    connParam[paramStrFunc + 'Args'][funcKey] = connParam[paramStrFunc + 'Vars'][funcKey](preCellsTags[preCellGid], postCellsTags[postCellGid])
+            self._addCellConn(connParam, preCellGid, postCellGid) # add connection
+
+
 # -----------------------------------------------------------------------------
 # Generate random unique integers 
 # -----------------------------------------------------------------------------
@@ -440,6 +763,9 @@ def convConn (self, preCellsTags, postCellsTags, connParam):
     # calculate hash for post cell gids
     hashPreCells = sim.hashList(preCellsTagsKeys)
 
+    vectorize = 'preCellsArrays' in connParam  # collect conns and evaluate string funcs at once (see cfg.vectorizeConns)
+    connPairs = []
+
     for postCellGid,postCellTags in postCellsTags.items():  # for each postsyn cell
         if postCellGid in self.gid2lid:  # check if postsyn is in this node
             convergence = connParam['convergenceFunc'][postCellGid] if 'convergenceFunc' in connParam else connParam['convergence']  # num of presyn conns / postsyn cell
@@ -452,6 +778,10 @@ def convConn (self, preCellsTags, postCellsTags, connParam):
                                    for i in randSample[0:convergence]}  # dict of selected gids of postsyn cells with removed post gid
             preCellsConv = {k:v for k,v in preCellsTags.items() if k in preCellsSample}  # dict of selected presyn cells tags
 
+            if vectorize:
+                connPairs.extend([(preCellGid, postCellGid) for preCellGid in preCellsConv if preCellGid != postCellGid])
+                continue
+
             for preCellGid, preCellTags in preCellsConv.items():  # for each presyn cell
          
                 for paramStrFunc in paramsStrFunc: # call lambda functions to get weight func args
@@ -462,6 +792,9 @@ def convConn (self, preCellsTags, postCellsTags, connParam):
                 if preCellGid != postCellGid: # if not self-connection   
                     self._addCellConn(connParam, preCellGid, postCellGid) # add connection
 
+    if vectorize:
+        self._addCellConnsVectorized(preCellsTags, postCellsTags, connParam, connPairs, funcKeys)
+
 
 # -----------------------------------------------------------------------------
 # Divergent connectivity 
@@ -487,6 +820,9 @@ def divConn (self, preCellsTags, postCellsTags, connParam):
     # calculate hash for post cell gids
     hashPostCells = sim.hashList(postCellsTagsKeys)
 
+    vectorize = 'preCellsArrays' in connParam  # collect conns and evaluate string funcs at once (see cfg.vectorizeConns)
+    connPairs = []
+
     for preCellGid, preCellTags in preCellsTags.items():  # for each presyn cell
         divergence = connParam['divergenceFunc'][preCellGid] if 'divergenceFunc' in connParam else connParam['divergence']  # num of presyn conns / postsyn cell
         divergence = max(min(int(round(divergence)), len(postCellsTags)-1), 0)
@@ -497,6 +833,10 @@ def divConn (self, preCellsTags, postCellsTags, connParam):
         postCellsSample = {postCellsTagsKeys[randSample[divergence]] if postCellsTagsKeys[i]==preCellGid else postCellsTagsKeys[i]: 0
                                for i in randSample[0:divergence]}  # dict of selected gids of postsyn cells with removed pre gid
 
+        if vectorize:
+            connPairs.extend([(preCellGid, postCellGid) for postCellGid in postCellsSample if postCellGid in self.gid2lid and preCellGid != postCellGid])
+            continue
+
         for postCellGid in [c for c in postCellsSample if c in self.gid2lid]:            
             postCellTags = postCellsTags[postCellGid]
             for paramStrFunc in paramsStrFunc: # call lambda functions to get weight func args
@@ -507,6 +847,9 @@ def divConn (self, preCellsTags, postCellsTags, connParam):
             if preCellGid != postCellGid: # if not self-connection
                 self._addCellConn(connParam, preCellGid, postCellGid) # add connection
 
+    if vectorize:
+        self._addCellConnsVectorized(preCellsTags, postCellsTags, connParam, connPairs, funcKeys)
+
 
 # -----------------------------------------------------------------------------
 # From list connectivity 
@@ -552,7 +895,9 @@ def fromListConn (self, preCellsTags, postCellsTags, connParam):
 # -----------------------------------------------------------------------------
 # Set parameters and create connection
 # -----------------------------------------------------------------------------
-def _addCellConn (self, connParam, preCellGid, postCellGid):
+def _addCellConn (self, connParam, preCellGid, postCellGid, connsPerCell=None):
+    ''' Adds conn(s) from preCellGid to postCellGid (one per synMech); if connsPerCell (dict) is provided, the params of 
+    the conns are appended to the list of the postsyn gid instead, to be added later in one batch (Cell.addConns) '''
     from .. import sim
 
     # set final param values
@@ -609,7 +954,10 @@ def _addCellConn (self, connParam, preCellGid, postCellGid):
 
         if sim.cfg.includeParamsLabel: params['label'] = connParam.get('label')
         
-        postCell.addConn(params=params)
+        if connsPerCell is not None:
+            connsPerCell.setdefault(postCellGid, []).append(params)
+        else:
+            postCell.addConn(params=params)
 
 
 
@@ -0,0 +1,438 @@
+"""
+connTable.py
+
+Contains ConnTable class to store the conns of all cells in a node as typed columns
+
+Contributors: salvadordura@gmail.com
+"""
+from __future__ import print_function
+from __future__ import division
+from __future__ import unicode_literals
+from __future__ import absolute_import
+
+from builtins import range
+try:
+    basestring
+except NameError:
+    basestring = str
+from future import standard_library
+standard_library.install_aliases()
+from array import array
+from numbers import Number
+import numpy as np
+
+
+###############################################################################
+#
+# CONN TABLE CLASS
+#
+###############################################################################
+
+class ConnTable (object):
+    ''' Struct-of-arrays storage for the conns of all cells in a node (one typed column per conn param);
+    section, synMech and label strings are interned to small int codes, and NetCons are kept in an object column
+    (list indexed by row). Cells access their conns through
+    CellConns (list-like) and ConnView (dict-like) views, so code using cell.conns works unchanged '''
+
+    numericColumns = {'preGid': 'l', 'loc': 'd', 'weight': 'd', 'delay': 'd'}
+    labelColumns = ['sec', 'synMech', 'label', 'preLabel']
+    objectColumns = ['hObj']  # NEURON objects present in (almost) all conns
+    netStimPreGid = -1  # preGid code for conns from NetStims (preGid = 'NetStim')
+
+    def __init__(self):
+        self.postGid = array('l')
+        self.columns = {key: array(typecode) for key, typecode in self.numericColumns.items()}
+        self.columns.update({key: array('i') for key in self.labelColumns})
+        self.labels = {key: [_Missing] for key in self.labelColumns}  # code -> label (code 0 = param missing)
+        self.labelCodes = {key: {} for key in self.labelColumns}  # label -> code
+        self.objects = {key: [] for key in self.objectColumns}  # row -> object (_Missing if not set)
+        self.extra = {}  # row -> dict of params not stored in columns (eg. plast, shape, gapJunction)
+        self.cellRows = {}  # postGid -> rows of conns of that cell (in order of creation)
+
+
+    def __len__(self):
+        return len(self.postGid)
+
+
+    def _labelCode(self, key, label):
+        codes = self.labelCodes[key]
+        if label not in codes:
+            codes[label] = len(self.labels[key])
+            self.labels[key].append(label)
+        return codes[label]
+
+
+    def cellConns(self, gid):
+        ''' Returns list-like view of the conns of cell gid '''
+        return CellConns(self, gid)
+
+
+    def addConn(self, postGid, conn):
+        ''' Adds conn (dict) to the table and returns its row '''
+        row = len(self.postGid)
+        self.postGid.append(postGid)
+        for key in self.numericColumns:
+            self.columns[key].append(0)
+        for key in self.labelColumns:
+            self.columns[key].append(0)
+        for key in self.objectColumns:
+            self.objects[key].append(_Missing)
+        missing = [key for key in self.numericColumns if key not in conn]
+        if missing:
+            self.extra[row] = {'_missing': missing}
+        for key, value in conn.items():
+            self.setValue(row, key, value)
+        self.cellRows.setdefault(postGid, array('l')).append(row)
+        return row
+
+
+    def getValue(self, row, key):
+        extra = self.extra.get(row)
+        if extra is not None:
+            if key in extra and key != '_missing':
+                return extra[key]
+            if key in extra.get('_missing', []):
+                raise KeyError(key)
+        if key in self.numericColumns:
+            value = self.columns[key][row]
+            if key == 'preGid' and value == self.netStimPreGid:
+                return 'NetStim'
+            return value
+        elif key in self.labelColumns:
+            value = self.labels[key][self.columns[key][row]]
+            if value is _Missing: raise KeyError(key)
+            return value
+        elif key in self.objectColumns:
+            value = self.objects[key][row]
+            if value is _Missing: raise KeyError(key)
+            return value
+        raise KeyError(key)
+
+
+    def setValue(self, row, key, value):
+        extra = self.extra.get(row)
+        if key == 'preGid' and value == 'NetStim':
+            value = self.netStimPreGid
+        if key in self.numericColumns and isinstance(value, Number) and not isinstance(value, bool) \
+                and (self.numericColumns[key] == 'd' or value == int(value)):
+            self.columns[key][row] = value if self.numericColumns[key] == 'd' else int(value)
+        elif key in self.labelColumns and _hashable(value):
+            self.columns[key][row] = self._labelCode(key, value)
+        elif key in self.objectColumns:
+            self.objects[key][row] = value
+        else:  # param not stored in columns (or value not representable, eg. list of weights)
+            if extra is None:
+                extra = self.extra[row] = {}
+            extra[key] = value
+            return
+        if extra is not None:
+            extra.pop(key, None)
+            if key in extra.get('_missing', []):
+                extra['_missing'].remove(key)
+
+
+    def rowKeys(self, row):
+        extra = self.extra.get(row, {})
+        missing = extra.get('_missing', [])
+        keys = [key for key in self.numericColumns if key not in missing and key not in extra]
+        keys += [key for key in self.labelColumns if self.columns[key][row] != 0 and key not in extra]
+        keys += [key for key in self.objectColumns if self.objects[key][row] is not _Missing]
+        keys += [key for key in extra if key != '_missing']
+        return keys
+
+
+    def getColumn(self, key, rows=None):
+        ''' Returns NumPy array with column values (label columns as int codes; see self.labels) '''
+        dtype = float if self.numericColumns.get(key) == 'd' else int
+        values = self.postGid if key == 'postGid' else self.columns[key]
+        if rows is None:
+            return np.array(values, dtype=dtype)
+        if not len(values):
+            return np.array([], dtype=dtype)
+        column = np.frombuffer(values, dtype=np.dtype(values.typecode))  # view (no copy of whole column)
+        selected = column[np.asarray(rows, dtype=int)].astype(dtype)
+        del column  # release buffer so column can grow
+        return selected
+
+
+    def getRows(self, gids=None):
+        ''' Returns array of rows of conns of the given postsyn cells (all rows if None) '''
+        if gids is None:
+            return np.arange(len(self.postGid))
+        rows = [self.cellRows[gid] for gid in gids if gid in self.cellRows]
+        return np.concatenate([np.array(r, dtype=int) for r in rows]) if rows else np.array([], dtype=int)
+
+
+    def setColumn(self, key, rows, value):
+        ''' Sets the same value for param key of the given rows (vectorized when the value fits in the column) '''
+        rows = np.asarray(rows, dtype=int)
+        if key == 'preGid' and value == 'NetStim':
+            value = self.netStimPreGid
+        if key in self.numericColumns and isinstance(value, Number) and not isinstance(value, bool):
+            column = np.frombuffer(self.columns[key], dtype=float if self.numericColumns[key] == 'd' else np.dtype(self.columns[key].typecode))
+            column[rows] = value
+            del column  # release buffer so column can grow
+            for row in rows.tolist():
+                if row in self.extra:
+                    self.extra[row].pop(key, None)
+                    if key in self.extra[row].get('_missing', []):
+                        self.extra[row]['_missing'].remove(key)
+        else:
+            for row in rows.tolist():
+                self.setValue(row, key, value)
+
+
+    def selectRows(self, conds, rows):
+        ''' Returns the subset of rows of conns matching conditions (range [min, max], list of values or single value) '''
+        rows = np.asarray(rows, dtype=int)
+        for condKey, condVal in conds.items():
+            if condKey in self.numericColumns or condKey == 'postGid':
+                values = self.getColumn(condKey, rows).astype(object)
+                if condKey == 'preGid':
+                    values[values == self.netStimPreGid] = 'NetStim'
+            elif condKey in self.labelColumns:
+                values = np.array([None]+self.labels[condKey][1:], dtype=object)[self.getColumn(condKey, rows)]
+            else:
+                values = np.array([self.extra.get(row, {}).get(condKey) for row in rows.tolist()] + [None], dtype=object)[:-1]
+
+            # params stored outside columns
+            for i, row in enumerate(rows.tolist()):
+                if row in self.extra and condKey in self.extra[row]:
+                    values[i] = self.extra[row][condKey]
+
+            if isinstance(condVal, list) and isinstance(condVal[0], Number):
+                mask = [value is not None and condVal[0] <= value <= condVal[1] for value in values]
+            elif isinstance(condVal, list):
+                mask = [value in condVal for value in values]
+            else:
+                mask = [value == condVal for value in values]
+            rows = rows[np.array(mask, dtype=bool)] if len(rows) else rows
+        return rows
+
+
+    def toLists(self, rows, connFormat):
+        ''' Returns list of conns of the given rows in compact list format (one list of values per conn, ordered by connFormat) '''
+        rows = np.asarray(rows, dtype=int)
+        columnValues = []
+        for key in connFormat:
+            if key in self.numericColumns:
+                values = self.getColumn(key, rows).tolist()
+                if key == 'preGid':
+                    values = ['NetStim' if value == self.netStimPreGid else value for value in values]
+            elif key in self.labelColumns:
+                labels = self.labels[key]
+                values = [labels[code] if code else None for code in self.getColumn(key, rows).tolist()]
+            else:
+                values = [None] * len(rows)
+            columnValues.append(values)
+        conns = [list(conn) for conn in zip(*columnValues)] if columnValues else [[] for row in rows]
+
+        # params stored outside columns
+        for iconn, row in enumerate(rows.tolist()):
+            if row in self.extra:
+                for i, key in enumerate(connFormat):
+                    if key in self.extra[row] and key != '_missing':
+                        conns[iconn][i] = self.extra[row][key]
+        return conns
+
+
+    def toDicts(self, rows, exclude=[]):
+        ''' Returns list of conns of the given rows as dicts '''
+        return [{key: self.getValue(row, key) for key in self.rowKeys(row) if key not in exclude} for row in rows]
+
+
+    def getState(self, rows=None):
+        ''' Returns picklable dict with the columns (used to gather the tables of all nodes) of all rows or the given
+        rows (renumbered in that order); excludes NEURON objects '''
+        state = {'postGid': self.getColumn('postGid', rows), 'labels': {key: [None]+labels[1:] for key, labels in self.labels.items()}}
+        state.update({key: self.getColumn(key, rows) for key in self.columns})
+        if rows is None:
+            extras = self.extra.items()
+        else:
+            extras = [(i, self.extra[row]) for i, row in enumerate(np.asarray(rows, dtype=int).tolist()) if row in self.extra]
+        state['extra'] = {row: {k: v for k, v in extra.items() if not k.startswith('h')} for row, extra in extras}
+        return state
+
+
+    @classmethod
+    def fromStates(cls, states):
+        ''' Creates ConnTable by concatenating the states (see getState()) of several tables (eg. one per node) '''
+        table = cls()
+        offset = 0
+        for state in states:
+            numConns = len(state['postGid'])
+            table.postGid.extend(state['postGid'].tolist())
+            for key in table.numericColumns:
+                table.columns[key].extend(state[key].tolist())
+            for key in table.labelColumns:  # remap label codes
+                codeMap = np.array([0] + [table._labelCode(key, label) for label in state['labels'][key][1:]], dtype=int)
+                table.columns[key].extend(codeMap[state[key]].tolist())
+            for key in table.objectColumns:  # NEURON objects not included in states
+                table.objects[key].extend([_Missing] * numConns)
+            for row, extra in state['extra'].items():
+                table.extra[row+offset] = dict(extra)
+            offset += numConns
+
+        order = np.argsort(np.array(table.postGid, dtype=int), kind='mergesort')
+        postGids = np.array(table.postGid, dtype=int)[order]
+        if len(order):
+            bounds = np.flatnonzero(np.diff(postGids)) + 1
+            for gid, rows in zip(postGids[np.concatenate(([0], bounds))].tolist(), np.split(order, bounds)):
+                table.cellRows[gid] = array('l', rows.tolist())
+        return table
+
+
+###############################################################################
+#
+# CELL CONNS VIEW (list-like)
+#
+###############################################################################
+
+class CellConns (object):
+    ''' List-like view of the conns of a cell stored in a ConnTable '''
+
+    def __init__(self, table, gid):
+        self.table = table
+        self.gid = gid
+
+    def _rows(self):
+        return self.table.cellRows.get(self.gid, [])
+
+    def __len__(self):
+        return len(self._rows())
+
+    def __bool__(self):
+        return len(self) > 0
+    __nonzero__ = __bool__
+
+    def __getitem__(self, index):
+        rows = self._rows()
+        if isinstance(index, slice):
+            return [ConnView(self.table, row) for row in rows[index]]
+        return ConnView(self.table, rows[index])
+
+    def __iter__(self):
+        for row in list(self._rows()):
+            yield ConnView(self.table, row)
+
+    def append(self, conn):
+        self.table.addConn(self.gid, conn)
+
+    def extend(self, conns):
+        for conn in conns:
+            self.append(conn)
+
+    def todicts(self, exclude=[]):
+        return self.table.toDicts(self._rows(), exclude=exclude)
+
+    def tolists(self, connFormat):
+        return self.table.toLists(self._rows(), connFormat)
+
+    def __reduce__(self):
+        # pickled as the columns of the cell conns, and unpickled as list of dicts (eg. in saved files)
+        return (_connDicts, (self.table.getState(self._rows()),))
+
+    def __repr__(self):
+        return repr(self.todicts())
+
+
+###############################################################################
+#
+# CONN VIEW (dict-like)
+#
+###############################################################################
+
+class ConnView (object):
+    ''' Dict-like view of a single conn (row) stored in a ConnTable '''
+
+    __slots__ = ['table', 'row']
+
+    def __init__(self, table, row):
+        self.table = table
+        self.row = row
+
+    def __getitem__(self, key):
+        return self.table.getValue(self.row, key)
+
+    def __setitem__(self, key, value):
+        self.table.setValue(self.row, key, value)
+
+    def __getattr__(self, key):
+        if key.startswith('__') or key in self.__slots__:
+            raise AttributeError(key)
+        try:
+            return self.table.getValue(self.row, key)
+        except KeyError:
+            raise AttributeError(key)
+
+    def __contains__(self, key):
+        return key in self.table.rowKeys(self.row)
+
+    def __iter__(self):
+        return iter(self.keys())
+
+    def __len__(self):
+        return len(self.keys())
+
+    def __eq__(self, other):
+        return isinstance(other, ConnView) and other.table is self.table and other.row == self.row
+
+    def __ne__(self, other):
+        return not self.__eq__(other)
+
+    def __hash__(self):
+        return hash((id(self.table), self.row))
+
+    def get(self, key, default=None):
+        try:
+            return self.table.getValue(self.row, key)
+        except KeyError:
+            return default
+
+    def keys(self):
+        return self.table.rowKeys(self.row)
+
+    def values(self):
+        return [self[key] for key in self.keys()]
+
+    def items(self):
+        return [(key, self[key]) for key in self.keys()]
+
+    def pop(self, key, *default):
+        value = self.get(key, *default) if default else self[key]
+        if key in self.table.objectColumns:
+            self.table.objects[key][self.row] = _Missing
+        extra = self.table.extra.get(self.row)
+        if extra is not None and key in extra:
+            del extra[key]
+        return value
+
+    def copy(self):
+        return dict(self.items())
+
+    def todict(self):
+        return self.copy()
+
+    def __repr__(self):
+        return repr(self.copy())
+
+
+def _connDicts (state):
+    ''' Returns list of conn dicts from the state of a ConnTable (see CellConns.__reduce__) '''
+    return ConnTable.fromStates([state]).toDicts(range(len(state['postGid'])))
+
+
+class _MissingType (object):
+    ''' Marker for conn params not included in a conn '''
+    def __repr__(self):
+        return 'Missing'
+
+_Missing = _MissingType()
+
+
+def _hashable(value):
+    try:
+        hash(value)
+        return True
+    except TypeError:
+        return False
@@ -67,8 +67,12 @@ def modifyConns (self, params, updateMasterAllCells=False):
     if sim.rank==0: 
         print('Modfying connection parameters...')
 
-    for cell in self.cells:
-        cell.modifyConns(params)
+    if self._connTableCells() and all(isinstance(cell.conns, sim.CellConns) for cell in self.cells):
+        self._modifyConnTable(params)  # select and modify conns using the table columns
+    else:
+        for cell in self.cells:
+            cell.modifyConns(params)
+    self.connVersion += 1
 
     if updateMasterAllCells:
         sim._gatherCells()  # update allCells
@@ -77,6 +81,54 @@ def modifyConns (self, params, updateMasterAllCells=False):
     if sim.rank == 0 and sim.cfg.timing: print(('  Done; connections modification time = %0.2f s.' % sim.timingData['modifyConnsTime']))
 
 
+# -----------------------------------------------------------------------------
+# Modify conn params stored in ConnTable (see cfg.connTable)
+# -----------------------------------------------------------------------------
+def _modifyConnTable (self, params):
+    from .. import sim
+    from numbers import Number
+
+    table = self.connTable
+    postConds = params.get('postConds', {})
+    postGids = []
+    for cell in self.cells:
+        conditionsMet = 1
+        for (condKey,condVal) in postConds.items():  # check if all conditions are met
+            if isinstance(condVal, list) and isinstance(condVal[0], Number):
+                if cell.tags.get(condKey) < condVal[0] or cell.tags.get(condKey) > condVal[1]:
+                    conditionsMet = 0
+                    break
+            elif isinstance(condVal, list):
+                if cell.tags.get(condKey) not in condVal:
+                    conditionsMet = 0
+                    break 
+            elif cell.tags.get(condKey) != condVal: 
+                conditionsMet = 0
+                break
+        if conditionsMet:
+            postGids.append(cell.gid)
+
+    rows = table.selectRows(params.get('conds', {}), table.getRows(postGids))
+    if len(rows) and 'preConds' in params:
+        print('Warning: modifyConns() does not yet support conditions of presynaptic cells')
+
+    newParams = {k: v for k,v in params.items() if k not in ['conds','preConds','postConds']}
+    if sim.cfg.createPyStruct:
+        for paramName, paramValue in newParams.items():
+            table.setColumn(paramName, rows, paramValue)
+    if sim.cfg.createNEURONObj:
+        for row in rows.tolist():
+            hObj = table.objects['hObj'][row]
+            for paramName, paramValue in newParams.items():
+                try:
+                    if paramName == 'weight':
+                        hObj.weight[0] = paramValue
+                    else:
+                        setattr(hObj, paramName, paramValue)
+                except:
+                    print('Error setting %s=%s on Netcon' % (paramName, str(paramValue)))
+
+
 # -----------------------------------------------------------------------------
 # Modify stim source params
 # -----------------------------------------------------------------------------
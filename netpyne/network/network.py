@@ -14,6 +14,9 @@ from __future__ import absolute_import
 from future import standard_library
 standard_library.install_aliases()
 from ..specs import ODict
+from .cellTagTable import CellTagTable
+from .connTable import ConnTable, CellConns
+from ..cell.pointCell import vecStimSpkTimesBatch
 from neuron import h  # import NEURON
 
 class Network (object):
@@ -43,6 +46,15 @@ class Network (object):
         self.gid2lid = {} # Empty dict for storing GID -> local index (key = gid; value = local id) -- ~x6 faster than .index() 
         self.lastGid = 0  # keep track of last cell gid 
         self.lastGapId = 0  # keep track of last gap junction gid 
+        self.cellTagTable = None  # table of tags of all cells (across nodes) used to select cells matching conditions
+        self.connTable = None  # table with conns of all cells in node (if cfg.connTable)
+        self.checkpointParams = None  # copy of params before creating the network, saved in checkpoints (if cfg.checkpointInterval)
+        self.connVersion = 0  # incremented each time conns are created or modified (used to invalidate cached conn matrix)
+        self.partitionStats = None  # expected edge cut and spike exchange of pops partition (if cfg.distributeCells='partition')
+        self.cellRuleMatches = None  # memoized labels of cellParams rules matching each combination of cell tags
+        self.cellPrototypes = {}  # python struct and NEURON recipe of each cell type (if cfg.cellPrototypes)
+        self.vecStimBatch = None  # VecStims of pop being created, to generate their spike times in batch (if cfg.vecStimBatch)
+        self.stimPools = {}  # NetStims shared by the targets of each stim source with 'pool' param
 
 
     # -----------------------------------------------------------------------------
@@ -73,13 +85,26 @@ class Network (object):
         if sim.rank==0: 
             print(("\nCreating network of %i cell populations on %i hosts..." % (len(self.pops), sim.nhosts))) 
         
+        if sim.cfg.distributeCells == 'partition': 
+            self._partitionPops()  # fraction of cells of each pop on each host based on conns between pops
+
+        self.cellRuleMatches, self.cellPrototypes = None, {}  # rebuilt from current cellParams
+
         for ipop in list(self.pops.values()): # For each pop instantiate the network cells (objects of class 'Cell')
+            if sim.cfg.vecStimBatch and sim.cfg.createNEURONObj and ipop.tags.get('cellModel') == 'VecStim':
+                self.vecStimBatch = []  # spike times of all VecStims of pop generated at once after creating them
             newCells = ipop.createCells() # create cells for this pop using Pop method
+            if self.vecStimBatch is not None:
+                spkTimes = vecStimSpkTimesBatch(self.vecStimBatch)
+                for cell in self.vecStimBatch:
+                    cell.playSpkTimes(spkTimes[cell.gid])
+                self.vecStimBatch = None
             self.cells.extend(newCells)  # add to list of cells
             sim.pc.barrier()
             if sim.rank==0 and sim.cfg.verbose: print(('Instantiated %d cells of population %s'%(len(newCells), ipop.tags['pop'])))  
 
         if self.params.defineCellShapes: self.defineCellShapes()
+        self.cellTagTable = None  # rebuilt with tags of new cells when required
   
         print(('  Number of cells on node %i: %i ' % (sim.rank,len(self.cells)))) 
         sim.pc.barrier()
@@ -88,17 +113,55 @@ class Network (object):
 
         return self.cells
 
+    # -----------------------------------------------------------------------------
+    # Get table with tags of all cells (gathered from all nodes)
+    # -----------------------------------------------------------------------------
+    def _getCellTagTable (self):
+        from .. import sim
+
+        if self.cellTagTable is None:
+            if sim.nhosts > 1: # Gather tags from all cells 
+                allCellTags = sim._gatherAllCellTags()  
+            else:
+                allCellTags = {cell.gid: cell.tags for cell in self.cells}
+            self.cellTagTable = CellTagTable(allCellTags)
+        return self.cellTagTable
+
+
+    # -----------------------------------------------------------------------------
+    # Get table storing conns of all cells in node (see cfg.connTable)
+    # -----------------------------------------------------------------------------
+    def _getConnTable (self):
+        if self.connTable is None:
+            self.connTable = ConnTable()
+        return self.connTable
+
+
+    # -----------------------------------------------------------------------------
+    # Check if cell conns are stored in ConnTable
+    # -----------------------------------------------------------------------------
+    def _connTableCells (self):
+        return self.connTable is not None and any(isinstance(cell.conns, CellConns) for cell in self.cells)
+
+
     # -----------------------------------------------------------------------------
     # Import stim methods
     # -----------------------------------------------------------------------------
-    from .stim import addStims, _addCellStim, _stimStrToFunc
+    from .stim import addStims, _addCellStim, _stimStrToFunc, _getStimPool
 
     # -----------------------------------------------------------------------------
     # Import conn methods
     # -----------------------------------------------------------------------------
     from .conn import connectCells, _findPrePostCellsCondition, _connStrToFunc, \
         fullConn, generateRandsPrePost, probConn, randUniqueInt, convConn, divConn, fromListConn, \
-        _addCellConn, _disynapticBiasProb, _disynapticBiasProb2
+        _addCellConn, _disynapticBiasProb, _disynapticBiasProb2, _cellTagsToArrays, _cellArraysReshape, \
+        _connStrFuncEvalArrays, _connStrFuncsToLists, _addCellConnsVectorized, \
+        _connMaxDist, generateRandsPairs, _probConnMaxDist
+
+    # -----------------------------------------------------------------------------
+    # Import partition methods
+    # -----------------------------------------------------------------------------
+    from .partition import _partitionPops, _popConnGraph
 
     # -----------------------------------------------------------------------------
     # Import subconn methods
@@ -114,12 +177,12 @@ class Network (object):
     # -----------------------------------------------------------------------------
     # Import shape methods
     # -----------------------------------------------------------------------------
-    from .shape import calcSegCoords, defineCellShapes
+    from .shape import calcSegCoords, setImembPtr, defineCellShapes
 
     # -----------------------------------------------------------------------------
     # Import modify methods
     # -----------------------------------------------------------------------------
-    from .modify import modifyCells, modifySynMechs, modifyConns, modifyStims
+    from .modify import modifyCells, modifySynMechs, modifyConns, _modifyConnTable, modifyStims
 
 
 
@@ -0,0 +1,137 @@
+"""
+network/partition.py
+
+Network class methods to partition cells across hosts based on the connectivity between populations
+
+Contributors: salvadordura@gmail.com
+"""
+from __future__ import print_function
+from __future__ import unicode_literals
+from __future__ import division
+from __future__ import absolute_import
+
+from builtins import range
+from future import standard_library
+standard_library.install_aliases()
+import numpy as np
+from .pop import Pop, _tagsMatchConds
+
+stringConnDensity = 0.1  # fraction of cell pairs assumed to be connected by conn rules with string-based functions
+
+
+# -----------------------------------------------------------------------------
+# Partition pops across hosts (cfg.distributeCells = 'partition')
+# -----------------------------------------------------------------------------
+def _partitionPops (self):
+    ''' Assigns to each pop the fraction of its cells placed on each host, co-locating strongly interconnected pops
+    while balancing the estimated cost of each host. Pops are ordered so that each pop is followed by the pop it is most
+    connected to, and the cost of their cells is laid out along a line which is cut into nhosts equal segments; within
+    each pop, cells are assigned to hosts by recursive coordinate bisection of their locations (see Pop._distributeCells) '''
+    from .. import sim
+
+    popLabels, connGraph = self._popConnGraph()
+    numCells = np.array([Pop._numCellsEstimate(self.pops[pop].tags) for pop in popLabels], dtype=float)
+    costs = numCells * np.array([self.pops[pop]._estimateCellCost() for pop in popLabels])
+
+    # order pops greedily following strongest connection to last placed pop
+    weights = connGraph + connGraph.T
+    remaining = [i for i in range(len(popLabels)) if numCells[i] > 0]
+    order = []
+    while remaining:
+        if order and weights[order[-1], remaining].max() > 0:
+            nextPop = remaining[int(np.argmax(weights[order[-1], remaining]))]
+        else:  # start new chain with pop most connected to those already placed (or the most costly)
+            linked = weights[np.ix_(order, remaining)].sum(axis=0) if order else np.zeros(len(remaining))
+            nextPop = remaining[int(np.argmax(linked))] if linked.max() > 0 else remaining[int(np.argmax(costs[remaining]))]
+        order.append(nextPop)
+        remaining.remove(nextPop)
+
+    # cut line with cost of cells of ordered pops into nhosts segments of equal cost
+    hostBounds = np.linspace(0, costs.sum(), sim.nhosts+1)
+    start = 0.0
+    hostFractions = np.zeros((len(popLabels), sim.nhosts))
+    for ipop in order:
+        end = start + costs[ipop]
+        overlaps = np.clip(np.minimum(hostBounds[1:], end) - np.maximum(hostBounds[:-1], start), 0, None)
+        hostFractions[ipop] = overlaps / overlaps.sum() if overlaps.sum() > 0 else np.ones(sim.nhosts) / sim.nhosts
+        start = end
+
+    for ipop, pop in enumerate(popLabels):
+        self.pops[pop]._hostFractions = hostFractions[ipop] if numCells[ipop] > 0 else None  # unknown num cells: distribute by cost
+
+    # diagnostics: expected edge cut and spike exchange volume compared to round-robin
+    hostCells = hostFractions * numCells[:, np.newaxis]
+    roundRobinCells = np.ones((len(popLabels), sim.nhosts)) * numCells[:, np.newaxis] / sim.nhosts
+    self.partitionStats = {'pops': popLabels, 'order': [popLabels[i] for i in order], 'hostFractions': hostFractions.tolist()}
+    for label, cells in [('partition', hostCells), ('roundRobin', roundRobinCells)]:
+        edgeCut, exchange = _partitionCost(connGraph, cells, numCells)
+        self.partitionStats[label] = {'edgeCut': edgeCut, 'exchangeVolume': exchange}
+
+    if sim.rank == 0:
+        totalConns = connGraph.sum()
+        print('  Partitioned %d pops across %d hosts (pop order: %s)' % (len(order), sim.nhosts, ', '.join(self.partitionStats['order'])))
+        for label in ['partition', 'roundRobin']:
+            stats = self.partitionStats[label]
+            print('    %s: expected edge cut = %.0f conns (%.1f%%); spike exchange volume = %.0f remote host targets per spike of all cells' %
+                (label, stats['edgeCut'], 100.0 * stats['edgeCut'] / totalConns if totalConns > 0 else 0.0, stats['exchangeVolume']))
+
+    return self.partitionStats
+
+
+# -----------------------------------------------------------------------------
+# Graph with expected number of conns between pops
+# -----------------------------------------------------------------------------
+def _popConnGraph (self):
+    ''' Returns list of pop labels and matrix (pre x post pop) with the expected number of conns between pops, estimated
+    from connParams or counted from a previously saved network (cfg.partitionGraphFile) '''
+    from .. import sim
+
+    popLabels = list(self.pops.keys())
+    popIndex = {pop: i for i, pop in enumerate(popLabels)}
+    connGraph = np.zeros((len(popLabels), len(popLabels)))
+
+    graphFile = getattr(sim.cfg, 'partitionGraphFile', None)
+    if graphFile:  # count conns between pops in saved network
+        data = sim._loadFile(graphFile)
+        cells = data['net']['cells']
+        cellPops = {cell['gid']: cell['tags']['pop'] for cell in cells}
+        connFormat = data.get('simConfig', {}).get('compactConnFormat')
+        preGidIndex = connFormat.index('preGid') if connFormat else 'preGid'
+        for cell in cells:
+            if cell['tags']['pop'] not in popIndex: continue
+            for conn in cell['conns']:
+                prePop = cellPops.get(conn[preGidIndex])
+                if prePop in popIndex:
+                    connGraph[popIndex[prePop], popIndex[cell['tags']['pop']]] += 1
+        return popLabels, connGraph
+
+    # cheap pre-pass over connParams
+    numCells = np.array([Pop._numCellsEstimate(self.pops[pop].tags) for pop in popLabels], dtype=float)
+    for connParam in self.params.connParams.values():
+        preMatch = np.array([_tagsMatchConds(self.pops[pop].tags, connParam.get('preConds', {})) for pop in popLabels], dtype=bool)
+        postMatch = np.array([_tagsMatchConds(self.pops[pop].tags, connParam.get('postConds', {})) for pop in popLabels], dtype=bool)
+        numPre, numPost = numCells[preMatch].sum(), numCells[postMatch].sum()
+        if numPre == 0 or numPost == 0: continue
+        connsPerCell = Pop._expectedConnsPerCell(connParam, numPre, numPost, stringDensity=stringConnDensity)
+        # conns of each postsyn pop split across presyn pops proportional to their num of cells
+        connGraph += np.outer(numCells * preMatch / numPre, numCells * postMatch * connsPerCell)
+    return popLabels, connGraph
+
+
+# -----------------------------------------------------------------------------
+# Expected edge cut and spike exchange volume of a distribution of pop cells across hosts
+# -----------------------------------------------------------------------------
+def _partitionCost (connGraph, hostCells, numCells):
+    ''' Edge cut = expected conns between cells in different hosts; exchange volume = expected number of (cell, remote host
+    with targets of the cell) pairs, ie. number of remote hosts that need to receive a spike if all cells fire once '''
+    with np.errstate(divide='ignore', invalid='ignore'):
+        fractions = np.nan_to_num(hostCells / numCells[:, np.newaxis])  # pop x host
+        connsPerCell = np.nan_to_num(connGraph / numCells[:, np.newaxis])  # conns from each presyn cell to each postsyn pop
+    sameHost = fractions.dot(fractions.T)  # prob that random pre and post cells of each pair of pops are in the same host
+    edgeCut = (connGraph * (1 - sameHost)).sum()
+
+    targetsPerHost = connsPerCell.dot(fractions)  # expected targets of each presyn cell in each host (pop x host)
+    probTargets = 1 - np.exp(-targetsPerHost)  # prob of at least one target in host (Poisson)
+    remoteHosts = probTargets.sum(axis=1, keepdims=True) - probTargets  # remote hosts with targets for cell in each host
+    exchange = (hostCells * remoteHosts).sum()
+    return edgeCut, exchange
@@ -20,6 +20,8 @@ except NameError:
 from future import standard_library
 standard_library.install_aliases()
 from numpy import  pi, sqrt, sin, cos, arccos
+from numbers import Number
+import heapq
 import numpy as np
 from neuron import h # Import NEURON
 
@@ -41,26 +43,141 @@ class Pop (object):
         self.rand = h.Random()  # random number generator
 
 
-    def _distributeCells(self, numCellsPop):
-        ''' distribute cells across compute nodes using round-robin'''
+    # cost model constants (in units of the cost of a passive segment)
+    segCost = 1.0  # cost of each segment
+    mechCost = 1.0  # additional cost of each density mechanism or point process in a segment
+    synCost = 0.1  # cost of each synapse (incoming conn)
+    pointCellCost = 0.1  # cost of artificial cells (NetStim, VecStim, IntFire, etc)
+
+    def _distributeCells(self, numCellsPop, locs=None):
+        ''' distribute cells across compute nodes using round-robin (default), assigning each cell to the host 
+        with lowest predicted load based on the estimated cell cost (cfg.distributeCells='cost'), or placing the 
+        fraction of pop cells assigned to each host by Network._partitionPops (cfg.distributeCells='partition'), 
+        using recursive coordinate bisection of the cell locations (locs; array numCells x 3) if available '''
         from .. import sim
             
         hostCells = {}
         for i in range(sim.nhosts):
             hostCells[i] = []
-            
-        for i in range(numCellsPop):
-            hostCells[sim.nextHost].append(i)
-            
-            sim.nextHost+=1
-            if sim.nextHost>=sim.nhosts:
-                sim.nextHost=0
+
+        distributeCells = getattr(sim.cfg, 'distributeCells', 'roundRobin')
+        if distributeCells in ['cost', 'partition']:
+            cellCost = self._estimateCellCost()
+            if len(getattr(sim, 'hostLoads', [])) != sim.nhosts:
+                sim.hostLoads = [0.0] * sim.nhosts  # predicted load of each host
+
+        hostFractions = getattr(self, '_hostFractions', None)
+        if distributeCells == 'partition' and hostFractions is not None and numCellsPop > 0:
+            # num of cells on each host (largest remainder) and cells assigned by bisection of locations
+            hostNumCells = np.floor(hostFractions * numCellsPop).astype(int)
+            remainders = hostFractions * numCellsPop - hostNumCells
+            hostNumCells[np.argsort(-remainders, kind='mergesort')[:numCellsPop - hostNumCells.sum()]] += 1
+            hosts = [host for host in range(sim.nhosts) if hostNumCells[host] > 0]
+            locs = np.array(locs, dtype=float)[:numCellsPop] if locs is not None else None
+            for host, cellIndices in _bisectCells(np.arange(numCellsPop), locs, hosts, hostNumCells[hosts]).items():
+                hostCells[host] = sorted(cellIndices.tolist())
+                sim.hostLoads[host] += len(cellIndices) * cellCost
+
+        elif distributeCells in ['cost', 'partition']:
+            # greedy: assign each cell to host with lowest load (ties broken by host index so all hosts agree)
+            heap = [(load, host) for host, load in enumerate(sim.hostLoads)]
+            heapq.heapify(heap)
+            for i in range(numCellsPop):
+                load, host = heapq.heappop(heap)
+                hostCells[host].append(i)
+                heapq.heappush(heap, (load + cellCost, host))
+            for load, host in heap:
+                sim.hostLoads[host] = load
+
+        else:
+            for i in range(numCellsPop):
+                hostCells[sim.nextHost].append(i)
+                
+                sim.nextHost+=1
+                if sim.nextHost>=sim.nhosts:
+                    sim.nextHost=0
         
         if sim.cfg.verbose: 
             print(("Distributed population of %i cells on %s hosts: %s, next: %s"%(numCellsPop,sim.nhosts,hostCells,sim.nextHost)))
         return hostCells
 
 
+    def _estimateCellCost(self):
+        ''' Estimate computational cost of each cell of the population, either from the cost profile of a previous run 
+        (cfg.cellCostProfile; see sim.loadBalance) or from the number of segments, mechanisms and expected synapses '''
+        from .. import sim
+
+        if getattr(self, '_cellCost', None) is not None:
+            return self._cellCost
+
+        profile = sim._loadCellCostProfile()
+        if profile and self.tags['pop'] in profile.get('popCosts', {}):
+            self._cellCost = profile['popCosts'][self.tags['pop']]
+            return self._cellCost
+        scale = profile.get('scale', 1.0) if profile else 1.0  # convert to profile units (pop not in profile)
+
+        if self.cellModelClass not in [sim.CompartCell, sim.NML2Cell]:
+            self._cellCost = self.pointCellCost * scale
+            return self._cellCost
+
+        # segments and mechanisms of cellParams rules matching pop tags
+        cost = 0.0
+        for cellRule in sim.net.params.cellParams.values():
+            if not _tagsMatchConds(self.tags, cellRule.get('conds', {})):
+                continue
+            for sec in cellRule.get('secs', {}).values():
+                nseg = sec.get('geom', {}).get('nseg', 1)
+                nseg = nseg if isinstance(nseg, Number) else 1
+                numMechs = len(sec.get('mechs', {})) + len(sec.get('pointps', {}))
+                cost += nseg * (self.segCost + numMechs * self.mechCost)
+
+        # expected synapses from connParams rules targeting the pop (only numeric params can be estimated)
+        for connParam in sim.net.params.connParams.values():
+            if not _tagsMatchConds(self.tags, connParam.get('postConds', {})):
+                continue
+            numPre = sum([self._numCellsEstimate(pop.tags) for pop in sim.net.pops.values() 
+                if _tagsMatchConds(pop.tags, connParam.get('preConds', {}))])
+            numPost = sum([self._numCellsEstimate(pop.tags) for pop in sim.net.pops.values() 
+                if _tagsMatchConds(pop.tags, connParam.get('postConds', {}))])
+            numConns = self._expectedConnsPerCell(connParam, numPre, numPost)
+            synsPerConn = connParam.get('synsPerConn', 1)
+            cost += numConns * (synsPerConn if isinstance(synsPerConn, Number) else 1) * self.synCost
+
+        self._cellCost = max(cost, self.pointCellCost) * scale
+        return self._cellCost
+
+
+    @staticmethod
+    def _expectedConnsPerCell(connParam, numPre, numPost, stringDensity=0):
+        ''' Expected number of conns per postsyn cell created by connParam rule; rules with string-based functions
+        are assumed to connect a fraction stringDensity of the cell pairs '''
+        if 'convergence' in connParam:
+            conv = connParam['convergence']
+            return conv if isinstance(conv, Number) else stringDensity * numPre
+        elif 'divergence' in connParam:
+            div = connParam['divergence']
+            if not numPost: return 0
+            return div * numPre / float(numPost) if isinstance(div, Number) else stringDensity * numPre
+        elif 'probability' in connParam:
+            prob = connParam['probability']
+            return prob * numPre if isinstance(prob, Number) else stringDensity * numPre
+        elif 'connList' in connParam:
+            return len(connParam['connList']) / float(numPost) if numPost else 0
+        return numPre
+
+
+    @staticmethod
+    def _numCellsEstimate(popTags):
+        ''' Number of cells of population (0 if not known before creating the cells, eg. density-based pops) '''
+        from .. import sim
+
+        if 'cellsList' in popTags:
+            return len(popTags['cellsList'])
+        elif 'numCells' in popTags and 'density' not in popTags:
+            return int(sim.net.params.scale * popTags['numCells'])
+        return 0
+
+
     def createCells(self):
         '''Function to instantiate Cell objects based on the characteristics of this population'''
         # add individual cells
@@ -130,7 +247,7 @@ class Pop (object):
                 maxv = self.tags[coord+'normRange'][1] 
                 randLocs[:,icoord] = randLocs[:,icoord] * (maxv-minv) + minv
 
-        for i in self._distributeCells(int(sim.net.params.scale * self.tags['numCells']))[sim.rank]:
+        for i in self._distributeCells(int(sim.net.params.scale * self.tags['numCells']), locs=randLocs)[sim.rank]:
             gid = sim.net.lastGid+i
             self.cellGids.append(gid)  # add gid list of cells belonging to this population - not needed?
             cellTags = {k: v for (k, v) in self.tags.items() if k in sim.net.params.popTagsCopiedToCells}  # copy all pop tags to cell tags, except those that are pop-specific
@@ -254,7 +371,7 @@ class Pop (object):
 
         if sim.cfg.verbose and not funcLocs: print('Volume=%.4f, density=%.2f, numCells=%.0f'%(volume, self.tags['density'], self.tags['numCells']))
 
-        for i in self._distributeCells(self.tags['numCells'])[sim.rank]:
+        for i in self._distributeCells(self.tags['numCells'], locs=randLocs)[sim.rank]:
             gid = sim.net.lastGid+i
             self.cellGids.append(gid)  # add gid list of cells belonging to this population - not needed?
             cellTags = {k: v for (k, v) in self.tags.items() if k in sim.net.params.popTagsCopiedToCells}  # copy all pop tags to cell tags, except those that are pop-specific
@@ -278,7 +395,9 @@ class Pop (object):
         
         cells = []
         self.tags['numCells'] = len(self.tags['cellsList'])
-        for i in self._distributeCells(len(self.tags['cellsList']))[sim.rank]:
+        cellsLocs = [[cellTags[coord] for coord in ['x','y','z']] for cellTags in self.tags['cellsList'] if all(coord in cellTags for coord in ['x','y','z'])]
+        cellsLocs = cellsLocs if len(cellsLocs) == len(self.tags['cellsList']) else None
+        for i in self._distributeCells(len(self.tags['cellsList']), locs=cellsLocs)[sim.rank]:
             #if 'cellModel' in self.tags['cellsList'][i]:
             #    self.cellModelClass = getattr(f, self.tags['cellsList'][i]['cellModel'])  # select cell class to instantiate cells based on the cellModel tags
             gid = sim.net.lastGid+i
@@ -325,7 +444,7 @@ class Pop (object):
 
         numCells = len(gridLocs)
 
-        for i in self._distributeCells(numCells)[sim.rank]:
+        for i in self._distributeCells(numCells, locs=gridLocs)[sim.rank]:
             gid = sim.net.lastGid+i
             self.cellGids.append(gid)  # add gid list of cells belonging to this population - not needed?
             cellTags = {k: v for (k, v) in self.tags.items() if k in sim.net.params.popTagsCopiedToCells}  # copy all pop tags to cell tags, except those that are pop-specific
@@ -450,5 +569,39 @@ class Pop (object):
         #odict['cellModelClass'] = str(odict['cellModelClass'])
         del odict['cellModelClass']
         del odict['rand']
+        odict.pop('_cellCost', None)
         return odict
 
+
+def _bisectCells(indices, locs, hosts, hostNumCells):
+    ''' Recursive coordinate bisection: splits cells (indices) across hosts with the given number of cells each, 
+    cutting along the axis with largest extent of cell locations (or by index if no locations) '''
+    if len(hosts) == 1:
+        return {hosts[0]: indices}
+    half = len(hosts) // 2
+    numLeft = int(sum(hostNumCells[:half]))
+    if locs is not None and len(indices) > 0:
+        cellLocs = locs[indices]
+        axis = int(np.argmax(cellLocs.max(axis=0) - cellLocs.min(axis=0)))
+        indices = indices[np.argsort(cellLocs[:, axis], kind='mergesort')]
+    parts = _bisectCells(np.sort(indices[:numLeft]), locs, hosts[:half], hostNumCells[:half])
+    parts.update(_bisectCells(np.sort(indices[numLeft:]), locs, hosts[half:], hostNumCells[half:]))
+    return parts
+
+
+def _tagsMatchConds(tags, conds):
+    ''' Check if pop tags match conds (conds on tags not defined at the pop level, eg. ynorm, are assumed to match) '''
+    for condKey, condVal in conds.items():
+        if condKey not in tags:
+            continue
+        tagVal = tags[condKey]
+        if isinstance(condVal, list) and len(condVal) and isinstance(condVal[0], Number):
+            if isinstance(tagVal, Number) and (tagVal < condVal[0] or tagVal > condVal[1]):
+                return False
+        elif isinstance(condVal, list):
+            if tagVal not in condVal:
+                return False
+        elif tagVal != condVal:
+            return False
+    return True
+
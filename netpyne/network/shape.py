@@ -30,6 +30,17 @@ def calcSegCoords(self):
         for cell in sim.net.compartCells:
             cell.calcAbsSegCoords()
 
+# -----------------------------------------------------------------------------
+# Set node-wide PtrVector to point to the i_membrane_ of all segments of compartCells (used for LFP calc)
+# -----------------------------------------------------------------------------
+def setImembPtr(self):
+    jseg = 0
+    for cell in self.compartCells:
+        for sec in list(cell.secs.values()):
+            for seg in sec['hObj']:
+                self.imembPtr.pset(jseg, seg._ref_i_membrane_)  # notice the underscore at the end (in nA)
+                jseg += 1
+
 # -----------------------------------------------------------------------------
 # Add 3D points to sections with simplified geometry
 # -----------------------------------------------------------------------------
@@ -14,6 +14,7 @@ from __future__ import absolute_import
 from future import standard_library
 standard_library.install_aliases()
 from numbers import Number
+from ..specs import Dict
 try:
     basestring
 except NameError:
@@ -31,10 +32,7 @@ def addStims (self):
         if sim.rank==0: 
             print('Adding stims...')
             
-        if sim.nhosts > 1: # Gather tags from all cells 
-            allCellTags = sim._gatherAllCellTags()  
-        else:
-            allCellTags = {cell.gid: cell.tags for cell in self.cells}
+        cellTagTable = self._getCellTagTable()  # gather tags from all cells 
         # allPopTags = {i: pop.tags for i,pop in enumerate(self.pops)}  # gather tags from pops so can connect NetStim pops
 
         sources = self.params.stimSourceParams
@@ -45,21 +43,13 @@ def addStims (self):
             
             source = sources.get(target['source'])
 
-            postCellsTags = allCellTags
-            for condKey,condValue in target['conds'].items():  # Find subset of cells that match postsyn criteria
-                if condKey in ['x','y','z','xnorm','ynorm','znorm']:
-                    postCellsTags = {gid: tags for (gid,tags) in postCellsTags.items() if condValue[0] <= tags.get(condKey, None) < condValue[1]}  # dict with post Cell objects}  # dict with pre cell tags
-                elif condKey == 'cellList':
-                    pass
-                elif isinstance(condValue, list): 
-                    postCellsTags = {gid: tags for (gid,tags) in postCellsTags.items() if tags.get(condKey, None) in condValue}  # dict with post Cell objects
-                else:
-                    postCellsTags = {gid: tags for (gid,tags) in postCellsTags.items() if tags.get(condKey, None) == condValue}  # dict with post Cell objects
+            # Find subset of cells that match postsyn criteria
+            postCellsTags = cellTagTable.selectTags({condKey: condValue for condKey,condValue in target['conds'].items() if condKey != 'cellList'})
             
             # subset of cells from selected pops (by relative indices)                     
             if 'cellList' in target['conds']:
                 orderedPostGids = sorted(postCellsTags.keys())
-                gidList = [orderedPostGids[i] for i in target['conds']['cellList']]
+                gidList = set([orderedPostGids[i] for i in target['conds']['cellList']])
                 postCellsTags = {gid: tags for (gid,tags) in postCellsTags.items() if gid in gidList}
 
             # initialize randomizer in case used in string-based function (see issue #89 for more details)
@@ -105,6 +95,9 @@ def addStims (self):
                         postCell.addStim(params)  # call cell method to add connection
 
     print(('  Number of stims on node %i: %i ' % (sim.rank, sum([len(cell.stims) for cell in self.cells]))))
+    if self.stimPools:
+        print(('  Number of pooled NetStims on node %i: %i ' % (sim.rank, sum([len(pool) for pool in self.stimPools.values()]))))
+    self.connVersion += 1  # NetStim conns
     sim.pc.barrier()
     sim.timing('stop', 'stimsTime')
     if sim.rank == 0 and sim.cfg.timing: print(('  Done; cell stims creation time = %0.2f s.' % sim.timingData['stimsTime']))
@@ -146,6 +139,30 @@ def _addCellStim (self, stimParam, postCell):
 
 
 
+# -----------------------------------------------------------------------------
+# Get pool of NetStims shared by targets of stim source
+# -----------------------------------------------------------------------------
+def _getStimPool (self, netStimParams, cell):
+    ''' Returns list with the params['pool'] stream dicts (with NetStim or NSLOC and Random) shared by all the cells
+    targeted by a stim source in this node; created the first time the source is connected, using the params of that
+    target. The randomizer of each stream is initialized in preRun from (source, stream, seed) so the spike trains do 
+    not depend on the node where they are created '''
+    from .. import sim
+
+    if netStimParams['source'] not in self.stimPools:
+        streamParams = {k: v for k, v in netStimParams.items() if k != 'pool'}
+        pool = []
+        for stream in range(int(netStimParams['pool'])):
+            streamContainer = Dict(streamParams)
+            streamContainer['stream'] = stream
+            cell.addNetStim(streamParams, stimContainer=streamContainer)
+            pool.append(streamContainer)
+        self.stimPools[netStimParams['source']] = pool
+        if sim.cfg.verbose: print(('  Created pool of %d %s NetStims' % (len(pool), netStimParams['source'])))
+
+    return self.stimPools[netStimParams['source']]
+
+
 # -----------------------------------------------------------------------------
 # Convert stim param string to function
 # -----------------------------------------------------------------------------
@@ -136,13 +136,19 @@ def subcellularConn(self, allCellTags, allPopTags):
                         conns = []
                         connsGroup = {}
                         iConn = -1
+                        connsIndex = {}  # conns of grouped synMechs not yet grouped, indexed by (synMech, sec, loc)
+                        connKey = lambda synMech, conn: (synMech,) + tuple(tuple(conn[k]) if isinstance(conn[k], list) else conn[k] for k in ['sec', 'loc'])
+                        for conn in allConns:
+                            if conn['synMech'] in subConnParam['groupSynMechs']:
+                                connsIndex.setdefault(connKey(conn['synMech'], conn), []).append(conn)
                         for conn in allConns:
                             if not conn['synMech'].startswith('__grouped__'):
                                 conns.append(conn)
                                 iConn = iConn + 1
                                 if conn['synMech'] in subConnParam['groupSynMechs']:
                                     for synMech in [s for s in subConnParam['groupSynMechs'] if s != conn['synMech']]:
-                                        connGroup = next((c for c in allConns if c['synMech'] == synMech and c['sec']==conn['sec'] and c['loc']==conn['loc']), None)
+                                        candidates = connsIndex.get(connKey(synMech, conn))
+                                        connGroup = candidates.pop(0) if candidates else None
                                         try:
                                             connGroup['synMech'] = '__grouped__'+connGroup['synMech']
                                             connsGroup[iConn] = connGroup
@@ -32,16 +32,25 @@ from .setup import initialize, setNet, setNetParams, setSimCfg, createParallelCo
 	readCmdLineArgs, setupRecording, setupRecordLFP, setGlobals
 
 # import run functions
-from .run import preRun, runSim, runSimWithIntervalFunc, loadBalance, calculateLFP
+from .run import preRun, runSim, _runIntervals, runTrials, runSimWithIntervalFunc, loadBalance, _saveCellCostProfile, _loadCellCostProfile, calculateLFP, _calculateBufferedLFP
+
+# import NumPy point cell simulation functions
+from .pointSim import runPointSim, canRunPointSim, netStimSpkTimes, PointCellGroup
+
+# import functions to stream output to disk during run
+from .stream import StreamWriter, openStream, streamData, closeStream
+
+# import checkpoint functions
+from .checkpoint import saveCheckpoint, resume, _restoreCheckpoint
 
 # import gather functions
 from .gather import gatherData, _gatherAllCellTags, _gatherAllCellConnPreGids, _gatherCells
 
 # import saving functions
-from .save import saveJSON, saveData, distributedSaveHDF5, compactConnFormat
+from .save import saveJSON, saveData, distributedSaveData, distributedSaveHDF5, compactConnFormat
 
 # import loading functions
-from .load import loadSimCfg, loadNetParams, loadNet, loadSimData, loadAll, loadHDF5, ijsonLoad
+from .load import _loadFile, DistributedData, NpyData, loadSimCfg, loadNetParams, loadNet, loadSimData, loadAll, loadHDF5, ijsonLoad
 
 # import utils functions (general)
 from .utils import cellByGid, getCellsList, timing, version, gitChangeset, hashStr, hashList,\
@@ -65,8 +74,8 @@ from .wrappers import create, simulate, analyze, createSimulate, \
 # import cell classes
 from ..cell import CompartCell, PointCell, NML2Cell, NML2SpikeSource
 
-# import Network and Pop classes
-from ..network import Network, Pop
+# import Network, Pop and CellTagTable classes
+from ..network import Network, Pop, CellTagTable, ConnTable, CellConns
 
 # import analysis-related module
 from .. import analysis
@@ -0,0 +1,253 @@
+"""
+sim/checkpoint.py
+
+Functions to save checkpoints of running simulations (cfg.checkpointInterval) and resume them
+
+Contributors: salvadordura@gmail.com
+"""
+from __future__ import print_function
+from __future__ import division
+from __future__ import unicode_literals
+from __future__ import absolute_import
+
+from builtins import range
+from future import standard_library
+standard_library.install_aliases()
+import os
+import json
+import pickle
+from copy import deepcopy
+from types import FunctionType
+import numpy as np
+from neuron import h
+from ..specs import Dict
+from . import utils
+
+
+#------------------------------------------------------------------------------
+# Checkpoint folder
+#------------------------------------------------------------------------------
+def _checkpointDir ():
+    from .. import sim
+    return sim.cfg.checkpointDir or sim.cfg.filename + '_checkpoint'
+
+
+#------------------------------------------------------------------------------
+# Random number generators of stims in node (in the same order for the same network)
+#------------------------------------------------------------------------------
+def _stimRandomizers ():
+    from .. import sim
+
+    rands = []
+    for cell in sim.net.cells:
+        if getattr(cell, 'hRandom', None) is not None:  # NetStim cells
+            rands.append(cell.hRandom)
+        for stim in cell.stims:
+            if stim.get('hRandom') is not None:
+                rands.append(stim['hRandom'])
+    for source in sorted(sim.net.stimPools):  # NetStims shared by stim targets
+        rands.extend([stim['hRandom'] for stim in sim.net.stimPools[source]])
+    return rands
+
+
+#------------------------------------------------------------------------------
+# Recording Vectors in simData of node ((path, Vector) with path eg. ('V_soma', 'cell_1'))
+#------------------------------------------------------------------------------
+def _simDataVectors (data=None, path=()):
+    from .. import sim
+
+    vecs = []
+    for key, value in (sim.simData if data is None else data).items():
+        if isinstance(value, dict):
+            vecs.extend(_simDataVectors(value, path+(key,)))
+        elif hasattr(value, 'as_numpy'):
+            vecs.append((path+(key,), value))
+    return vecs
+
+
+#------------------------------------------------------------------------------
+# Copy of params (plain dicts and lists) with functions replaced by 'func' so they can be pickled
+#------------------------------------------------------------------------------
+def _replaceFuncs (obj):
+    if isinstance(obj, dict):
+        return {key: _replaceFuncs(value) for key, value in obj.items()}
+    elif isinstance(obj, (list, tuple)):
+        return type(obj)([_replaceFuncs(value) for value in obj])
+    return 'func' if isinstance(obj, FunctionType) else obj
+
+
+#------------------------------------------------------------------------------
+# Save checkpoint
+#------------------------------------------------------------------------------
+def saveCheckpoint (checkpointDir=None):
+    ''' Saves a checkpoint of the simulation at the current time: each node saves the state of its NEURON model
+    (h.SaveState, including the event queue) to checkpoint.rank<N>.dat, and the position of its stim Random123
+    streams, the samples recorded so far (or the lengths of the streamed datasets if cfg.streamOutput) and the time to
+    checkpoint.rank<N>.pkl; the master node saves checkpoint.json and the netParams (as set before creating the network)
+    and simConfig of the current run (model.pkl) used to rebuild the network in sim.resume(). Files are written with a temporary name and
+    renamed, so a job killed while saving keeps the previous checkpoint '''
+    from .. import sim
+
+    sim.timing('start', 'checkpointTime')
+    checkpointDir = checkpointDir or _checkpointDir()
+    if sim.rank == 0 and not os.path.exists(checkpointDir):
+        os.makedirs(checkpointDir)
+    sim.pc.barrier()
+
+    # model params to rebuild network
+    modelFile = os.path.join(checkpointDir, 'model.pkl')
+    if sim.rank == 0:
+        netParams = getattr(sim.net, 'checkpointParams', None)
+        if netParams is None:  # eg. network loaded from file
+            netParams = Dict().undotify(sim.net.params.__dict__)
+        netParams = _replaceFuncs({key: value for key, value in netParams.items() if key != '_labelid'})
+        model = {'net': {'params': netParams}, 'simConfig': sim.cfg.__dict__}
+        with open(modelFile+'.tmp', 'wb') as fileObj:
+            pickle.dump(utils.replaceDictODict(model), fileObj)
+        os.rename(modelFile+'.tmp', modelFile)  # overwrites model of previous runs in same folder
+
+    # NEURON state of node
+    basePath = os.path.join(checkpointDir, 'checkpoint.rank%d' % (sim.rank))
+    state = h.SaveState()
+    state.save()
+    stateFile = h.File(basePath+'.dat.tmp')
+    stateFile.wopen(basePath+'.dat.tmp')
+    state.fwrite(stateFile)
+    stateFile.close()
+
+    # stim randomizers, recorded data and stream offsets of node
+    nodeData = {'t': h.t, 'nhosts': sim.nhosts, 'randSeqs': [rand.seq() for rand in _stimRandomizers()],
+        'numNetCons': int(h.List('NetCon').count()), 'vectors': [(path, vec.as_numpy().copy()) for path, vec in _simDataVectors()]}
+    if getattr(sim, 'streamWriter', None) is not None:
+        sim.streamWriter.flush()
+        nodeData['streamMeta'] = sim.streamWriter.meta
+    with open(basePath+'.pkl.tmp', 'wb') as fileObj:
+        pickle.dump(nodeData, fileObj, protocol=2)
+    sim.pc.barrier()
+
+    for ext in ['.dat', '.pkl']:
+        os.rename(basePath+ext+'.tmp', basePath+ext)
+    sim.pc.barrier()
+    if sim.rank == 0:
+        sim.saveJSON(os.path.join(checkpointDir, 'checkpoint.json.tmp'), {'t': h.t, 'nhosts': sim.nhosts, 'duration': sim.cfg.duration})
+        os.rename(os.path.join(checkpointDir, 'checkpoint.json.tmp'), os.path.join(checkpointDir, 'checkpoint.json'))
+        sim.timing('stop', 'checkpointTime')
+        if sim.cfg.timing: print(('  Saved checkpoint at t = %0.1f ms in %s (%0.2f s)' % (h.t, checkpointDir, sim.timingData['checkpointTime'])))
+
+
+#------------------------------------------------------------------------------
+# Restore checkpoint (after preRun and finitialize)
+#------------------------------------------------------------------------------
+def _restoreCheckpoint (checkpointDir, warmStart=False):
+    ''' Restores the checkpoint saved in checkpointDir; with warmStart (cfg.warmStartDir) only the state is restored:
+    the NetCon weights of the network built (SaveState restores the saved ones) are kept, and the recording and
+    stream files start from the time of the checkpoint '''
+    from .. import sim
+
+    with open(os.path.join(checkpointDir, 'checkpoint.json'), 'r') as fileObj:
+        info = json.load(fileObj)
+    if info['nhosts'] != sim.nhosts:
+        raise Exception('Checkpoint in %s was saved with %d nodes but resuming with %d (NEURON state is saved per node)' % (checkpointDir, info['nhosts'], sim.nhosts))
+
+    basePath = os.path.join(checkpointDir, 'checkpoint.rank%d' % (sim.rank))
+    with open(basePath+'.pkl', 'rb') as fileObj:
+        nodeData = pickle.load(fileObj)
+    if abs(nodeData['t'] - info['t']) > 1e-9:
+        raise Exception('Checkpoint file %s.pkl does not match checkpoint.json (t = %s ms instead of %s ms)' % (basePath, nodeData['t'], info['t']))
+
+    netCons = h.List('NetCon')
+    if 'numNetCons' in nodeData and netCons.count() != nodeData['numNetCons']:
+        raise Exception('Network does not match checkpoint (%d NetCons in node %d instead of %d)' % (netCons.count(), sim.rank, nodeData['numNetCons']))
+    if warmStart:
+        weights = [netCons.o(i).weight[0] for i in range(int(netCons.count()))]
+
+    # NEURON state (restores t and event queue)
+    state = h.SaveState()
+    stateFile = h.File(basePath+'.dat')
+    stateFile.ropen(basePath+'.dat')
+    state.fread(stateFile)
+    stateFile.close()
+    state.restore()
+
+    # position of stim random streams (not included in SaveState)
+    rands = _stimRandomizers()
+    if len(rands) != len(nodeData['randSeqs']):
+        raise Exception('Network does not match checkpoint (%d stim randomizers in node %d instead of %d)' % (len(rands), sim.rank, len(nodeData['randSeqs'])))
+    for rand, seq in zip(rands, nodeData['randSeqs']):
+        rand.seq(seq)
+
+    # weights of network built (eg. changed by batch params compatible with warm start)
+    if warmStart:
+        for i, weight in enumerate(weights):
+            netCons.o(i).weight[0] = weight
+        h.frecord_init()
+        return info['t']
+
+    # recording restarted from checkpoint time, after the samples recorded before it; the sample at the checkpoint time
+    # is recorded again when the simulation continues, so the last saved one is removed (t and traces, not spikes),
+    # or the last row streamed if the streamed Vectors (t and one per cell) were empty at the checkpoint
+    h.frecord_init()
+    vecs = dict(_simDataVectors())
+    recorded = lambda path: path[0] == 't' or path[0] in sim.cfg.recordTraces
+    streamMeta = deepcopy(nodeData.get('streamMeta'))
+    if streamMeta:
+        streamed = [(path[0], len(values)) for path, values in nodeData['vectors'] if recorded(path) and len(path) <= 2]
+        for key in set([key for key, length in streamed]) - set([key for key, length in streamed if length]):
+            dataset = streamMeta['datasets'].get('t' if key == 't' else 'trace_'+key)
+            if dataset and dataset[0] > 0:
+                dataset[0] -= 1
+    for path, values in nodeData['vectors']:
+        if recorded(path):
+            values = values[:-1]
+        if path in vecs and len(values):
+            vecs[path].from_python(np.concatenate((values, vecs[path].as_numpy().copy())))
+
+    if sim.cfg.streamOutput:
+        sim.openStream(meta=streamMeta)
+
+    return info['t']
+
+
+#------------------------------------------------------------------------------
+# Resume simulation from checkpoint
+#------------------------------------------------------------------------------
+def resume (checkpointDir, netParams=None, simConfig=None, netFile=None):
+    ''' Rebuilds the network (with the netParams and simConfig provided, or those saved in the checkpoint; or loaded
+    from netFile saved with sim.saveData) with the same number of nodes, restores the state of the last checkpoint
+    saved in checkpointDir (see cfg.checkpointInterval) and continues the simulation until cfg.duration (checkpoints
+    continue being saved), then gathers the data as sim.simulate(). Note netParams with functions (eg. lambdas)
+    are saved as strings, so they need to be provided '''
+    from .. import sim
+
+    if netFile:
+        sim.load(netFile, simConfig)
+    else:
+        if netParams is None or simConfig is None:
+            modelFile = os.path.join(checkpointDir, 'model.pkl')
+            data = sim._loadFile(modelFile)
+            netParams = netParams or sim.loadNetParams(modelFile, data, setLoaded=False)
+            simConfig = simConfig or sim.loadSimCfg(modelFile, data, setLoaded=False)
+        sim.create(netParams, simConfig)
+    if not sim.cfg.checkpointDir:
+        sim.cfg.checkpointDir = checkpointDir  # new checkpoints saved in same folder
+    if sim.cfg.recordLFP and sim.rank == 0:
+        print('  Warning: LFP recording is not restored from checkpoint, so only LFP after resuming is recorded')
+
+    sim.pc.barrier()
+    sim.timing('start', 'runTime')
+    sim.preRun()
+    h.finitialize(float(sim.cfg.hParams['v_init']))
+    tstart = _restoreCheckpoint(checkpointDir)
+
+    if sim.rank == 0: print(('\nResuming simulation from %s ms to %s ms...' % (tstart, sim.cfg.duration)))
+    sim._runIntervals()
+
+    sim.pc.barrier()
+    sim.timing('stop', 'runTime')
+    if sim.rank == 0:
+        print(('  Done; run time = %0.2f s; real-time ratio: %0.2f.' %
+            (sim.timingData['runTime'], (sim.cfg.duration-tstart)/1000/sim.timingData['runTime'])))
+    if sim.cfg.streamOutput:
+        sim.closeStream()
+
+    sim.gatherData()
@@ -45,6 +45,10 @@ def gatherData (gatherLFP = True):
             
     # remove data structures used to calculate LFP 
     if gatherLFP and sim.cfg.recordLFP and hasattr(sim.net, 'compartCells') and sim.cfg.createNEURONObj:
+        if getattr(sim.net, 'imembBufferSteps', None):
+            sim._calculateBufferedLFP()  # LFP of remaining buffered steps (eg. if sim stopped before duration)
+        for attr in ['imembPtr', 'imembVec', 'imembBuffer']:
+            if hasattr(sim.net, attr): delattr(sim.net, attr)
         for cell in sim.net.compartCells:
             try:
                 del cell.imembVec
@@ -58,14 +62,24 @@ def gatherData (gatherLFP = True):
             except:
                 pass
 
+    # save data of each node to its own file and read it lazily in master, instead of gathering (cfg.distributedSave)
+    if getattr(sim.cfg, 'distributedSave', False):
+        return _gatherDistributed()
+
     simDataVecs = ['spkt','spkid','stims']+list(sim.cfg.recordTraces.keys())
     singleNodeVecs = ['t']
+
+    # gather spikes and traces as contiguous arrays (remaining simData gathered via py_alltoall)
+    nodeSimData, simDataArrays = sim.simData, None
+    if getattr(sim.cfg, 'arrayGather', False):
+        nodeSimData, simDataArrays = _gatherSimDataArrays()
+
     if sim.nhosts > 1:  # only gather if >1 nodes
         netPopsCellGids = {popLabel: list(pop.cellGids) for popLabel,pop in sim.net.pops.items()}
 
         # gather only sim data
         if getattr(sim.cfg, 'gatherOnlySimData', False):
-            nodeData = {'simData': sim.simData}
+            nodeData = {'simData': nodeSimData}
             data = [None]*sim.nhosts
             data[0] = {}
             for k,v in nodeData.items():
@@ -101,6 +115,9 @@ def gatherData (gatherLFP = True):
                                 sim.allSimData[key] = list(sim.allSimData[key])+list(val) # udpate simData dicts which are Vectors
                         elif gatherLFP and key == 'LFP':
                             sim.allSimData[key] += np.array(val)
+                        elif gatherLFP and key == 'LFPPops':
+                            for pop, popLFP in val.items():
+                                sim.allSimData[key][pop] = sim.allSimData[key].get(pop, 0) + np.array(popLFP)
                         elif key not in singleNodeVecs:
                             sim.allSimData[key].update(val)           # update simData dicts which are not Vectors
 
@@ -112,10 +129,15 @@ def gatherData (gatherLFP = True):
                 for popLabel,pop in sim.net.pops.items(): sim.net.allPops[popLabel] = pop.__getstate__() # can't use dict comprehension for OrderedDict
 
                 sim.net.allCells = [c.__dict__ for c in sim.net.cells]
+                
+                if simDataArrays: 
+                    _setSimDataArrays(*simDataArrays)
 
         # gather cells, pops and sim data
         else:
-            nodeData = {'netCells': [c.__getstate__() for c in sim.net.cells], 'netPopsCellGids': netPopsCellGids, 'simData': sim.simData}
+            nodeData = {'netCells': [c.__getstate__() for c in sim.net.cells], 'netPopsCellGids': netPopsCellGids, 'simData': nodeSimData}
+            if sim.net._connTableCells():  # gather conns as columns
+                nodeData['connTable'] = sim.net.connTable.getState()
             data = [None]*sim.nhosts
             data[0] = {}
             for k,v in nodeData.items():
@@ -160,6 +182,9 @@ def gatherData (gatherLFP = True):
                                 sim.allSimData[key] = list(sim.allSimData[key])+list(val) # udpate simData dicts which are Vectors
                         elif gatherLFP and key == 'LFP':
                             sim.allSimData[key] += np.array(val)
+                        elif gatherLFP and key == 'LFPPops':
+                            for pop, popLFP in val.items():
+                                sim.allSimData[key][pop] = sim.allSimData[key].get(pop, 0) + np.array(popLFP)
                         elif key not in singleNodeVecs:
                             sim.allSimData[key].update(val)           # update simData dicts which are not Vectors
 
@@ -168,11 +193,17 @@ def gatherData (gatherLFP = True):
                     sim.allSimData['spkt'], sim.allSimData['spkid'] = list(sim.allSimData['spkt']), list(sim.allSimData['spkid'])
 
                 sim.net.allCells =  sorted(allCells, key=lambda k: k['gid'])
+                connTableStates = [node['connTable'] for node in gather if node.get('connTable') is not None]
+                if connTableStates: 
+                    _setAllConns(connTableStates)
 
                 for popLabel,pop in allPops.items():
                     pop['cellGids'] = sorted(allPopsCellGids[popLabel])
                 sim.net.allPops = allPops
 
+                if simDataArrays: 
+                    _setSimDataArrays(*simDataArrays)
+
 
         # clean to avoid mem leaks
         for node in gather:
@@ -187,14 +218,16 @@ def gatherData (gatherLFP = True):
     else:  # if single node, save data in same format as for multiple nodes for consistency
         if sim.cfg.createNEURONObj:
             sim.net.allCells = [Dict(c.__getstate__()) for c in sim.net.cells]
+            if sim.net._connTableCells(): 
+                _setAllConns([sim.net.connTable.getState()])
         else:
             sim.net.allCells = [c.__dict__ for c in sim.net.cells]
         sim.net.allPops = ODict()
         for popLabel,pop in sim.net.pops.items(): sim.net.allPops[popLabel] = pop.__getstate__() # can't use dict comprehension for OrderedDict
         sim.allSimData = Dict()
-        for k in list(sim.simData.keys()):  # initialize all keys of allSimData dict
+        for k in list(nodeSimData.keys()):  # initialize all keys of allSimData dict
             sim.allSimData[k] = Dict()
-        for key,val in sim.simData.items():  # update simData dics of dics of h.Vector
+        for key,val in nodeSimData.items():  # update simData dics of dics of h.Vector
                 if key in simDataVecs+singleNodeVecs:          # simData dicts that contain Vectors
                     if isinstance(val,dict):
                         for cell,val2 in val.items():
@@ -208,6 +241,21 @@ def gatherData (gatherLFP = True):
                         sim.allSimData[key] = list(sim.allSimData[key])+list(val) # udpate simData dicts which are Vectors
                 else:
                     sim.allSimData[key] = val           # update simData dicts which are not Vectors
+        
+        if simDataArrays: 
+            _setSimDataArrays(*simDataArrays)
+
+    # spikes and traces streamed to disk during run (memory-mapped from merged .npy files) 
+    if getattr(sim.cfg, 'streamOutput', None) and sim.rank == 0:
+        import os
+        folder = sim.cfg.filename + '_stream'
+        if os.path.exists(os.path.join(folder, 'schema.json')):
+            streamData = sim.NpyData(folder, include=['simData'])
+            for key, keyType in streamData.schema['simData'].items():
+                if keyType == 'trace' and isinstance(sim.allSimData.get(key), dict):
+                    sim.allSimData[key].update(streamData.getSimData(key))  # keep gathered traces with one Vector per synMech
+                else:
+                    sim.allSimData[key] = streamData.getSimData(key)
 
     ## Print statistics
     sim.pc.barrier()
@@ -229,7 +277,7 @@ def gatherData (gatherLFP = True):
         sim.numCells = len(sim.net.allCells)
 
         if sim.totalSpikes > 0:
-            sim.firingRate = float(sim.totalSpikes)/sim.numCells/sim.cfg.duration*1e3 # Calculate firing rate
+            sim.firingRate = float(sim.totalSpikes)/sim.numCells/(sim.cfg.duration-sim.tstart)*1e3 # Calculate firing rate (over simulated time)
         else:
             sim.firingRate = 0
         if sim.numCells > 0:
@@ -248,7 +296,7 @@ def gatherData (gatherLFP = True):
             if sim.cfg.printPopAvgRates and not sim.cfg.gatherOnlySimData:
                 trange = sim.cfg.printPopAvgRates if isinstance(sim.cfg.printPopAvgRates,list) else None
                 sim.allSimData['popRates'] = sim.analysis.popAvgRates(trange=trange)
-            print(('  Simulated time: %0.1f s; %i workers' % (sim.cfg.duration/1e3, sim.nhosts)))
+            print(('  Simulated time: %0.1f s; %i workers' % ((sim.cfg.duration-sim.tstart)/1e3, sim.nhosts)))
             print(('  Run time: %0.2f s' % (sim.timingData['runTime'])))
 
             sim.allSimData['avgRate'] = sim.firingRate  # save firing rate
@@ -256,6 +304,138 @@ def gatherData (gatherLFP = True):
         return sim.allSimData
 
 
+#------------------------------------------------------------------------------
+# Save data of each node to its own file and read it lazily in master (cfg.distributedSave)
+#------------------------------------------------------------------------------
+def _gatherDistributed ():
+    from .. import sim
+
+    manifestFile = sim.distributedSaveData()
+    sim.pc.barrier()
+    if sim.rank == 0:
+        data = sim.DistributedData(manifestFile)
+        sim.allSimData = data.get('simData', Dict())
+        sim.net.allPops = data['net'].get('pops', ODict())
+        sim.net.allCells = data['net'].get('cells', [])
+        sim.timing('stop', 'gatherTime')
+        if sim.cfg.timing: print(('  Done; gather time = %0.2f s.' % sim.timingData['gatherTime']))
+
+        # statistics from manifest (avoids reading partitions)
+        partitions = data.partitions
+        sim.numCells, sim.totalSpikes = sum(partitions['numCells']), sum(partitions['numSpikes'])
+        sim.totalSynapses = sim.totalConnections = sum(partitions['numConns'])
+        sim.firingRate = float(sim.totalSpikes)/sim.numCells/(sim.cfg.duration-sim.tstart)*1e3 if sim.numCells > 0 else 0
+        sim.connsPerCell = sim.synsPerCell = sim.totalSynapses/float(sim.numCells) if sim.numCells > 0 else 0
+        print('\nAnalyzing...')
+        print(('  Cells: %i (saved in %i partitions)' % (sim.numCells, data.numPartitions())))
+        print(('  Synaptic contacts: %i (%0.2f per cell)' % (sim.totalSynapses, sim.synsPerCell)))
+        if 'runTime' in sim.timingData:
+            print(('  Spikes: %i (%0.2f Hz)' % (sim.totalSpikes, sim.firingRate)))
+            print(('  Simulated time: %0.1f s; %i workers' % ((sim.cfg.duration-sim.tstart)/1e3, sim.nhosts)))
+            print(('  Run time: %0.2f s' % (sim.timingData['runTime'])))
+            sim.allSimData['avgRate'] = sim.firingRate
+        return sim.allSimData
+
+
+#------------------------------------------------------------------------------
+# Gather array from all nodes into master (contiguous float64 buffers sent with pc.alltoall on Vectors)
+#------------------------------------------------------------------------------
+def _gatherArray (array):
+    from .. import sim
+    from neuron import h
+
+    array = np.asarray(array, dtype=float).ravel()
+    counts = h.Vector(sim.nhosts)
+    sim.pc.allgather(float(len(array)), counts)  # num of values of each node
+    sendCounts = h.Vector(sim.nhosts)
+    sendCounts.x[0] = len(array)  # send all values to master
+    allValues = h.Vector()
+    sim.pc.alltoall(h.Vector(array), sendCounts, allValues)
+    if sim.rank == 0:
+        return allValues.as_numpy().copy(), counts.as_numpy().astype(int)
+    return None, None
+
+
+#------------------------------------------------------------------------------
+# Gather spikes and traces of all nodes as arrays (cfg.arrayGather)
+#------------------------------------------------------------------------------
+def _gatherSimDataArrays ():
+    ''' Returns simData of node without the keys gathered as arrays, and (only in master) arrays with the spikes 
+    (sorted by time and gid in each node) and the traces of all nodes '''
+    from .. import sim
+
+    # spikes of node sorted by time and gid
+    spkt, spkid = sim.simData['spkt'].as_numpy(), sim.simData['spkid'].as_numpy()
+    order = np.lexsort((spkid, spkt))
+    allSpkt, spkCounts = _gatherArray(spkt[order])
+    allSpkid, _ = _gatherArray(spkid[order])
+
+    # traces with one Vector per cell (header with key index, gid and num of values of each trace)
+    traceKeys = list(sim.cfg.recordTraces.keys())
+    nodeSimData = {k: v for k, v in sim.simData.items() if k not in ['spkt', 'spkid']+traceKeys}
+    header, values = [], []
+    for ikey, key in enumerate(traceKeys):
+        if key not in sim.simData: continue
+        nodeSimData[key] = {}
+        for cellLabel, vec in sim.simData[key].items():
+            if isinstance(vec, dict):  # multiple traces per cell (eg. multiple synMechs) gathered via py_alltoall
+                nodeSimData[key][cellLabel] = vec
+            else:
+                header.append([ikey, int(cellLabel.split('_')[1]), len(vec)])
+                values.append(vec.as_numpy())
+    allHeader, _ = _gatherArray(np.array(header, dtype=float))
+    allValues, _ = _gatherArray(np.concatenate(values) if values else np.zeros(0))
+
+    if sim.rank == 0:
+        return nodeSimData, (allSpkt, allSpkid, spkCounts, allHeader.reshape(-1, 3), allValues, traceKeys)
+    return nodeSimData, None
+
+
+#------------------------------------------------------------------------------
+# Merge spikes of all nodes (each sorted by time and gid) 
+#------------------------------------------------------------------------------
+def _mergeSpikes (spkt, spkid, counts):
+    # stable sort (timsort) of concatenated sorted runs of each node performs a k-way merge
+    order = np.argsort(spkt, kind='stable')
+    spkt, spkid = spkt[order], spkid[order]
+
+    # spikes with same time from different nodes sorted by gid
+    ties = np.flatnonzero(np.diff(spkt) == 0)
+    if len(counts) > 1 and len(ties) > 0:
+        tied = np.unique(np.concatenate((ties, ties+1)))
+        spkid[tied] = spkid[tied][np.lexsort((spkid[tied], spkt[tied]))]
+    return spkt, spkid
+
+
+#------------------------------------------------------------------------------
+# Set spikes and traces of allSimData from gathered arrays
+#------------------------------------------------------------------------------
+def _setSimDataArrays (spkt, spkid, spkCounts, header, values, traceKeys):
+    from .. import sim
+
+    spkt, spkid = _mergeSpikes(spkt, spkid, spkCounts)
+    sim.allSimData['spkt'], sim.allSimData['spkid'] = spkt.tolist(), spkid.tolist()
+
+    # traces of each key stored as 2D array (cells sorted by gid x time); allSimData stores views of rows
+    dtype = np.float32 if sim.cfg.arrayGather == 'float32' else float
+    offsets = np.concatenate(([0], np.cumsum(header[:, 2]))).astype(int)
+    sim.allTraceArrays = {}
+    for ikey, key in enumerate(traceKeys):
+        rows = np.flatnonzero(header[:, 0] == ikey)
+        if len(rows) == 0: continue
+        rows = rows[np.argsort(header[rows, 1], kind='stable')]
+        lengths = header[rows, 2].astype(int)
+        data = np.full((len(rows), lengths.max()), np.nan, dtype=dtype)  # padded with NaN if different lengths
+        for i, row in enumerate(rows):
+            data[i, :lengths[i]] = values[offsets[row]:offsets[row+1]]
+        cellLabels = ['cell_%d' % (gid) for gid in header[rows, 1].astype(int)]
+        if key not in sim.allSimData: 
+            sim.allSimData[key] = Dict()
+        for i, cellLabel in enumerate(cellLabels):
+            sim.allSimData[key][cellLabel] = data[i, :lengths[i]]
+        sim.allTraceArrays[key] = {'cells': cellLabels, 'data': data}
+
+
 #------------------------------------------------------------------------------
 # Gather tags from cells
 #------------------------------------------------------------------------------
@@ -320,6 +500,8 @@ def _gatherCells ():
 
     if sim.nhosts > 1:  # only gather if >1 nodes
         nodeData = {'netCells': [c.__getstate__() for c in sim.net.cells]}
+        if sim.net._connTableCells():  # gather conns as columns
+            nodeData['connTable'] = sim.net.connTable.getState()
         data = [None]*sim.nhosts
         data[0] = {}
         for k,v in nodeData.items():
@@ -333,6 +515,9 @@ def _gatherCells ():
             for node in gather:  # concatenate data from each node
                 allCells.extend(node['netCells'])  # extend allCells list
             sim.net.allCells =  sorted(allCells, key=lambda k: k['gid'])
+            connTableStates = [node['connTable'] for node in gather if node.get('connTable') is not None]
+            if connTableStates: 
+                _setAllConns(connTableStates)
 
         # clean to avoid mem leaks
         for node in gather:
@@ -346,4 +531,17 @@ def _gatherCells ():
 
     else:  # if single node, save data in same format as for multiple nodes for consistency
         sim.net.allCells = [c.__getstate__() for c in sim.net.cells]
+        if sim.net._connTableCells(): 
+            _setAllConns([sim.net.connTable.getState()])
+
+
+#------------------------------------------------------------------------------
+# Set conns of gathered cells from ConnTable states of all nodes
+#------------------------------------------------------------------------------
+def _setAllConns (connTableStates):
+    from .. import sim
+
+    sim.net.allConns = sim.ConnTable.fromStates(connTableStates)  # without NEURON objects
+    for cell in sim.net.allCells:
+        cell['conns'] = sim.net.allConns.cellConns(cell['gid'])
 
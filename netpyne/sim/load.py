@@ -26,6 +26,7 @@ except NameError:
 from future import standard_library
 standard_library.install_aliases()
 import sys
+import numpy as np
 from collections import OrderedDict
 from ..specs import Dict, ODict
 from .. import specs
@@ -35,7 +36,7 @@ from . import setup
 #------------------------------------------------------------------------------
 # Load data from file
 #------------------------------------------------------------------------------
-def _loadFile (filename):
+def _loadFile (filename, include=None):
     from .. import sim
     import os
 
@@ -57,10 +58,20 @@ def _loadFile (filename):
         return data
 
     if hasattr(sim, 'cfg') and sim.cfg.timing: sim.timing('start', 'loadFileTime')
-    ext = os.path.basename(filename).split('.')[1]
+    ext = os.path.basename(filename).split('.')[1] if '.' in os.path.basename(filename) else None
+
+    # load directory of .npy files (only arrays and JSON files in include are read, when first accessed)
+    if os.path.isdir(filename) and os.path.exists(os.path.join(filename, 'schema.json')):
+        print(('Loading file %s ... ' % (filename)))
+        data = NpyData(filename, include=include)
+
+    # load manifest of data saved by each node (partitions are read lazily)
+    elif filename.endswith('_manifest.json'):
+        print(('Loading distributed data %s ... ' % (filename)))
+        data = DistributedData(filename)
 
     # load pickle file
-    if ext == 'pkl':
+    elif ext == 'pkl':
         import pickle
         print(('Loading file %s ... ' % (filename)))
         with open(filename, 'rb') as fileObj:
@@ -128,6 +139,9 @@ def _loadFile (filename):
         print(('Format not recognized for file %s'%(filename)))
         return
 
+    if include and not isinstance(data, NpyData):  # other formats need to be read entirely
+        data = _filterInclude(data, include)
+
     if hasattr(sim, 'rank') and sim.rank == 0 and hasattr(sim, 'cfg') and sim.cfg.timing:
         sim.timing('stop', 'loadFileTime')
         print(('  Done; file loading time = %0.2f s' % sim.timingData['loadFileTime']))
@@ -136,6 +150,41 @@ def _loadFile (filename):
     return data
 
 
+#------------------------------------------------------------------------------
+# Data paths in include (eg. ['simConfig', 'simData.spkt', 'simData.V_soma'])
+#------------------------------------------------------------------------------
+_includeAliases = {'netParams': ['net.params'], 'netCells': ['net.cells'], 'netPops': ['net.pops'], 
+    'net': ['net.params', 'net.cells', 'net.pops']}
+
+def _includePaths (include):
+    paths = []
+    for item in include:
+        paths.extend(_includeAliases.get(item, [item]))
+    return paths
+
+def _included (path, include):
+    ''' Checks if data path (eg. 'simData.spkt') or any of its parents is in include (all included if None) '''
+    if include is None: 
+        return True
+    parts = path.split('.')
+    return any(['.'.join(parts[:i]) in include for i in range(1, len(parts)+1)])
+
+
+#------------------------------------------------------------------------------
+# Keep only data in include (for formats that can't be read partially)
+#------------------------------------------------------------------------------
+def _filterInclude (data, include):
+    include = _includePaths(include)
+    filtered = {}
+    for key, value in data.items():
+        if _included(key, include):
+            filtered[key] = value
+        elif isinstance(value, dict):
+            subset = {k: v for k, v in value.items() if _included(key+'.'+k, include)}
+            if subset: filtered[key] = subset
+    return filtered
+
+
 #------------------------------------------------------------------------------
 # Load simulation config from file
 #------------------------------------------------------------------------------
@@ -271,14 +320,16 @@ def loadSimData (filename, data=None):
 #------------------------------------------------------------------------------
 # Load all data in file
 #------------------------------------------------------------------------------
-def loadAll (filename, data=None, instantiate=True, createNEURONObj=True):
+def loadAll (filename, data=None, instantiate=True, createNEURONObj=True, include=None):
     from .. import sim 
 
-    if not data: data = _loadFile(filename)
+    if not data: data = _loadFile(filename, include=include)
     loadSimCfg(filename, data=data)
     sim.cfg.createNEURONObj = createNEURONObj  # set based on argument
     loadNetParams(filename, data=data)
-    if hasattr(sim.cfg, 'compactConnFormat'): 
+    if isinstance(data, NpyData):  # conns read from columns
+        connFormat = False
+    elif hasattr(sim.cfg, 'compactConnFormat'): 
         connFormat = sim.cfg.compactConnFormat
     else:
         print('Error: no connFormat provided in simConfig')
@@ -387,4 +438,287 @@ def ijsonLoad(filename, tagsGidRange=None, connsGidRange=None, loadTags=True, lo
     return tags, conns
 
 
+#------------------------------------------------------------------------------
+# Dict with values of some keys loaded on first access
+#------------------------------------------------------------------------------
+class _LazyDict (Dict):
+
+    def __init__(self, data, loaders):
+        super(_LazyDict, self).__init__(data)
+        object.__setattr__(self, '_loaders', dict(loaders))  # key -> function returning value
+
+    def __missing__(self, key):
+        if key not in self._loaders:
+            raise KeyError(key)
+        value = self._loaders.pop(key)()
+        dict.__setitem__(self, key, value)
+        return value
 
+    def __contains__(self, key):
+        return dict.__contains__(self, key) or key in self._loaders
+
+    def __iter__(self):
+        return iter(self.keys())
+
+    def __len__(self):
+        return len(self.keys())
+
+    def keys(self):
+        return list(dict.keys(self)) + [key for key in self._loaders if not dict.__contains__(self, key)]
+
+    def values(self):
+        return [self[key] for key in self.keys()]
+
+    def items(self):
+        return [(key, self[key]) for key in self.keys()]
+
+    def get(self, key, default=None):
+        return self[key] if key in self else default
+
+    def __reduce__(self):  # pickled/copied as Dict with all values loaded
+        return (Dict, (dict(self.items()),))
+
+
+#------------------------------------------------------------------------------
+# Data saved by each node to its own file (see sim.distributedSaveData)
+#------------------------------------------------------------------------------
+class DistributedData (_LazyDict):
+    ''' Dict with the contents of the manifest saved with cfg.distributedSave, where data['net']['cells'] and 
+    data['simData'] are read lazily from the files of the partitions (one per node). Each file is only opened when
+    required, and only the arrays requested are read (eg. the conns of a cell are read when first accessed) '''
+
+    def __init__(self, manifestFile):
+        import os, json
+        with open(manifestFile, 'r') as fileObj:
+            manifest = json.load(fileObj)
+        partitions = manifest.pop('partitions')
+        net = Dict(manifest.pop('net', {}))
+        super(DistributedData, self).__init__(manifest, {})
+        object.__setattr__(self, 'folder', os.path.dirname(manifestFile))
+        object.__setattr__(self, 'partitions', partitions)
+        object.__setattr__(self, '_files', {})
+        object.__setattr__(self, '_partCells', {})
+
+        if any(partitions['cellKeys']):
+            net = _LazyDict(net, {'cells': self.getCells})
+        self['net'] = net
+        simDataKeys = ['spkt', 'spkid'] + sorted(set([key for keys in partitions['traceKeys'] for key in keys]))
+        simDataKeys += [key for key in self._partArrayKeys(0) if key in ['t', 'LFP']]
+        if 'simData' in self._partArrayKeys(0):
+            simDataKeys += [key for key in self._otherSimData(0) if key not in simDataKeys]
+            self._loaders['simData'] = lambda: _LazyDict({}, {key: (lambda key=key: self._loadSimData(key)) for key in simDataKeys})
+
+    def numPartitions(self):
+        return len(self.partitions['files'])
+
+    def partitionGids(self, ipart):
+        ''' Returns array of gids of cells saved in partition (from runs in manifest) '''
+        runs = self.partitions['gidRuns'][ipart]
+        return np.concatenate([np.arange(*run) for run in runs]).astype(int) if runs else np.array([], dtype=int)
+
+    def gidPartitions(self, gids=None):
+        ''' Returns indices of partitions with any of the gids (all if None) '''
+        if gids is None:
+            return list(range(self.numPartitions()))
+        return [ipart for ipart in range(self.numPartitions()) if np.isin(self.partitionGids(ipart), gids).any()]
+
+    def _partition(self, ipart):
+        import os
+        if ipart not in self._files:  # np.load of npz only reads arrays when accessed
+            self._files[ipart] = np.load(os.path.join(self.folder, self.partitions['files'][ipart]))
+        return self._files[ipart]
+
+    def _partArrayKeys(self, ipart):
+        return self._partition(ipart).files
+
+    def _unpickle(self, ipart, key):
+        import pickle
+        return pickle.loads(self._partition(ipart)[key].tobytes())
+
+    def _otherSimData(self, ipart):
+        if ('simData', ipart) not in self._partCells:
+            self._partCells[('simData', ipart)] = self._unpickle(ipart, 'simData')
+        return self._partCells[('simData', ipart)]
+
+    def _cellStates(self, ipart):
+        ''' Returns dict {gid: cell state} of cells in partition (with conns as views of the partition ConnTable) '''
+        if ipart not in self._partCells:
+            cells = {cell['gid']: cell for cell in self._unpickle(ipart, 'cells')}
+            if 'connTable' in self._partArrayKeys(ipart):
+                from .. import sim
+                connTable = sim.ConnTable.fromStates([self._unpickle(ipart, 'connTable')])
+                for gid, cell in cells.items():
+                    cell['conns'] = connTable.cellConns(gid)
+            self._partCells[ipart] = cells
+        return self._partCells[ipart]
+
+    def getCells(self, gids=None):
+        ''' Returns list of cells (sorted by gid) with tags; the remaining params of the cells of each partition 
+        (eg. conns, secs, stims) are read when first accessed '''
+        cells = []
+        gidSet = set(gids) if gids is not None else None
+        for ipart in self.gidPartitions(gids):
+            cellKeys = [key for key in self.partitions['cellKeys'][ipart] if key != 'tags']
+            partGids = self._partition(ipart)['gids'].tolist()
+            for gid, tags in zip(partGids, self._unpickle(ipart, 'cellTags')):
+                if gidSet is None or gid in gidSet:
+                    loaders = {key: (lambda ipart=ipart, gid=gid, key=key: self._cellStates(ipart)[gid].get(key)) for key in cellKeys}
+                    cells.append(_LazyDict({'gid': gid, 'tags': Dict(tags)}, loaders))
+        return sorted(cells, key=lambda cell: cell['gid'])
+
+    def getSpikes(self, gids=None, timeRange=None):
+        ''' Returns arrays of spike times and gids (sorted by time and gid) of the given cells (all if None) within
+        timeRange [start, stop) (all if None); only the partitions with any of the gids are read, and the spikes of
+        each partition are selected before merging them '''
+        from .gather import _mergeSpikes
+        spkt, spkid = [], []
+        for ipart in self.gidPartitions(gids):
+            part = self._partition(ipart)
+            partSpkt, partSpkid = part['spkt'], part['spkid']
+            if timeRange is not None:  # spikes of each partition saved sorted by time
+                start, stop = np.searchsorted(partSpkt, timeRange, side='left')
+                partSpkt, partSpkid = partSpkt[start:stop], partSpkid[start:stop]
+            if gids is not None:
+                mask = np.isin(partSpkid, gids)
+                partSpkt, partSpkid = partSpkt[mask], partSpkid[mask]
+            spkt.append(partSpkt)
+            spkid.append(partSpkid)
+        if not spkt: 
+            return np.array([]), np.array([])
+        return _mergeSpikes(np.concatenate(spkt), np.concatenate(spkid), [len(t) for t in spkt])
+
+    def getTraces(self, key, gids=None):
+        ''' Returns Dict {cell_<gid>: trace} of recorded trace `key` of cells in partitions with any of the gids '''
+        traces = Dict()
+        gidSet = set(gids) if gids is not None else None
+        for ipart in self.gidPartitions(gids):
+            if key in self.partitions['traceKeys'][ipart]:
+                part = self._partition(ipart)
+                data, lengths = part['trace_'+key], part['traceLengths_'+key]
+                for i, gid in enumerate(part['traceGids_'+key].tolist()):
+                    if gidSet is None or gid in gidSet:
+                        traces['cell_%d' % (gid)] = data[i, :lengths[i]]
+            if 'simData' in self._partArrayKeys(ipart):
+                traces.update(self._otherSimData(ipart).get(key, {}))  # eg. one trace per synMech
+        return traces
+
+    def _loadSimData(self, key):
+        if key in ['spkt', 'spkid']:  # merged once for both keys
+            spkt, spkid = self.getSpikes()
+            self['simData']['spkt' if key == 'spkid' else 'spkid'] = spkt if key == 'spkid' else spkid
+            return spkt if key == 'spkt' else spkid
+        elif key in set([key for keys in self.partitions['traceKeys'] for key in keys]):
+            return self.getTraces(key)
+        elif key == 't':
+            return self._partition(0)['t']
+        elif key == 'LFP':  # LFP of each node summed
+            return sum([self._partition(ipart)['LFP'] for ipart in range(self.numPartitions())])
+        value = None
+        for ipart in range(self.numPartitions()):
+            partValue = self._otherSimData(ipart).get(key)
+            if key == 'LFPPops':
+                value = {pop: value.get(pop, 0) + lfp for pop, lfp in partValue.items()} if value else partValue
+            elif isinstance(partValue, dict):
+                value = Dict(value or {})
+                value.update(partValue)
+            elif partValue is not None:
+                value = partValue
+        return value
+
+
+#------------------------------------------------------------------------------
+# Data saved as directory of .npy files (see cfg.saveNpy)
+#------------------------------------------------------------------------------
+class NpyData (_LazyDict):
+    ''' Dict with the data saved in columnar format (cfg.saveNpy), restricted to the data paths in `include` 
+    (eg. ['simConfig', 'netCells', 'simData.spkt']; all if None). Each JSON file and array is only read when first 
+    accessed, and arrays are memory-mapped (eg. traces of cells are views of the rows of a memory-mapped 2D array) '''
+
+    def __init__(self, folder, include=None):
+        import os, json
+        with open(os.path.join(folder, 'schema.json'), 'r') as fileObj:
+            schema = json.load(fileObj)
+        include = _includePaths(include) if include is not None else None
+        super(NpyData, self).__init__(schema['info'], {})
+        object.__setattr__(self, 'folder', folder)
+        object.__setattr__(self, 'schema', schema)
+        object.__setattr__(self, 'connTable', None)  # ConnTable with conns of all cells (created on first access)
+
+        if 'simConfig' in schema['json'] and _included('simConfig', include):
+            self._loaders['simConfig'] = lambda: self.getJSON('simConfig')
+        netLoaders = {}
+        if 'net.params' in schema['json'] and _included('net.params', include):
+            netLoaders['params'] = lambda: self.getJSON('net.params')
+        if 'net.pops' in schema['json'] and _included('net.pops', include):
+            netLoaders['pops'] = lambda: ODict(self.getJSON('net.pops'))
+        if 'net.cells.gid' in schema['arrays'] and _included('net.cells', include):
+            netLoaders['cells'] = self.getCells
+        if netLoaders:
+            self['net'] = _LazyDict({}, netLoaders)
+        simDataLoaders = {key: (lambda key=key: self.getSimData(key)) for key in schema['simData'] if _included('simData.'+key, include)}
+        if simDataLoaders:
+            self._loaders['simData'] = lambda: _LazyDict({}, simDataLoaders)
+
+    def getArray(self, name, mmap=True):
+        ''' Returns array `name` (eg. 'simData.spkt'), memory-mapped by default '''
+        import os
+        mmapMode = 'r' if mmap and 0 not in self.schema['arrays'][name]['shape'] else None  # can't map empty arrays
+        return np.load(os.path.join(self.folder, name+'.npy'), mmap_mode=mmapMode)
+
+    def getJSON(self, name):
+        import os, json
+        with open(os.path.join(self.folder, name+'.json'), 'r') as fileObj:
+            return json.load(fileObj)
+
+    def getSimData(self, key):
+        name = 'simData.'+key
+        keyType = self.schema['simData'][key]
+        if keyType == 'trace':
+            data, lengths = self.getArray(name), self.getArray(name+'.lengths', mmap=False)
+            gids = self.getArray(name+'.gids', mmap=False).tolist()
+            return Dict({'cell_%d' % (gid): data[i, :lengths[i]] for i, gid in enumerate(gids)})
+        elif keyType == 'array':
+            return self.getArray(name)  # memory-mapped (incl. spkt, spkid and t)
+        return self.getJSON(name)
+
+    def getConnTable(self):
+        ''' Returns ConnTable with the conns of all cells (columns read from the conns arrays) '''
+        if self.connTable is None:
+            from .. import sim
+            state = {'postGid': self.getArray('net.conns.postGid', mmap=False)}
+            for key in list(sim.ConnTable.numericColumns)+sim.ConnTable.labelColumns:
+                state[key] = self.getArray('net.conns.'+key, mmap=False)
+            state['labels'] = {key: [None]+self.schema['labels']['net.conns.'+key] for key in sim.ConnTable.labelColumns}
+            state['extra'] = {int(row): extra for row, extra in self.getJSON('net.conns.extra').items()}
+            object.__setattr__(self, 'connTable', sim.ConnTable.fromStates([state]))
+        return self.connTable
+
+    def getCells(self):
+        ''' Returns list of cells with tags read from the tag columns; the remaining params of cells (eg. conns, secs, 
+        stims) are read when first accessed '''
+        gids = self.getArray('net.cells.gid', mmap=False).tolist()
+        tagColumns = {}
+        for key, keyType in self.schema['cells'].items():
+            name = 'net.cells.tags.'+key
+            if keyType == 'int':
+                tagColumns[key] = self.getArray(name, mmap=False).tolist()
+            elif keyType == 'numeric':
+                tagColumns[key] = [None if np.isnan(value) else value for value in self.getArray(name, mmap=False).tolist()]
+            elif keyType == 'label':
+                labels = self.schema['labels'][name] + [None]  # code -1 = missing
+                tagColumns[key] = [labels[code] for code in self.getArray(name, mmap=False).tolist()]
+            else:
+                tagColumns[key] = self.getJSON(name)
+        cellParams = {}
+        def cellParam(key, i):
+            if key == 'conns':
+                return self.getConnTable().cellConns(gids[i])
+            if key not in cellParams: 
+                cellParams[key] = self.getJSON('net.cells.'+key)  # read once for all cells
+            return cellParams[key][i]
+        cells = []
+        for i, gid in enumerate(gids):
+            tags = Dict({key: column[i] for key, column in tagColumns.items() if column[i] is not None})
+            loaders = {key: (lambda key=key, i=i: cellParam(key, i)) for key in ['conns']+self.schema['cellParams']}
+            cells.append(_LazyDict({'gid': gid, 'tags': tags}, loaders))
+        return cells
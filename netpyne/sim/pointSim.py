@@ -0,0 +1,390 @@
+"""
+sim/pointSim.py
+
+Functions to simulate networks of point cells (IntFire1, IntFire2, IntFire4, NetStim and VecStim) with NumPy,
+directly from the Python structure of cells and conns (ie. without creating NEURON objects)
+
+Contributors: salvadordura@gmail.com
+"""
+from __future__ import print_function
+from __future__ import division
+from __future__ import unicode_literals
+from __future__ import absolute_import
+
+from builtins import range
+from future import standard_library
+standard_library.install_aliases()
+import numpy as np
+import scipy.linalg
+from neuron import h
+from ..specs import Dict
+from ..cell.pointCell import vecStimSpkTimesBatch
+from . import utils
+
+
+pointSimModels = ['IntFire1', 'IntFire2', 'IntFire4']  # artificial cells simulated
+pointSimStims = ['NetStim', 'VecStim']  # spike sources (spike times generated before the run)
+
+
+###############################################################################
+#
+# POINT CELL GROUP CLASS
+#
+###############################################################################
+
+class PointCellGroup (object):
+    ''' State of a group of point cells of the same cellModel and params, with linear dynamics x' = M x between
+    events (so that states are advanced each time step with the exact propagator exp(M*dt), as a single matrix
+    product for all cells of the group). Excitatory (inhibitory) inputs are added to state excState (inhState);
+    cells fire when m > 1, after which m is reset to 0 (IntFire1 ignores inputs during its refractory period) '''
+
+    def __init__(self, cellModel, params, cellIndices, dt):
+        self.cellModel = cellModel
+        self.cellIndices = np.asarray(cellIndices, dtype=int)
+        self.states, M, self.excState, self.inhState = self.dynamics(cellModel, params)
+        self.m = self.states.index('m')
+        self.propagator = scipy.linalg.expm(np.asarray(M) * dt).T  # x(t+dt) = x(t) . P'
+        self.x = np.zeros((len(self.cellIndices), len(M)))
+        if 'const' in self.states:
+            self.x[:, self.states.index('const')] = 1.0
+        self.refrac = params.get('refrac', 5.0) if cellModel == 'IntFire1' else 0.0
+        self.refracEnd = np.full(len(self.cellIndices), -np.inf)  # end of refractory period of each cell
+
+
+    @staticmethod
+    def dynamics(cellModel, params):
+        ''' Returns state names, matrix M of linear dynamics (x' = M x) and states that receive excitatory and
+        inhibitory inputs of cellModel, with default params as in the NEURON mechanisms '''
+        if cellModel == 'IntFire1':  # tau*m' = -m
+            tau = params.get('tau', 10.0)
+            return ['m'], [[-1.0/tau]], 0, 0
+
+        elif cellModel == 'IntFire2':  # taum*m' = ib + i - m; taus*i' = -i
+            taum, taus, ib = params.get('taum', 10.0), params.get('taus', 20.0), params.get('ib', 0.0)
+            M = [[-1.0/taum, 1.0/taum, ib/taum],
+                 [0.0, -1.0/taus, 0.0],
+                 [0.0, 0.0, 0.0]]
+            return ['m', 'i', 'const'], M, 1, 1
+
+        elif cellModel == 'IntFire4':  # taue*e' = -e; taui1*i1' = -i1; taui2*i2' = i1 - i2; taum*m' = ae*e + ai2*i2 - m
+            taue, taui1, taui2, taum = [params.get(p, default) for p, default in
+                [('taue', 5.0), ('taui1', 10.0), ('taui2', 20.0), ('taum', 50.0)]]
+            M = np.array([[-1.0/taue, 0.0, 0.0, 0.0],
+                          [0.0, -1.0/taui1, 0.0, 0.0],
+                          [0.0, 1.0/taui2, -1.0/taui2, 0.0],
+                          [1.0/taum, 0.0, 1.0/taum, -1.0/taum]])
+            # normalize so a single input of weight w produces a peak m of w (excitatory via e, inhibitory via i1)
+            for state, coef in [(0, 0), (1, 2)]:
+                x0 = np.zeros(4)
+                x0[state] = 1.0
+                M[3, coef] /= PointCellGroup._peak(M, x0, 3, min(taue, taui1, taui2, taum)/100.0, 10*max(taui1+taui2, taum))
+            return ['e', 'i1', 'i2', 'm'], M, 0, 1
+
+
+    @staticmethod
+    def _peak(M, x0, state, step, duration):
+        ''' Returns max absolute value of state when x' = M x with initial value x0 (sampled every step) '''
+        propagator = scipy.linalg.expm(M * step)
+        x, peak = x0, 0.0
+        for i in range(int(duration/step)):
+            x = propagator.dot(x)
+            peak = max(peak, abs(x[state]))
+        return peak
+
+
+    def advance(self, t, inputs):
+        ''' Advances states to time t, adds inputs (array with exc and inh input of each cell, or None) and
+        returns bool array with cells that fired '''
+        self.x = self.x.dot(self.propagator)
+        if self.refrac:
+            refractory = self.refracEnd > t + 1e-9
+            self.x[refractory, self.m] = 2.0  # as in IntFire1.mod (m = 2 while refractory)
+            ended = np.isfinite(self.refracEnd) & ~refractory
+            self.x[ended, self.m] = 0.0
+            self.refracEnd[ended] = -np.inf
+        if inputs is not None:
+            exc, inh = inputs[self.cellIndices, 0], inputs[self.cellIndices, 1]
+            if self.refrac:
+                exc[refractory], inh[refractory] = 0.0, 0.0
+            self.x[:, self.excState] += exc
+            self.x[:, self.inhState] += inh
+        fired = self.x[:, self.m] > 1.0
+        if self.refrac:
+            fired &= ~refractory
+        if fired.any():
+            if self.refrac:
+                self.x[fired, self.m] = 2.0
+                self.refracEnd[fired] = t + self.refrac
+            else:
+                self.x[fired, self.m] = 0.0
+        return fired
+
+
+#------------------------------------------------------------------------------
+# Check if network can be simulated with NumPy (see cfg.numpyBackend)
+#------------------------------------------------------------------------------
+def canRunPointSim (verbose=True):
+    ''' Returns True if all cells are point cells of models supported by sim.runPointSim and network was created
+    without NEURON objects (cfg.createNEURONObj=False) in a single node '''
+    from .. import sim
+
+    reason = None
+    unsupported = set([cell.tags.get('cellModel') for cell in sim.net.cells
+        if not isinstance(cell, sim.PointCell) or cell.tags.get('cellModel') not in pointSimModels+pointSimStims])
+    if sim.cfg.createNEURONObj:
+        reason = 'requires cfg.createNEURONObj=False'
+    elif not sim.cfg.createPyStruct:
+        reason = 'requires cfg.createPyStruct=True'
+    elif sim.nhosts > 1:
+        reason = 'only supported in a single node'
+    elif unsupported:
+        reason = 'cell models not supported: %s' % (', '.join([str(model) for model in unsupported]))
+    if reason and verbose and sim.rank == 0:
+        print('  Error: cannot simulate network with NumPy backend (%s)' % (reason))
+    return reason is None
+
+
+#------------------------------------------------------------------------------
+# Get conns of point cells as arrays
+#------------------------------------------------------------------------------
+def _getConnArrays (cells):
+    ''' Returns arrays with preGid, postGid, weight and delay of conns from gids (excludes conns from NetStims) '''
+    from .. import sim
+
+    if sim.net._connTableCells():  # read conns from ConnTable columns
+        table = sim.net.connTable
+        rows = table.getRows([cell.gid for cell in cells])
+        rows = rows[table.getColumn('preGid', rows) != table.netStimPreGid]
+        preGid, postGid = table.getColumn('preGid', rows), table.getColumn('postGid', rows)
+        weight, delay = table.getColumn('weight', rows), table.getColumn('delay', rows)
+        for i, row in enumerate(rows.tolist()):
+            if row in table.extra:  # values not stored in columns (or missing)
+                for key, column in [('weight', weight), ('delay', delay)]:
+                    if key in table.extra[row] and key != '_missing':
+                        column[i] = table.getValue(row, key)
+                    elif key in table.extra[row].get('_missing', []):
+                        column[i] = getattr(sim.net.params, 'default'+key.title())
+        return preGid, postGid, weight, delay
+
+    values = [(conn.get('preGid'), cell.gid, conn.get('weight', sim.net.params.defaultWeight),
+        conn.get('delay', sim.net.params.defaultDelay)) for cell in cells for conn in cell.conns if conn.get('preGid') != 'NetStim']
+    if not values:
+        return np.array([], dtype=int), np.array([], dtype=int), np.array([]), np.array([])
+    preGid, postGid, weight, delay = zip(*values)
+    return np.array(preGid, dtype=int), np.array(postGid, dtype=int), np.array(weight, dtype=float), np.array(delay, dtype=float)
+
+
+#------------------------------------------------------------------------------
+# Generate NetStim spike times
+#------------------------------------------------------------------------------
+def netStimSpkTimes (cell, duration):
+    ''' Returns array with spike times of NetStim point cell up to duration, as generated by NetStim.mod (with noise
+    from the same Random123 stream set in sim.preRun, so spike times are the same as in NEURON) '''
+    from .. import sim
+
+    params = cell.params
+    if 'rate' in params:
+        params['interval'] = 1000.0/params['rate']
+    interval = params.get('interval', 10.0)
+    mean = interval if interval > 0 else 0.01
+    start, number = params.get('start', 50.0), params.get('number', 1e9)
+    noise = min(max(params.get('noise', 0.0), 0.0), 1.0)
+    if start < 0 or number <= 0:
+        return np.array([])
+
+    if noise == 0:
+        numSpks = int(min(number, np.floor((duration - start)/mean) + 1)) if duration >= start else 0
+        return start + mean * np.arange(numSpks)
+
+    # each interval (and the first spike) uses one negexp(1) pick from the randomizer
+    rand = h.Random()
+    utils._init_stim_randomizer(rand, 'NetStim', cell.gid, params.get('seed', sim.cfg.seeds['stim']))
+    rand.negexp(1)
+    numPicks = max(1, int(min(number, 2*max(duration - start, 0)/mean + 10)))
+    erand = np.array([])
+    while True:
+        vec = h.Vector(numPicks)
+        vec.setrand(rand)
+        erand = np.append(erand, np.array(vec))
+        first = max(start + noise*mean*erand[0], 0.0)  # first spike at start + invl - interval*(1-noise)
+        spkTimes = first + np.concatenate(([0.0], np.cumsum((1.0-noise)*mean + noise*mean*erand[1:])))
+        if len(spkTimes) >= number or spkTimes[-1] > duration:
+            break
+    spkTimes = spkTimes[:int(min(number, len(spkTimes)))]
+    return spkTimes[spkTimes <= duration]
+
+
+#------------------------------------------------------------------------------
+# Run simulation of point cell network with NumPy
+#------------------------------------------------------------------------------
+def runPointSim ():
+    ''' Simulates network of point cells (IntFire1, IntFire2, IntFire4, NetStim and VecStim) with NumPy instead of
+    NEURON, directly from the Python structure (requires cfg.createNEURONObj=False; see cfg.numpyBackend). States
+    of each group of cells with the same model and params are advanced every cfg.dt with the exact propagator of
+    their linear dynamics; spikes are delivered through a ring buffer of time steps (delays rounded to dt, min 1
+    step) over arrays of conns (read from the ConnTable columns if cfg.connTable). NetStim and VecStim spike times
+    are generated before the run with the same randomizers as in NEURON. Spikes and traces of state variables
+    (recordTraces with 'var' eg. 'm') are stored in simData with the same layout as when running NEURON '''
+    from .. import sim
+
+    if not canRunPointSim():
+        return
+
+    sim.pc.barrier()
+    sim.timing('start', 'runTime')
+
+    dt, duration = float(sim.cfg.dt), float(sim.cfg.duration)
+    numSteps = int(round(duration/dt))
+    cells = sim.net.cells
+    gids = np.array([cell.gid for cell in cells], dtype=int)
+    gidOrder = np.argsort(gids)
+
+    def cellIndex(cellGids):
+        idx = np.searchsorted(gids, cellGids, sorter=gidOrder)
+        idx = gidOrder[np.minimum(idx, len(gids)-1)]
+        return np.where(gids[idx] == cellGids, idx, -1)
+
+    # groups of cells with the same model and params
+    groupCells = {}
+    for i, cell in enumerate(cells):
+        cellModel = cell.tags['cellModel']
+        if cellModel in pointSimModels:
+            params = {k: v for k, v in cell.params.items() if isinstance(v, (int, float))}
+            groupCells.setdefault((cellModel, tuple(sorted(params.items()))), []).append(i)
+    groups = [PointCellGroup(cellModel, dict(params), indices, dt) for (cellModel, params), indices in groupCells.items()]
+
+    # spike times of NetStims and VecStims (as steps to deliver them)
+    stimSpkt, stimSpkid = [], []
+    if sim.cfg.vecStimBatch:
+        vecStimSpkTimes = vecStimSpkTimesBatch([cell for cell in cells if cell.tags['cellModel'] == 'VecStim'])
+    for i, cell in enumerate(cells):
+        cellModel = cell.tags['cellModel']
+        if cellModel in pointSimStims:
+            cell._setRandomRate()
+            if cellModel == 'NetStim':
+                spkTimes = netStimSpkTimes(cell, duration)
+            else:
+                spkTimes = vecStimSpkTimes[cell.gid] if sim.cfg.vecStimBatch else cell.vecStimSpkTimes()
+            if spkTimes is not None and len(spkTimes):
+                stimSpkt.append(np.asarray(spkTimes, dtype=float))
+                stimSpkid.append(np.full(len(spkTimes), i, dtype=int))
+    stimSpkt = np.concatenate(stimSpkt) if stimSpkt else np.array([])
+    stimSpkid = np.concatenate(stimSpkid) if stimSpkid else np.array([], dtype=int)
+    order = np.argsort(stimSpkt, kind='mergesort')
+    stimSpkt, stimSpkid = stimSpkt[order], stimSpkid[order]
+    stimBounds = np.searchsorted(np.rint(stimSpkt/dt).astype(int), np.arange(numSteps+2))
+
+    # conns as arrays sorted by presyn cell (inputs of IntFire4 with negative weight go to inhibitory state)
+    preGid, postGid, weight, delay = _getConnArrays(cells)
+    pre, post = cellIndex(preGid), cellIndex(postGid)
+    isModel, inhibitory = np.zeros(len(cells), dtype=bool), np.zeros(len(cells), dtype=bool)
+    for group in groups:
+        isModel[group.cellIndices] = True
+        inhibitory[group.cellIndices] = group.inhState != group.excState
+    valid = (pre >= 0) & (post >= 0)
+    valid[valid] = isModel[post[valid]]  # conns to NetStims and VecStims not simulated
+    order = np.argsort(pre[valid], kind='mergesort')
+    connPre = pre[valid][order]
+    connTarget = (2 * post[valid] + (inhibitory[post[valid]] & (weight[valid] < 0)))[order]
+    connWeight = weight[valid][order]
+    connSteps = np.maximum(1, np.rint(delay[valid]/dt).astype(int))[order]
+    connStart = np.searchsorted(connPre, np.arange(len(cells)+1))
+    numSlots = int(connSteps.max()) + 1 if len(connSteps) else 1
+    ringBuffer = [[] for i in range(numSlots)]  # (target, weight) of events to deliver at each step (mod numSlots)
+
+    # spikes recorded
+    if sim.cfg.recordCellsSpikes == -1:
+        recordSpikes = np.ones(len(cells), dtype=bool)
+    else:
+        recordSpikes = np.zeros(len(cells), dtype=bool)
+        recordGids = utils.getCellsList(sim.cfg.recordCellsSpikes, returnGids=True)
+        recordSpikes[cellIndex(np.array(recordGids, dtype=int))] = True
+    spkt, spkid = [], []
+
+    # traces recorded (state variables of each group)
+    recordStep = max(1, int(round(sim.cfg.recordStep/dt)))
+    numRecords = numSteps//recordStep + 1
+    traces = []  # (key, gids, group, state, positions in group, array with values)
+    if sim.cfg.recordTraces:
+        from .setup import _getCellsRecordTraces
+        cellsRecord = _getCellsRecordTraces()
+        for key, params in sim.cfg.recordTraces.items():
+            if key not in sim.simData: sim.simData[key] = Dict()
+            if 'var' not in params or any(k in params for k in ['sec', 'synMech', 'pointp']):
+                continue
+            for group in groups:
+                if params['var'] not in group.states:
+                    continue
+                positions = {idx: j for j, idx in enumerate(group.cellIndices.tolist())}
+                recCells = [(cells[i].gid, positions[i]) for i in sorted(set([sim.net.gid2lid[cell.gid] for cell in cellsRecord]))
+                    if i in positions and cells[i]._recordTraceConds(params)]
+                if recCells:
+                    traceGids, tracePositions = zip(*recCells)
+                    traces.append((key, traceGids, group, group.states.index(params['var']), np.array(tracePositions),
+                        np.zeros((numRecords, len(recCells)))))
+
+    def recordTraces(irecord):
+        for key, traceGids, group, state, positions, values in traces:
+            values[irecord] = group.x[positions, state]
+
+    if sim.rank == 0: print(('\nRunning simulation for %s ms (NumPy backend; %d point cells, %d conns)...' % (sim.cfg.duration, len(cells), len(connPre))))
+    printRunTimeSteps = int(round(sim.cfg.printRunTime*1000.0/dt)) if sim.cfg.printRunTime else 0
+
+    recordTraces(0)
+    for step in range(numSteps+1):
+        t = step * dt
+
+        # advance cell states and deliver events of this step
+        fired = [stimSpkid[stimBounds[step]:stimBounds[step+1]]]
+        if step > 0:
+            slot = ringBuffer[step % numSlots]
+            inputs = None
+            if slot:
+                targets, weights = zip(*slot)
+                inputs = np.bincount(np.concatenate(targets), weights=np.concatenate(weights), minlength=2*len(cells)).reshape(-1, 2)
+                ringBuffer[step % numSlots] = []
+            for group in groups:
+                groupFired = group.advance(t, inputs)
+                if groupFired.any():
+                    fired.append(group.cellIndices[groupFired])
+                    rec = group.cellIndices[groupFired]
+                    rec = rec[recordSpikes[rec]]
+                    spkt.append(np.full(len(rec), t))
+                    spkid.append(gids[rec])
+        stimFired = fired[0][recordSpikes[fired[0]]]
+        spkt.append(stimSpkt[stimBounds[step]:stimBounds[step+1]][recordSpikes[fired[0]]])
+        spkid.append(gids[stimFired])
+
+        # schedule events from cells that fired
+        fired = np.concatenate(fired) if len(fired) > 1 else fired[0]
+        if len(fired):
+            starts, counts = connStart[fired], connStart[fired+1] - connStart[fired]
+            if counts.sum():
+                conns = np.repeat(starts - np.cumsum(counts) + counts, counts) + np.arange(counts.sum())
+                slots = (step + connSteps[conns]) % numSlots
+                order = np.argsort(slots, kind='mergesort')
+                conns, slots = conns[order], slots[order]
+                bounds = np.flatnonzero(np.diff(slots)) + 1
+                for slotConns in np.split(conns, bounds):
+                    ringBuffer[(step + connSteps[slotConns[0]]) % numSlots].append((connTarget[slotConns], connWeight[slotConns]))
+
+        if step > 0 and step % recordStep == 0:
+            recordTraces(step // recordStep)
+        if printRunTimeSteps and step > 0 and step % printRunTimeSteps == 0 and step < numSteps and sim.rank == 0:
+            print(t/1000.0, 's')
+
+    # store spikes and traces with the same layout as simData recorded from NEURON
+    spkt, spkid = np.concatenate(spkt), np.concatenate(spkid)
+    order = np.argsort(spkt, kind='mergesort')
+    sim.simData['spkt'], sim.simData['spkid'] = spkt[order], spkid[order].astype(float)
+    for key, traceGids, group, state, positions, values in traces:
+        for j, gid in enumerate(traceGids):
+            sim.simData[key]['cell_'+str(gid)] = values[:, j]
+    if traces and sim.cfg.recordTime:
+        sim.simData['t'] = np.arange(numRecords) * recordStep * dt
+
+    sim.pc.barrier() # Wait for all hosts to get to this point
+    sim.timing('stop', 'runTime')
+    if sim.rank==0:
+        print(('  Done; run time = %0.2f s; real-time ratio: %0.2f.' %
+            (sim.timingData['runTime'], sim.cfg.duration/1000/sim.timingData['runTime'])))
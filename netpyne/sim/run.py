@@ -66,6 +66,24 @@ def preRun ():
         rand.Random123_globalindex(int(sim.cfg.rand123GlobalIndex))
 
     # reset all netstim randomizers so runs are always equivalent
+    _initStimRandomizers()
+
+    # handler for recording LFP
+    if sim.cfg.recordLFP:
+        def recordLFPHandler():
+            for i in np.arange(sim.cfg.recordStep, sim.cfg.duration+sim.cfg.recordStep, sim.cfg.recordStep):
+                sim.cvode.event(i, sim.calculateLFP)
+
+        sim.recordLFPHandler = recordLFPHandler
+        sim.fih.append(h.FInitializeHandler(0, sim.recordLFPHandler))  # initialize imemb
+
+
+#------------------------------------------------------------------------------
+# Initialize random number generators of stims (NetStims, stims with noise and pools)
+#------------------------------------------------------------------------------
+def _initStimRandomizers ():
+    from .. import sim
+
     for cell in sim.net.cells:
         if cell.tags.get('cellModel') == 'NetStim':
             #cell.hRandom.Random123(sim.hashStr('NetStim'), cell.gid, cell.params['seed'])
@@ -86,14 +104,13 @@ def preRun ():
                     if not isinstance(stim['hObj'].noiseFromRandom, dict):
                         stim['hObj'].noiseFromRandom(stim['hRandom'])
 
-    # handler for recording LFP
-    if sim.cfg.recordLFP:
-        def recordLFPHandler():
-            for i in np.arange(sim.cfg.recordStep, sim.cfg.duration+sim.cfg.recordStep, sim.cfg.recordStep):
-                sim.cvode.event(i, sim.calculateLFP)
-
-        sim.recordLFPHandler = recordLFPHandler
-        sim.fih.append(h.FInitializeHandler(0, sim.recordLFPHandler))  # initialize imemb
+    # reset randomizers of NetStims shared by stim targets (stim sources with 'pool')
+    for source, pool in sim.net.stimPools.items():
+        for stim in pool:
+            utils._init_stim_randomizer(stim['hRandom'], 'pool_'+source, stim['stream'], stim['seed'])
+            stim['hRandom'].negexp(1)
+            if not isinstance(stim['hObj'].noiseFromRandom, dict):
+                stim['hObj'].noiseFromRandom(stim['hRandom'])
 
 
 #------------------------------------------------------------------------------
@@ -102,20 +119,183 @@ def preRun ():
 def runSim ():
     from .. import sim
 
+    # simulate point cells with NumPy if network created without NEURON objects (see cfg.numpyBackend)
+    if sim.cfg.numpyBackend and not sim.cfg.createNEURONObj:
+        sim.runPointSim()
+        return
+
     sim.pc.barrier()
     sim.timing('start', 'runTime')
     preRun()
     
     h.finitialize(float(sim.cfg.hParams['v_init']))
 
-    if sim.rank == 0: print(('\nRunning simulation for %s ms...'%sim.cfg.duration))
-    sim.pc.psolve(sim.cfg.duration)
+    # start from state saved at end of transient of another run (see cfg.warmStartDir)
+    tstart = 0
+    if sim.cfg.warmStartDir:
+        tstart = sim._restoreCheckpoint(sim.cfg.warmStartDir, warmStart=True)
+        if sim.rank == 0: print(('\nWarm start from state at %s ms saved in %s' % (tstart, sim.cfg.warmStartDir)))
+
+    sim.tstart = tstart  # rates calculated over simulated time
+    if sim.rank == 0: print(('\nRunning simulation for %s ms...'%(sim.cfg.duration-tstart)))
+    if sim.cfg.streamOutput or sim.cfg.checkpointInterval:
+        if sim.cfg.streamOutput: sim.openStream()
+        _runIntervals()
+    else:
+        sim.pc.psolve(sim.cfg.duration)
 
     sim.pc.barrier() # Wait for all hosts to get to this point
     sim.timing('stop', 'runTime')
     if sim.rank==0:
         print(('  Done; run time = %0.2f s; real-time ratio: %0.2f.' %
-            (sim.timingData['runTime'], sim.cfg.duration/1000/sim.timingData['runTime'])))
+            (sim.timingData['runTime'], (sim.cfg.duration-tstart)/1000/sim.timingData['runTime'])))
+
+    # save final state to warm start other runs (see cfg.saveStateDir)
+    if sim.cfg.saveStateDir:
+        sim.saveCheckpoint(sim.cfg.saveStateDir)
+
+    if sim.cfg.streamOutput:
+        sim.closeStream()
+
+
+#------------------------------------------------------------------------------
+# Run Simulation from current time in intervals (to stream output or save checkpoints)
+#------------------------------------------------------------------------------
+def _runIntervals ():
+    ''' Runs simulation from h.t to cfg.duration, stopping every cfg.streamOutput['interval'] to write spikes and
+    traces to disk, and every cfg.checkpointInterval to save a checkpoint (after writing the streamed output) '''
+    from .. import sim
+
+    streamInterval = sim.cfg.streamOutput.get('interval', 1000) if sim.cfg.streamOutput else None
+    checkpointInterval = sim.cfg.checkpointInterval
+    while round(h.t) < sim.cfg.duration:
+        tstops = [sim.cfg.duration] + [(np.floor(h.t/interval + 1e-9) + 1) * interval for interval in [streamInterval, checkpointInterval] if interval]
+        tstop = min(tstops)
+        sim.pc.psolve(tstop)
+        if streamInterval: 
+            sim.streamData()
+        if checkpointInterval and tstop < sim.cfg.duration and abs(tstop/checkpointInterval - round(tstop/checkpointInterval)) < 1e-9:
+            sim.saveCheckpoint()
+
+
+#------------------------------------------------------------------------------
+# Run multiple trials of the network created
+#------------------------------------------------------------------------------
+def runTrials (numTrials=None, vary=None):
+    ''' Runs numTrials trials of the network already created, without recreating it: before each trial the cfg params
+    in vary (dict with lists of values of each trial; nested params as eg. 'seeds.stim') are set, the stim random
+    streams are reseeded (and VecStim spike trains regenerated when 'seeds.stim' changes the seed of stims that used
+    it), and the state is reset with finitialize. Only params used at run time (eg. 'seeds.stim' or 'duration') have
+    an effect. Default vary is {'seeds.stim': [seed, seed+1, ...]} from cfg.seeds['stim']. The spikes of all trials
+    are gathered into sim.trialData (returned in master), with spkt, spkid and trial arrays sorted by trial, time and
+    gid; simData keeps the spikes and traces of the last trial, which can be gathered with sim.gatherData() '''
+    from .. import sim
+    from .gather import _gatherArray
+
+    if sim.cfg.numpyBackend and not sim.cfg.createNEURONObj:
+        raise Exception('runTrials requires the NEURON objects of the network (cfg.createNEURONObj)')
+    if vary is None:
+        vary = {'seeds.stim': [sim.cfg.seeds['stim'] + i for i in range(numTrials or 1)]}
+    if numTrials is None:
+        numTrials = min([len(values) for values in vary.values()])
+    for paramLabel, values in vary.items():
+        if len(values) < numTrials:
+            raise Exception('runTrials: %d values of %s for %d trials' % (len(values), paramLabel, numTrials))
+
+    sim.pc.barrier()
+    sim.timing('start', 'trialsTime')
+    preRun()
+    spkts, spkids, trials = [], [], []
+    for trial in range(numTrials):
+        for paramLabel, values in vary.items():
+            _setTrialParam(paramLabel, values[trial])
+        _initStimRandomizers()
+        sim.simData['spkt'].resize(0)
+        sim.simData['spkid'].resize(0)
+        h.finitialize(float(sim.cfg.hParams['v_init']))
+
+        if sim.rank == 0: print(('\nRunning trial %d of %d (%s) for %s ms...' % (trial+1, numTrials, 
+            ', '.join(['%s=%s' % (paramLabel, values[trial]) for paramLabel, values in vary.items()]), sim.cfg.duration)))
+        sim.pc.psolve(sim.cfg.duration)
+
+        spkts.append(sim.simData['spkt'].as_numpy().copy())
+        spkids.append(sim.simData['spkid'].as_numpy().copy())
+        trials.append(np.full(len(spkts[-1]), trial, dtype=float))
+
+    # spikes of all trials (trial index of each spike) gathered in master
+    sim.pc.barrier()
+    allSpkt, spkCounts = _gatherArray(np.concatenate(spkts))
+    allSpkid, _ = _gatherArray(np.concatenate(spkids))
+    allTrials, _ = _gatherArray(np.concatenate(trials))
+    sim.timing('stop', 'trialsTime')
+    if sim.rank == 0:
+        order = np.lexsort((allSpkid, allSpkt, allTrials))
+        sim.trialData = {'numTrials': numTrials, 'vary': {paramLabel: list(values[:numTrials]) for paramLabel, values in vary.items()},
+            'spkt': allSpkt[order], 'spkid': allSpkid[order], 'trial': allTrials[order].astype(int)}
+        sim.trialData['numSpikes'] = np.bincount(sim.trialData['trial'], minlength=numTrials)
+        print(('  Done; %d trials in %0.2f s (%0.1f trials per hour); %0.1f spikes per trial' % (numTrials,
+            sim.timingData['trialsTime'], numTrials*3600.0/sim.timingData['trialsTime'], np.mean(sim.trialData['numSpikes']))))
+        return sim.trialData
+
+
+#------------------------------------------------------------------------------
+# Set cfg param of trial (nested params as eg. 'seeds.stim')
+#------------------------------------------------------------------------------
+def _setTrialParam (paramLabel, value):
+    from .. import sim
+
+    keys = paramLabel.split('.')
+    container = sim.cfg
+    for key in keys[:-1]:
+        container = getattr(container, key) if container is sim.cfg else container[key]
+    if keys == ['seeds', 'stim']:
+        _setStimSeed(sim.cfg.seeds['stim'], value)
+    if container is sim.cfg:
+        setattr(sim.cfg, keys[-1], value)
+    else:
+        container[keys[-1]] = value
+    if keys[0] == 'hParams':
+        sim.setGlobals()
+
+
+#------------------------------------------------------------------------------
+# Replace seed of stims that use the stim seed of cfg
+#------------------------------------------------------------------------------
+def _setStimSeed (oldSeed, newSeed):
+    from .. import sim
+    from ..cell.pointCell import vecStimSpkTimesBatch
+
+    if newSeed == oldSeed: return
+    vecStims = []
+    for cell in sim.net.cells:
+        params = getattr(cell, 'params', None)
+        if isinstance(params, dict) and params.get('seed') == oldSeed:
+            params['seed'] = newSeed
+            if cell.tags.get('cellModel') == 'VecStim':
+                vecStims.append(cell)
+        if isinstance(params, dict) and '_rateRange' in params:  # rate drawn from range with stim seed
+            cell._setRandomRate(newSeed)
+            params['interval'] = 1000.0/params['rate']
+            if cell.tags.get('cellModel') == 'VecStim':
+                if cell not in vecStims: vecStims.append(cell)
+            elif getattr(cell, 'hPointp', None) is not None:
+                cell.hPointp.interval = params['interval']
+        for stim in cell.stims:
+            if stim.get('seed') == oldSeed:
+                stim['seed'] = newSeed
+    for pool in sim.net.stimPools.values():
+        for stim in pool:
+            if stim['seed'] == oldSeed:
+                stim['seed'] = newSeed
+
+    # regenerate spike trains of VecStims with new seed
+    if sim.cfg.vecStimBatch and vecStims:
+        spkTimes = vecStimSpkTimesBatch(vecStims)
+        for cell in vecStims:
+            cell.playSpkTimes(spkTimes[cell.gid])
+    else:
+        for cell in vecStims:
+            cell.playSpkTimes(cell.vecStimSpkTimes())
 
 
 #------------------------------------------------------------------------------
@@ -129,10 +309,12 @@ def runSimWithIntervalFunc (interval, func):
     preRun()
     init()
     if sim.rank == 0: print('\nRunning...')
+    if sim.cfg.streamOutput: sim.openStream()
 
     while round(h.t) < sim.cfg.duration:
         sim.pc.psolve(min(sim.cfg.duration, h.t+interval))
         func(h.t) # function to be called at intervals
+        if sim.cfg.streamOutput: sim.streamData()  # write spikes and traces to disk at each interval
 
     sim.pc.barrier() # Wait for all hosts to get to this point
     sim.timing('stop', 'runTime')
@@ -140,6 +322,9 @@ def runSimWithIntervalFunc (interval, func):
         print(('  Done; run time = %0.2f s; real-time ratio: %0.2f.' %
             (sim.timingData['runTime'], sim.cfg.duration/1000/sim.timingData['runTime'])))
 
+    if sim.cfg.streamOutput:
+        sim.closeStream()
+
 
 #------------------------------------------------------------------------------
 # Calculate LFP (fucntion called at every time step)      
@@ -147,26 +332,48 @@ def runSimWithIntervalFunc (interval, func):
 def calculateLFP():
     from .. import sim    
 
-    # Set pointers to i_membrane in each cell (required form LFP calc )        
-    for cell in sim.net.compartCells:
-        cell.setImembPtr()
-
-    # compute 
+    # gather i_membrane_ of all segments in node (single pointer vector) into buffer 
     saveStep = int(np.floor(h.t / sim.cfg.recordStep))
-    for cell in sim.net.compartCells: # compute ecp only from the biophysical cells
-        gid = cell.gid
-        im = cell.getImemb() # in nA
-        tr = sim.net.recXElectrode.getTransferResistance(gid)  # in MOhm
-        ecp = np.dot(tr,im) # in mV (= R * I = MOhm * nA)
-        if sim.cfg.saveLFPCells: 
-            sim.simData['LFPCells'][gid][saveStep-1, :] = ecp  # contribution of individual cells (stored optionally)
-        sim.simData['LFP'][saveStep-1, :] += ecp  # sum of all cells
+    sim.net.imembPtr.gather(sim.net.imembVec)
+    sim.net.imembBuffer[:, len(sim.net.imembBufferSteps)] = sim.net.imembVec.as_numpy()  # in nA
+    sim.net.imembBufferSteps.append(saveStep-1)
+
+    # compute LFP of buffered steps when buffer is full or at last record step
+    if len(sim.net.imembBufferSteps) == sim.net.imembBuffer.shape[1] or saveStep >= sim.simData['LFP'].shape[0]:
+        _calculateBufferedLFP()
+
+
+#------------------------------------------------------------------------------
+# Calculate LFP of record steps stored in i_membrane_ buffer (one matrix product)
+#------------------------------------------------------------------------------
+def _calculateBufferedLFP():
+    from .. import sim
+
+    steps = sim.net.imembBufferSteps
+    if not steps: 
+        return
+    im = sim.net.imembBuffer[:, :len(steps)]  # segments x steps (in nA)
+    tr = sim.net.recXElectrode.stackedTransferResistance  # sites x segments (in MOhm)
+    np.add.at(sim.simData['LFP'], steps, np.dot(tr, im).T)  # sum of all cells, in mV (= R * I = MOhm * nA); steps can repeat
+    if sim.cfg.saveLFPCells: 
+        for gid, segs in sim.net.recXElectrode.segSlices.items():
+            sim.simData['LFPCells'][gid][steps, :] = np.dot(tr[:, segs], im[segs, :]).T  # contribution of individual cells (stored optionally)
+    if sim.cfg.saveLFPPops:
+        for pop, (segs, popTr) in sim.net.popSegs.items():
+            np.add.at(sim.simData['LFPPops'][pop], steps, np.dot(popTr, im[segs, :]).T)  # contribution of each pop (stored optionally)
+    sim.net.imembBufferSteps = []
 
 
 #------------------------------------------------------------------------------
 # Calculate and print load balance
 #------------------------------------------------------------------------------
-def loadBalance ():
+def loadBalance (saveProfile = None):
+    ''' Calculate load balance (avg/max computation time across nodes) and compare to load balance predicted
+    from estimated cell costs when distributing cells (see cfg.distributeCells)
+        - saveProfile (string): file name to save the fitted cost per cell of each pop, which can be used to distribute 
+          cells in subsequent runs via cfg.cellCostProfile (default: None) 
+        - Returns [max_comp_time, min_comp_time, avg_comp_time, load_balance]; the predicted load balance (if cells
+          distributed with cfg.distributeCells='cost' or 'partition') is stored in sim.timingData['predictedLoadBalance'] '''
     from .. import sim
 
     computation_time = sim.pc.step_time()
@@ -175,13 +382,75 @@ def loadBalance ():
     avg_comp_time = sim.pc.allreduce(computation_time, 1)/sim.nhosts
     load_balance = avg_comp_time/max_comp_time
 
+    hostLoads = getattr(sim, 'hostLoads', None)  # predicted load of each node
+    predicted_load_balance = np.mean(hostLoads)/max(hostLoads) if hostLoads and max(hostLoads) > 0 else None
+
     print('node:',sim.rank,' comp_time:',computation_time)
     if sim.rank==0:
         print('max_comp_time:', max_comp_time)
         print('min_comp_time:', min_comp_time)
         print('avg_comp_time:', avg_comp_time)
         print('load_balance:',load_balance)
+        if predicted_load_balance is not None:
+            sim.timingData['predictedLoadBalance'] = predicted_load_balance
+            print('predicted_load_balance (%s):' % (sim.cfg.distributeCells), predicted_load_balance)
         print('\nspike exchange time (run_time-comp_time): ', sim.timingData['runTime'] - max_comp_time)
 
+    if saveProfile:
+        _saveCellCostProfile(saveProfile, computation_time)
+
     return [max_comp_time, min_comp_time, avg_comp_time, load_balance]
 
+
+#------------------------------------------------------------------------------
+# Fit cost per cell of each pop from computation time of each node and save to file
+#------------------------------------------------------------------------------
+def _saveCellCostProfile (filename, computation_time):
+    from .. import sim
+    import json
+    from scipy.optimize import nnls
+
+    popCells = {}
+    for cell in sim.net.cells:
+        popCells[cell.tags['pop']] = popCells.get(cell.tags['pop'], 0) + 1
+    data = [{'compTime': computation_time, 'popCells': popCells}]*sim.nhosts
+    gather = sim.pc.py_alltoall(data)
+    sim.pc.barrier()
+
+    if sim.rank == 0:
+        pops = list(sim.net.pops.keys())
+        numCells = np.array([[node['popCells'].get(pop, 0) for pop in pops] for node in gather], dtype=float)  # node x pop
+        compTimes = np.array([node['compTime'] for node in gather])
+        modelCosts = np.array([sim.net.pops[pop]._estimateCellCost() for pop in pops])
+
+        # scale model costs to computation time; if enough nodes, fit cost of each pop (non-negative least squares)
+        predicted = numCells.dot(modelCosts).sum()
+        scale = compTimes.sum() / predicted if predicted > 0 else 1.0
+        popCosts = modelCosts * scale
+        used = numCells.sum(axis=0) > 0
+        if used.any() and np.linalg.matrix_rank(numCells[:, used]) == used.sum():
+            fitCosts, _ = nnls(numCells[:, used], compTimes)
+            popCosts[used] = np.where(fitCosts > 0, fitCosts, popCosts[used])
+
+        profile = {'popCosts': dict(zip(pops, popCosts.tolist())), 'scale': scale, 'nhosts': sim.nhosts, 
+            'compTimes': compTimes.tolist()}
+        print('Saving cell cost profile to %s ... ' % (filename))
+        with open(filename, 'w') as fileObj:
+            json.dump(profile, fileObj, indent=4)
+
+
+#------------------------------------------------------------------------------
+# Load cost per cell of each pop (cfg.cellCostProfile)
+#------------------------------------------------------------------------------
+def _loadCellCostProfile ():
+    from .. import sim
+    import json
+
+    filename = getattr(sim.cfg, 'cellCostProfile', None)
+    if not filename:
+        return None
+    if getattr(sim, '_cellCostProfile', (None, None))[0] != filename:
+        with open(filename, 'r') as fileObj:
+            sim._cellCostProfile = (filename, json.load(fileObj))
+    return sim._cellCostProfile[1]
+
@@ -20,10 +20,17 @@ try:
     to_unicode = unicode
 except NameError:
     to_unicode = str
+try:
+    basestring
+except NameError:
+    basestring = str
 
 from time import time
+from numbers import Number
 from datetime import datetime
 import pickle as pk
+import numpy as np
+from ..specs import ODict
 from . import gather
 from . import utils
 
@@ -33,11 +40,24 @@ from . import utils
 #------------------------------------------------------------------------------
 def saveJSON(fileName, data):
     import json, io
+    def default(obj):
+        if hasattr(obj, 'todicts'): return obj.todicts(exclude=obj.table.objectColumns)  # conns of one cell stored in ConnTable
+        return obj.tolist() if hasattr(obj, 'tolist') else str(obj)  # eg. NumPy arrays of traces
+    encoder = json.JSONEncoder(indent=4, sort_keys=True, separators=(',', ': '), ensure_ascii=False, default=default)
     with io.open(fileName, 'w', encoding='utf8') as fileObj:
-        str_ = json.dumps(data,
-                          indent=4, sort_keys=True,
-                          separators=(',', ': '), ensure_ascii=False)
-        fileObj.write(to_unicode(str_))
+        for chunk in encoder.iterencode(data):  # written in chunks so the full string is not kept in memory
+            fileObj.write(to_unicode(chunk))
+
+
+#------------------------------------------------------------------------------
+# Convert conns stored in ConnTable to list of dicts (for formats that require them in memory, eg. .mat)
+#------------------------------------------------------------------------------
+def _connsToDicts(dataSave):
+    from .. import sim
+    if 'cells' not in dataSave.get('net', {}): return dataSave
+    cells = [dict(cell, conns=cell['conns'].todicts(exclude=cell['conns'].table.objectColumns))
+        if isinstance(cell.get('conns'), sim.CellConns) else cell for cell in dataSave['net']['cells']]
+    return dict(dataSave, net=dict(dataSave['net'], cells=cells))
 
 
 #------------------------------------------------------------------------------
@@ -46,6 +66,11 @@ def saveJSON(fileName, data):
 def saveData (include = None, filename = None):
     from .. import sim
 
+    if getattr(sim.cfg, 'distributedSave', False):  # each node saves its own data (no need to gather)
+        if filename or not getattr(sim, 'distributedManifest', None):
+            return distributedSaveData(include, filename)
+        return sim.distributedManifest
+
     if sim.rank == 0 and not getattr(sim.net, 'allCells', None): needGather = True
     else: needGather = False
     if needGather: gather.gatherData()
@@ -97,13 +122,16 @@ def saveData (include = None, filename = None):
             sim.net.params.__dict__.pop('_labelid', None)
             net['params'] = utils.replaceFuncObj(sim.net.params.__dict__)
         if 'net' in include: include.extend(['netPops', 'netCells'])
-        if 'netCells' in include: net['cells'] = sim.net.allCells
+        if 'netCells' in include: 
+            net['cells'] = sim.net.allCells  # conns stored in ConnTable are written from its columns by each format
         if 'netPops' in include: net['pops'] = sim.net.allPops
         if net: dataSave['net'] = net
         if 'simConfig' in include: dataSave['simConfig'] = sim.cfg.__dict__
         if 'simData' in include: 
             if 'LFP' in sim.allSimData: 
                 sim.allSimData['LFP'] = sim.allSimData['LFP'].tolist() 
+            if 'LFPPops' in sim.allSimData: 
+                sim.allSimData['LFPPops'] = {pop: lfp.tolist() if hasattr(lfp, 'tolist') else lfp for pop, lfp in sim.allSimData['LFPPops'].items()}
             dataSave['simData'] = sim.allSimData
 
 
@@ -144,17 +172,23 @@ def saveData (include = None, filename = None):
             if sim.cfg.saveMat:
                 from scipy.io import savemat
                 print(('Saving output as %s ... ' % (filePath+'.mat')))
-                savemat(filePath+'.mat', utils.tupleToList(utils.replaceNoneObj(dataSave)))  # replace None and {} with [] so can save in .mat format
+                savemat(filePath+'.mat', utils.tupleToList(utils.replaceNoneObj(_connsToDicts(dataSave))))  # replace None and {} with [] so can save in .mat format
                 print('Finished saving!')
 
             # Save to HDF5 file (uses very inefficient hdf5storage module which supports dicts)
             if sim.cfg.saveHDF5:
-                dataSaveUTF8 = utils._dict2utf8(utils.replaceNoneObj(dataSave)) # replace None and {} with [], and convert to utf
+                dataSaveUTF8 = utils._dict2utf8(utils.replaceNoneObj(_connsToDicts(dataSave))) # replace None and {} with [], and convert to utf
                 import hdf5storage
                 print(('Saving output as %s... ' % (filePath+'.hdf5')))
                 hdf5storage.writes(dataSaveUTF8, filename=filePath+'.hdf5')
                 print('Finished saving!')
 
+            # Save to directory of .npy files (columnar format that can be read partially; see sim.load(include=...))
+            if getattr(sim.cfg, 'saveNpy', False):
+                print(('Saving output as %s ... ' % (filePath+'_npy')))
+                _saveNpy(filePath+'_npy', dataSave)
+                print('Finished saving!')
+
             # Save to CSV file (currently only saves spikes)
             if sim.cfg.saveCSV:
                 if 'simData' in dataSave:
@@ -202,6 +236,251 @@ def saveData (include = None, filename = None):
             print('Nothing to save')
 
 
+#------------------------------------------------------------------------------
+# Save data as directory of .npy files (cfg.saveNpy)
+#------------------------------------------------------------------------------
+def _saveNpy (folder, dataSave):
+    ''' Saves data in columnar format: one .npy file per array (spikes, traces as 2D arrays, cell tags, conns as 
+    columns sorted by postGid with row pointers per cell) and JSON files for the remaining data (eg. netParams, 
+    simConfig), described by schema.json. Arrays can be memory-mapped when loaded (see sim.NpyData) '''
+    from .. import sim
+    import os, json
+
+    if not os.path.exists(folder):
+        os.makedirs(folder)
+    schema = {'format': 'netpyne-npy', 'formatVersion': 1, 'arrays': {}, 'json': [], 'labels': {}, 'simData': {}, 'cells': {}}
+    schema['info'] = {key: dataSave[key] for key in ['netpyne_version', 'netpyne_changeset', 'netParams_version'] if key in dataSave}
+
+    def saveArray (name, array):
+        array = np.asarray(array)
+        np.save(os.path.join(folder, name+'.npy'), array)
+        schema['arrays'][name] = {'dtype': str(array.dtype), 'shape': list(array.shape)}
+
+    def saveBlob (name, value):
+        with open(os.path.join(folder, name+'.json'), 'w') as fileObj:
+            json.dump(utils.replaceDictODict(value), fileObj, default=lambda obj: obj.tolist() if hasattr(obj, 'tolist') else str(obj))
+        schema['json'].append(name)
+
+    def saveLabels (name, values):  # categorical column saved as int codes (-1 if missing)
+        labels = sorted(set([value for value in values if value is not None]), key=str)
+        codes = {label: code for code, label in enumerate(labels)}
+        saveArray(name, np.array([codes[value] if value is not None else -1 for value in values], dtype=np.int32))
+        schema['labels'][name] = labels
+
+    net = dataSave.get('net', {})
+    if 'params' in net: saveBlob('net.params', net['params'])
+    if 'pops' in net: saveBlob('net.pops', net['pops'])
+    if 'simConfig' in dataSave: saveBlob('simConfig', dataSave['simConfig'])
+
+    # cell table (one column per tag) and conns table
+    if 'cells' in net:
+        cells = sorted(net['cells'], key=lambda cell: cell['gid'])
+        saveArray('net.cells.gid', np.array([cell['gid'] for cell in cells], dtype=int))
+        tagKeys = sorted(set([key for cell in cells for key in cell['tags']]))
+        for key in tagKeys:
+            values = [cell['tags'].get(key) for cell in cells]
+            if all([isinstance(value, int) and not isinstance(value, bool) for value in values]):
+                saveArray('net.cells.tags.'+key, np.array(values, dtype=int))
+                schema['cells'][key] = 'int'
+            elif all([value is None or (isinstance(value, Number) and not isinstance(value, bool)) for value in values]):
+                saveArray('net.cells.tags.'+key, np.array([np.nan if value is None else value for value in values], dtype=float))
+                schema['cells'][key] = 'numeric'
+            elif all([value is None or isinstance(value, basestring) for value in values]):
+                saveLabels('net.cells.tags.'+key, values)
+                schema['cells'][key] = 'label'
+            else:
+                saveBlob('net.cells.tags.'+key, values)
+                schema['cells'][key] = 'json'
+        schema['cellParams'] = sorted(set([key for cell in cells for key in cell if key not in ['gid', 'tags', 'conns']]))
+        for key in schema['cellParams']:
+            saveBlob('net.cells.'+key, [cell.get(key) for cell in cells])
+
+        cellConns = [cell.get('conns', []) for cell in cells]
+        tables = set([id(conns.table) for conns in cellConns if isinstance(conns, sim.CellConns)])
+        if len(tables) == 1 and all([isinstance(conns, sim.CellConns) or not conns for conns in cellConns]):
+            connTable = next(conns.table for conns in cellConns if isinstance(conns, sim.CellConns))  # columns read directly
+        else:  # conns as lists or dicts (eg. loaded from file)
+            connFormat = sim.cfg.compactConnFormat if isinstance(sim.cfg.compactConnFormat, list) else None
+            connTable = sim.ConnTable()
+            for cell, conns in zip(cells, cellConns):
+                for conn in conns:
+                    connTable.addConn(cell['gid'], dict(zip(connFormat, conn)) if connFormat else conn)
+        gids = [cell['gid'] for cell in cells]
+        state = connTable.getState(connTable.getRows(gids))  # conns of each cell in consecutive rows
+        saveArray('net.conns.indptr', np.cumsum([0]+[len(connTable.cellRows.get(gid, [])) for gid in gids]))
+        for key in ['postGid']+list(connTable.numericColumns)+connTable.labelColumns:
+            saveArray('net.conns.'+key, state[key])
+        schema['labels'].update({'net.conns.'+key: labels[1:] for key, labels in state['labels'].items()})
+        saveBlob('net.conns.extra', state['extra'])
+
+    # spikes, traces and other sim data
+    for key, value in dataSave.get('simData', {}).items():
+        name = 'simData.'+key
+        if isinstance(value, dict) and value and all([k.startswith('cell_') and not isinstance(v, dict) for k, v in value.items()]):
+            lengths = [len(v) for v in value.values()]
+            trace = np.full((len(value), max(lengths)), np.nan)
+            for i, v in enumerate(value.values()):
+                trace[i, :lengths[i]] = v
+            saveArray(name, trace)
+            saveArray(name+'.gids', np.array([int(k.split('_')[1]) for k in value], dtype=int))
+            saveArray(name+'.lengths', np.array(lengths, dtype=int))
+            schema['simData'][key] = 'trace'
+        elif isinstance(value, (list, tuple, np.ndarray)) and np.asarray(value).dtype.kind in 'iuf':
+            saveArray(name, np.asarray(value, dtype=float))
+            schema['simData'][key] = 'array'
+        else:
+            saveBlob(name, value)
+            schema['simData'][key] = 'json'
+
+    with open(os.path.join(folder, 'schema.json'), 'w') as fileObj:
+        json.dump(schema, fileObj, indent=4, sort_keys=True)
+
+
+#------------------------------------------------------------------------------
+# Save data of each node to its own file, plus manifest (cfg.distributedSave)
+#------------------------------------------------------------------------------
+def distributedSaveData (include = None, filename = None):
+    ''' Saves the cells, conns, stims, spikes and traces of each node to <filename>.rank<N>.npz, without gathering them
+    in the master node, which saves a manifest (<filename>_manifest.json) with the gids and metadata of each partition.
+    The saved data can be loaded (lazily) with sim.load*(<filename>_manifest.json). Returns path of manifest '''
+    from .. import sim
+    import os
+
+    if filename: sim.cfg.filename = filename
+    if not include: include = sim.cfg.saveDataInclude
+    if 'net' in include: include = include + ['netPops', 'netCells']
+    sim.timing('start', 'saveTime')
+
+    targetFolder = os.path.dirname(sim.cfg.filename)
+    if sim.rank == 0 and targetFolder and not os.path.exists(targetFolder):
+        try:
+            os.mkdir(targetFolder)
+        except OSError:
+            print(' Could not create target folder: %s' % (targetFolder))
+    sim.pc.barrier()
+
+    # data of node 
+    partFile = '%s.rank%d.npz' % (sim.cfg.filename, sim.rank)
+    gids = [cell.gid for cell in sim.net.cells]
+    arrays = {'gids': np.array(gids, dtype=int)}
+    cellKeys, numConns, traceKeys = [], 0, []
+    if 'netCells' in include:
+        cells = [cell.__getstate__() for cell in sim.net.cells]
+        arrays['cellTags'] = _pickleArray([cell.pop('tags') for cell in cells])
+        cellKeys = sorted(set([key for cell in cells for key in cell if key != 'gid']))
+        arrays['cells'] = _pickleArray(cells)
+        if sim.net._connTableCells():  # conns saved as columns 
+            arrays['connTable'] = _pickleArray(sim.net.connTable.getState())
+            numConns = len(sim.net.connTable)
+        else:
+            numConns = sum([len(cell.conns) for cell in sim.net.cells])
+    if 'simData' in include:
+        otherSimData, traceKeys = _saveSimDataArrays(arrays)
+        arrays['simData'] = _pickleArray(otherSimData)
+
+    print(('  Saving output of node %d as %s ... ' % (sim.rank, partFile)))
+    np.savez(partFile, **arrays)
+
+    # gather small summary of each node to save manifest
+    netPopsCellGids = {popLabel: list(pop.cellGids) for popLabel, pop in sim.net.pops.items()}
+    nodeData = {'gidRuns': _gidRuns(gids), 'numCells': len(gids), 'numConns': numConns, 'cellKeys': cellKeys, 
+        'numSpikes': len(arrays.get('spkt', [])), 'traceKeys': traceKeys, 'netPopsCellGids': netPopsCellGids}
+    data = [None]*sim.nhosts
+    data[0] = nodeData
+    gather = sim.pc.py_alltoall(data)
+    sim.pc.barrier()
+
+    manifestFile = sim.cfg.filename + '_manifest.json'
+    if sim.rank == 0:
+        manifest = {'netpyne_version': sim.version(show=False), 'netpyne_changeset': sim.gitChangeset(show=False)}
+        if 'netParams' in include: 
+            sim.net.params.__dict__.pop('_labelid', None)
+            manifest['net'] = {'params': utils.replaceFuncObj(sim.net.params.__dict__)}
+        if 'netPops' in include:
+            allPops = ODict()
+            for popLabel, pop in sim.net.pops.items(): 
+                allPops[popLabel] = pop.__getstate__()
+                allPops[popLabel]['cellGids'] = sorted([gid for node in gather for gid in node['netPopsCellGids'][popLabel]])
+            manifest.setdefault('net', {})['pops'] = allPops
+        if 'simConfig' in include: manifest['simConfig'] = sim.cfg.__dict__
+        manifest['partitions'] = {'files': [os.path.basename('%s.rank%d.npz' % (sim.cfg.filename, rank)) for rank in range(sim.nhosts)]}
+        for key in ['gidRuns', 'numCells', 'numConns', 'numSpikes', 'cellKeys', 'traceKeys']:
+            manifest['partitions'][key] = [node[key] for node in gather]
+        print(('  Saving manifest as %s ... ' % (manifestFile)))
+        sim.saveJSON(manifestFile, utils.replaceDictODict(manifest))
+        print('Finished saving!')
+        sim.timing('stop', 'saveTime')
+        if sim.cfg.timing: print(('  Done; saving time = %0.2f s.' % sim.timingData['saveTime']))
+
+    sim.distributedManifest = os.path.abspath(manifestFile)
+    return sim.distributedManifest
+
+
+#------------------------------------------------------------------------------
+# Add spikes and traces of node to arrays to save (returns remaining simData and trace keys saved as arrays)
+#------------------------------------------------------------------------------
+def _saveSimDataArrays (arrays):
+    from .. import sim
+
+    spkt, spkid = np.array(sim.simData['spkt']), np.array(sim.simData['spkid'])
+    order = np.lexsort((spkid, spkt))  # sorted by time and gid (see sim.gather._mergeSpikes)
+    arrays['spkt'], arrays['spkid'] = spkt[order], spkid[order]
+    if sim.rank == 0 and 't' in sim.simData: 
+        arrays['t'] = np.array(sim.simData['t'])
+    if 'LFP' in sim.simData: 
+        arrays['LFP'] = np.array(sim.simData['LFP'])  # LFP of node; summed across nodes when loaded
+
+    # traces with one Vector per cell saved as 2D array (cells x time; padded with NaN)
+    traceKeys = []
+    otherSimData = {}
+    for key in sim.cfg.recordTraces:
+        if key not in sim.simData: continue
+        cellLabels = [cellLabel for cellLabel, vec in sim.simData[key].items() if not isinstance(vec, dict)]
+        otherSimData[key] = {cellLabel: {k: list(v) for k, v in vecs.items()} 
+            for cellLabel, vecs in sim.simData[key].items() if isinstance(vecs, dict)}  # eg. one trace per synMech
+        if cellLabels:
+            lengths = [len(sim.simData[key][cellLabel]) for cellLabel in cellLabels]
+            trace = np.full((len(cellLabels), max(lengths)), np.nan)
+            for i, cellLabel in enumerate(cellLabels):
+                trace[i, :lengths[i]] = sim.simData[key][cellLabel]
+            arrays['trace_'+key] = trace
+            arrays['traceGids_'+key] = np.array([int(cellLabel.split('_')[1]) for cellLabel in cellLabels], dtype=int)
+            arrays['traceLengths_'+key] = np.array(lengths, dtype=int)
+            traceKeys.append(key)
+
+    for key, value in sim.simData.items():
+        if key in ['spkt', 'spkid', 't', 'LFP'] or key in sim.cfg.recordTraces: continue
+        if key == 'stims':
+            value = {cell: {stim: list(spks) for stim, spks in stims.items()} for cell, stims in value.items()}
+        elif key == 'LFPPops':
+            value = {pop: np.array(lfp) for pop, lfp in value.items()}
+        otherSimData[key] = value
+    return otherSimData, traceKeys
+
+
+#------------------------------------------------------------------------------
+# Store picklable object as array of bytes (so can be saved in .npz files without allow_pickle)
+#------------------------------------------------------------------------------
+def _pickleArray (obj):
+    return np.frombuffer(pk.dumps(obj, protocol=2), dtype=np.uint8)
+
+
+#------------------------------------------------------------------------------
+# Compress list of gids into runs [start, stop, step] (eg. gids of node with round-robin distribution)
+#------------------------------------------------------------------------------
+def _gidRuns (gids):
+    runs = []
+    for gid in sorted(gids):
+        if runs and runs[-1][1] == runs[-1][0]+1 and runs[-1][2] == 1 and gid > runs[-1][0]:  # second gid sets step
+            runs[-1][2] = gid - runs[-1][0]
+            runs[-1][1] = gid + runs[-1][2]
+        elif runs and gid == runs[-1][1]:
+            runs[-1][1] += runs[-1][2]
+        else:
+            runs.append([gid, gid+1, 1])
+    return runs
+
+
 #------------------------------------------------------------------------------
 # Save distributed data using HDF5 (only conns for now)
 #------------------------------------------------------------------------------
@@ -237,7 +516,10 @@ def compactConnFormat():
 
     connFormat = sim.cfg.compactConnFormat
     for cell in sim.net.cells:
-        newConns = [[conn[param] for param in connFormat] for conn in cell.conns]
+        if isinstance(cell.conns, sim.CellConns):  # read columns of ConnTable directly
+            newConns = cell.conns.tolists(connFormat)
+        else:
+            newConns = [[conn[param] for param in connFormat] for conn in cell.conns]
         del cell.conns
         cell.conns = newConns
 
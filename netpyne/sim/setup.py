@@ -42,9 +42,11 @@ def initialize (netParams = None, simConfig = None, net = None):
     sim.fih = []  # list of func init handlers
     sim.rank = 0  # initialize rank
     sim.nextHost = 0  # initialize next host
+    sim.tstart = 0  # start time of simulation (end of transient if warm started; see cfg.warmStartDir)
     sim.timingData = Dict()  # dict to store timing
 
     sim.createParallelContext()  # inititalize PC, nhosts and rank
+    sim.hostLoads = [0.0] * sim.nhosts  # predicted computational load of each host (see Pop._distributeCells)
     sim.cvode = h.CVode()
 
     sim.setSimCfg(simConfig)  # set simulation configuration
@@ -97,6 +99,11 @@ def setNetParams (params):
     else:
         sim.net.params = specs.NetParams()
 
+    # copy of params saved in checkpoints to rebuild the network (params are modified when creating pops and cells)
+    if getattr(sim.cfg, 'checkpointInterval', None):
+        from copy import deepcopy
+        sim.net.checkpointParams = deepcopy(Dict().undotify(sim.net.params.__dict__))  # as plain dicts
+
 
 #------------------------------------------------------------------------------
 # Set simulation config
@@ -190,6 +197,9 @@ def setupRecordLFP():
     if sim.cfg.saveLFPCells:
         for c in sim.net.cells:
             sim.simData['LFPCells'][c.gid] = np.zeros((saveSteps, nsites))
+    if sim.cfg.saveLFPPops:
+        for pop in sim.net.pops:
+            sim.simData['LFPPops'][pop] = np.zeros((saveSteps, nsites))
     
     if not sim.net.params.defineCellShapes: sim.net.defineCellShapes()  # convert cell shapes (if not previously done already)
     sim.net.calcSegCoords()  # calculate segment coords for each cell
@@ -197,13 +207,28 @@ def setupRecordLFP():
     
     if sim.cfg.createNEURONObj:
         for cell in sim.net.compartCells:
-            nseg = cell._segCoords['p0'].shape[1]
             sim.net.recXElectrode.calcTransferResistance(cell.gid, cell._segCoords)  # transfer resistance for each cell
-            cell.imembPtr = h.PtrVector(nseg)  # pointer vector
-            cell.imembPtr.ptr_update_callback(cell.setImembPtr)   # used for gathering an array of  i_membrane values from the pointer vector
-            cell.imembVec = h.Vector(nseg)
-
+        
+        # single matrix with transfer resistances of all segments in node (sites x segments)
+        recXElectrode = sim.net.recXElectrode
+        recXElectrode.calcStackedTransferResistance([cell.gid for cell in sim.net.compartCells])
+        nseg = recXElectrode.stackedTransferResistance.shape[1]
+        sim.net.imembPtr = h.PtrVector(nseg)  # single pointer vector to i_membrane_ of all segments in node
+        sim.net.imembPtr.ptr_update_callback(sim.net.setImembPtr)  # only called if pointers need to be updated
+        sim.net.imembVec = h.Vector(nseg)
+        sim.net.imembBuffer = np.zeros((nseg, max(1, int(sim.cfg.bufferLFPSteps))))  # i_membrane_ of buffered record steps
+        sim.net.imembBufferSteps = []  # record steps stored in buffer
         sim.cvode.use_fast_imem(1)   # make i_membrane_ a range variable
+        sim.net.setImembPtr()
+
+        # segments of each pop (to calculate LFP of each pop with one matrix product)
+        if sim.cfg.saveLFPPops:
+            sim.net.popSegs = {}
+            for pop in sim.net.pops:
+                segs = [np.arange(nseg)[recXElectrode.segSlices[cell.gid]] for cell in sim.net.compartCells if cell.tags['pop'] == pop]
+                if segs: 
+                    segs = np.concatenate(segs)
+                    sim.net.popSegs[pop] = (segs, recXElectrode.stackedTransferResistance[:, segs])
         
 
 #------------------------------------------------------------------------------
@@ -254,14 +279,8 @@ def setupRecording ():
         if len(sim.net.params.rxdParams) > 0:
             h.finitialize()
 
-        # get list of cells from argument of plotTraces function
-        if 'plotTraces' in sim.cfg.analysis and 'include' in sim.cfg.analysis['plotTraces']:
-            cellsPlot = utils.getCellsList(sim.cfg.analysis['plotTraces']['include'])
-        else:
-            cellsPlot = []
-
         # get actual cell objects to record from, both from recordCell and plotCell lists
-        cellsRecord = utils.getCellsList(sim.cfg.recordCells)+cellsPlot
+        cellsRecord = _getCellsRecordTraces()
 
         for key in list(sim.cfg.recordTraces.keys()): sim.simData[key] = Dict()  # create dict to store traces
         for cell in cellsRecord: 
@@ -296,6 +315,21 @@ def setupRecording ():
     return sim.simData
 
 
+#------------------------------------------------------------------------------
+# Get cells to record traces from (recordCells and include of plotTraces)
+#------------------------------------------------------------------------------
+def _getCellsRecordTraces ():
+    from .. import sim
+
+    # get list of cells from argument of plotTraces function
+    if 'plotTraces' in sim.cfg.analysis and 'include' in sim.cfg.analysis['plotTraces']:
+        cellsPlot = utils.getCellsList(sim.cfg.analysis['plotTraces']['include'])
+    else:
+        cellsPlot = []
+
+    return utils.getCellsList(sim.cfg.recordCells)+cellsPlot
+
+
 #------------------------------------------------------------------------------
 # Get cells list for recording based on set of conditions
 #------------------------------------------------------------------------------
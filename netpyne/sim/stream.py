@@ -0,0 +1,284 @@
+"""
+sim/stream.py
+
+Functions to write spikes and traces to disk during the simulation (cfg.streamOutput), so that recorded Vectors
+do not grow with the duration of long runs
+
+Contributors: salvadordura@gmail.com
+"""
+from __future__ import print_function
+from __future__ import division
+from __future__ import unicode_literals
+from __future__ import absolute_import
+
+from builtins import range
+from future import standard_library
+standard_library.install_aliases()
+import os
+import json
+import numpy as np
+from . import utils
+
+
+###############################################################################
+#
+# STREAM WRITER CLASS
+#
+###############################################################################
+
+class StreamWriter (object):
+    ''' Appends arrays (1D, or 2D with one row per record step) of a node to extendable datasets: chunked datasets of
+    an HDF5 file (format='h5', requires h5py) or raw binary files of a folder (format='npy'). Shapes, dtypes and
+    attributes (eg. gids of the columns of each trace) are kept in a JSON file so the node files can be merged '''
+
+    def __init__ (self, path, format='h5', mode='w', meta=None):
+        self.path, self.format = path, format
+        self.meta = {'format': format, 'datasets': {}, 'attrs': {}}
+        if mode == 'r':  # format and shapes of datasets from JSON file
+            with open(path+'.json', 'r') as fileObj:
+                self.meta = json.load(fileObj)
+        elif mode == 'a':  # reopened to continue writing (eg. when resuming from checkpoint), with meta when saved
+            self.meta = meta
+        self.format = self.meta['format']
+        self.h5 = None
+        if self.format == 'h5':
+            import h5py
+            self.h5 = h5py.File(path+'.h5', mode)
+        elif not os.path.exists(path):
+            os.makedirs(path)
+
+
+    def create (self, name, numColumns=None, attrs=None):
+        ''' Creates empty dataset with numColumns (1D if None) '''
+        shape = [0] if numColumns is None else [0, numColumns]
+        self.meta['datasets'][name] = shape
+        if attrs is not None:
+            self.meta['attrs'][name] = attrs
+        if self.h5 is not None:
+            self.h5.create_dataset(name, shape=tuple(shape), maxshape=(None,)+tuple(shape[1:]), dtype=float, chunks=True)
+        else:
+            open(os.path.join(self.path, name+'.bin'), 'wb').close()
+
+
+    def append (self, name, array):
+        array = np.asarray(array, dtype=float)
+        if len(array) == 0: return
+        shape = self.meta['datasets'][name]
+        if self.h5 is not None:
+            dataset = self.h5[name]
+            dataset.resize(shape[0]+len(array), axis=0)
+            dataset[shape[0]:] = array
+        else:
+            with open(os.path.join(self.path, name+'.bin'), 'ab') as fileObj:
+                fileObj.write(np.ascontiguousarray(array).tobytes())
+        shape[0] += len(array)
+
+
+    def read (self, name, start=0, stop=None):
+        ''' Returns array with rows start to stop of dataset '''
+        shape = self.meta['datasets'][name]
+        stop = shape[0] if stop is None else min(stop, shape[0])
+        if self.h5 is not None:
+            return self.h5[name][start:stop]
+        with open(os.path.join(self.path, name+'.bin'), 'rb') as fileObj:
+            rowSize = int(np.prod(shape[1:]))
+            fileObj.seek(start * rowSize * 8)
+            data = np.fromfile(fileObj, dtype=float, count=max(stop-start, 0) * rowSize)
+        return data.reshape([-1]+shape[1:])
+
+
+    def truncate (self):
+        ''' Truncates datasets to their length in meta (eg. rows appended after the checkpoint being resumed) '''
+        for name, shape in self.meta['datasets'].items():
+            if self.h5 is not None:
+                self.h5[name].resize(shape[0], axis=0)
+            else:
+                with open(os.path.join(self.path, name+'.bin'), 'r+b') as fileObj:
+                    fileObj.truncate(shape[0] * int(np.prod(shape[1:])) * 8)
+
+
+    def flush (self):
+        if self.h5 is not None:
+            self.h5.flush()
+
+
+    def close (self, saveMeta=True):
+        if self.h5 is not None:
+            self.h5.close()
+            self.h5 = None
+        if saveMeta:
+            with open(self.path+'.json', 'w') as fileObj:
+                json.dump(self.meta, fileObj)
+
+
+    def remove (self):
+        import shutil
+        self.close(saveMeta=False)
+        if self.format == 'h5':
+            os.remove(self.path+'.h5')
+        else:
+            shutil.rmtree(self.path)
+        os.remove(self.path+'.json')
+
+
+#------------------------------------------------------------------------------
+# Path of stream files of node
+#------------------------------------------------------------------------------
+def _streamPath (rank):
+    from .. import sim
+    return '%s_stream.rank%d' % (sim.cfg.filename, rank)
+
+
+#------------------------------------------------------------------------------
+# Open stream files of node (called before running the simulation)
+#------------------------------------------------------------------------------
+def openStream (meta=None):
+    ''' Creates the stream file of the node with datasets for the spikes, time and each trace key (one column per cell
+    with a Vector, ie. traces with one Vector per synMech are gathered at the end as usual); if meta of the writer is 
+    provided (eg. saved in checkpoint), the existing file is reopened and truncated to the lengths in meta instead '''
+    from .. import sim
+
+    streamFormat = sim.cfg.streamOutput.get('format', 'h5')
+    if streamFormat == 'h5':
+        try:
+            import h5py
+        except ImportError:
+            print('  Warning: h5py not available, so streaming output as raw binary files (streamOutput format "npy")')
+            streamFormat = 'npy'
+    targetFolder = os.path.dirname(sim.cfg.filename)
+    if targetFolder and not os.path.exists(targetFolder):
+        try:
+            os.makedirs(targetFolder)
+        except OSError:
+            pass
+
+    if meta:
+        writer = StreamWriter(_streamPath(sim.rank), mode='a', meta=meta)
+        writer.truncate()
+    else:
+        writer = StreamWriter(_streamPath(sim.rank), format=streamFormat)
+        writer.create('spkt')
+        writer.create('spkid')
+        if sim.rank == 0 and 't' in sim.simData:
+            writer.create('t')
+    sim.streamTraces = {}
+    for key in sim.cfg.recordTraces:
+        if key not in sim.simData: continue
+        cellLabels = [cellLabel for cellLabel, vec in sim.simData[key].items() if not isinstance(vec, dict)]
+        if not meta:
+            writer.create('trace_'+key, len(cellLabels), attrs={'gids': [int(cellLabel.split('_')[1]) for cellLabel in cellLabels]})
+        sim.streamTraces[key] = [sim.simData[key][cellLabel] for cellLabel in cellLabels]
+    sim.streamWriter = writer
+
+
+#------------------------------------------------------------------------------
+# Append new spikes and trace samples to stream files and clear Vectors
+#------------------------------------------------------------------------------
+def streamData ():
+    ''' Appends the spikes and trace samples recorded since the last call to the stream file of the node, and resizes
+    the recording Vectors to 0 (recording continues appending to them) '''
+    from .. import sim
+
+    writer = sim.streamWriter
+    writer.append('spkt', sim.simData['spkt'].as_numpy())
+    writer.append('spkid', sim.simData['spkid'].as_numpy())
+    sim.simData['spkt'].resize(0)
+    sim.simData['spkid'].resize(0)
+    if 't' in writer.meta['datasets']:
+        writer.append('t', sim.simData['t'].as_numpy())
+        sim.simData['t'].resize(0)
+    for key, vecs in sim.streamTraces.items():
+        if not vecs: continue
+        numSamples = max([len(vec) for vec in vecs])
+        samples = np.full((numSamples, len(vecs)), np.nan)
+        for i, vec in enumerate(vecs):
+            samples[:len(vec), i] = vec.as_numpy()
+            vec.resize(0)
+        writer.append('trace_'+key, samples)
+
+
+#------------------------------------------------------------------------------
+# Close stream files and merge them into directory of .npy files read by sim.load
+#------------------------------------------------------------------------------
+def closeStream ():
+    ''' Writes the remaining data of each node and merges the stream files of all nodes into <filename>_stream, with
+    the layout of cfg.saveNpy (spikes sorted by time and gid, traces as 2D arrays of cells sorted by gid x time),
+    which is loaded in gatherData (traces memory-mapped) and can be read with sim.load '''
+    from .. import sim
+
+    streamData()
+    sim.streamWriter.close()
+    sim.streamWriter, sim.streamTraces = None, {}
+    sim.pc.barrier()
+    if sim.rank == 0:
+        sim.timing('start', 'streamTime')
+        folder = sim.cfg.filename + '_stream'
+        print(('  Merging streamed output as %s ... ' % (folder)))
+        _mergeStreams(folder, [_streamPath(rank) for rank in range(sim.nhosts)])
+        sim.timing('stop', 'streamTime')
+        if sim.cfg.timing: print(('  Done; stream merging time = %0.2f s.' % sim.timingData['streamTime']))
+    sim.pc.barrier()
+
+
+def _mergeStreams (folder, paths, blockSize=int(1e7)):
+    from .. import sim
+
+    if not os.path.exists(folder):
+        os.makedirs(folder)
+    schema = {'format': 'netpyne-npy', 'formatVersion': 1, 'arrays': {}, 'json': [], 'labels': {}, 'simData': {}, 'cells': {}}
+    schema['info'] = {'netpyne_version': sim.version(show=False), 'netpyne_changeset': sim.gitChangeset(show=False)}
+    readers = [StreamWriter(path, mode='r') for path in paths]
+
+    def saveArray (name, array):
+        np.save(os.path.join(folder, name+'.npy'), array)
+        schema['arrays'][name] = {'dtype': str(array.dtype), 'shape': list(array.shape)}
+
+    # spikes sorted by time and gid
+    spkt = np.concatenate([reader.read('spkt') for reader in readers])
+    spkid = np.concatenate([reader.read('spkid') for reader in readers])
+    order = np.lexsort((spkid, spkt))
+    saveArray('simData.spkt', spkt[order])
+    saveArray('simData.spkid', spkid[order])
+    schema['simData']['spkt'] = schema['simData']['spkid'] = 'array'
+    if 't' in readers[0].meta['datasets']:
+        saveArray('simData.t', readers[0].read('t'))
+        schema['simData']['t'] = 'array'
+
+    # traces written to memory-mapped .npy in blocks of samples (cells x time)
+    traceNames = sorted(set([name for reader in readers for name in reader.meta['datasets'] if name.startswith('trace_')]))
+    for name in traceNames:
+        key = name[len('trace_'):]
+        parts = [(reader, reader.meta['attrs'][name]['gids']) for reader in readers if name in reader.meta['datasets']]
+        gids = np.array([gid for reader, partGids in parts for gid in partGids], dtype=int)
+        if not len(gids): continue
+        order = np.argsort(gids, kind='stable')
+        rowOfCell = np.argsort(order)  # row in saved array of each column of the nodes
+        lengths = np.array([reader.meta['datasets'][name][0] for reader, partGids in parts for gid in partGids], dtype=int)
+        filePath = os.path.join(folder, 'simData.'+key+'.npy')
+        trace = np.lib.format.open_memmap(filePath, mode='w+', dtype=float, shape=(len(gids), int(lengths.max())))
+        trace[:] = np.nan
+        offset = 0
+        for reader, partGids in parts:
+            rows = rowOfCell[offset:offset+len(partGids)]
+            numSamples = reader.meta['datasets'][name][0]
+            step = max(1, blockSize // max(len(partGids), 1))
+            for start in range(0, numSamples, step):
+                block = reader.read(name, start, start+step)
+                trace[rows, start:start+len(block)] = block.T
+            offset += len(partGids)
+        trace.flush()
+        schema['arrays']['simData.'+key] = {'dtype': str(trace.dtype), 'shape': list(trace.shape)}
+        del trace
+        saveArray('simData.'+key+'.gids', gids[order])
+        saveArray('simData.'+key+'.lengths', lengths[order])
+        schema['simData'][key] = 'trace'
+
+    # simConfig (so folder can be loaded with sim.load)
+    with open(os.path.join(folder, 'simConfig.json'), 'w') as fileObj:
+        json.dump(utils.replaceDictODict(sim.cfg.__dict__), fileObj, default=lambda obj: obj.tolist() if hasattr(obj, 'tolist') else str(obj))
+    schema['json'].append('simConfig')
+
+    with open(os.path.join(folder, 'schema.json'), 'w') as fileObj:
+        json.dump(schema, fileObj, indent=4, sort_keys=True)
+    for reader in readers:
+        reader.remove()
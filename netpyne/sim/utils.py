@@ -30,8 +30,9 @@ import hashlib
 import array
 from numbers import Number
 from collections import OrderedDict
+from copy import deepcopy
 from neuron import h# Import NEURON
-from ..specs import Dict, ODict
+from ..specs import Dict, FrozenDict, ODict
 
 
 
@@ -52,9 +53,9 @@ def getCellsList (include, returnGids=False):
     from .. import sim
 
     if sim.nhosts > 1 and any(isinstance(cond, tuple) or isinstance(cond,list) for cond in include): # Gather tags from all cells
-        allCellTags = sim._gatherAllCellTags()
+        cellTagTable = sim.net._getCellTagTable()
     else:
-        allCellTags = {cell.gid: cell.tags for cell in sim.net.cells}
+        cellTagTable = sim.CellTagTable({cell.gid: cell.tags for cell in sim.net.cells})
 
     cellGids = []
     cells = []
@@ -70,18 +71,15 @@ def getCellsList (include, returnGids=False):
             cellGids.extend(list(sim.net.pops[condition].cellGids))
 
         elif isinstance(condition, tuple) or isinstance(condition, list):  # subset of a pop with relative indices
-            cellsPop = [gid for gid,tags in allCellTags.items() if tags['pop']==condition[0]]
-
-            if isinstance(condition[1], list):
-                cellGids.extend([gid for i,gid in enumerate(cellsPop) if i in condition[1]])
-            elif isinstance(condition[1], int):
-                cellGids.extend([gid for i,gid in enumerate(cellsPop) if i==condition[1]])
+            if isinstance(condition[1], (list, int)):
+                cellGids.extend(cellTagTable.popGids(condition[0], condition[1]))
 
     cellGids = list(set(cellGids))  # unique values
     if returnGids:
         return cellGids
     else:
-        cells = [cell for cell in sim.net.cells if cell.gid in cellGids]
+        cellGidsSet = set(cellGids)
+        cells = [cell for cell in sim.net.cells if cell.gid in cellGidsSet]
         return cells
 
 
@@ -208,6 +206,8 @@ def copyReplaceItemObj (obj, keystart, newval, objCopy='ROOT'):
             if type(val) in [list]:
                 objCopy[key] = []
                 copyReplaceItemObj(val, keystart, newval, objCopy[key])
+            elif isinstance(val, FrozenDict):
+                objCopy[key] = val  # params shared between objects (no h objects) are not copied
             elif isinstance(val, (dict, Dict)):
                 objCopy[key] = {}
                 copyReplaceItemObj(val, keystart, newval, objCopy[key])
@@ -242,6 +242,8 @@ def copyRemoveItemObj (obj, keystart,  objCopy='ROOT'):
             if type(val) in [list]:
                 objCopy[key] = []
                 copyRemoveItemObj(val, keystart, objCopy[key])
+            elif isinstance(val, FrozenDict):
+                objCopy[key] = val  # params shared between objects (no h objects) are not copied
             elif isinstance(val, (dict, Dict)):
                 objCopy[key] = {}
                 copyRemoveItemObj(val, keystart, objCopy[key])
@@ -318,6 +320,8 @@ def replaceNoneObj (obj):
 
     elif isinstance(obj, (dict, Dict, ODict)):
         for key,val in obj.items():
+            if isinstance(val, FrozenDict):
+                val = obj[key] = deepcopy(val)  # copy shared params before modifying
             if isinstance(val, (list, dict, Dict, ODict)):
                 replaceNoneObj(val)
             if val == None:
@@ -379,6 +383,8 @@ def tupleToList (obj):
 
     elif isinstance(obj, (dict, ODict)):
         for key,val in obj.items():
+            if isinstance(val, FrozenDict):
+                val = obj[key] = deepcopy(val)  # copy shared params before modifying
             if isinstance(val, (list, dict, ODict)):
                 tupleToList(val)
             elif type(val) == tuple:
@@ -82,12 +82,13 @@ def createSimulateAnalyze (netParams=None, simConfig=None, output=False):
 #------------------------------------------------------------------------------
 # Wrapper to load all, ready for simulation
 #------------------------------------------------------------------------------
-def load (filename, simConfig=None, output=False, instantiate=True, createNEURONObj=True):
-    ''' Sequence of commands load, simulate and analyse network '''
+def load (filename, simConfig=None, output=False, instantiate=True, createNEURONObj=True, include=None):
+    ''' Sequence of commands load, simulate and analyse network; include (eg. ['simConfig', 'simData.spkt']) 
+    restricts the data loaded (only read from disk for files saved with cfg.saveNpy) '''
     from .. import sim
     sim.initialize()  # create network object and set cfg and net params
     sim.cfg.createNEURONObj = createNEURONObj
-    sim.loadAll(filename, instantiate=instantiate, createNEURONObj=createNEURONObj)
+    sim.loadAll(filename, instantiate=instantiate, createNEURONObj=createNEURONObj, include=include)
     if simConfig: sim.setSimCfg(simConfig)  # set after to replace potentially loaded cfg
     if len(sim.net.cells) == 0 and instantiate:
         pops = sim.net.createPops()                  # instantiate network populations
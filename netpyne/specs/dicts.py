@@ -1,6 +1,6 @@
 """
 specs/dict.py
-Contains Dict and ODict classes
+Contains Dict, FrozenDict and ODict classes
 
 Reproduce dict and OrderedDict behavior but add support to use object-like dot notation
 e.g. cell.secs.soma.geom.diam
@@ -18,6 +18,7 @@ from builtins import super
 from future import standard_library
 standard_library.install_aliases()
 from collections import OrderedDict
+from copy import deepcopy
 
 # ----------------------------------------------------------------------------
 # Dict class (allows dot notation for dicts)
@@ -88,7 +89,9 @@ class Dict(dict):
 
 
     def dotify(self, x):
-        if isinstance(x, dict):
+        if isinstance(x, FrozenDict):
+            return x
+        elif isinstance(x, dict):
             return Dict( (k, self.dotify(v)) for k,v in x.items() )
         elif isinstance(x, (list, tuple)):
             return type(x)( self.dotify(v) for v in x )
@@ -96,7 +99,9 @@ class Dict(dict):
             return x
 
     def undotify(self, x):
-        if isinstance(x, dict):
+        if isinstance(x, FrozenDict):
+            return x
+        elif isinstance(x, dict):
             return dict( (k, self.undotify(v)) for k,v in x.items() )
         elif isinstance(x, (list, tuple)):
             return type(x)( self.undotify(v) for v in x )
@@ -141,6 +146,52 @@ class Dict(dict):
         self = self.fromdict(d)
 
 
+# ----------------------------------------------------------------------------
+# FrozenDict class (read-only Dict that can be shared by several objects)
+# ----------------------------------------------------------------------------
+
+class FrozenDict(Dict):
+    ''' Read-only Dict (nested dicts also frozen) used to share params between objects, eg. the section params of all
+    cells of the same type; modifying it raises TypeError, so objects have to replace it by a (mutable) copy first. 
+    Copies are (mutable) Dicts, while dotify/undotify keep references to it (it can't be modified); since pickle 
+    stores each object once, a FrozenDict shared by several objects is only serialized once '''
+
+    __slots__ = []
+
+    def __init__(*args, **kwargs):
+        self = args[0]
+        d = dict(*args[1:], **kwargs)
+        dict.update(self, ((k, self.freeze(v)) for k,v in d.items()))
+
+    def freeze(self, x):
+        if isinstance(x, FrozenDict):
+            return x
+        elif isinstance(x, dict):
+            return FrozenDict(x)
+        elif isinstance(x, (list, tuple)):
+            return type(x)( self.freeze(v) for v in x )
+        else:
+            return x
+
+    def _readonly(self, *args, **kwargs):
+        raise TypeError('FrozenDict is read-only (shared by several objects); replace it by a copy (eg. copy.deepcopy) to modify it')
+
+    __setitem__ = __delitem__ = clear = pop = popitem = setdefault = update = _readonly
+    __setattr__ = __delattr__ = _readonly
+
+    def __missing__(self, key):
+        raise KeyError(key)
+
+    def __reduce__(self):
+        return (FrozenDict, (dict(self),))
+
+    def __copy__(self):
+        return Dict(self)
+
+    def __deepcopy__(self, memo):
+        return Dict(deepcopy(dict(self), memo))
+
+
 # ----------------------------------------------------------------------------
 # ODict class (allows dot notation for ordered dicts)
 # ----------------------------------------------------------------------------
@@ -43,9 +43,20 @@ class SimConfig (object):
         self.createNEURONObj = True  #  create runnable network in NEURON when instantiating netpyne network metadata
         self.createPyStruct = True  # create Python structure (simulator-independent) when instantiating network
         self.addSynMechs = True  # whether to add synaptich mechanisms or not
+        self.cellPrototypes = False  # create python struct and NEURON recipe once per cell type (combination of cellParams rules) and instantiate cells from it sharing its section params
         self.includeParamsLabel = True  # include label of param rule that created that cell, conn or stim
         self.gatherOnlySimData = False  # omits gathering of net+cell data thus reducing gatherData time
+        self.arrayGather = False  # gather spikes and traces as contiguous arrays (traces stored as 2D arrays; 'float32' to reduce memory) instead of pickled dicts
         self.compactConnFormat = False  # replace dict format with compact list format for conns (need to provide list of keys to include)
+        self.vectorizeConns = False  # evaluate string-based conn functions (probability, weight, etc) over NumPy arrays of all pre/post cells at once
+        self.distributeCells = 'roundRobin'  # method to distribute cells across hosts ('roundRobin'; 'cost', ie. based on estimated cell cost; or 'partition', ie. co-locating connected pops)
+        self.cellCostProfile = None  # file with cost per cell of each pop from previous run (see sim.loadBalance(saveProfile)) used when distributeCells='cost' or 'partition'
+        self.partitionGraphFile = None  # saved network file used to count conns between pops when distributeCells='partition' (if None, estimated from connParams)
+        self.connTable = False  # store conns of all cells in node in a table with one typed column per conn param (instead of list of dicts per cell)
+        self.bulkNetCons = False  # create NetCons of each cell in bulk after applying all conn rules (instead of one at a time when each conn is added)
+        self.vecStimBatch = False  # generate spike times of all VecStims of each pop at once (vectorized Random123 streams, same trains as one by one)
+        self.vecStimCache = None  # folder to cache VecStim spike times generated in batch, reused in runs with the same params, gids and duration (None to disable)
+        self.numpyBackend = False  # simulate networks of point cells (IntFire1, IntFire2, IntFire4, NetStim, VecStim) with NumPy instead of NEURON (requires createNEURONObj=False)
         self.connRandomSecFromList = True  # select random section (and location) from list even when synsPerConn=1 
         self.saveCellSecs = True  # save all the sections info for each cell (False reduces time+space; available in netParams; prevents re-simulation)
         self.saveCellConns = True  # save all the conns info for each cell (False reduces time+space; prevents re-simulation)
@@ -63,6 +74,8 @@ class SimConfig (object):
         self.recordStim = False  # record spikes of cell stims
         self.recordLFP = [] # list of 3D locations to record LFP from
         self.saveLFPCells = False  # Store LFP generate individually by each cell 
+        self.saveLFPPops = False  # Store LFP generated by each population
+        self.bufferLFPSteps = 1  # Num of record steps to buffer i_membrane_ before calculating LFP (one matrix product per buffer)
         self.recordStep = 0.1 # Step size in ms to save data (eg. V traces, LFP, etc)
         self.recordTime = True  # record time step of recording
 
@@ -71,6 +84,12 @@ class SimConfig (object):
         self.saveFolder = ''  # path where to save output data
         self.filename = 'model_output'  # Name of file to save model output (if omitted then saveFolder+simLabel is used)
         self.saveDataInclude = ['netParams', 'netCells', 'netPops', 'simConfig', 'simData']
+        self.distributedSave = False  # each node saves its cells, conns, spikes and traces to its own file (<filename>.rank<N>.npz) instead of gathering them; master saves <filename>_manifest.json
+        self.streamOutput = None  # write spikes and traces to disk during run, eg. {'interval': 1000, 'format': 'h5'} (merged into <filename>_stream, loaded by gatherData)
+        self.checkpointInterval = None  # save checkpoint (NEURON state, stim random streams and recorded data of each node) every interval (ms), to continue run with sim.resume()
+        self.checkpointDir = None  # folder where checkpoints are saved (default: <filename>_checkpoint)
+        self.saveStateDir = None  # folder where state at end of run is saved (as a checkpoint) to warm start other runs with cfg.warmStartDir
+        self.warmStartDir = None  # folder with state saved with cfg.saveStateDir to start run from (only time from saved state to duration is simulated)
         self.timestampFilename = False  # Add timestamp to filename to avoid overwriting
         self.savePickle = False # save to pickle file
         self.saveJson = False # save to json file
@@ -78,6 +97,7 @@ class SimConfig (object):
         self.saveCSV = False # save to txt file
         self.saveDpk = False # save to .dpk pickled file
         self.saveHDF5 = False # save to HDF5 file
+        self.saveNpy = False # save to directory of .npy files (columnar format that can be loaded partially)
         self.saveDat = False # save traces to .dat file(s)
         self.backupCfgFile = [] # copy cfg file, list with [sourceFile,destFolder] (eg. ['cfg.py', 'backupcfg/'])
 
@@ -0,0 +1,55 @@
+"""
+random123.py
+
+Vectorized NumPy version of the Random123 (Philox4x32-10) generator used by NEURON's Random.Random123(id1, id2, id3),
+to draw the random values of many streams (eg. one per cell gid) at once
+
+Contributors: salvadordura@gmail.com
+"""
+from __future__ import division
+from __future__ import unicode_literals
+from __future__ import absolute_import
+
+from future import standard_library
+standard_library.install_aliases()
+import numpy as np
+
+PHILOX_M0, PHILOX_M1 = 0xD2511F53, 0xCD9E8D57  # round multipliers
+PHILOX_W0, PHILOX_W1 = 0x9E3779B9, 0xBB67AE85  # key Weyl increments
+MASK32 = 0xFFFFFFFF
+SHIFT32 = 1.0 / 4294967297.0  # 1/(2^32 + 1), maps uint32 to open interval (0,1) as nrnran123_uint2dbl
+
+
+def philox4x32(counters, keys, rounds=10):
+    ''' Returns Philox4x32 output (uint32 array N x 4) of counters (N x 4) and keys (N x 2 or 2) '''
+    c = [np.asarray(counters, dtype=np.uint64)[:, i] & MASK32 for i in range(4)]
+    keys = np.asarray(keys, dtype=np.uint64)
+    k0, k1 = (keys[..., 0] & MASK32, keys[..., 1] & MASK32)
+    for r in range(rounds):
+        if r > 0:  # bump key before each round except the first
+            k0, k1 = (k0 + PHILOX_W0) & MASK32, (k1 + PHILOX_W1) & MASK32
+        prod0, prod1 = c[0] * np.uint64(PHILOX_M0), c[2] * np.uint64(PHILOX_M1)
+        c = [(prod1 >> np.uint64(32)) ^ c[1] ^ k0, prod1 & MASK32, (prod0 >> np.uint64(32)) ^ c[3] ^ k1, prod0 & MASK32]
+    return np.stack(c, axis=1).astype(np.uint32)
+
+
+def uniform(ids1, ids2, ids3, numPicks, firstPick=0, globalIndex=0):
+    ''' Returns array (N x numPicks) with picks firstPick..firstPick+numPicks-1 in the open interval (0,1) of N
+    Random123 streams, as returned by NEURON's Random.Random123(id1, id2, id3) (counter [seq, id3, id1, id2] and key
+    [globalIndex, 0], with 4 picks per counter seq) '''
+    ids1, ids2, ids3 = np.broadcast_arrays(*[np.asarray(ids, dtype=np.uint64).ravel() for ids in (ids1, ids2, ids3)])
+    numStreams = len(ids1)
+    seqs = np.arange(firstPick // 4, (firstPick + numPicks - 1) // 4 + 1, dtype=np.uint64)
+    counters = np.empty((numStreams, len(seqs), 4), dtype=np.uint64)
+    counters[:, :, 0] = seqs
+    counters[:, :, 1], counters[:, :, 2], counters[:, :, 3] = ids3[:, None], ids1[:, None], ids2[:, None]
+    values = philox4x32(counters.reshape(-1, 4), [globalIndex, 0]).reshape(numStreams, -1)
+    start = firstPick - 4 * (firstPick // 4)
+    return (values[:, start:start+numPicks].astype(float) + 1.0) * SHIFT32
+
+
+def negexp(mean, ids1, ids2, ids3, numPicks, firstPick=0, globalIndex=0):
+    ''' Returns array (N x numPicks) with negative exponential values of mean (scalar or N array), as returned by
+    NEURON's Random.negexp(mean) with Random123 streams (-mean*log(u)) '''
+    u = uniform(ids1, ids2, ids3, numPicks, firstPick, globalIndex)
+    return -np.reshape(mean, (-1, 1)) * np.log(u)
@@ -103,3 +103,13 @@ class RecXElectrode(object):
 
         tr *= 1/(4*math.pi*sigma)  # units: 1/um / (mS/mm) = mm/um / mS = 1e3 * kOhm = MOhm
         self.transferResistances[gid] = tr
+
+    def calcStackedTransferResistance(self, gids):
+        """Stack transfer resistances of cells (in order of gids) into a single matrix (sites x segments of all cells);
+        the matrix of each cell is then a view of the stacked matrix (segSlices[gid] = columns of cell)"""
+        trs = [self.transferResistances[gid] for gid in gids]
+        self.stackedTransferResistance = np.hstack(trs) if trs else np.zeros((self.nsites, 0))
+        bounds = np.cumsum([0] + [tr.shape[1] for tr in trs])
+        self.segSlices = {gid: slice(bounds[i], bounds[i+1]) for i, gid in enumerate(gids)}
+        for gid in gids:
+            self.transferResistances[gid] = self.stackedTransferResistance[:, self.segSlices[gid]]